@@ -0,0 +1,91 @@
+"""Compares the latency of the cold cli.py path with the resident agent.
+
+Every run is a new ``python cli.py <action>`` process, just like Alfred does it.
+The cold path imports and runs the handler in that process, the agent path
+forwards the action to an agent started once in the beginning. The raw socket
+round-trip of the agent is measured too.
+
+Usage:
+    python benchmarks/agent_latency.py [--action settings_list] [--runs 30] [-- query]
+
+The default action doesn't need keepassxc-cli or Keychain, so the benchmark
+works anywhere. Other actions use the settings from the current environment.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SOURCE_PATH)
+
+from agent import AgentClient, get_socket_path  # noqa: E402
+
+
+def measure(func, runs):
+    timings = []
+
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+
+    return timings
+
+
+def run_cli(arguments, environment):
+    command = [sys.executable, os.path.join(SOURCE_PATH, "cli.py")] + arguments
+    subprocess.run(command, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<28} median {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms   min {timings[0]:8.2f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--action", default="settings_list")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("query", nargs="*")
+
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = parse_args()
+    arguments = [parsed_args.action] + parsed_args.query
+    temporary_directory = tempfile.mkdtemp(prefix="kp-", dir="/tmp")
+    environment = dict(os.environ, TMPDIR=temporary_directory, alfred_keyword=os.getenv("alfred_keyword", "kp"))
+    agent_environment = dict(environment, use_agent="1")
+
+    try:
+        report("cold path", measure(lambda: run_cli(arguments, environment), parsed_args.runs))
+
+        os.environ.update(agent_environment)
+        agent_process = subprocess.Popen([sys.executable, os.path.join(SOURCE_PATH, "agent.py")], env=agent_environment)
+        client = AgentClient(get_socket_path())
+
+        while not os.path.exists(client.socket_path):
+            time.sleep(0.01)
+
+        client.request(arguments, agent_environment)  # warm up: unlocks the database once
+        report("agent via cli.py", measure(lambda: run_cli(arguments, agent_environment), parsed_args.runs))
+        report(
+            "agent socket round-trip", measure(lambda: client.request(arguments, agent_environment), parsed_args.runs)
+        )
+
+        agent_process.terminate()
+        agent_process.wait()
+    finally:
+        shutil.rmtree(temporary_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Measures workflow actions end to end on a generated vault.
+
+Every run is a new ``python cli.py <action>`` process, just like Alfred does
+it, with the fake ``keepassxc-cli``, ``security`` and ``osascript`` from the
+test suite, so it works offline on Linux. The vault is generated by
+``generate_vault.py``. The KDF time and the failure rates of the fakes are set
+with the options below. Latency is the wall time of a run. Peak RSS is the
+``ru_maxrss`` of the run reported by ``wait4``, which includes the processes it
+waited for, e.g. keepassxc-cli. A run fails if it exits with an error or
+prints a traceback. Runs of "fetch" and "totp" rotate over entries from the
+whole vault.
+
+Usage:
+    python benchmarks/end_to_end.py [--entries 10000] [--runs 30] [--actions search,fetch,totp]
+    python benchmarks/end_to_end.py --entries 1000000 --kdf-delay 0.5 --setting use_local_search=1
+"""
+
+import argparse
+import collections
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate_vault import generate_entries, write_vault
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+FAKES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tests", "fakes")
+ACTIONS = ("search", "list_entries", "fetch", "totp", "totps", "open_url")
+
+Run = collections.namedtuple("Run", "elapsed max_rss output_size failed")
+
+
+def build_arguments(action, query, samples, index):
+    arguments = {
+        "search": [query],
+        "list_entries": [],
+        "fetch": [samples["paths"][index % len(samples["paths"])]],
+        "totp": [samples["otp_paths"][index % len(samples["otp_paths"])]],
+        "totps": [query],
+        "open_url": ["cmd://benchmark"],  # isn't opened, so only osascript shows a message
+    }
+
+    return [action] + arguments[action]
+
+
+def build_environment(parsed_args, db_path, work_directory):
+    environment = dict(
+        os.environ,
+        PATH=os.path.abspath(FAKES_PATH) + os.pathsep + os.environ.get("PATH", ""),
+        TMPDIR=work_directory,
+        alfred_keyword="kp",
+        alfred_workflow_data=os.path.join(work_directory, "data"),
+        alfred_workflow_cache=os.path.join(work_directory, "cache"),
+        keepassxc_cli_path=os.path.abspath(os.path.join(FAKES_PATH, "keepassxc-cli")),
+        keepassxc_db_path=db_path,
+        keepassxc_master_password="••••••••",  # the password is in Keychain, i.e. in the fake security
+        keychain_account="benchmark",
+        keychain_service="benchmark",
+        python_path=sys.executable,
+        desired_attributes="title,username,password,url,notes",  # the defaults of settings.js
+        show_attribute_values="true",
+        show_unfilled_attributes="false",
+        show_passwords="false",
+        show_totp_request="true",
+        entry_delimiter=" › ",
+        clipboard_timeout="10",
+        FAKE_SECURITY_PASSWORD="password",
+        FAKE_KEEPASSXC_DELAY=str(parsed_args.kdf_delay),
+        FAKE_KEEPASSXC_FAILURE_RATE=str(parsed_args.failure_rate),
+        FAKE_SECURITY_FAILURE_RATE=str(parsed_args.failure_rate),
+        FAKE_OSASCRIPT_FAILURE_RATE=str(parsed_args.failure_rate),
+    )
+
+    for setting in parsed_args.setting:
+        name, _, value = setting.partition("=")
+        environment[name] = value
+
+    return environment
+
+
+def run_cli(arguments, environment):
+    command = [sys.executable, os.path.join(SOURCE_PATH, "cli.py")] + arguments
+
+    with tempfile.TemporaryFile() as stdout_file, tempfile.TemporaryFile() as stderr_file:
+        started_at = time.perf_counter()
+        process = subprocess.Popen(
+            command, env=environment, stdin=subprocess.DEVNULL, stdout=stdout_file, stderr=stderr_file
+        )
+        _, status, resource_usage = os.wait4(process.pid, 0)
+        elapsed = (time.perf_counter() - started_at) * 1000
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stderr_file.seek(0)
+        failed = process.returncode != 0 or b"Traceback" in stderr_file.read()
+        max_rss = resource_usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)  # in MiB
+
+        return Run(elapsed, max_rss, os.fstat(stdout_file.fileno()).st_size, failed)
+
+
+def percentile(sorted_values, percent):
+    """Returns the nearest-rank percentile."""
+
+    return sorted_values[max(math.ceil(len(sorted_values) * percent / 100) - 1, 0)]
+
+
+def report(action, runs):
+    timings = sorted(run.elapsed for run in runs)
+    failures = sum(run.failed for run in runs)
+    print(
+        f"{action:<13} p50 {percentile(timings, 50):8.1f} ms   p95 {percentile(timings, 95):8.1f} ms   "
+        f"p99 {percentile(timings, 99):8.1f} ms   peak RSS {max(run.max_rss for run in runs):7.1f} MiB   "
+        f"output {max(run.output_size for run in runs) / 1024:8.1f} KiB   failures {failures}/{len(runs)}"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--depth", type=int, default=8, help="maximum depth of groups")
+    parser.add_argument("--notes-size", type=int, default=65536, help="size of long notes in characters")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--actions", default="search,fetch,totp", help=f"comma-separated, any of {', '.join(ACTIONS)}")
+    parser.add_argument("--query", default="github", help="query of search and totps")
+    parser.add_argument("--kdf-delay", type=float, default=0.0, help="seconds keepassxc-cli spends unlocking")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability that a fake tool fails")
+    parser.add_argument("--setting", action="append", default=[], help="workflow variable as name=value")
+
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = parse_args()
+    actions = [action for action in parsed_args.actions.split(",") if action]
+    unknown_actions = set(actions) - set(ACTIONS)
+
+    if unknown_actions:
+        sys.exit(f"Unknown actions: {', '.join(sorted(unknown_actions))}.")
+
+    work_directory = tempfile.mkdtemp(prefix="kp-", dir="/tmp")
+
+    try:
+        db_path = os.path.join(work_directory, "vault.json")
+        started_at = time.perf_counter()
+        entries = generate_entries(parsed_args.entries, parsed_args.depth, parsed_args.notes_size)
+        samples = write_vault(db_path, entries)
+        db_size = os.path.getsize(db_path) / 1024 / 1024
+        print(f"vault of {parsed_args.entries} entries ({db_size:.1f} MiB) in {time.perf_counter() - started_at:.1f} s")
+        environment = build_environment(parsed_args, db_path, work_directory)
+
+        for action in actions:
+            run_cli(build_arguments(action, parsed_args.query, samples, 0), environment)  # warm up
+            runs = [
+                run_cli(build_arguments(action, parsed_args.query, samples, index), environment)
+                for index in range(parsed_args.runs)
+            ]
+            report(action, runs)
+    finally:
+        shutil.rmtree(work_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Compares loading the whole vault with one export against a "show" call per entry.
+
+By default the benchmark generates a database with ``--entries`` entries for
+the fake keepassxc-cli from the test suite. The "show" loop spawns a process
+per entry, so it runs on the first ``--show-entries`` entries only and the
+result is extrapolated. The time includes the work of keepassxc-cli, which
+dominates with the fake one. The peak memory is measured with tracemalloc in the
+benchmark process, i.e. it's the memory of the parser, not of keepassxc-cli.
+
+Usage:
+    python benchmarks/export_entries.py [--entries 100000] [--show-entries 200]
+    python benchmarks/export_entries.py --cli /path/to/keepassxc-cli --db /path/to/db.kdbx
+
+With ``--db`` the master password is read from the KEEPASSXC_PASSWORD environment variable.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+FAKE_CLI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tests", "fakes", "keepassxc-cli")
+sys.path.insert(0, SOURCE_PATH)
+
+from services import KeepassXCClient  # noqa: E402
+
+
+def generate_database(path, entries_count):
+    entries = [
+        {
+            "path": f"/Group {index % 100}/Subgroup {index % 7}/Entry {index}",
+            "title": f"Entry {index}",
+            "username": f"user{index}@example.com",
+            "password": f"password {index}",
+            "url": f"https://service{index}.example.com/login",
+            "notes": f"Notes of the entry {index}\nwith two lines",
+            "uuid": f"{index:032x}",
+            "tags": "benchmark;generated",
+            "created": 1600000000 + index,
+            "modified": 1650000000 + index,
+        }
+        for index in range(entries_count)
+    ]
+
+    with open(path, "w") as db_file:
+        json.dump({"password": "password", "entries": entries}, db_file)
+
+
+def measure_export(client, export_format):
+    """Returns the number of entries, the time and the peak memory. The memory is traced in a separate run."""
+
+    started_at = time.perf_counter()
+    entries_count = sum(1 for _ in client.export_entries(export_format))
+    elapsed = time.perf_counter() - started_at
+
+    tracemalloc.start()
+    sum(1 for _ in client.export_entries(export_format))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return entries_count, elapsed, peak
+
+
+def measure_show_loop(client, limit):
+    started_at = time.perf_counter()
+    paths = client.search("")[:limit]
+
+    for path in paths:
+        client.show(path)
+
+    return len(paths), time.perf_counter() - started_at
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--show-entries", type=int, default=200)
+    parser.add_argument("--cli", default=FAKE_CLI_PATH)
+    parser.add_argument("--db")
+
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = parse_args()
+    temporary_directory = tempfile.mkdtemp(prefix="kp-")
+
+    try:
+        db_path, password = parsed_args.db, os.getenv("KEEPASSXC_PASSWORD", "")
+
+        if not db_path:
+            db_path, password = os.path.join(temporary_directory, "passwords.kdbx"), "password"
+            generate_database(db_path, parsed_args.entries)
+
+        client = KeepassXCClient(cli_path=parsed_args.cli, db_path=db_path, key_file=None, password=password)
+
+        for export_format in ("xml", "csv"):
+            count, elapsed, peak = measure_export(client, export_format)
+            print(
+                f"export -f {export_format:<4} {count:>8} entries {elapsed:8.2f} s   "
+                f"{elapsed / count * 1e6:8.1f} µs/entry   peak memory {peak / 1024 / 1024:6.2f} MiB"
+            )
+
+        count, elapsed = measure_show_loop(client, parsed_args.show_entries)
+        print(
+            f"search + show  {count:>8} entries {elapsed:8.2f} s   {elapsed / count * 1e6:8.1f} µs/entry   "
+            f"~{elapsed / count * parsed_args.entries / 60:.1f} min for {parsed_args.entries} entries"
+        )
+    finally:
+        shutil.rmtree(temporary_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Generates a synthetic database for the fake keepassxc-cli from the test suite.
+
+Entries are spread over groups nested up to ``--depth`` levels, a part of the
+titles and group names have non-ASCII characters (accents, Cyrillic, CJK and
+emoji), every tenth entry has TOTP set up and ``--long-notes-share`` of the
+entries have notes of ``--notes-size`` characters, so the output of "show"
+and "export" grows with them. The file is written entry by entry, so vaults
+with millions of entries don't need the memory of a whole JSON document.
+
+Usage:
+    python benchmarks/generate_vault.py vault.json [--entries 100000] [--depth 8] [--notes-size 65536]
+"""
+
+import argparse
+import json
+import random
+
+SERVICES = (
+    "GitHub GitLab Jira Slack Zoom Google Outlook Dropbox iCloud Amazon AWS Azure Heroku Cloudflare PayPal "
+    "Stripe Revolut Monzo Chase Netflix Spotify Steam Twitch Discord Telegram Docker Grafana Sentry Okta Postgres"
+).split()
+QUALIFIERS = "admin root deploy backup personal work test api ci readonly".split()
+GROUPS = "Work Personal Finance Servers Databases Social Shopping Travel Family Archive Production Staging".split()
+UNICODE_WORDS = "Café Straße Señor Ærø Пароль Почта 東京 서울 Ελλάδα מפתח 🔑 🏦".split()
+SYLLABLES = "ka lo mi ne ru sa ti vo ze pa do fi gu he ja".split()
+OTP_URI = "otpauth://totp/{title}?secret=GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ&period=30&digits=6"
+SAMPLE_SIZE = 100
+
+
+def generate_group(randomizer, depth):
+    names = [
+        randomizer.choice(UNICODE_WORDS) if randomizer.random() < 0.1 else randomizer.choice(GROUPS)
+        for _ in range(randomizer.randint(1, depth))
+    ]
+
+    return "/" + "/".join(names)
+
+
+def generate_notes(randomizer, notes_size, long_notes_share):
+    if randomizer.random() >= long_notes_share:
+        return "Recovery codes are in the safe."
+
+    line = " ".join(randomizer.choice(SYLLABLES + UNICODE_WORDS) for _ in range(12)) + "\n"
+
+    return (line * (notes_size // len(line) + 1))[:notes_size]
+
+
+def generate_entries(count, depth=8, notes_size=65536, long_notes_share=0.01, seed=0):
+    randomizer = random.Random(seed)
+
+    for index in range(count):
+        service = randomizer.choice(SERVICES)
+        account = "".join(randomizer.choice(SYLLABLES) for _ in range(3))
+        title = f"{service} {randomizer.choice(QUALIFIERS)} {account} {index}"
+
+        if randomizer.random() < 0.2:
+            title = f"{randomizer.choice(UNICODE_WORDS)} {title}"
+
+        entry = {
+            "path": f"{generate_group(randomizer, depth)}/{title}",
+            "title": title,
+            "username": f"{account}{index}@example.com",
+            "password": "".join(randomizer.choice(SYLLABLES) for _ in range(8)),
+            "url": f"https://{service.lower()}.example.com/{account}",
+            "notes": generate_notes(randomizer, notes_size, long_notes_share),
+            "uuid": f"{index:032x}",
+            "tags": randomizer.choice(["", "prod", "shared;2fa", "legacy"]),
+            "created": 1600000000 + index,
+            "modified": 1650000000 + index,
+        }
+
+        if index % 10 == 0:
+            entry["otp"] = OTP_URI.format(title=account)
+
+        yield entry
+
+
+def write_vault(path, entries, password="password"):
+    """Writes the entries and returns samples of their paths: all of them and the ones with TOTP."""
+
+    step = 1
+    samples = {"paths": [], "otp_paths": []}
+
+    with open(path, "w", encoding="utf-8") as db_file:
+        db_file.write(f'{{"password": {json.dumps(password)}, "entries": [')
+
+        for index, entry in enumerate(entries):
+            db_file.write(("," if index else "") + json.dumps(entry, ensure_ascii=False))
+
+            if index % step == 0:
+                samples["paths"].append(entry["path"])
+
+                if entry.get("otp"):
+                    samples["otp_paths"].append(entry["path"])
+
+            if len(samples["paths"]) >= SAMPLE_SIZE * 2:  # keeps the samples spread over the whole vault
+                samples = {name: paths[::2] for name, paths in samples.items()}
+                step *= 2
+
+        db_file.write("]}")
+
+    return samples
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--depth", type=int, default=8, help="maximum depth of groups")
+    parser.add_argument("--notes-size", type=int, default=65536, help="size of long notes in characters")
+    parser.add_argument("--long-notes-share", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = parse_args()
+    entries = generate_entries(
+        parsed_args.entries, parsed_args.depth, parsed_args.notes_size, parsed_args.long_notes_share, parsed_args.seed
+    )
+    write_vault(parsed_args.path, entries)
+
+
+if __name__ == "__main__":
+    main()
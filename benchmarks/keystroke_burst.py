@@ -0,0 +1,448 @@
+"""Replays typing sessions against a script filter the way Alfred queues its runs.
+
+Alfred runs the script filter of a query while the next characters are being
+typed. The queue settings of the script filter come from ``src/info.plist``:
+
+- ``queuedelaymode`` 0 starts a run after every keystroke, 1 ("automatic")
+  and 2 ("custom", ``queuedelaycustom`` tenths of a second) after a pause in
+  typing. Alfred adapts the automatic delay to the typing speed, here it's
+  ``--automatic-delay``. With ``queuedelayimmediatelyinitially`` the first
+  keystroke starts a run at once.
+- ``queuemode`` 1 waits for the previous run to finish and then runs the last
+  query typed meanwhile, 2 terminates the previous run with SIGTERM.
+
+A session is the list of keystrokes: the time since the keyword was typed and
+the query after the keystroke. Synthetic sessions type ``--query`` character
+by character, starting with the empty query, at random intervals within
+``--interval``. Recorded sessions are read from a JSON file::
+
+    [{"name": "typo", "keystrokes": [[0, ""], [90, "g"], [160, "gt"], [300, "g"], [380, "gi"]]}]
+
+Runs are ``python -S cli.py <action> <query>`` processes with the fake tools
+of the test suite, as in ``end_to_end.py``. The fake keepassxc-cli spins for
+``--kdf-delay`` seconds while unlocking, so its CPU time looks like the KDF.
+Reported per session:
+
+- latency: time from the last keystroke to the output of the run of the final query;
+- wasted decrypts: unlocks by runs other than the one which produced the final result,
+  every run logs the unlocks of its keepassxc-cli to its own file;
+- CPU: user and system time of the runs and of their subprocesses. On Linux the harness
+  adopts orphaned subprocesses (``PR_SET_CHILD_SUBREAPER``), so the CPU of subprocesses
+  left by terminated runs is counted too. On macOS it isn't. With ``use_agent`` the work
+  done by the agent isn't counted either, the agent isn't a subprocess of a run;
+- peak processes: the most runs and keepassxc-cli processes alive at once;
+- left: keepassxc-cli processes still running when the final result came.
+
+After a session the harness waits up to ``--drain-timeout`` seconds for the
+processes to finish and kills the remaining ones, so sessions don't overlap.
+
+Usage:
+    python benchmarks/keystroke_burst.py [--sessions 5] [--query github] [--interval 50,150] [--kdf-delay 0.3]
+    python benchmarks/keystroke_burst.py --sessions-file sessions.json --setting use_agent=1
+"""
+
+import argparse
+import json
+import os
+import plistlib
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from end_to_end import SOURCE_PATH, build_environment, percentile
+from generate_vault import generate_entries, write_vault
+
+INFO_PLIST_PATH = os.path.join(SOURCE_PATH, "info.plist")
+PR_SET_CHILD_SUBREAPER = 36
+WAIT_FOR_PREVIOUS, TERMINATE_PREVIOUS = 1, 2
+IMMEDIATELY, AUTOMATIC_DELAY, CUSTOM_DELAY = 0, 1, 2
+TICK = 0.002
+SAMPLING_INTERVAL = 0.01
+
+
+class ScriptFilter:
+    """The queue settings of a script filter of info.plist."""
+
+    def __init__(self, action, queue_mode, delay_mode, custom_delay, is_immediate_initially):
+        self.action = action
+        self.queue_mode = queue_mode
+        self.delay_mode = delay_mode
+        self.custom_delay = custom_delay
+        self.is_immediate_initially = is_immediate_initially
+
+    @classmethod
+    def from_info_plist(cls, path, action):
+        with open(path, "rb") as info_plist_file:
+            info_plist = plistlib.load(info_plist_file)
+
+        for workflow_object in info_plist["objects"]:
+            config = workflow_object["config"]
+            is_script_filter = workflow_object["type"] == "alfred.workflow.input.scriptfilter"
+
+            if is_script_filter and f"cli.py {action} " in config.get("script", ""):
+                return cls(
+                    action=action,
+                    queue_mode=config["queuemode"],
+                    delay_mode=config["queuedelaymode"],
+                    custom_delay=config["queuedelaycustom"] / 10,
+                    is_immediate_initially=config["queuedelayimmediatelyinitially"],
+                )
+
+        raise ValueError(f"There is no script filter running cli.py {action} with a query.")
+
+    def get_delay(self, automatic_delay):
+        return {IMMEDIATELY: 0, AUTOMATIC_DELAY: automatic_delay, CUSTOM_DELAY: self.custom_delay}[self.delay_mode]
+
+    def describe(self, automatic_delay):
+        queue_mode = "wait for the previous run" if self.queue_mode == WAIT_FOR_PREVIOUS else "terminate previous run"
+        return f"{self.action}: {queue_mode}, delay {self.get_delay(automatic_delay) * 1000:.0f} ms"
+
+
+class Run:
+    """A cli.py process started for a query."""
+
+    def __init__(self, index, query, process, output_file, unlocks_path, started_at):
+        self.index = index
+        self.query = query
+        self.process = process
+        self.output_file = output_file
+        self.unlocks_path = unlocks_path
+        self.started_at = started_at
+        self.is_finished = False
+        self.is_terminated = False
+        self.exit_code = None
+
+    @property
+    def is_successful(self):
+        self.output_file.seek(0)
+        output = self.output_file.read()
+        return self.exit_code == 0 and b'"items"' in output and b"Traceback" not in output
+
+    def read_unlock_pids(self):
+        try:
+            with open(self.unlocks_path) as unlocks_file:
+                return [int(line) for line in unlocks_file if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+class Replay:
+    """Types a session and runs the script filter like Alfred does."""
+
+    def __init__(self, script_filter, environment, automatic_delay, work_directory):
+        self.script_filter = script_filter
+        self.environment = environment
+        self.delay = script_filter.get_delay(automatic_delay)
+        self.work_directory = work_directory
+        self.runs = []
+        self.current_run = None
+        self.queued_query = None
+        self.peak_processes = 0
+
+    def start(self, query, now):
+        index = len(self.runs)
+        unlocks_path = os.path.join(self.work_directory, f"unlocks-{index}.log")
+        command = [sys.executable, "-S", os.path.join(SOURCE_PATH, "cli.py"), self.script_filter.action, query]
+        output_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            command,
+            cwd=SOURCE_PATH,
+            env=dict(self.environment, FAKE_KEEPASSXC_LOG=unlocks_path),
+            stdin=subprocess.DEVNULL,
+            stdout=output_file,
+            stderr=subprocess.STDOUT,
+        )
+        self.current_run = Run(index, query, process, output_file, unlocks_path, now)
+        self.runs.append(self.current_run)
+
+    def trigger(self, query, now):
+        if self.current_run is None:
+            self.start(query, now)
+        elif self.script_filter.queue_mode == WAIT_FOR_PREVIOUS:
+            self.queued_query = query
+        else:
+            self.current_run.process.send_signal(signal.SIGTERM)
+            self.current_run.is_terminated = True
+            self.start(query, now)
+
+    def reap(self, now):
+        """Collects finished runs and adopted orphans. Runs are never waited for with Popen."""
+
+        runs_by_pid = {run.process.pid: run for run in self.runs if not run.is_finished}
+
+        while True:
+            try:
+                pid, status, _ = os.wait4(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+
+            if pid == 0:
+                return
+
+            run = runs_by_pid.get(pid)
+
+            if run is None:  # an orphaned subprocess adopted by the harness
+                continue
+
+            run.is_finished = True
+            run.exit_code = run.process.returncode = os.waitstatus_to_exitcode(status)
+
+            if run is self.current_run:
+                self.current_run = None
+
+                if self.queued_query is not None:
+                    self.start(self.queued_query, now)
+                    self.queued_query = None
+
+    def count_processes(self):
+        count = 0
+
+        for run in self.runs:
+            count += not run.is_finished
+            count += sum(is_running(pid) for pid in run.read_unlock_pids())
+
+        return count
+
+    def play(self, keystrokes, timeout):
+        """Returns the run which produced the final result and the time it came, or None on timeout."""
+
+        started_at = time.monotonic()
+        final_query = keystrokes[-1][1]
+        next_keystroke, trigger_at, trigger_query, sampled_at = 0, None, None, 0.0
+
+        while True:
+            now = time.monotonic() - started_at
+
+            while next_keystroke < len(keystrokes) and keystrokes[next_keystroke][0] <= now:
+                query = keystrokes[next_keystroke][1]
+
+                if self.delay == 0 or (next_keystroke == 0 and self.script_filter.is_immediate_initially):
+                    self.trigger(query, now)
+                    trigger_at = None
+                else:  # a keystroke within the delay postpones the run
+                    trigger_at, trigger_query = keystrokes[next_keystroke][0] + self.delay, query
+
+                next_keystroke += 1
+
+            if trigger_at is not None and trigger_at <= now:
+                self.trigger(trigger_query, now)
+                trigger_at = None
+
+            self.reap(now)
+
+            if now - sampled_at >= SAMPLING_INTERVAL:
+                self.peak_processes = max(self.peak_processes, self.count_processes())
+                sampled_at = now
+
+            is_typed = next_keystroke == len(keystrokes) and trigger_at is None and self.queued_query is None
+            last_run = self.runs[-1] if self.runs else None
+
+            if is_typed and last_run and last_run.is_finished and last_run.query == final_query:
+                return last_run, now
+
+            if now > timeout:
+                return None, now
+
+            time.sleep(TICK)
+
+    def drain(self, timeout):
+        """Waits for the processes of the session to finish and kills the remaining ones."""
+
+        deadline = time.monotonic() + timeout
+
+        while self.count_processes() and time.monotonic() < deadline:
+            self.reap(0)
+            time.sleep(TICK * 5)
+
+        for run in self.runs:
+            for pid in [run.process.pid] + run.read_unlock_pids():
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+
+        deadline = time.monotonic() + 1  # zombies adopted by an init which doesn't reap them are left alone
+
+        while any(exists(pid) for run in self.runs for pid in [run.process.pid] + run.read_unlock_pids()):
+            self.reap(0)
+
+            if all(run.is_finished for run in self.runs) and time.monotonic() > deadline:
+                break
+
+            time.sleep(TICK)
+
+        for run in self.runs:
+            run.output_file.close()
+
+
+def exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # the ID has been reused by a process of another user
+        return False
+
+    return True
+
+
+def is_running(pid):
+    """Tells if the process exists and isn't a zombie."""
+
+    if not os.path.isdir("/proc/self"):
+        return exists(pid)
+
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            return stat_file.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+    except FileNotFoundError:
+        return False
+
+
+def become_subreaper():
+    """Makes orphaned descendants children of this process on Linux, so their CPU time can be collected."""
+
+    if not sys.platform.startswith("linux"):
+        return False
+
+    import ctypes
+
+    return ctypes.CDLL(None, use_errno=True).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+
+
+def get_children_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def generate_sessions(query, count, interval, seed=0):
+    randomizer = random.Random(seed)
+    sessions = []
+
+    for index in range(count):
+        keystrokes, typed_at = [(0.0, "")], 0.0
+
+        for length in range(1, len(query) + 1):
+            typed_at += randomizer.uniform(*interval) / 1000
+            keystrokes.append((typed_at, query[:length]))
+
+        sessions.append({"name": f"{query} #{index + 1}", "keystrokes": keystrokes})
+
+    return sessions
+
+
+def load_sessions(path):
+    with open(path, encoding="utf-8") as sessions_file:
+        sessions = json.load(sessions_file)
+
+    for session in sessions:
+        session["keystrokes"] = [(offset / 1000, query) for offset, query in session["keystrokes"]]
+
+    return sessions
+
+
+def replay_session(session, script_filter, parsed_args, environment, work_directory):
+    session_directory = tempfile.mkdtemp(dir=work_directory)
+    replay = Replay(script_filter, environment, parsed_args.automatic_delay, session_directory)
+    cpu_time_before = get_children_cpu_time()
+    final_run, result_at = replay.play(session["keystrokes"], parsed_args.session_timeout)
+    left = sum(is_running(pid) for run in replay.runs for pid in run.read_unlock_pids())
+    is_successful = final_run is not None and final_run.is_successful
+    replay.drain(parsed_args.drain_timeout)
+    wasted_decrypts = sum(len(run.read_unlock_pids()) for run in replay.runs if run is not final_run)
+
+    return {
+        "name": session["name"],
+        "latency": (result_at - session["keystrokes"][-1][0]) * 1000,
+        "runs": len(replay.runs),
+        "terminated": sum(run.is_terminated for run in replay.runs),
+        "wasted_decrypts": wasted_decrypts,
+        "cpu": (get_children_cpu_time() - cpu_time_before) * 1000,
+        "peak_processes": replay.peak_processes,
+        "left": left,
+        "failed": not is_successful,
+    }
+
+
+def report(result):
+    print(
+        f"{result['name']:<20} latency {result['latency']:8.1f} ms   runs {result['runs']:3} "
+        f"({result['terminated']} terminated)   wasted decrypts {result['wasted_decrypts']:3}   "
+        f"CPU {result['cpu']:8.1f} ms   peak processes {result['peak_processes']:3}   left {result['left']:3}"
+        + ("   FAILED" if result["failed"] else "")
+    )
+
+
+def report_summary(results):
+    latencies = sorted(result["latency"] for result in results)
+    print(
+        f"{len(results)} sessions: latency p50 {percentile(latencies, 50):.1f} ms, "
+        f"p95 {percentile(latencies, 95):.1f} ms; "
+        f"wasted decrypts {sum(result['wasted_decrypts'] for result in results)}; "
+        f"CPU {sum(result['cpu'] for result in results) / len(results):.1f} ms per session; "
+        f"peak processes {max(result['peak_processes'] for result in results)}; "
+        f"failures {sum(result['failed'] for result in results)}/{len(results)}"
+    )
+
+
+def parse_interval(value):
+    low, _, high = value.partition(",")
+    return float(low), float(high or low)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5, help="number of synthetic sessions")
+    parser.add_argument("--sessions-file", help="JSON file with recorded sessions, offsets in milliseconds")
+    parser.add_argument("--query", default="github", help="query typed in synthetic sessions")
+    parser.add_argument("--interval", type=parse_interval, default=(50, 150), help="keystroke interval as min,max ms")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--script-filter", default="search", help="action of the script filter, e.g. search or totps")
+    parser.add_argument("--automatic-delay", type=float, default=0.1, help="seconds of Alfred's automatic delay")
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--kdf-delay", type=float, default=0.3, help="seconds keepassxc-cli spends unlocking")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability that a fake tool fails")
+    parser.add_argument("--session-timeout", type=float, default=60.0, help="seconds to wait for the final result")
+    parser.add_argument("--drain-timeout", type=float, default=10.0, help="seconds to wait for leftover processes")
+    parser.add_argument("--setting", action="append", default=[], help="workflow variable as name=value")
+
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = parse_args()
+    script_filter = ScriptFilter.from_info_plist(INFO_PLIST_PATH, parsed_args.script_filter)
+    sessions = (
+        load_sessions(parsed_args.sessions_file)
+        if parsed_args.sessions_file
+        else generate_sessions(parsed_args.query, parsed_args.sessions, parsed_args.interval, parsed_args.seed)
+    )
+
+    if not become_subreaper():
+        print("CPU time of subprocesses left by terminated runs isn't counted on this platform.")
+
+    work_directory = tempfile.mkdtemp(prefix="kp-", dir="/tmp")
+
+    try:
+        db_path = os.path.join(work_directory, "vault.json")
+        write_vault(db_path, generate_entries(parsed_args.entries))
+        environment = dict(build_environment(parsed_args, db_path, work_directory), FAKE_KEEPASSXC_BUSY="1")
+        print(script_filter.describe(parsed_args.automatic_delay))
+        results = []
+
+        for session in sessions:
+            results.append(replay_session(session, script_filter, parsed_args, environment, work_directory))
+            report(results[-1])
+
+        report_summary(results)
+    finally:
+        shutil.rmtree(work_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Measures the in-process layers every workflow run goes through and compares them with a baseline.
+
+The cases cover serialization of script filter items, reading settings from
+environment variables, parsing the output of ``security`` and splitting the
+output of ``keepassxc-cli show`` and ``search``. Subprocesses aren't started:
+the tools' output is prepared in advance. Every case has a realistic size and
+an extreme one (10 000 items or lines, 1 MB notes).
+
+The baseline is ``micro_baseline.json`` next to this file. The time of every
+case is the best of ``--repeat`` rounds per call. Timings depend on the
+machine and on its load, so the rounds of every case alternate with rounds of
+a fixed pure Python workload (calibration), and the time of the case relative
+to the calibration is compared with the baseline. The benchmark fails if a
+case is relatively slower than in the baseline by more than ``--tolerance``
+and by more than ``--min-slowdown`` microseconds: cases of a few microseconds
+vary by more than 50% between runs without any change of the code.
+
+Usage:
+    python benchmarks/micro.py [--tolerance 0.5] [--min-slowdown 5] [--repeat 15] [case ...]
+    python benchmarks/micro.py --update   # writes the current timings as the new baseline
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import timeit
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json")
+sys.path.insert(0, SOURCE_PATH)
+
+import processes  # noqa: E402
+from alfred import AlfredMod, AlfredModActionEnum, AlfredScriptFilter  # noqa: E402
+from conf import settings  # noqa: E402
+from services import KeepassXCClient, KeychainAccess  # noqa: E402
+
+MEGABYTE_NOTES = ("Recovery code: 1234-5678-9012, Пароль, 東京 🔑\n" * 20000)[: 1024 * 1024]
+SETTINGS_ENVIRONMENT = {
+    "alfred_keyword": "kp",
+    "keepassxc_cli_path": "/usr/local/bin/keepassxc-cli",
+    "keepassxc_db_path": "/Users/user/Passwords.kdbx",
+    "keepassxc_master_password": "••••••••",
+    "keychain_account": "user",
+    "keychain_service": "com.lxbrvr.keepassxcalfred",
+    "python_path": "/usr/bin/python3",
+    "desired_attributes": "title,username,password,url,notes",
+    "show_attribute_values": "true",
+    "show_unfilled_attributes": "false",
+    "show_passwords": "false",
+    "entry_delimiter": " › ",
+    "clipboard_timeout": "10",
+}
+
+
+class FakeProcess:
+    """Answers like a finished subprocess.Popen instance."""
+
+    def __init__(self, stdout, stderr):
+        self.pid = 0  # isn't recorded, so it's never killed
+        self.returncode = 0
+        self._output = (stdout, stderr)
+
+    def communicate(self, input=None, timeout=None):
+        return self._output
+
+
+def build_script_filter(items_count):
+    script_filter = AlfredScriptFilter()
+
+    for index in range(items_count):
+        mod = AlfredMod(action=AlfredModActionEnum.CMD, subtitle="Copy and paste to front most app.", arg="")
+        mod.add_variable("USER_ACTION", "cmd")
+        script_filter.add_item(
+            title=f"Internet › Services › Entry {index}",
+            subtitle="user@example.com",
+            arg=f"/Internet/Services/Entry {index}",
+            mods=[mod],
+            uid=f"{index:032x}",
+        )
+
+    return script_filter
+
+
+def script_filter_case(items_count):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_script_filter(items_count).send()
+
+    return run
+
+
+def settings_case(accesses_count):
+    fields = [
+        settings.ENTRY_DELIMITER,
+        settings.SHOW_PASSWORDS,
+        settings.DESIRED_ATTRIBUTES,
+        settings.CLIPBOARD_TIMEOUT,
+    ]
+
+    def run():
+        for index in range(accesses_count):
+            fields[index % len(fields)].value
+
+    return run
+
+
+def keychain_case(password):
+    if password.isascii() and password.isprintable():
+        stderr = f'password: "{password}"\n'.encode()
+    else:
+        stderr = f"password: 0x{password.encode('utf-8').hex().upper()}\n".encode()
+
+    spawn = processes.spawn
+    process = FakeProcess(stdout=b'keychain: "/Users/user/Library/Keychains/login.keychain-db"\n', stderr=stderr)
+
+    def run():
+        processes.spawn = lambda *args, **kwargs: process
+
+        try:
+            KeychainAccess.get_password("user", "service")
+        finally:
+            processes.spawn = spawn
+
+    return run
+
+
+def keepassxc_client_case(method_name, output):
+    client = KeepassXCClient(cli_path="keepassxc-cli", db_path="/db.kdbx", key_file=None, password="password")
+    client._execute = lambda command: output
+
+    return lambda: getattr(client, method_name)("/Internet/Entry")
+
+
+CASES = {
+    "script_filter.send[20 items]": lambda: script_filter_case(20),
+    "script_filter.send[10000 items]": lambda: script_filter_case(10000),
+    "settings.value[100 reads]": lambda: settings_case(100),
+    "settings.value[10000 reads]": lambda: settings_case(10000),
+    "keychain.get_password[ascii]": lambda: keychain_case("correct horse battery staple"),
+    "keychain.get_password[4 KB unicode]": lambda: keychain_case("пароль🔑" * 256),
+    "keepassxc.show[short notes]": lambda: keepassxc_client_case(
+        "show", "Entry\nuser@example.com\npassword\nhttps://example.com\nRecovery codes are in the safe.\n"
+    ),
+    "keepassxc.show[1 MB notes]": lambda: keepassxc_client_case(
+        "show", f"Entry\nuser@example.com\npassword\nhttps://example.com\n{MEGABYTE_NOTES}\n"
+    ),
+    "keepassxc.search[20 lines]": lambda: keepassxc_client_case(
+        "search", "".join(f"/Internet/Entry {index}\n" for index in range(20))
+    ),
+    "keepassxc.search[10000 lines]": lambda: keepassxc_client_case(
+        "search", "".join(f"/Internet/Group {index % 50}/Entry {index}\n" for index in range(10000))
+    ),
+}
+
+
+def calibrate():
+    """A fixed workload which the cases are measured against."""
+
+    return sum(len(str(index)) for index in range(10000))
+
+
+def measure(func, repeat):
+    """Returns the best time of one call in microseconds and the best time of the calibration next to it."""
+
+    timer, calibration_timer = timeit.Timer(func), timeit.Timer(calibrate)
+    number, _ = timer.autorange()
+    calibration_number, _ = calibration_timer.autorange()
+    timings, calibration_timings = [], []
+
+    for _ in range(repeat):
+        timings.append(timer.timeit(number) / number * 1e6)
+        calibration_timings.append(calibration_timer.timeit(calibration_number) / calibration_number * 1e6)
+
+    return min(timings), min(calibration_timings)
+
+
+def load_baseline():
+    try:
+        with open(BASELINE_PATH, encoding="utf-8") as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def compare(timings, baseline, tolerance, min_slowdown):
+    """Prints the timings next to the baseline scaled to the current calibration and returns regressed cases."""
+
+    regressions = []
+
+    for name, (timing, calibration) in timings.items():
+        if name not in baseline:
+            print(f"{name:<38} {timing:12.2f} µs   no baseline")
+            continue
+
+        expected = baseline[name]["time"] / baseline[name]["calibration"] * calibration
+        ratio = timing / expected
+        verdict = "REGRESSION" if ratio > 1 + tolerance and timing - expected > min_slowdown else "ok"
+        print(f"{name:<38} {timing:12.2f} µs   baseline {expected:12.2f} µs   {ratio:5.2f}x   {verdict}")
+
+        if verdict != "ok":
+            regressions.append(name)
+
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown, 0.5 is 50%%")
+    parser.add_argument(
+        "--min-slowdown", type=float, default=5.0, help="slowdowns up to this many microseconds are noise"
+    )
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--update", action="store_true", help="measure all cases and write them as the new baseline")
+    parser.add_argument("cases", nargs="*", help=f"any of: {', '.join(CASES)}")
+
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = parse_args()
+    names = list(CASES) if parsed_args.update or not parsed_args.cases else parsed_args.cases
+    unknown_names = set(names) - set(CASES)
+
+    if unknown_names:
+        sys.exit(f"Unknown cases: {', '.join(sorted(unknown_names))}.")
+
+    os.environ.update(SETTINGS_ENVIRONMENT)
+    timings = {name: measure(CASES[name](), parsed_args.repeat) for name in CASES if name in names}
+
+    if parsed_args.update:
+        baseline = {
+            name: {"time": timing, "calibration": calibration} for name, (timing, calibration) in timings.items()
+        }
+
+        with open(BASELINE_PATH, "w", encoding="utf-8") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, ensure_ascii=False)
+            baseline_file.write("\n")
+
+        print(f"baseline of {len(timings)} cases is written to {os.path.relpath(BASELINE_PATH)}")
+        return
+
+    regressions = compare(timings, load_baseline(), parsed_args.tolerance, parsed_args.min_slowdown)
+
+    if regressions:
+        sys.exit(f"{len(regressions)} of {len(timings)} cases are slower than the baseline by over the tolerance.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Measures the local search engine on a generated vault.
+
+The vault imitates a real one: titles are service names with qualifiers and
+account names, entries are spread over nested groups and have usernames,
+URLs and tags for field queries like "user:alice". Every query is run
+``--runs`` times and the median and the worst time are reported. The
+benchmark fails if the median of a query is over ``--budget``, or over
+``--field-budget`` for queries with field terms.
+
+Usage:
+    python benchmarks/search_engine.py [--entries 100000] [--runs 50] [--budget 5] [--field-budget 1] [query ...]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SOURCE_PATH)
+
+from search import SearchIndex, parse_query  # noqa: E402
+
+SERVICES = (
+    "GitHub GitLab Bitbucket Jira Confluence Slack Zoom Google Gmail Outlook Office365 Dropbox Box iCloud "
+    "Amazon AWS Azure DigitalOcean Heroku Netlify Vercel Cloudflare Namecheap GoDaddy PayPal Stripe Revolut "
+    "Wise Monzo Chase Barclays HSBC Santander Netflix Spotify Steam Twitch YouTube Twitter Facebook Instagram "
+    "LinkedIn Reddit Discord Telegram WhatsApp Signal Docker Kubernetes Jenkins Grafana Sentry Datadog "
+    "PagerDuty Okta Auth0 Vault Postgres MySQL Redis MongoDB Elastic Kafka RabbitMQ Nginx Apache Tomcat"
+).split()
+GROUPS = "Work Personal Finance Servers Databases Social Shopping Travel Family Archive".split()
+SUBGROUPS = "Production Staging Development Legacy Shared Team Admin Backup".split()
+QUALIFIERS = "admin root deploy backup personal work test api ci readonly".split()
+SYLLABLES = "ka lo mi ne ru sa ti vo ze pa do fi gu he ja".split()
+DOMAINS = "example.com corp.example.org mail.test".split()
+TAGS = "prod staging dev shared legacy 2fa".split()
+DEFAULT_QUERIES = [
+    "g",
+    "gi",
+    "git",
+    "github",
+    "githib",
+    "admin",
+    "dmin",
+    "prod github",
+    "post admin",
+    "g a",
+    "zzz",
+    "user:kalomi url:github",
+    "url:github tag:prod admin",
+    "tag:prod group:/work/production ci",
+    "user:ka tag:2fa group:finance",
+]
+
+
+class Entry:
+    __slots__ = ("path", "title", "username", "url", "tags")
+
+    def __init__(self, path, title, username, url, tags):
+        self.path = path
+        self.title = title
+        self.username = username
+        self.url = url
+        self.tags = tags
+
+
+def generate_entries(count, seed=0):
+    randomizer = random.Random(seed)
+
+    for _ in range(count):
+        service = randomizer.choice(SERVICES)
+        account = "".join(randomizer.choice(SYLLABLES) for _ in range(3))
+        title = f"{service} {randomizer.choice(QUALIFIERS)} {account}"
+        group = f"/{randomizer.choice(GROUPS)}/{randomizer.choice(SUBGROUPS)}"
+        username = f"{account}@{randomizer.choice(DOMAINS)}"
+        url = f"https://{randomizer.choice(['', 'www.', 'login.'])}{service.lower()}.com/{account}"
+        tags = ";".join(randomizer.sample(TAGS, randomizer.randint(0, 2)))
+        yield Entry(f"{group}/{title}", title, username, url, tags)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--budget", type=float, default=5.0, help="allowed median time of a query in milliseconds")
+    parser.add_argument(
+        "--field-budget", type=float, default=1.0, help="allowed median time of a query with field terms"
+    )
+    parser.add_argument("queries", nargs="*")
+
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = parse_args()
+
+    entries = list(generate_entries(parsed_args.entries))
+    started_at = time.perf_counter()
+    index = SearchIndex(entries)
+    print(f"index of {len(index)} entries built in {time.perf_counter() - started_at:.2f} s")
+
+    slow_queries = []
+
+    for query in parsed_args.queries or DEFAULT_QUERIES:
+        timings = []
+
+        for _ in range(parsed_args.runs):
+            started_at = time.perf_counter()
+            results = index.search(query)
+            timings.append((time.perf_counter() - started_at) * 1000)
+
+        median_time = statistics.median(timings)
+        budget = parsed_args.field_budget if parse_query(query)[1] else parsed_args.budget
+        verdict = "OVER BUDGET" if median_time > budget else "ok"
+        top = results[0].title if results else "-"
+        print(
+            f"{query!r:<38} median {median_time:7.3f} ms   max {max(timings):7.3f} ms   "
+            f"{len(results):>3} results, top: {top:<24} {verdict}"
+        )
+
+        if verdict != "ok":
+            slow_queries.append(query)
+
+    if slow_queries:
+        sys.exit(f"{len(slow_queries)} queries are over the budget: {', '.join(map(repr, slow_queries))}")
+
+
+if __name__ == "__main__":
+    main()
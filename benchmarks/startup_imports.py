@@ -0,0 +1,115 @@
+"""Measures the import time of a cold ``cli.py`` run and fails if it's over the budget.
+
+Every keystroke in Alfred starts a new Python process, so the modules imported
+before the handler runs are paid for on every keystroke. The benchmark runs
+the interpreter with ``-S`` and ``-X importtime`` the way the workflow does,
+imports cli.py and parses the arguments of the action, which imports the
+handlers. Compiled modules are warmed up first, like in the workflow directory
+after the first run.
+
+It also fails if the search path imports modules of other actions. The
+default budget leaves room for noise above the usual 55 ms, while imports of
+every action, like before they were split, take over 120 ms.
+
+Usage:
+    python benchmarks/startup_imports.py [--action search] [--runs 10] [--budget 80]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+FORBIDDEN_MODULES = [
+    "argparse",
+    "crypto",
+    "csv",
+    "kdbx",
+    "search",
+    "totp",
+    "traceback",
+    "urllib.request",
+    "webbrowser",
+    "xml.etree.ElementTree",
+]
+
+STARTUP_CODE = """
+import sys
+sys.path.insert(0, {source_path!r})
+import cli
+cli.parse_args([{action!r}, "query"])
+"""
+
+
+def run_python(action, pycache_prefix):
+    environment = dict(os.environ, PYTHONPYCACHEPREFIX=pycache_prefix)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    code = STARTUP_CODE.format(source_path=os.path.abspath(SOURCE_PATH), action=action)
+    command = [sys.executable, "-S", "-X", "importtime", "-c", code]
+    process = subprocess.run(command, env=environment, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    return parse_import_times(process.stderr)
+
+
+def parse_import_times(output):
+    """Returns imported modules and their cumulative import times in microseconds.
+
+    Names of nested imports keep their indentation.
+    """
+
+    import_times = {}
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        import_times[name[1:].rstrip()] = int(cumulative)
+
+    return import_times
+
+
+def get_total_time(import_times):
+    return sum(time for name, time in import_times.items() if not name.startswith(" ")) / 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--action", default="search")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=80, help="allowed median import time in milliseconds")
+
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = parse_args()
+
+    with tempfile.TemporaryDirectory() as pycache_prefix:
+        run_python(parsed_args.action, pycache_prefix)  # compiles the modules
+        runs = [run_python(parsed_args.action, pycache_prefix) for _ in range(parsed_args.runs)]
+
+    median_time = statistics.median(get_total_time(import_times) for import_times in runs)
+    imported_modules = {name.strip() for name in runs[-1]}
+    forbidden_modules = [name for name in FORBIDDEN_MODULES if name in imported_modules]
+
+    print("Slowest imports of the last run:")
+
+    for name, time in sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"{time / 1000:8.2f} ms  {name}")
+
+    print(f"Median import time of {parsed_args.action}: {median_time:.2f} ms, budget: {parsed_args.budget:.2f} ms")
+
+    if forbidden_modules:
+        print(f"Modules of other actions are imported: {', '.join(forbidden_modules)}")
+
+    if median_time > parsed_args.budget or forbidden_modules:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
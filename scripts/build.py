@@ -28,16 +28,25 @@ def make_alfred_file_from_source(source, version):
 def copy_source(source, destination):
     allowed_files = [
         "__init__.py",
+        "agent.py",
         "alfred.py",
         "cli.py",
         "clip.js",
         "conf.py",
+        "crypto.py",
         "handlers.py",
         "helpers.py",
+        "instrumentation.py",
         "icon.png",
         "info.plist",
+        "kdbx.py",
+        "processes.py",
+        "search.py",
         "services.py",
         "settings.js",
+        "singleflight.py",
+        "totp.py",
+        "usage.py",
     ]
 
     for allowed_file in allowed_files:
@@ -0,0 +1,403 @@
+"""Resident workflow agent.
+
+Every Alfred invocation of cli.py is a new Python process that imports the
+handlers, asks Keychain for the master password and unlocks the database
+before it can answer. The agent is a long-lived process that keeps all of it
+in memory: cli.py sends it the action and gets the script filter output back.
+
+Protocol
+--------
+
+The agent listens on a Unix domain socket. A client opens a connection,
+sends one request and reads one response. Both messages are framed the same
+way: a 4-byte unsigned big-endian length followed by that many bytes of a
+UTF-8 encoded JSON object.
+
+Request::
+
+    {"version": 1, "arguments": ["search", "query"], "environment": {"keepassxc_db_path": "...", ...}}
+
+Response::
+
+    {"version": 1, "output": "<script filter json>", "log": "", "error": null}
+
+``arguments`` are the command line arguments of cli.py and ``environment`` is
+the environment of the client process, so the agent always sees the settings
+that Alfred passed to the current run. A traced client adds its invocation
+ID to the environment, so the agent's part of the run joins its timeline.
+``log`` is what the handler wrote to stderr, the client writes it to its
+stderr for the Alfred debugger. ``error`` is a traceback if the handler
+failed; the output written before the failure is still returned.
+
+The socket lives in a directory available only to the current user, next to
+a lock file held by the running agent. The agent handles one request at a
+time and drops a waiting request if its client has already disconnected,
+e.g. when Alfred has stopped the run of a superseded query. It exits after
+``agent_idle_timeout`` seconds without requests.
+
+The client side runs on every keystroke, so the module imports only what the
+client needs, and even the socket module only when the agent is enabled. The
+modules used by the agent itself are imported in place.
+"""
+
+import json
+import os
+import struct
+import sys
+import typing as t
+
+import instrumentation
+from conf import settings
+
+if t.TYPE_CHECKING:
+    import socket
+
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+DEFAULT_IDLE_TIMEOUT = 600
+CONNECT_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 60
+AGENT_ACTIONS = ("search", "list_entries", "fetch", "totp", "totps", "settings_list")
+
+
+class AgentProtocolError(OSError):
+    """Raised when a message doesn't follow the agent protocol."""
+
+
+def get_socket_path() -> str:
+    """Returns a path of the agent socket.
+
+    Unix socket paths are limited to ~100 bytes on macOS, so the socket is
+    placed into the short per-user temporary directory instead of the Alfred
+    workflow cache directory.
+    """
+
+    directory = os.path.join(os.getenv("TMPDIR") or "/tmp", f"alfred-keepassxc-{os.getuid()}")
+    return os.path.join(directory, "agent.sock")
+
+
+def send_message(connection: "socket.socket", message: t.Dict[str, t.Any]) -> None:
+    """Sends a length-prefixed JSON message."""
+
+    payload = json.dumps(message).encode("utf-8")
+    connection.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def receive_message(connection: "socket.socket") -> t.Dict[str, t.Any]:
+    """Receives a length-prefixed JSON message."""
+
+    (size,) = HEADER.unpack(_receive_exactly(connection, HEADER.size))
+
+    if size > MAX_MESSAGE_SIZE:
+        raise AgentProtocolError(f"The message is too big: {size} bytes.")
+
+    message = json.loads(_receive_exactly(connection, size).decode("utf-8"))
+
+    if not isinstance(message, dict) or message.get("version") != PROTOCOL_VERSION:
+        raise AgentProtocolError("Unsupported message.")
+
+    return message
+
+
+def _receive_exactly(connection: "socket.socket", size: int) -> bytes:
+    chunks = []
+
+    while size:
+        chunk = connection.recv(min(size, 65536))
+
+        if not chunk:
+            raise AgentProtocolError("The connection has been closed before the message was received.")
+
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _is_disconnected(connection: "socket.socket") -> bool:
+    """Returns True if the peer has closed the connection, without waiting for data."""
+
+    import socket
+
+    timeout = connection.gettimeout()
+    connection.setblocking(False)
+
+    try:
+        return connection.recv(1, socket.MSG_PEEK) == b""
+    except BlockingIOError:
+        return False
+    finally:
+        connection.settimeout(timeout)
+
+
+class AgentClient:
+    """Sends workflow actions to the agent."""
+
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+
+    def request(self, arguments: t.List[str], environment: t.Dict[str, str]) -> t.Dict[str, t.Any]:
+        """Sends the action to the agent and returns its response.
+
+        OSError is raised if the agent isn't running or doesn't respond.
+        """
+
+        import socket
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(CONNECT_TIMEOUT)
+            connection.connect(self.socket_path)
+            connection.settimeout(REQUEST_TIMEOUT)
+            send_message(connection, {"version": PROTOCOL_VERSION, "arguments": arguments, "environment": environment})
+            return receive_message(connection)
+
+
+class Agent:
+    """Long-lived process handling workflow actions received over a Unix socket."""
+
+    def __init__(self, socket_path: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> None:
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self._server: t.Optional["socket.socket"] = None
+        self._lock_file: t.Optional[int] = None
+
+    def bind(self) -> None:
+        """Creates the listening socket.
+
+        The agent holds a lock on ``<socket path>.lock`` until it's closed, so
+        only one agent at a time replaces the socket file, and a socket file
+        found by the lock holder is left by a dead agent. If another agent
+        holds the lock, OSError is raised.
+        """
+
+        import fcntl
+        import socket
+
+        os.makedirs(os.path.dirname(self.socket_path), mode=0o700, exist_ok=True)
+        os.chmod(os.path.dirname(self.socket_path), 0o700)
+        lock_file = os.open(self.socket_path + ".lock", os.O_WRONLY | os.O_CREAT, 0o600)
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(lock_file)
+            raise OSError(f"Another agent is already listening on {self.socket_path}.") from None
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        previous_umask = os.umask(0o177)
+
+        try:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+            server.bind(self.socket_path)
+        except OSError:
+            server.close()
+            os.close(lock_file)
+            raise
+        finally:
+            os.umask(previous_umask)
+
+        server.listen(8)
+        server.settimeout(self.idle_timeout)
+        self._server = server
+        self._lock_file = lock_file
+
+    def serve(self) -> None:
+        """Handles requests until the agent has been idle for ``idle_timeout`` seconds."""
+
+        import socket
+
+        from services import (
+            client_pool,
+            entry_prefetcher,
+            keychain_password_cache,
+            search_index_cache,
+            search_results_cache,
+            totp_settings_cache,
+        )
+
+        if self._server is None:
+            self.bind()
+
+        caches = [
+            client_pool,
+            keychain_password_cache,
+            search_index_cache,
+            search_results_cache,
+            totp_settings_cache,
+            entry_prefetcher,
+        ]
+
+        for cache in caches:
+            cache.is_enabled = True
+
+        try:
+            while True:
+                try:
+                    connection, _ = self._server.accept()  # type: ignore
+                except socket.timeout:
+                    break
+
+                with connection:
+                    self._handle_connection(connection)
+        finally:
+            self.close()
+            entry_prefetcher.clear()
+            entry_prefetcher.join()
+            client_pool.clear()
+            keychain_password_cache.clear()
+            search_index_cache.clear()
+            search_results_cache.clear()
+            totp_settings_cache.clear()
+
+            for cache in caches:
+                cache.is_enabled = False
+
+    def close(self) -> None:
+        """Closes the listening socket, removes the socket file and releases the lock."""
+
+        if self._server is None:
+            return
+
+        self._server.close()
+        self._server = None
+
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+        # the lock file stays, a new agent may have opened it already
+        os.close(self._lock_file)  # type: ignore
+        self._lock_file = None
+
+    def _handle_connection(self, connection: "socket.socket") -> None:
+        import traceback
+
+        connection.settimeout(REQUEST_TIMEOUT)
+
+        try:
+            request = receive_message(connection)
+
+            if _is_disconnected(connection):
+                return  # nobody waits for the output, e.g. Alfred has stopped a superseded run
+
+            response = self.handle_request(request)
+            send_message(connection, response)
+        except (OSError, ValueError):
+            traceback.print_exc()
+
+    def handle_request(self, request: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        """Runs the requested action in the environment of the client and returns its output.
+
+        The request is recorded if the instrumentation is on in the settings
+        of the client. SystemExit raised by a termination signal isn't
+        caught, so the agent doesn't keep running with the database unlocked.
+        """
+
+        import contextlib
+        import io
+
+        import cli
+
+        os.environ.clear()
+        os.environ.update(request.get("environment") or {})
+        arguments = request.get("arguments") or []
+        output, log = io.StringIO(), io.StringIO()
+
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(log):
+            cli.enable_instrumentation(resident=True)
+
+            try:
+                error = self._run_action(arguments)
+            finally:
+                instrumentation.finish(arguments[0] if arguments else "")
+
+        return {"version": PROTOCOL_VERSION, "output": output.getvalue(), "log": log.getvalue(), "error": error}
+
+    @staticmethod
+    def _run_action(arguments: t.List[str]) -> t.Optional[str]:
+        """Runs the action and returns the traceback if it has failed."""
+
+        import traceback
+
+        import cli
+
+        try:
+            parsed_args = cli.parse_args(arguments)
+        except SystemExit:  # argparse exits on invalid arguments
+            return traceback.format_exc()
+
+        try:
+            with instrumentation.stage("handler"):
+                parsed_args.handler(parsed_args)
+        except Exception:
+            return traceback.format_exc()
+
+        return None
+
+
+def start_agent() -> None:
+    """Starts the agent in the background, detached from the current process."""
+
+    import subprocess
+
+    agent_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent.py")
+    subprocess.Popen(
+        [sys.executable, agent_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        close_fds=True,
+    )
+
+
+def forward_to_agent(arguments: t.List[str]) -> bool:
+    """Runs the action in the agent and writes its output to stdout and its log to stderr.
+
+    Returns False if the agent is disabled, can't run the action or doesn't
+    respond. If the agent isn't running, it's started for the next runs. A
+    busy agent isn't started again. In both cases the caller should run the
+    action in-process.
+    """
+
+    if not settings.USE_AGENT.value or not arguments or arguments[0] not in AGENT_ACTIONS:
+        return False
+
+    try:
+        response = AgentClient(get_socket_path()).request(arguments, {**os.environ, **instrumentation.get_variables()})
+    except (FileNotFoundError, ConnectionRefusedError):
+        start_agent()
+        return False
+    except OSError:
+        return False
+
+    sys.stdout.write(response.get("output") or "")
+    sys.stdout.flush()
+    sys.stderr.write(response.get("log") or "")
+
+    if response.get("error"):
+        sys.stderr.write(response["error"])
+
+    return True
+
+
+def main() -> None:
+    import processes
+
+    processes.install_signal_handlers()
+    agent = Agent(get_socket_path(), idle_timeout=settings.AGENT_IDLE_TIMEOUT.value or DEFAULT_IDLE_TIMEOUT)
+
+    try:
+        agent.bind()
+    except OSError:
+        return  # another agent has been started in the meantime
+
+    agent.serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import json
 import sys
 import typing as t
 
+import instrumentation
+
 
 class AlfredModActionEnum:
     CMD = "cmd"
@@ -25,17 +27,56 @@ class AlfredMod:
 
 
 class AlfredScriptFilter:
-    """Interface for working with the Alfred's script filter."""
+    """Interface for working with the Alfred's script filter.
+
+    The output isn't cached by Alfred unless ``set_cache`` is called, so
+    output with secrets must never call it.
+    """
+
+    MIN_CACHE_SECONDS = 5
+    MAX_CACHE_SECONDS = 86400
 
     def __init__(self) -> None:
         self.items: t.List[t.Dict[str, t.Any]] = []
         self.variables: t.Dict[str, str] = {}
+        self.rerun: t.Optional[float] = None
+        self.cache: t.Optional[t.Dict[str, t.Any]] = None
+        self.skip_knowledge = False
 
     def add_variable(self, key: str, value: str) -> None:
         """Adds a passed variable to "variables" key for the Alfred's script filter."""
 
         self.variables[key] = value
 
+    def set_rerun(self, interval: float) -> None:
+        """Asks Alfred to run the script filter again after the interval (0.1-5.0 seconds).
+
+        Variables of the script filter are passed to the next run.
+        """
+
+        self.rerun = interval
+
+    def set_cache(self, seconds: int, loose_reload: bool = False) -> None:
+        """Asks Alfred 5 to cache the output for the given number of seconds (5-86400).
+
+        With ``loose_reload`` Alfred shows the cached output at once and runs
+        the script filter in the background to replace it. Older versions of
+        Alfred ignore it.
+        """
+
+        if not self.MIN_CACHE_SECONDS <= seconds <= self.MAX_CACHE_SECONDS:
+            raise ValueError(f"Alfred caches output for 5-86400 seconds, not {seconds}.")
+
+        self.cache = {"seconds": seconds}
+
+        if loose_reload:
+            self.cache["loosereload"] = True
+
+    def set_skip_knowledge(self) -> None:
+        """Asks Alfred 5 to keep the order of items and not to learn from the selected ones."""
+
+        self.skip_knowledge = True
+
     def add_item(
         self,
         title: str,
@@ -43,10 +84,15 @@ class AlfredScriptFilter:
         is_valid: bool = True,
         arg: t.Optional[str] = None,
         mods: t.Optional[t.List[AlfredMod]] = None,
+        uid: t.Optional[str] = None,
+        match: t.Optional[str] = None,
     ) -> None:
         """
         Forms item data with specific format for the Alfred's script filter
         and adds to "items" key.
+
+        ``uid`` lets Alfred learn which items are chosen and sort them first,
+        ``match`` replaces the title when Alfred filters the items itself.
         """
 
         prepared_mods = {
@@ -60,6 +106,8 @@ class AlfredScriptFilter:
             "valid": is_valid,
             "arg": arg,
             "mods": prepared_mods,
+            "uid": uid,
+            "match": match,
         }
 
         item = {k: v for k, v in item.items() if v is not None}
@@ -72,9 +120,20 @@ class AlfredScriptFilter:
         """
 
         data: t.Dict[str, t.Any] = {"items": self.items}
+        variables = {**self.variables, **instrumentation.get_variables()}
+
+        if variables:
+            data["variables"] = variables
+
+        if self.rerun:
+            data["rerun"] = self.rerun
+
+        if self.cache:
+            data["cache"] = self.cache
 
-        if self.variables:
-            data["variables"] = self.variables
+        if self.skip_knowledge:
+            data["skipknowledge"] = True
 
-        json.dump(data, sys.stdout)
-        sys.stdout.flush()
+        with instrumentation.stage("send"):
+            json.dump(data, sys.stdout)
+            sys.stdout.flush()
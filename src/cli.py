@@ -1,22 +1,22 @@
-import argparse
-import traceback
+import sys
+import types
 import typing as t
 
-from handlers import (
-    check_for_updates_handler,
-    fetch_handler,
-    list_settings_handler,
-    open_url_handler,
-    search_handler,
-    totp_handler,
-)
+import instrumentation
+from agent import forward_to_agent
+from conf import settings
+
+if t.TYPE_CHECKING:
+    import argparse
 
 
 class CLIActions:
     SEARCH = "search"
+    LIST_ENTRIES = "list_entries"
     FETCH = "fetch"
     SETTINGS_LIST = "settings_list"
     TOTP = "totp"
+    TOTPS = "totps"
     CHECK_FOR_UPDATES = "check_for_updates"
     OPEN_URL = "open_url"
 
@@ -24,44 +24,122 @@ class CLIActions:
     def choices(cls) -> t.List[str]:
         """Returns an action list."""
 
-        return [cls.SEARCH, cls.FETCH, cls.SETTINGS_LIST, cls.TOTP, cls.CHECK_FOR_UPDATES, cls.OPEN_URL]
+        return [
+            cls.SEARCH,
+            cls.LIST_ENTRIES,
+            cls.FETCH,
+            cls.SETTINGS_LIST,
+            cls.TOTP,
+            cls.TOTPS,
+            cls.CHECK_FOR_UPDATES,
+            cls.OPEN_URL,
+        ]
+
+
+# action: (handler in the handlers module, required arguments, optional arguments)
+ACTION_HANDLERS: t.Dict[str, t.Tuple[str, t.Tuple[str, ...], t.Tuple[str, ...]]] = {
+    CLIActions.SEARCH: ("search_handler", ("query",), ()),
+    CLIActions.LIST_ENTRIES: ("list_entries_handler", (), ()),
+    CLIActions.FETCH: ("fetch_handler", ("query",), ()),
+    CLIActions.SETTINGS_LIST: ("list_settings_handler", (), ()),
+    CLIActions.TOTP: ("totp_handler", ("query",), ()),
+    CLIActions.TOTPS: ("totps_handler", (), ("query",)),
+    CLIActions.CHECK_FOR_UPDATES: ("check_for_updates_handler", (), ()),
+    CLIActions.OPEN_URL: ("open_url_handler", ("url",), ()),
+}
+
+
+def parse_args(arguments: t.Optional[t.List[str]] = None) -> t.Any:
+    """Returns the handler of the action and its arguments.
+
+    Alfred always passes an action and its arguments, so they're looked up in
+    ACTION_HANDLERS without importing argparse and building all subparsers.
+    Anything else goes to the argparse parser, which prints the usage.
+    Optional arguments are empty strings by default.
+    """
+
+    arguments = sys.argv[1:] if arguments is None else arguments
+    action, values = (arguments[0], arguments[1:]) if arguments else ("", [])
+
+    if action not in ACTION_HANDLERS:
+        return build_parser().parse_args(arguments)
+
+    handler_name, required_names, optional_names = ACTION_HANDLERS[action]
+
+    if not len(required_names) <= len(values) <= len(required_names) + len(optional_names):
+        return build_parser().parse_args(arguments)
+
+    # handlers are imported here because the actions forwarded to the agent don't need them
+    import handlers
+
+    parsed_args = types.SimpleNamespace(**dict.fromkeys(optional_names, ""))
+    parsed_args.__dict__.update(zip(required_names + optional_names, values))
+    parsed_args.handler = getattr(handlers, handler_name)
 
+    return parsed_args
+
+
+def build_parser() -> "argparse.ArgumentParser":
+    """Builds the argparse parser of all actions. It's used for invalid arguments only."""
+
+    import argparse
+
+    import handlers
 
-def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers()
 
-    search_parse = subparsers.add_parser(CLIActions.SEARCH)
-    search_parse.set_defaults(handler=search_handler, action=CLIActions.SEARCH)
-    search_parse.add_argument("query")
+    for action in CLIActions.choices():
+        handler_name, required_names, optional_names = ACTION_HANDLERS[action]
+        action_parser = subparsers.add_parser(action)
+        action_parser.set_defaults(handler=getattr(handlers, handler_name))
 
-    fetch_parser = subparsers.add_parser(CLIActions.FETCH)
-    fetch_parser.set_defaults(handler=fetch_handler, action=CLIActions.FETCH)
-    fetch_parser.add_argument("query")
+        for name in required_names:
+            action_parser.add_argument(name)
 
-    settings_list_parser = subparsers.add_parser(CLIActions.SETTINGS_LIST)
-    settings_list_parser.set_defaults(handler=list_settings_handler)
+        for name in optional_names:
+            action_parser.add_argument(name, nargs="?", default="")
 
-    totp_parser = subparsers.add_parser(CLIActions.TOTP)
-    totp_parser.set_defaults(handler=totp_handler)
-    totp_parser.add_argument("query")
+    return parser
 
-    check_for_updates_parser = subparsers.add_parser(CLIActions.CHECK_FOR_UPDATES)
-    check_for_updates_parser.set_defaults(handler=check_for_updates_handler)
 
-    open_url_parser = subparsers.add_parser(CLIActions.OPEN_URL)
-    open_url_parser.set_defaults(handler=open_url_handler)
-    open_url_parser.add_argument("url")
+def enable_instrumentation(resident: bool = False) -> None:
+    """Starts recording the run if the instrumentation is on in the settings."""
 
-    return parser.parse_args()
+    if settings.INSTRUMENTATION.value or settings.INSTRUMENTATION_TRACE.value:
+        instrumentation.enable(
+            profile=bool(settings.INSTRUMENTATION_PROFILE.value),
+            trace=bool(settings.INSTRUMENTATION_TRACE.value),
+            resident=resident,
+        )
 
 
 def main() -> None:
-    parsed_args = parse_args()
+    enable_instrumentation()
 
     try:
-        parsed_args.handler(parsed_args)
+        run()
+    finally:
+        instrumentation.finish(sys.argv[1] if len(sys.argv) > 1 else "")
+
+
+def run() -> None:
+    with instrumentation.stage("agent"):
+        if forward_to_agent(sys.argv[1:]):
+            return
+
+    with instrumentation.stage("imports"):
+        import processes
+
+        processes.install_signal_handlers()  # subprocesses of a run terminated by Alfred die with it
+        parsed_args = parse_args()
+
+    try:
+        with instrumentation.stage("handler"):
+            parsed_args.handler(parsed_args)
     except Exception:
+        import traceback
+
         traceback.print_exc()
 
 
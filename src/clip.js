@@ -8,7 +8,48 @@ function* integerIncrementer(start, end) {
 }
 
 
+function getenv(envName) {
+	try {
+		return $.getenv(envName)
+	} catch (e) {}
+}
+
+
+/*
+ * Appends the span of the copying to the trace of the invocation
+ * started by the script filters, see instrumentation.py. The trace
+ * file is created by them, so nothing is written without it.
+ */
+function traceCopying(startedAt) {
+	let invocationId = getenv("INVOCATION_ID")
+	let isTraced = ["1", "true", "yes"].includes((getenv("instrumentation_trace") || "").toLowerCase())
+
+	if (!invocationId || !isTraced) {
+		return
+	}
+
+	let path = `${getenv("alfred_workflow_data")}/trace-${invocationId}.json`
+	let traceFile = $.NSFileHandle.fileHandleForWritingAtPath(path)
+
+	if (traceFile.isNil()) {
+		return
+	}
+
+	let pid = $.NSProcessInfo.processInfo.processIdentifier
+	let events = [
+		{name: "clip.js", ph: "X", ts: startedAt * 1000, dur: (Date.now() - startedAt) * 1000, pid: pid, tid: pid},
+		{name: "process_name", ph: "M", ts: startedAt * 1000, pid: pid, tid: pid, args: {name: "clip.js"}},
+	]
+	let lines = events.map(event => JSON.stringify(event) + ",\n").join("")
+
+	traceFile.seekToEndOfFile
+	traceFile.writeData($(lines).dataUsingEncoding($.NSUTF8StringEncoding))
+	traceFile.closeFile
+}
+
+
 function run(argv) {
+	let startedAt = Date.now()
 	let userValueForClipboard = argv[0]
 	let utf8PlainTextType = "public.utf8-plain-text"
 	let userTimeout = parseInt(argv[1])
@@ -17,6 +58,7 @@ function run(argv) {
 	pasteBoard.clearContents
 	pasteBoard.setStringForType('', 'org.nspasteboard.ConcealedType')  //http://nspasteboard.org
 	pasteBoard.setStringForType(userValueForClipboard, utf8PlainTextType)
+	traceCopying(startedAt)
 
 	if (!userTimeout) {
 		return
@@ -73,6 +73,8 @@ class Settings(metaclass=SettingsMeta):
     KEEPASSXC_DB_PATH = SettingsAttr(env_name="keepassxc_db_path", required=True)
     KEEPASSXC_MASTER_PASSWORD = SettingsAttr(env_name="keepassxc_master_password")
     KEEPASSXC_KEYFILE_PATH = SettingsAttr(env_name="keepassxc_keyfile_path")
+    KEEPASSXC_BACKEND = SettingsAttr(env_name="keepassxc_backend")
+    KEEPASSXC_VAULTS = SettingsAttr(env_name="keepassxc_vaults")
     KEYCHAIN_ACCOUNT = SettingsAttr(env_name="keychain_account", required=True)
     KEYCHAIN_SERVICE = SettingsAttr(env_name="keychain_service", required=True)
     SHOW_ATTRIBUTE_VALUES = SettingsAttr(env_name="show_attribute_values", cast_to=cast_value_to_bool)
@@ -83,6 +85,18 @@ class Settings(metaclass=SettingsMeta):
     PYTHON_PATH = SettingsAttr(env_name="python_path", required=True)
     SHOW_TOTP_REQUEST = SettingsAttr(env_name="show_totp_request", cast_to=cast_value_to_bool)
     CLIPBOARD_TIMEOUT = SettingsAttr(env_name="clipboard_timeout", cast_to=int)
+    USE_AGENT = SettingsAttr(env_name="use_agent", cast_to=cast_value_to_bool)
+    AGENT_IDLE_TIMEOUT = SettingsAttr(env_name="agent_idle_timeout", cast_to=int)
+    SUBPROCESS_TIMEOUT = SettingsAttr(env_name="subprocess_timeout", cast_to=int)
+    USE_LOCAL_SEARCH = SettingsAttr(env_name="use_local_search", cast_to=cast_value_to_bool)
+    SEARCH_CACHE_TTL = SettingsAttr(env_name="search_cache_ttl", cast_to=int)
+    SEARCH_CACHE_DIR = SettingsAttr(env_name="search_cache_dir")
+    PREFETCH_ENTRIES = SettingsAttr(env_name="prefetch_entries", cast_to=int)
+    RECENT_ENTRIES = SettingsAttr(env_name="recent_entries", cast_to=int)
+    ALFRED_FILTERING_MAX_ENTRIES = SettingsAttr(env_name="alfred_filtering_max_entries", cast_to=int)
+    INSTRUMENTATION = SettingsAttr(env_name="instrumentation", cast_to=cast_value_to_bool)
+    INSTRUMENTATION_PROFILE = SettingsAttr(env_name="instrumentation_profile", cast_to=cast_value_to_bool)
+    INSTRUMENTATION_TRACE = SettingsAttr(env_name="instrumentation_trace", cast_to=cast_value_to_bool)
 
     def validate(self) -> None:
         """
@@ -0,0 +1,656 @@
+"""Pure Python implementations of the primitives used by KeePass databases.
+
+The workflow has no dependencies, so the ciphers (AES-256, ChaCha20, Salsa20)
+and the key derivation functions (AES-KDF, Argon2d, Argon2id) are implemented
+here. They are much slower than native code, which matters for the key
+derivation only: it's tuned to take about a second in KeePassXC. If
+``argon2-cffi`` or ``pycryptodomex`` are importable, they are used instead.
+"""
+
+import hashlib
+import struct
+import sys
+import typing as t
+
+
+def _import_accelerator(module_name: str) -> t.Any:
+    """Imports an optional native module or returns None if it isn't installed.
+
+    The workflow runs Python with -S, so site-packages aren't on sys.path.
+    Their directories are added only while the module is imported, so the
+    paths and the imports of the rest of the process don't change.
+    """
+
+    import importlib
+
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        if not sys.flags.no_site:
+            return None
+
+    import site  # with -S importing it doesn't change sys.path
+
+    saved_path = sys.path[:]
+    sys.path += [path for path in [*site.getsitepackages(), site.getusersitepackages()] if path not in sys.path]
+
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+    finally:
+        sys.path[:] = saved_path
+
+
+_NativeAES = _import_accelerator("Cryptodome.Cipher.AES")
+_NativeChaCha20 = _import_accelerator("Cryptodome.Cipher.ChaCha20")
+_native_argon2_module = _import_accelerator("argon2.low_level")
+_NativeArgon2Type: t.Any = _native_argon2_module.Type if _native_argon2_module else None
+_native_argon2: t.Any = _native_argon2_module.hash_secret_raw if _native_argon2_module else None
+
+
+class CryptoError(ValueError):
+    pass
+
+
+def xor_bytes(data: bytes, key_stream: bytes) -> bytes:
+    """XORs two byte strings of the same length."""
+
+    size = len(data)
+    result = int.from_bytes(data, "little") ^ int.from_bytes(key_stream[:size], "little")
+    return result.to_bytes(size, "little")
+
+
+# AES
+
+
+def _build_aes_tables() -> t.Tuple[t.List[int], ...]:
+    exp, log = [0] * 512, [0] * 256
+    value = 1
+
+    for power in range(255):  # 3 is a generator of GF(2^8)
+        exp[power] = value
+        log[value] = power
+        value ^= (value << 1) ^ (0x1B if value & 0x80 else 0)
+        value &= 0xFF
+
+    for power in range(255, 512):
+        exp[power] = exp[power - 255]
+
+    def multiply(a: int, b: int) -> int:
+        return exp[log[a] + log[b]] if a and b else 0
+
+    sbox, inverse_sbox = [0] * 256, [0] * 256
+
+    for byte in range(256):
+        inverse = exp[255 - log[byte]] if byte else 0
+        substituted = inverse
+
+        for shift in range(1, 5):
+            substituted ^= ((inverse << shift) | (inverse >> (8 - shift))) & 0xFF
+
+        substituted ^= 0x63
+        sbox[byte] = substituted
+        inverse_sbox[substituted] = byte
+
+    te0, td0 = [0] * 256, [0] * 256
+
+    for byte in range(256):
+        s, i = sbox[byte], inverse_sbox[byte]
+        te0[byte] = (multiply(s, 2) << 24) | (s << 16) | (s << 8) | multiply(s, 3)
+        td0[byte] = (multiply(i, 14) << 24) | (multiply(i, 9) << 16) | (multiply(i, 13) << 8) | multiply(i, 11)
+
+    def rotate(table: t.List[int], bits: int) -> t.List[int]:
+        return [((word >> bits) | (word << (32 - bits))) & 0xFFFFFFFF for word in table]
+
+    te1, te2, te3 = rotate(te0, 8), rotate(te0, 16), rotate(te0, 24)
+    td1, td2, td3 = rotate(td0, 8), rotate(td0, 16), rotate(td0, 24)
+
+    return sbox, inverse_sbox, te0, te1, te2, te3, td0, td1, td2, td3
+
+
+_SBOX, _INV_SBOX, _TE0, _TE1, _TE2, _TE3, _TD0, _TD1, _TD2, _TD3 = _build_aes_tables()
+
+
+class AES:
+    """AES block cipher with 128, 192 or 256-bit keys."""
+
+    block_size = 16
+
+    def __init__(self, key: bytes) -> None:
+        if len(key) not in (16, 24, 32):
+            raise CryptoError("AES key must be 16, 24 or 32 bytes long.")
+
+        self.key = key
+        self.rounds = len(key) // 4 + 6
+        self._encryption_keys = self._expand_key(key)
+        self._decryption_keys = self._invert_keys(self._encryption_keys)
+
+    def _expand_key(self, key: bytes) -> t.List[int]:
+        key_words = len(key) // 4
+        words = list(struct.unpack(f">{key_words}I", key))
+        round_constant = 1
+
+        for index in range(key_words, 4 * (self.rounds + 1)):
+            word = words[index - 1]
+
+            if index % key_words == 0:
+                word = ((word << 8) | (word >> 24)) & 0xFFFFFFFF
+                word = self._substitute_word(word) ^ (round_constant << 24)
+                round_constant = (round_constant << 1) ^ (0x11B if round_constant & 0x80 else 0)
+            elif key_words > 6 and index % key_words == 4:
+                word = self._substitute_word(word)
+
+            words.append(words[index - key_words] ^ word)
+
+        return words
+
+    @staticmethod
+    def _substitute_word(word: int) -> int:
+        return (
+            (_SBOX[word >> 24] << 24)
+            | (_SBOX[(word >> 16) & 0xFF] << 16)
+            | (_SBOX[(word >> 8) & 0xFF] << 8)
+            | _SBOX[word & 0xFF]
+        )
+
+    def _invert_keys(self, words: t.List[int]) -> t.List[int]:
+        """Builds the round keys for the equivalent inverse cipher."""
+
+        inverted = []
+
+        for round_index in range(self.rounds, -1, -1):
+            round_keys = words[4 * round_index : 4 * round_index + 4]  # noqa: E203
+
+            if 0 < round_index < self.rounds:
+                round_keys = [
+                    _TD0[_SBOX[w >> 24]]
+                    ^ _TD1[_SBOX[(w >> 16) & 0xFF]]
+                    ^ _TD2[_SBOX[(w >> 8) & 0xFF]]
+                    ^ _TD3[_SBOX[w & 0xFF]]
+                    for w in round_keys
+                ]
+
+            inverted.extend(round_keys)
+
+        return inverted
+
+    def encrypt_block(self, block: bytes) -> bytes:
+        keys = self._encryption_keys
+        s0, s1, s2, s3 = struct.unpack(">4I", block)
+        s0, s1, s2, s3 = s0 ^ keys[0], s1 ^ keys[1], s2 ^ keys[2], s3 ^ keys[3]
+        te0, te1, te2, te3 = _TE0, _TE1, _TE2, _TE3
+
+        for offset in range(4, 4 * self.rounds, 4):
+            s0, s1, s2, s3 = (
+                te0[s0 >> 24] ^ te1[(s1 >> 16) & 0xFF] ^ te2[(s2 >> 8) & 0xFF] ^ te3[s3 & 0xFF] ^ keys[offset],
+                te0[s1 >> 24] ^ te1[(s2 >> 16) & 0xFF] ^ te2[(s3 >> 8) & 0xFF] ^ te3[s0 & 0xFF] ^ keys[offset + 1],
+                te0[s2 >> 24] ^ te1[(s3 >> 16) & 0xFF] ^ te2[(s0 >> 8) & 0xFF] ^ te3[s1 & 0xFF] ^ keys[offset + 2],
+                te0[s3 >> 24] ^ te1[(s0 >> 16) & 0xFF] ^ te2[(s1 >> 8) & 0xFF] ^ te3[s2 & 0xFF] ^ keys[offset + 3],
+            )
+
+        sbox, offset = _SBOX, 4 * self.rounds
+        return struct.pack(
+            ">4I",
+            ((sbox[s0 >> 24] << 24) | (sbox[(s1 >> 16) & 0xFF] << 16) | (sbox[(s2 >> 8) & 0xFF] << 8) | sbox[s3 & 0xFF])
+            ^ keys[offset],
+            ((sbox[s1 >> 24] << 24) | (sbox[(s2 >> 16) & 0xFF] << 16) | (sbox[(s3 >> 8) & 0xFF] << 8) | sbox[s0 & 0xFF])
+            ^ keys[offset + 1],
+            ((sbox[s2 >> 24] << 24) | (sbox[(s3 >> 16) & 0xFF] << 16) | (sbox[(s0 >> 8) & 0xFF] << 8) | sbox[s1 & 0xFF])
+            ^ keys[offset + 2],
+            ((sbox[s3 >> 24] << 24) | (sbox[(s0 >> 16) & 0xFF] << 16) | (sbox[(s1 >> 8) & 0xFF] << 8) | sbox[s2 & 0xFF])
+            ^ keys[offset + 3],
+        )
+
+    def decrypt_block(self, block: bytes) -> bytes:
+        keys = self._decryption_keys
+        s0, s1, s2, s3 = struct.unpack(">4I", block)
+        s0, s1, s2, s3 = s0 ^ keys[0], s1 ^ keys[1], s2 ^ keys[2], s3 ^ keys[3]
+        td0, td1, td2, td3 = _TD0, _TD1, _TD2, _TD3
+
+        for offset in range(4, 4 * self.rounds, 4):
+            s0, s1, s2, s3 = (
+                td0[s0 >> 24] ^ td1[(s3 >> 16) & 0xFF] ^ td2[(s2 >> 8) & 0xFF] ^ td3[s1 & 0xFF] ^ keys[offset],
+                td0[s1 >> 24] ^ td1[(s0 >> 16) & 0xFF] ^ td2[(s3 >> 8) & 0xFF] ^ td3[s2 & 0xFF] ^ keys[offset + 1],
+                td0[s2 >> 24] ^ td1[(s1 >> 16) & 0xFF] ^ td2[(s0 >> 8) & 0xFF] ^ td3[s3 & 0xFF] ^ keys[offset + 2],
+                td0[s3 >> 24] ^ td1[(s2 >> 16) & 0xFF] ^ td2[(s1 >> 8) & 0xFF] ^ td3[s0 & 0xFF] ^ keys[offset + 3],
+            )
+
+        sbox, offset = _INV_SBOX, 4 * self.rounds
+        return struct.pack(
+            ">4I",
+            ((sbox[s0 >> 24] << 24) | (sbox[(s3 >> 16) & 0xFF] << 16) | (sbox[(s2 >> 8) & 0xFF] << 8) | sbox[s1 & 0xFF])
+            ^ keys[offset],
+            ((sbox[s1 >> 24] << 24) | (sbox[(s0 >> 16) & 0xFF] << 16) | (sbox[(s3 >> 8) & 0xFF] << 8) | sbox[s2 & 0xFF])
+            ^ keys[offset + 1],
+            ((sbox[s2 >> 24] << 24) | (sbox[(s1 >> 16) & 0xFF] << 16) | (sbox[(s0 >> 8) & 0xFF] << 8) | sbox[s3 & 0xFF])
+            ^ keys[offset + 2],
+            ((sbox[s3 >> 24] << 24) | (sbox[(s2 >> 16) & 0xFF] << 16) | (sbox[(s1 >> 8) & 0xFF] << 8) | sbox[s0 & 0xFF])
+            ^ keys[offset + 3],
+        )
+
+
+def aes_cbc_decrypt(key: bytes, iv: bytes, data: bytes) -> bytes:
+    """Decrypts AES-CBC data and removes PKCS#7 padding."""
+
+    if not data or len(data) % 16:
+        raise CryptoError("AES-CBC data length must be a multiple of 16.")
+
+    if _NativeAES is not None:
+        plain = _NativeAES.new(key, _NativeAES.MODE_CBC, iv).decrypt(data)
+    else:
+        cipher, previous, blocks = AES(key), iv, []
+
+        for offset in range(0, len(data), 16):
+            block = data[offset : offset + 16]  # noqa: E203
+            blocks.append(xor_bytes(cipher.decrypt_block(block), previous))
+            previous = block
+
+        plain = b"".join(blocks)
+
+    padding = plain[-1]
+
+    if not 1 <= padding <= 16 or plain[-padding:] != bytes([padding]) * padding:
+        raise CryptoError("Invalid padding. The key is probably wrong.")
+
+    return plain[:-padding]
+
+
+def aes_kdf(key: bytes, seed: bytes, rounds: int) -> bytes:
+    """AES-KDF: encrypts the key with AES-256-ECB ``rounds`` times and hashes the result."""
+
+    if _NativeAES is not None:
+        cipher = _NativeAES.new(seed, _NativeAES.MODE_ECB)
+        encrypt = cipher.encrypt
+
+        for _ in range(rounds):
+            key = encrypt(key)
+    else:
+        encrypt_block = AES(seed).encrypt_block
+        left, right = key[:16], key[16:]
+
+        for _ in range(rounds):
+            left, right = encrypt_block(left), encrypt_block(right)
+
+        key = left + right
+
+    return hashlib.sha256(key).digest()
+
+
+# ChaCha20 and Salsa20
+
+_MASK32 = 0xFFFFFFFF
+
+
+def _chacha20_block(state: t.List[int]) -> bytes:
+    x = list(state)
+
+    def quarter_round(a: int, b: int, c: int, d: int) -> None:
+        x[a] = (x[a] + x[b]) & _MASK32
+        x[d] ^= x[a]
+        x[d] = ((x[d] << 16) | (x[d] >> 16)) & _MASK32
+        x[c] = (x[c] + x[d]) & _MASK32
+        x[b] ^= x[c]
+        x[b] = ((x[b] << 12) | (x[b] >> 20)) & _MASK32
+        x[a] = (x[a] + x[b]) & _MASK32
+        x[d] ^= x[a]
+        x[d] = ((x[d] << 8) | (x[d] >> 24)) & _MASK32
+        x[c] = (x[c] + x[d]) & _MASK32
+        x[b] ^= x[c]
+        x[b] = ((x[b] << 7) | (x[b] >> 25)) & _MASK32
+
+    for _ in range(10):
+        quarter_round(0, 4, 8, 12)
+        quarter_round(1, 5, 9, 13)
+        quarter_round(2, 6, 10, 14)
+        quarter_round(3, 7, 11, 15)
+        quarter_round(0, 5, 10, 15)
+        quarter_round(1, 6, 11, 12)
+        quarter_round(2, 7, 8, 13)
+        quarter_round(3, 4, 9, 14)
+
+    return struct.pack("<16I", *((x[i] + state[i]) & _MASK32 for i in range(16)))
+
+
+def _salsa20_block(state: t.List[int]) -> bytes:
+    x = list(state)
+
+    def quarter_round(a: int, b: int, c: int, d: int) -> None:
+        value = (x[a] + x[d]) & _MASK32
+        x[b] ^= ((value << 7) | (value >> 25)) & _MASK32
+        value = (x[b] + x[a]) & _MASK32
+        x[c] ^= ((value << 9) | (value >> 23)) & _MASK32
+        value = (x[c] + x[b]) & _MASK32
+        x[d] ^= ((value << 13) | (value >> 19)) & _MASK32
+        value = (x[d] + x[c]) & _MASK32
+        x[a] ^= ((value << 18) | (value >> 14)) & _MASK32
+
+    for _ in range(10):
+        quarter_round(0, 4, 8, 12)
+        quarter_round(5, 9, 13, 1)
+        quarter_round(10, 14, 2, 6)
+        quarter_round(15, 3, 7, 11)
+        quarter_round(0, 1, 2, 3)
+        quarter_round(5, 6, 7, 4)
+        quarter_round(10, 11, 8, 9)
+        quarter_round(15, 12, 13, 14)
+
+    return struct.pack("<16I", *((x[i] + state[i]) & _MASK32 for i in range(16)))
+
+
+class StreamCipher:
+    """Base class for stream ciphers producing the key stream in 64-byte blocks.
+
+    The key stream is consumed continuously, so the class can be used for the
+    protected values of KeePass databases, which are decrypted one by one.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = b""
+
+    def _next_block(self) -> bytes:
+        raise NotImplementedError
+
+    def key_stream(self, size: int) -> bytes:
+        blocks = [self._buffer]
+        available = len(self._buffer)
+
+        while available < size:
+            block = self._next_block()
+            blocks.append(block)
+            available += len(block)
+
+        stream = b"".join(blocks)
+        self._buffer = stream[size:]
+        return stream[:size]
+
+    def process(self, data: bytes) -> bytes:
+        """Encrypts or decrypts data, it's the same operation for stream ciphers."""
+
+        return xor_bytes(data, self.key_stream(len(data)))
+
+
+class ChaCha20(StreamCipher):
+    """ChaCha20 from RFC 8439 with a 96-bit nonce."""
+
+    def __init__(self, key: bytes, nonce: bytes, counter: int = 0) -> None:
+        super().__init__()
+
+        if len(key) != 32 or len(nonce) != 12:
+            raise CryptoError("ChaCha20 requires a 32-byte key and a 12-byte nonce.")
+
+        self._state = [0x61707865, 0x3320646E, 0x79622D32, 0x6B206574]
+        self._state += list(struct.unpack("<8I", key)) + [counter] + list(struct.unpack("<3I", nonce))
+        self._native = None
+
+        if _NativeChaCha20 is not None and counter == 0:
+            self._native = _NativeChaCha20.new(key=key, nonce=nonce)
+
+    def _next_block(self) -> bytes:
+        block = _chacha20_block(self._state)
+        self._state[12] = (self._state[12] + 1) & _MASK32
+        return block
+
+    def process(self, data: bytes) -> bytes:
+        if self._native is not None:
+            return self._native.decrypt(data)
+
+        return super().process(data)
+
+
+class Salsa20(StreamCipher):
+    """Salsa20/20 with a 256-bit key and a 64-bit nonce."""
+
+    def __init__(self, key: bytes, nonce: bytes) -> None:
+        super().__init__()
+
+        if len(key) != 32 or len(nonce) != 8:
+            raise CryptoError("Salsa20 requires a 32-byte key and an 8-byte nonce.")
+
+        k = struct.unpack("<8I", key)
+        n = struct.unpack("<2I", nonce)
+        self._state = [
+            0x61707865, k[0], k[1], k[2],
+            k[3], 0x3320646E, n[0], n[1],
+            0, 0, 0x79622D32, k[4],
+            k[5], k[6], k[7], 0x6B206574,
+        ]  # fmt: skip
+
+    def _next_block(self) -> bytes:
+        block = _salsa20_block(self._state)
+        self._state[8] = (self._state[8] + 1) & _MASK32
+
+        if self._state[8] == 0:
+            self._state[9] = (self._state[9] + 1) & _MASK32
+
+        return block
+
+
+# Argon2
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+ARGON2D = 0
+ARGON2ID = 2
+_ARGON2_SYNC_POINTS = 4
+
+
+def _blake2b_long(data: bytes, size: int) -> bytes:
+    """Variable-length hash function H' from RFC 9106."""
+
+    prefix = struct.pack("<I", size)
+
+    if size <= 64:
+        return hashlib.blake2b(prefix + data, digest_size=size).digest()
+
+    chunk = hashlib.blake2b(prefix + data).digest()
+    result = [chunk[:32]]
+    remaining = size - 32
+
+    while remaining > 64:
+        chunk = hashlib.blake2b(chunk).digest()
+        result.append(chunk[:32])
+        remaining -= 32
+
+    result.append(hashlib.blake2b(chunk, digest_size=remaining).digest())
+    return b"".join(result)
+
+
+def _argon2_permute(v: t.List[int], indexes: t.Sequence[int]) -> None:
+    """Applies the BLAKE2b-based permutation P to 16 words of the block in place."""
+
+    def mix(a: int, b: int, c: int, d: int) -> None:
+        va, vb, vc, vd = v[a], v[b], v[c], v[d]
+        va = (va + vb + 2 * (va & _MASK32) * (vb & _MASK32)) & _MASK64
+        vd ^= va
+        vd = (vd >> 32) | ((vd << 32) & _MASK64)
+        vc = (vc + vd + 2 * (vc & _MASK32) * (vd & _MASK32)) & _MASK64
+        vb ^= vc
+        vb = (vb >> 24) | ((vb << 40) & _MASK64)
+        va = (va + vb + 2 * (va & _MASK32) * (vb & _MASK32)) & _MASK64
+        vd ^= va
+        vd = (vd >> 16) | ((vd << 48) & _MASK64)
+        vc = (vc + vd + 2 * (vc & _MASK32) * (vd & _MASK32)) & _MASK64
+        vb ^= vc
+        vb = (vb >> 63) | ((vb << 1) & _MASK64)
+        v[a], v[b], v[c], v[d] = va, vb, vc, vd
+
+    i = indexes
+    mix(i[0], i[4], i[8], i[12])
+    mix(i[1], i[5], i[9], i[13])
+    mix(i[2], i[6], i[10], i[14])
+    mix(i[3], i[7], i[11], i[15])
+    mix(i[0], i[5], i[10], i[15])
+    mix(i[1], i[6], i[11], i[12])
+    mix(i[2], i[7], i[8], i[13])
+    mix(i[3], i[4], i[9], i[14])
+
+
+_ROW_INDEXES = [list(range(16 * row, 16 * row + 16)) for row in range(8)]
+_COLUMN_INDEXES = [[16 * row + 2 * column + offset for row in range(8) for offset in (0, 1)] for column in range(8)]
+
+
+def _argon2_compress(x: t.List[int], y: t.List[int]) -> t.List[int]:
+    """Compression function G from RFC 9106 on 1 KiB blocks of 128 words."""
+
+    r = [a ^ b for a, b in zip(x, y)]
+    q = list(r)
+
+    for indexes in _ROW_INDEXES:
+        _argon2_permute(q, indexes)
+
+    for indexes in _COLUMN_INDEXES:
+        _argon2_permute(q, indexes)
+
+    return [a ^ b for a, b in zip(q, r)]
+
+
+def argon2(
+    password: bytes,
+    salt: bytes,
+    time_cost: int,
+    memory_cost: int,
+    parallelism: int,
+    hash_len: int = 32,
+    type_: int = ARGON2D,
+    version: int = 0x13,
+    secret: bytes = b"",
+    associated_data: bytes = b"",
+) -> bytes:
+    """Argon2d and Argon2id from RFC 9106. ``memory_cost`` is in KiB."""
+
+    if type_ not in (ARGON2D, ARGON2ID):
+        raise CryptoError("Only Argon2d and Argon2id are supported.")
+
+    if _native_argon2 is not None and not secret and not associated_data:
+        return _native_argon2(
+            secret=password,
+            salt=salt,
+            time_cost=time_cost,
+            memory_cost=memory_cost,
+            parallelism=parallelism,
+            hash_len=hash_len,
+            type=_NativeArgon2Type.D if type_ == ARGON2D else _NativeArgon2Type.ID,
+            version=version,
+        )
+
+    return _argon2(
+        password, salt, time_cost, memory_cost, parallelism, hash_len, type_, version, secret, associated_data
+    )
+
+
+def _argon2(
+    password: bytes,
+    salt: bytes,
+    time_cost: int,
+    memory_cost: int,
+    parallelism: int,
+    hash_len: int,
+    type_: int,
+    version: int,
+    secret: bytes,
+    associated_data: bytes,
+) -> bytes:
+    def length_prefixed(value: bytes) -> bytes:
+        return struct.pack("<I", len(value)) + value
+
+    h0 = hashlib.blake2b(
+        struct.pack("<6I", parallelism, hash_len, memory_cost, time_cost, version, type_)
+        + length_prefixed(password)
+        + length_prefixed(salt)
+        + length_prefixed(secret)
+        + length_prefixed(associated_data)
+    ).digest()
+
+    segment_length = max(memory_cost, 8 * parallelism) // (parallelism * _ARGON2_SYNC_POINTS)
+    lane_length = segment_length * _ARGON2_SYNC_POINTS
+    memory: t.List[t.List[t.List[int]]] = [[[] for _ in range(lane_length)] for _ in range(parallelism)]
+
+    for lane in range(parallelism):
+        for index in range(2):
+            block = _blake2b_long(h0 + struct.pack("<II", index, lane), 1024)
+            memory[lane][index] = list(struct.unpack("<128Q", block))
+
+    for pass_index in range(time_cost):
+        for slice_index in range(_ARGON2_SYNC_POINTS):
+            for lane in range(parallelism):
+                _argon2_fill_segment(memory, (pass_index, lane, slice_index), time_cost, type_, version)
+
+    final_block = memory[0][lane_length - 1]
+
+    for lane in range(1, parallelism):
+        final_block = [a ^ b for a, b in zip(final_block, memory[lane][lane_length - 1])]
+
+    return _blake2b_long(struct.pack("<128Q", *final_block), hash_len)
+
+
+def _argon2_fill_segment(
+    memory: t.List[t.List[t.List[int]]], position: t.Tuple[int, int, int], time_cost: int, type_: int, version: int
+) -> None:
+    pass_index, lane, slice_index = position
+    parallelism, lane_length = len(memory), len(memory[0])
+    segment_length = lane_length // _ARGON2_SYNC_POINTS
+    data_independent = type_ == ARGON2ID and pass_index == 0 and slice_index < 2
+    start = 2 if pass_index == 0 and slice_index == 0 else 0
+    addresses = _Argon2Addresses(position, lane_length * parallelism, time_cost, type_) if data_independent else None
+
+    for index in range(start, segment_length):
+        column = slice_index * segment_length + index
+        previous_column = column - 1 if column else lane_length - 1
+
+        if addresses is not None:
+            pseudo_random = addresses.get(index)
+        else:
+            pseudo_random = memory[lane][previous_column][0]
+
+        reference_lane = lane if pass_index == 0 and slice_index == 0 else (pseudo_random >> 32) % parallelism
+        reference_column = _argon2_reference_column(
+            position, index, segment_length, pseudo_random & _MASK32, reference_lane == lane
+        )
+        new_block = _argon2_compress(memory[lane][previous_column], memory[reference_lane][reference_column])
+
+        if pass_index and version == 0x13:
+            new_block = [a ^ b for a, b in zip(memory[lane][column], new_block)]
+
+        memory[lane][column] = new_block
+
+
+def _argon2_reference_column(
+    position: t.Tuple[int, int, int], index: int, segment_length: int, pseudo_random: int, same_lane: bool
+) -> int:
+    pass_index, _, slice_index = position
+    lane_length = segment_length * _ARGON2_SYNC_POINTS
+
+    if pass_index == 0:
+        reference_area = slice_index * segment_length
+    else:
+        reference_area = lane_length - segment_length
+
+    if same_lane:
+        reference_area += index - 1
+    elif index == 0:
+        reference_area -= 1
+
+    relative = (pseudo_random * pseudo_random) >> 32
+    relative = reference_area - 1 - ((reference_area * relative) >> 32)
+    start_position = 0 if pass_index == 0 else ((slice_index + 1) % _ARGON2_SYNC_POINTS) * segment_length
+
+    return (start_position + relative) % lane_length
+
+
+class _Argon2Addresses:
+    """Pseudo-random values of the data-independent addressing used by Argon2id."""
+
+    zero_block = [0] * 128
+
+    def __init__(self, position: t.Tuple[int, int, int], memory_blocks: int, time_cost: int, type_: int) -> None:
+        self._input_block = list(position) + [memory_blocks, time_cost, type_] + [0] * 122
+        self._address_block: t.List[int] = []
+
+    def get(self, index: int) -> int:
+        if not self._address_block or index % 128 == 0:
+            self._input_block[6] += 1
+            self._address_block = _argon2_compress(
+                self.zero_block, _argon2_compress(self.zero_block, self._input_block)
+            )
+
+        return self._address_block[index % 128]
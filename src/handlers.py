@@ -1,12 +1,63 @@
-import argparse
+import json
+import os
+import re
 import subprocess
+import time
 import typing as t
-import webbrowser
 
+import instrumentation
+import processes
 from alfred import AlfredMod, AlfredModActionEnum, AlfredScriptFilter
 from conf import settings
 from helpers import cast_bool_to_yesno
-from services import WorkflowUpdatesChecker, initialize_keepassxc_client
+from services import (
+    NoSearchResultsError,
+    WorkflowUpdatesChecker,
+    WorkflowUpdatesRateLimitError,
+    entry_prefetcher,
+    forget_credentials,
+    initialize_keepassxc_client,
+    initialize_search_results_file_cache,
+    initialize_usage_store,
+    is_credentials_error,
+    is_local_search_enabled,
+    load_vaults,
+    matches_search_terms,
+    parse_search_terms,
+    prefetch_entries,
+    record_entry_usage,
+    resolve_entry_reference,
+    search_index_cache,
+    search_results_cache,
+    totp_settings_cache,
+)
+
+if t.TYPE_CHECKING:
+    import argparse
+
+    from services import KeepassXCEntry, Vault
+    from totp import TOTPSettings
+    from usage import UsageStore
+
+TOTP_CODES_VARIABLE = "TOTP_CODES"
+TOTP_LIST_VARIABLE = "TOTP_LIST"
+TOTP_PERIODS_AHEAD = 4
+
+# Alfred 5 may cache the output of script filters. Settings rarely change, search results are
+# reloaded in the background because they depend on the query, output with secrets is never cached.
+SETTINGS_LIST_CACHE_SECONDS = 3600
+SEARCH_CACHE_SECONDS = 10
+ENTRY_LIST_CACHE_SECONDS = 600
+
+# Alfred filters the whole entry list on every keystroke, so large lists are searched by the workflow instead.
+DEFAULT_ALFRED_FILTERING_MAX_ENTRIES = 2000
+
+# a slow vault is reported and doesn't hold the results of the others
+VAULT_SEARCH_TIMEOUT = 10.0
+
+VaultErrors = t.List[t.Tuple["Vault", str]]
+TOTPCodes = t.Sequence[t.Tuple[str, t.Optional[int]]]
+ScheduledTOTPCodes = t.List[t.Tuple[str, int]]
 
 
 def require_password(func: t.Callable[..., None]) -> t.Callable[..., None]:
@@ -16,14 +67,21 @@ def require_password(func: t.Callable[..., None]) -> t.Callable[..., None]:
     be displayed in Alfred. When an user selects this item, he will be
     prompted to enter a new password. So it is necessary to send the arg
     with settings.KEEPASSXC_MASTER_PASSWORD.name value. It will be passed
-    to js script as parameter.
+    to js script as parameter. If the database rejects the password, the
+    cached password is forgotten.
     """
 
     def wrapper(*args, **kw):
         script_filter = AlfredScriptFilter()
 
         if settings.KEEPASSXC_MASTER_PASSWORD.value:
-            return func(*args, **kw)
+            try:
+                return func(*args, **kw)
+            except OSError as e:
+                if is_credentials_error(e):
+                    forget_credentials()
+
+                raise
 
         script_filter.add_item(
             title="Please enter your password",
@@ -43,7 +101,10 @@ def validate_settings(func: t.Callable[..., None]) -> t.Callable[..., None]:
     """
 
     def wrapper(*args, **kw):
-        if settings.is_valid():
+        with instrumentation.stage("settings"):
+            is_valid = settings.is_valid()
+
+        if is_valid:
             return func(*args, **kw)
 
         script_filter = AlfredScriptFilter()
@@ -63,40 +124,340 @@ def validate_settings(func: t.Callable[..., None]) -> t.Callable[..., None]:
     return wrapper
 
 
+def search_entries(query: str, vault: t.Optional["Vault"] = None) -> t.List[str]:
+    """Returns paths of KeepassXC entries found in the vault by the query with the configured search.
+
+    The local search index and the remembered results serve the primary
+    vault, other vaults are searched by their clients. Without the agent the
+    local search falls back to the client's search.
+    """
+
+    kp_client = initialize_keepassxc_client(vault)
+
+    if vault is not None and not vault.is_primary:
+        return kp_client.search(query)
+
+    if is_local_search_enabled():
+        with instrumentation.stage("search index cache"):
+            search_index = search_index_cache.get(kp_client)
+
+        return [kp_entry.path for kp_entry in search_index.search(query)]
+
+    with instrumentation.stage("search results cache"):
+        return search_results_cache.search(kp_client, query)
+
+
+def search_vaults(query: str, vaults: t.List["Vault"]) -> t.Tuple[t.List[str], VaultErrors]:
+    """Returns references to entries found in all vaults and errors of the vaults which have failed.
+
+    A single vault is searched in the current thread and its errors are
+    raised. A vault which hasn't answered in time is reported as failed.
+    """
+
+    if len(vaults) == 1:
+        return search_entries(query), []
+
+    answers = search_vaults_concurrently(query, vaults)
+    references: t.List[str] = []
+    errors: VaultErrors = []
+
+    for index, vault in enumerate(vaults):
+        answer = answers.get(index, TimeoutError(f"It hasn't answered in {VAULT_SEARCH_TIMEOUT:g} s."))
+
+        if isinstance(answer, Exception):
+            errors.append((vault, str(answer) or type(answer).__name__))
+
+            if is_credentials_error(answer):
+                forget_credentials()
+        else:
+            references.extend(vault.reference(path) for path in answer)
+
+    return list(dict.fromkeys(references)), errors
+
+
+def search_vaults_concurrently(query: str, vaults: t.List["Vault"]) -> t.Dict[int, t.Union[t.List[str], Exception]]:
+    """Searches every vault in its own thread and returns the answers given in VAULT_SEARCH_TIMEOUT seconds.
+
+    The search takes as long as the slowest vault instead of the sum of all
+    of them. Answers are found paths or errors by indexes of the vaults.
+    The threads are daemonic, so a vault which hasn't answered doesn't keep
+    the process running, and the subprocesses it has started are killed.
+    """
+
+    import queue
+    import threading
+
+    answers: "queue.Queue[t.Tuple[int, t.Union[t.List[str], Exception]]]" = queue.Queue()
+
+    def search(index: int, vault: "Vault") -> None:
+        answer: t.Union[t.List[str], Exception]
+
+        try:
+            answer = search_entries(query, vault)
+        except NoSearchResultsError:
+            answer = []
+        except Exception as e:  # the vault is reported, the others are searched anyway
+            answer = e
+
+        answers.put((index, answer))
+
+    threads = [threading.Thread(target=search, args=(index, vault), daemon=True) for index, vault in enumerate(vaults)]
+
+    for thread in threads:
+        thread.start()
+
+    collected_answers: t.Dict[int, t.Union[t.List[str], Exception]] = {}
+    deadline = time.monotonic() + VAULT_SEARCH_TIMEOUT
+
+    while len(collected_answers) < len(vaults):
+        try:
+            index, answer = answers.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            break
+
+        collected_answers[index] = answer
+
+    unfinished_threads = {
+        thread.ident for index, thread in enumerate(threads) if index not in collected_answers and thread.ident
+    }
+
+    if unfinished_threads:
+        processes.kill_started_by(unfinished_threads)
+
+    return collected_answers
+
+
 @validate_settings
 @require_password
-def search_handler(parsed_args: argparse.Namespace) -> None:
+def search_handler(parsed_args: "argparse.Namespace") -> None:
     """
     Forms a list with found KeepassXC entries by a passed query
     and send it to the Alfred's script filter.
+
+    All configured vaults are searched. Vaults which have failed are listed
+    first, and then the results aren't cached. With the history of chosen
+    entries, entries chosen often and recently come first and an empty query
+    lists the recent ones. Without it, an empty query isn't searched.
     """
 
+    entry_prefetcher.cancel()
     script_filter = AlfredScriptFilter()
-    kp_client = initialize_keepassxc_client()
 
     try:
-        kp_entries = kp_client.search(parsed_args.query)
+        vaults = load_vaults()
+    except ValueError as e:
+        script_filter.add_item(title="Vaults are configured incorrectly.", subtitle=str(e), is_valid=False)
+        script_filter.send()
+        raise
+
+    usage_store = initialize_usage_store()
+
+    if usage_store and send_recent_entries(script_filter, usage_store, parsed_args.query, vaults):
+        return
+
+    if not parsed_args.query.strip():  # Alfred runs the script filter for the keyword alone
+        script_filter.add_item(title="Type to search entries.", is_valid=False)
+        script_filter.send()
+        return
+
+    try:
+        kp_entries, vault_errors = find_entries(parsed_args.query, vaults)
     except OSError:
         script_filter.add_item(title="There aren't matches or something went wrong.", is_valid=False)
         script_filter.send()
         raise
 
-    for entry_path in kp_entries:
-        formatted_entry_path = entry_path[1:].replace("/", settings.ENTRY_DELIMITER.value)
-        script_filter.add_item(title=formatted_entry_path, arg=entry_path)
+    if usage_store:
+        kp_entries = usage_store.rank(kp_entries)
 
+    add_search_results(script_filter, kp_entries, vault_errors, vaults)
     script_filter.add_variable("USER_QUERY", parsed_args.query)  # used for "back" button
+
+    if not vault_errors:
+        script_filter.set_cache(SEARCH_CACHE_SECONDS, loose_reload=True)
+
+    script_filter.send()
+    prefetch_entries(kp_entries)
+
+
+def find_entries(query: str, vaults: t.List["Vault"]) -> t.Tuple[t.List[str], VaultErrors]:
+    """Returns references to entries found by the query and errors of the vaults which have failed.
+
+    Results are taken from the search results cache if it's enabled, and
+    complete results are stored in it.
+    """
+
+    results_file_cache = initialize_search_results_file_cache(vaults)
+
+    with instrumentation.stage("search results file cache") as stage:
+        kp_entries = results_file_cache.get(query) if results_file_cache else None
+        stage.annotate(hit=kp_entries is not None)
+
+    if kp_entries is not None:
+        return kp_entries, []
+
+    try:
+        kp_entries, vault_errors = search_vaults(query, vaults)
+    except NoSearchResultsError:
+        kp_entries, vault_errors = [], []
+
+    if results_file_cache and not vault_errors:
+        results_file_cache.set(query, kp_entries)
+
+    return kp_entries, vault_errors
+
+
+def send_recent_entries(
+    script_filter: AlfredScriptFilter, usage_store: "UsageStore", query: str, vaults: t.List["Vault"]
+) -> bool:
+    """Sends the recently chosen entries if the query is empty or has one character.
+
+    The entries are taken from the history, so neither Keychain nor the
+    database is touched. A one-character query lists entries with a word
+    starting with it, and it's searched as usual if there are none.
+    Returns True if the entries have been sent.
+    """
+
+    prefix = query.strip().casefold()
+
+    if len(prefix) > 1:
+        return False
+
+    recent_entries = []
+
+    for reference in usage_store.recent(usage_store.max_entries):
+        vault, entry_path = resolve_entry_reference(reference, vaults)
+        is_configured = not vault.is_primary or entry_path.startswith("/")  # the vault may have been removed
+
+        if is_configured and any(word.startswith(prefix) for word in re.split(r"\W+", entry_path.casefold())):
+            recent_entries.append((vault, entry_path, reference))
+
+    if prefix and not recent_entries:
+        return False
+
+    if not recent_entries:
+        script_filter.add_item(
+            title="Type to search entries.", subtitle="Chosen entries are listed here.", is_valid=False
+        )
+
+    for vault, entry_path, reference in recent_entries[: settings.RECENT_ENTRIES.value]:
+        script_filter.add_item(
+            title=entry_path[1:].replace("/", settings.ENTRY_DELIMITER.value),
+            subtitle=f"Recently used in {vault.name}" if len(vaults) > 1 else "Recently used",
+            arg=reference,
+        )
+
+    script_filter.add_variable("USER_QUERY", query)  # used for "back" button, as typed
+    script_filter.send()
+
+    return True
+
+
+def add_search_results(
+    script_filter: AlfredScriptFilter, references: t.List[str], vault_errors: VaultErrors, vaults: t.List["Vault"]
+) -> None:
+    """Adds items of vaults which have failed and of found entries.
+
+    With several vaults the subtitle of an entry is the name of its vault.
+    """
+
+    for vault, error in vault_errors:
+        script_filter.add_item(title=f"Can't search {vault.name}.", subtitle=error, is_valid=False)
+
+    if not references and not vault_errors:
+        script_filter.add_item(title="There aren't matches or something went wrong.", is_valid=False)
+
+    for reference in references:
+        vault, entry_path = resolve_entry_reference(reference, vaults)
+        formatted_entry_path = entry_path[1:].replace("/", settings.ENTRY_DELIMITER.value)
+
+        if len(vaults) > 1:
+            script_filter.add_item(title=formatted_entry_path, subtitle=vault.name, arg=reference)
+        else:
+            script_filter.add_item(title=formatted_entry_path, arg=reference)
+
+
+@validate_settings
+@require_password
+def list_entries_handler(parsed_args: "argparse.Namespace") -> None:
+    """Sends all KeepassXC entries to the Alfred's script filter which filters them itself.
+
+    The list is read with one export and cached by Alfred, so typing
+    doesn't run the workflow. A database with more entries than
+    ``alfred_filtering_max_entries`` isn't listed, the item refers to the
+    search instead.
+    """
+
+    import itertools
+
+    entry_prefetcher.cancel()
+    script_filter = AlfredScriptFilter()
+    max_entries = settings.ALFRED_FILTERING_MAX_ENTRIES.value or DEFAULT_ALFRED_FILTERING_MAX_ENTRIES
+
+    try:
+        # the export stops right after the entry exceeding the limit
+        kp_entries = list(itertools.islice(initialize_keepassxc_client().export_entries(), max_entries + 1))
+    except OSError:
+        script_filter.add_item(title="Something went wrong.", is_valid=False)
+        script_filter.send()
+        raise
+
+    if len(kp_entries) > max_entries:
+        script_filter.add_item(
+            title=f"There are more than {max_entries} entries.",
+            subtitle=f'Search them with "{settings.ALFRED_KEYWORD.value} <term>".',
+            is_valid=False,
+        )
+        script_filter.send()
+        return
+
+    if not kp_entries:
+        script_filter.add_item(title="There aren't entries.", is_valid=False)
+
+    for kp_entry in sorted(kp_entries, key=lambda entry: entry.path):
+        script_filter.add_item(
+            title=kp_entry.path[1:].replace("/", settings.ENTRY_DELIMITER.value),
+            arg=kp_entry.path,
+            uid=kp_entry.uuid or kp_entry.path,
+            match=build_match_words(kp_entry),
+        )
+
+    script_filter.add_variable("USER_QUERY", "")  # used for "back" button
+    script_filter.set_cache(ENTRY_LIST_CACHE_SECONDS, loose_reload=True)
     script_filter.send()
 
 
+def build_match_words(kp_entry: "KeepassXCEntry") -> str:
+    """Returns words of the title, the groups and the username which Alfred matches the query against.
+
+    Alfred matches beginnings of words, so the username is also split by
+    punctuation: "alice@example.com" is found by "example" too.
+    """
+
+    import re
+
+    words = [kp_entry.title, *kp_entry.group_path.split("/"), kp_entry.username]
+    words += re.split(r"[\W_]+", kp_entry.username)
+
+    return " ".join(dict.fromkeys(word for word in words if word))
+
+
 @validate_settings
 @require_password
-def fetch_handler(parsed_args: argparse.Namespace) -> None:
+def fetch_handler(parsed_args: "argparse.Namespace") -> None:
     """Forms a list with KeepassXC entry attributes and sends it to the Alfred's script filter."""
 
     script_filter = AlfredScriptFilter()
-    kp_client = initialize_keepassxc_client()
-    kp_entry = kp_client.show(parsed_args.query)
+    script_filter.set_skip_knowledge()
+    vault, entry_path = resolve_entry_reference(parsed_args.query)
+    kp_client = initialize_keepassxc_client(vault)
+
+    with instrumentation.stage("entry prefetcher") as stage:
+        kp_entry = entry_prefetcher.get(kp_client, entry_path)
+        stage.annotate(hit=kp_entry is not None)
+
+    kp_entry = kp_entry or kp_client.show(entry_path)
+    record_entry_usage(parsed_args.query)
     script_filter.add_item(title="← Back", subtitle="Back to search", arg="back")
 
     if settings.SHOW_TOTP_REQUEST.value:
@@ -144,38 +505,171 @@ def fetch_handler(parsed_args: argparse.Namespace) -> None:
 
 @validate_settings
 @require_password
-def totp_handler(parsed_args: argparse.Namespace) -> None:
+def totp_handler(parsed_args: "argparse.Namespace") -> None:
     """Requests TOTP for a given KeepassXC entry and sends it to the Alfred workflow."""
 
     script_filter = AlfredScriptFilter()
-    kp_client = initialize_keepassxc_client()
-
-    try:
-        totp = kp_client.totp(parsed_args.query)
-    except OSError:
-        script_filter.add_item(title="There is no configured TOTP or something went wrong.", is_valid=False)
-        script_filter.send()
-        raise
+    script_filter.set_skip_knowledge()
+    now = time.time()
+    codes = load_totp_codes(parsed_args.query, now)
+
+    if codes is None:
+        try:
+            codes = generate_totp_codes(parsed_args.query, now)
+        except OSError:
+            script_filter.add_item(title="There is no configured TOTP or something went wrong.", is_valid=False)
+            script_filter.send()
+            raise
+
+    totp, expires_at = codes[0]
+    subtitle = "Press Enter to copy the TOTP."
+
+    if expires_at is not None:
+        subtitle += f" Expires in {expires_at - int(now)} s."
+        script_filter.add_variable(TOTP_CODES_VARIABLE, json.dumps({"query": parsed_args.query, "codes": codes}))
+        script_filter.set_rerun(1)
 
     mod = AlfredMod(action=AlfredModActionEnum.CMD, subtitle="Copy and paste to front most app.", arg=totp)
     mod.add_variable("USER_ACTION", "mod")
-    script_filter.add_item(title=totp, subtitle="Press Enter to copy the TOTP.", arg=totp, mods=[mod])
+    script_filter.add_item(title=totp, subtitle=subtitle, arg=totp, mods=[mod])
     script_filter.send()
 
 
-def check_for_updates_handler(_: argparse.Namespace) -> None:
+@validate_settings
+@require_password
+def totps_handler(parsed_args: "argparse.Namespace") -> None:
+    """Lists current TOTPs of all entries found by a passed query which have TOTP set up.
+
+    All entries are read with one export. Their codes are generated for a few
+    periods ahead and passed to the next runs of the script filter, so the
+    database is read again only when the codes of an entry run out.
+    """
+
+    script_filter = AlfredScriptFilter()
+    script_filter.set_skip_knowledge()
+    now = time.time()
+    totp_list = load_totp_list(parsed_args.query, now)
+
+    if totp_list is None:
+        try:
+            totp_list = generate_totp_list(parsed_args.query, now)
+        except OSError:
+            script_filter.add_item(title="There aren't entries with TOTP or something went wrong.", is_valid=False)
+            script_filter.send()
+            raise
+
+    if not totp_list:
+        script_filter.add_item(title="There aren't entries with TOTP.", is_valid=False)
+
+    for entry_path, codes in totp_list:
+        totp, expires_at = codes[0]
+        mod = AlfredMod(action=AlfredModActionEnum.CMD, subtitle="Copy and paste to front most app.", arg=totp)
+        mod.add_variable("USER_ACTION", "mod")
+        script_filter.add_item(
+            title=f"{totp}  {entry_path[1:].replace('/', settings.ENTRY_DELIMITER.value)}",
+            subtitle=f"Expires in {expires_at - int(now)} s. Press Enter to copy the TOTP.",
+            arg=totp,
+            mods=[mod],
+        )
+
+    script_filter.add_variable(TOTP_LIST_VARIABLE, json.dumps({"query": parsed_args.query, "entries": totp_list}))
+    script_filter.set_rerun(1)
+    script_filter.send()
+
+
+def generate_totp_codes(query: str, now: float) -> TOTPCodes:
+    """Returns the current TOTP of the entry and the next ones with their expiration times.
+
+    The codes are generated in-process from the entry's TOTP settings. If the
+    settings can't be read, e.g. the entry has legacy TOTP attributes, the
+    client generates the current code and its expiration time is unknown.
+    """
+
+    vault, entry_path = resolve_entry_reference(query)
+    kp_client = initialize_keepassxc_client(vault)
+
+    try:
+        with instrumentation.stage("TOTP settings cache"):
+            totp_settings = totp_settings_cache.get(kp_client, entry_path)
+    except OSError:
+        return [(kp_client.totp(entry_path), None)]
+
+    return build_totp_codes(totp_settings, now)
+
+
+def build_totp_codes(totp_settings: "TOTPSettings", now: float) -> ScheduledTOTPCodes:
+    """Returns the current code and the codes of the next periods with their expiration times.
+
+    TOTPError is raised if the settings are malformed.
+    """
+
+    totp_settings.validate()
+    period = totp_settings.period
+    period_start = int(now) // period * period
+
+    return [
+        (totp_settings.generate(period_start + index * period), period_start + (index + 1) * period)
+        for index in range(TOTP_PERIODS_AHEAD)
+    ]
+
+
+def load_totp_codes(query: str, now: float) -> t.Optional[TOTPCodes]:
+    """Returns codes of the entry passed by the previous run of the script filter which are still valid.
+
+    The script filter is rerun every second to update the countdown, and
+    Alfred passes its variables to the next run. So the codes are generated
+    once for a few periods ahead, and the secret itself isn't passed.
+    """
+
+    try:
+        passed_codes = json.loads(os.getenv(TOTP_CODES_VARIABLE) or "null")
+    except ValueError:
+        return None
+
+    if not isinstance(passed_codes, dict) or passed_codes.get("query") != query:
+        return None
+
+    codes = [(code, expires_at) for code, expires_at in passed_codes.get("codes", []) if expires_at > now]
+
+    return codes or None
+
+
+def check_for_updates_handler(_: "argparse.Namespace") -> None:
     """Checks for updates for the workflow.
 
     The new release message will be shown to the user after 30 seconds if this
     handler was run in the background. This behavior is intended not to interrupt
     the user's current interaction with Alfred. Of course, this does not give
     guarantees, but it reduces this probability.
+
+    The check runs in a detached process, like the agent, so the run ends
+    without waiting for GitHub and the process shows the message itself.
     """
 
+    import sys
+
+    subprocess.Popen(
+        [sys.executable, "-S", "-c", "import handlers; handlers.announce_updates()"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        close_fds=True,
+    )
+
+
+def announce_updates() -> None:
+    """Shows whether there is a new release of the workflow."""
+
     release_checker = WorkflowUpdatesChecker()
 
     try:
         has_new_version = release_checker.has_new_version()
+    except WorkflowUpdatesRateLimitError as e:
+        command = ["osascript", "-l", "JavaScript", "settings.js", "showMessage", f"{e} Please try again later."]
+        subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
+        return
     except Exception:
         message = f"An error occurred while trying to check for updates. Please try again later."
         command = ["osascript", "-l", "JavaScript", "settings.js", "showMessage", message]
@@ -192,7 +686,7 @@ def check_for_updates_handler(_: argparse.Namespace) -> None:
         subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
 
 
-def open_url_handler(parsed_args: argparse.Namespace) -> None:
+def open_url_handler(parsed_args: "argparse.Namespace") -> None:
     """Opens incoming url in a default browser.
 
     If the url starts with cmd:// or kdbx:// it will not open
@@ -211,10 +705,12 @@ def open_url_handler(parsed_args: argparse.Namespace) -> None:
     if not incoming_url.startswith(("http://", "https://")):
         incoming_url = f"http://{parsed_args.url}"  # webbrowser doesn't open urls without the protocol.
 
+    import webbrowser
+
     webbrowser.open(incoming_url)
 
 
-def list_settings_handler(_: argparse.Namespace) -> None:
+def list_settings_handler(_: "argparse.Namespace") -> None:
     """Collects a list with global settings and sends it for the Alfred's script filter."""
 
     script_filter = AlfredScriptFilter()
@@ -313,4 +809,53 @@ def list_settings_handler(_: argparse.Namespace) -> None:
         arg=settings.PYTHON_PATH.name,
     )
 
+    script_filter.set_cache(SETTINGS_LIST_CACHE_SECONDS, loose_reload=True)
     script_filter.send()
+
+
+def generate_totp_list(query: str, now: float) -> t.List[t.Tuple[str, ScheduledTOTPCodes]]:
+    """Returns paths of entries found by the query which have TOTP set up and their codes.
+
+    Entries with malformed TOTP settings are skipped.
+    """
+
+    from totp import TOTPError
+
+    kp_client = initialize_keepassxc_client()
+    terms = parse_search_terms(query)
+    totp_list = []
+
+    for kp_entry in kp_client.export_entries(with_totp=True):
+        if not kp_entry.totp_settings or not matches_search_terms(kp_entry, terms):
+            continue
+
+        try:
+            totp_list.append((kp_entry.path, build_totp_codes(kp_entry.totp_settings, now)))
+        except TOTPError:  # one malformed entry doesn't hide the others
+            continue
+
+    return sorted(totp_list)
+
+
+def load_totp_list(query: str, now: float) -> t.Optional[t.List[t.Tuple[str, ScheduledTOTPCodes]]]:
+    """Returns the TOTP list passed by the previous run if every entry still has a valid code."""
+
+    try:
+        passed_list = json.loads(os.getenv(TOTP_LIST_VARIABLE) or "null")
+    except ValueError:
+        return None
+
+    if not isinstance(passed_list, dict) or passed_list.get("query") != query:
+        return None
+
+    totp_list = []
+
+    for entry_path, codes in passed_list.get("entries", []):
+        valid_codes = [(code, expires_at) for code, expires_at in codes if expires_at > now]
+
+        if not valid_codes:
+            return None
+
+        totp_list.append((entry_path, valid_codes))
+
+    return totp_list
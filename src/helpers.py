@@ -1,3 +1,4 @@
+import os
 import typing as t
 
 
@@ -26,6 +27,21 @@ def split_string_with_commas(value: str) -> t.List[str]:
     return value.replace(" ", "").split(",") if value else []
 
 
+def get_files_fingerprint(paths: t.List[str]) -> t.List[t.Tuple[str, int, int, int]]:
+    """
+    Returns the path, the size, the modification time and the inode of every file.
+    The fingerprint changes when a file is changed or replaced.
+    """
+
+    fingerprint = []
+
+    for path in paths:
+        stat = os.stat(path)
+        fingerprint.append((path, stat.st_size, stat.st_mtime_ns, stat.st_ino))
+
+    return fingerprint
+
+
 def cast_bool_to_yesno(value: bool) -> str:
     """Returns "Yes" if a passed boolean value is True else False."""
 
@@ -0,0 +1,345 @@
+"""Opt-in timing of the stages of a workflow run.
+
+With the ``instrumentation`` setting every run measures its stages with
+``perf_counter_ns``: reading settings, the Keychain lookup, keepassxc-cli,
+parsing of its output, serialization of the script filter output and the
+handler as a whole. Startup is the CPU time the process spent before
+``cli.main``, i.e. in the interpreter and the first imports. Subprocesses
+are counted by an audit hook on ``subprocess.Popen``. Bytes read are the
+output of ``security`` and keepassxc-cli; streamed exports aren't counted.
+
+At the end of the run a summary is written to stderr, where the Alfred
+debugger shows it, and appended as a JSON line to ``instrumentation.log`` in
+the workflow data directory. The log is rotated to ``instrumentation.log.1``
+when it reaches 1 MiB. With ``instrumentation_profile`` the run is profiled
+with cProfile and the stats are dumped to ``profile-<action>.prof`` there.
+
+With ``instrumentation_trace`` the stages, the started subprocesses and the
+run itself are also written as Chrome trace events to
+``trace-<invocation id>.json`` there. The invocation ID is passed to the next
+steps of the flow in the ``INVOCATION_ID`` variable of the script filter
+output, so the runs of a search, the fetch of the chosen entry and clip.js
+copying the value append to the same file, which opens as one timeline in
+chrome://tracing or Perfetto. The file is in the JSON array format without
+the closing bracket, which trace viewers accept, so processes only append.
+The agent records every request it handles as a run of its own, named
+``agent.py`` in the trace, and the client passes it the invocation ID.
+
+The Keychain password cache reports its lookups outside the agent with
+``log``, which writes to stderr only when the run is recorded.
+
+When the instrumentation is off, ``stage`` returns a shared object which
+does nothing, and this module imports nothing but the standard basics.
+"""
+
+import json
+import os
+import sys
+import time
+import typing as t
+
+if t.TYPE_CHECKING:
+    import cProfile
+
+MAX_LOG_SIZE = 1024 * 1024
+LOG_FILE_NAME = "instrumentation.log"
+INVOCATION_ID_VARIABLE = "INVOCATION_ID"
+TRACE_FILE_MAX_AGE = 24 * 3600
+
+
+class Recorder:
+    """Collects timings and counters of the current run."""
+
+    def __init__(
+        self, startup_cpu_time: float, invocation_id: t.Optional[str] = None, process_name: str = "cli.py"
+    ) -> None:
+        self.started_at = time.perf_counter_ns()
+        self.clock_offset = time.time_ns() - self.started_at  # converts perf_counter_ns to the wall clock
+        self.startup_cpu_time = startup_cpu_time
+        self.stages: t.Dict[str, t.List[int]] = {}  # name: [count, total nanoseconds]
+        self.subprocesses = 0
+        self.bytes_read = 0
+        self.profiler: t.Optional["cProfile.Profile"] = None
+        self.invocation_id = invocation_id
+        self.process_name = process_name
+        self.trace_events: t.Optional[t.List[t.Dict[str, t.Any]]] = [] if invocation_id else None
+
+    def add_stage(self, name: str, started_at: int, elapsed: int, args: t.Optional[t.Dict[str, t.Any]] = None) -> None:
+        stage = self.stages.setdefault(name, [0, 0])
+        stage[0] += 1
+        stage[1] += elapsed
+        self.add_trace_event("X", name, started_at, dur=elapsed / 1000, args=args or None)
+
+    def add_trace_event(self, phase: str, name: str, started_at: int, **fields: t.Any) -> None:
+        """Adds a Chrome trace event if the run is traced. Timestamps are in microseconds of the wall clock."""
+
+        if self.trace_events is None:
+            return
+
+        import threading
+
+        event = {"name": name, "ph": phase, "ts": (self.clock_offset + started_at) / 1000}
+        event.update(pid=os.getpid(), tid=threading.get_ident())
+        event.update((key, value) for key, value in fields.items() if value is not None)
+        self.trace_events.append(event)
+
+    def on_audit_event(self, event: str, arguments: t.Tuple[t.Any, ...]) -> None:
+        """Counts started subprocesses and marks their start in the trace."""
+
+        if event != "subprocess.Popen":
+            return
+
+        self.subprocesses += 1
+
+        if self.trace_events is not None:
+            executable, args = arguments[0], arguments[1]
+
+            if not executable:
+                executable = args if isinstance(args, (str, bytes, os.PathLike)) else next(iter(args), "")
+
+            # only the name of the program, its arguments may be secrets
+            name = os.path.basename(os.fsdecode(executable))
+            self.add_trace_event("i", f"start {name}", time.perf_counter_ns(), s="t")
+
+    def summarize(self, action: str) -> t.Dict[str, t.Any]:
+        return {
+            "time": int(time.time()),
+            "pid": os.getpid(),
+            "action": action,
+            "total_ms": (time.perf_counter_ns() - self.started_at) / 1e6,
+            "startup_cpu_ms": self.startup_cpu_time * 1000,
+            "stages": {name: {"count": count, "ms": total / 1e6} for name, (count, total) in self.stages.items()},
+            "subprocesses": self.subprocesses,
+            "bytes_read": self.bytes_read,
+            **({"invocation_id": self.invocation_id} if self.invocation_id else {}),
+        }
+
+
+class Stage:
+    """Adds the time spent inside the ``with`` block to the stage."""
+
+    __slots__ = ("recorder", "name", "started_at", "args")
+
+    def __init__(self, recorder: Recorder, name: str) -> None:
+        self.recorder = recorder
+        self.name = name
+        self.started_at = 0
+        self.args: t.Dict[str, t.Any] = {}
+
+    def __enter__(self) -> "Stage":
+        self.started_at = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_: t.Any) -> None:
+        self.recorder.add_stage(self.name, self.started_at, time.perf_counter_ns() - self.started_at, self.args)
+
+    def annotate(self, **args: t.Any) -> None:
+        """Adds arguments to the span of the stage in the trace, e.g. whether a cache lookup has hit."""
+
+        self.args.update(args)
+
+
+class NullStage:
+    """Used instead of Stage when the instrumentation is off."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "NullStage":
+        return self
+
+    def __exit__(self, *_: t.Any) -> None:
+        pass
+
+    def annotate(self, **args: t.Any) -> None:
+        pass
+
+
+NULL_STAGE = NullStage()
+recorder: t.Optional[Recorder] = None
+_has_audit_hook = False
+
+
+def enable(profile: bool = False, trace: bool = False, resident: bool = False) -> None:
+    """Starts recording the current run. It's called once, as early as possible.
+
+    With ``trace`` the run continues the invocation passed by the previous
+    step of the flow or starts a new one. A ``resident`` process, i.e. the
+    agent, records every request as a run, which has no startup.
+    """
+
+    global recorder, _has_audit_hook
+
+    if resident:
+        startup_cpu_time = 0.0
+    else:
+        import resource
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        startup_cpu_time = usage.ru_utime + usage.ru_stime
+
+    invocation_id = (os.getenv(INVOCATION_ID_VARIABLE) or os.urandom(8).hex()) if trace else None
+    process_name = "agent.py" if resident else "cli.py"
+    recorder = Recorder(startup_cpu_time=startup_cpu_time, invocation_id=invocation_id, process_name=process_name)
+
+    if not _has_audit_hook:
+        sys.addaudithook(on_audit_event)  # it can't be removed, but it does nothing between recorded runs
+        _has_audit_hook = True
+
+    if profile:
+        import cProfile
+
+        recorder.profiler = cProfile.Profile()
+        recorder.profiler.enable()
+
+
+def on_audit_event(event: str, arguments: t.Tuple[t.Any, ...]) -> None:
+    if recorder is not None:
+        recorder.on_audit_event(event, arguments)
+
+
+def stage(name: str) -> t.Union[Stage, NullStage]:
+    """Returns a context manager timing the stage."""
+
+    if recorder is None:
+        return NULL_STAGE
+
+    return Stage(recorder, name)
+
+
+def add_bytes_read(size: int) -> None:
+    if recorder is not None:
+        recorder.bytes_read += size
+
+
+def log(message: str) -> None:
+    """Writes a debug message to stderr, where the Alfred debugger shows it, if the run is recorded."""
+
+    if recorder is not None:
+        sys.stderr.write(message + "\n")
+
+
+def get_variables() -> t.Dict[str, str]:
+    """Returns the variables which pass the invocation to the next steps of the flow."""
+
+    if recorder is None or recorder.invocation_id is None:
+        return {}
+
+    return {INVOCATION_ID_VARIABLE: recorder.invocation_id}
+
+
+def finish(action: str) -> None:
+    """Writes the summary of the run to stderr and to the log, the trace events and the profile."""
+
+    global recorder
+
+    if recorder is None:
+        return
+
+    current_recorder, recorder = recorder, None
+    summary = current_recorder.summarize(action)
+    directory = get_log_directory()
+
+    if current_recorder.profiler is not None:
+        current_recorder.profiler.disable()
+        summary["profile"] = os.path.join(directory, f"profile-{action or 'none'}.prof")
+
+    sys.stderr.write(format_summary(summary) + "\n")
+
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        write_log_line(os.path.join(directory, LOG_FILE_NAME), json.dumps(summary))
+
+        if current_recorder.trace_events is not None:
+            write_trace(directory, current_recorder, action)
+
+        if current_recorder.profiler is not None:
+            current_recorder.profiler.dump_stats(summary["profile"])
+    except OSError as e:
+        sys.stderr.write(f"Can't write the instrumentation log: {e}\n")
+
+
+def format_summary(summary: t.Dict[str, t.Any]) -> str:
+    stages = ", ".join(
+        f"{name} {stage['ms']:.1f} ms" + (f" ({stage['count']}x)" if stage["count"] > 1 else "")
+        for name, stage in summary["stages"].items()
+    )
+
+    return (
+        f"Instrumentation of {summary['action'] or 'no action'}: total {summary['total_ms']:.1f} ms, "
+        f"startup CPU {summary['startup_cpu_ms']:.1f} ms" + (f", {stages}" if stages else "") + "; "
+        f"{summary['subprocesses']} subprocesses, {summary['bytes_read']} bytes read"
+    )
+
+
+def write_log_line(path: str, line: str) -> None:
+    """Appends the line to the log. A log which has reached MAX_LOG_SIZE is renamed to "<path>.1" first."""
+
+    try:
+        if os.path.getsize(path) >= MAX_LOG_SIZE:
+            os.replace(path, path + ".1")
+    except FileNotFoundError:
+        pass
+
+    descriptor = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    try:
+        os.write(descriptor, (line + "\n").encode("utf-8"))
+    finally:
+        os.close(descriptor)
+
+
+def write_trace(directory: str, finished_recorder: Recorder, action: str) -> None:
+    """Appends the events of the run to the trace file of the invocation, the file is created if needed."""
+
+    path = os.path.join(directory, f"trace-{finished_recorder.invocation_id}.json")
+    started_at = finished_recorder.started_at
+    name = f"{finished_recorder.process_name} {action}".strip()
+    finished_recorder.add_trace_event("X", name, started_at, dur=(time.perf_counter_ns() - started_at) / 1000)
+    finished_recorder.add_trace_event("M", "process_name", started_at, args={"name": name})
+
+    if not os.path.exists(path):
+        create_trace_file(path)
+
+    lines = "".join(json.dumps(event) + ",\n" for event in finished_recorder.trace_events or [])
+    descriptor = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    try:
+        os.write(descriptor, lines.encode("utf-8"))  # one write, so events of concurrent runs don't interleave
+    finally:
+        os.close(descriptor)
+
+
+def create_trace_file(path: str) -> None:
+    """Creates the trace file with the opening bracket and removes trace files of old invocations.
+
+    The file is written under a temporary name and linked, so another process
+    can't append to it before the bracket.
+    """
+
+    directory = os.path.dirname(path)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as trace_file:
+        trace_file.write("[\n")
+
+    try:
+        os.link(temporary_path, path)
+    except FileExistsError:  # created by another process of the invocation
+        pass
+    finally:
+        os.unlink(temporary_path)
+
+    now = time.time()
+
+    for dir_entry in os.scandir(directory):
+        try:
+            if dir_entry.name.startswith("trace-") and now - dir_entry.stat().st_mtime > TRACE_FILE_MAX_AGE:
+                os.unlink(dir_entry.path)
+        except FileNotFoundError:  # removed by another process
+            pass
+
+
+def get_log_directory() -> str:
+    from services import get_runtime_directory
+
+    return os.getenv("alfred_workflow_data") or get_runtime_directory()
@@ -0,0 +1,487 @@
+"""Reader of KeePass databases in KDBX 3.1 and KDBX 4 formats.
+
+Only reading is supported. The payload is decrypted with AES-256 or ChaCha20
+and the key is derived with AES-KDF, Argon2d or Argon2id. Twofish databases
+aren't supported.
+
+The key derivation is the slow part by design, so ``KdbxReader`` keeps the
+transformed key in memory. It's valid only for one KDF seed: KeePassXC and
+KeePass generate a new AES-KDF seed or Argon2 salt on every save, so the key
+is derived again after the database has been edited. Only changes of the
+file which keep the header, e.g. restoring a copy, skip the derivation.
+"""
+
+import base64
+import gzip
+import hashlib
+import hmac
+import os
+import struct
+import typing as t
+import xml.etree.ElementTree as ElementTree
+
+import crypto
+
+SIGNATURE = (0x9AA2D903, 0xB54BFB67)
+KDBX3 = 3
+KDBX4 = 4
+
+CIPHER_AES256 = bytes.fromhex("31c1f2e6bf714350be5805216afc5aff")
+CIPHER_CHACHA20 = bytes.fromhex("d6038a2b8b6f4cb5a524339a31dbb59a")
+KDF_AES_KDBX3 = bytes.fromhex("c9d9f39a628a4460bf740d08c18a4fea")
+KDF_AES_KDBX4 = bytes.fromhex("7c02bb8279a74ac0927d114a00648238")
+KDF_ARGON2D = bytes.fromhex("ef636ddf8c29444b91f7a9a403e30a0c")
+KDF_ARGON2ID = bytes.fromhex("9e298b1956db4773b23dfc3ec6f0a1e6")
+
+PROTECTED_STREAM_SALSA20 = 2
+PROTECTED_STREAM_CHACHA20 = 3
+SALSA20_PROTECTED_STREAM_NONCE = bytes.fromhex("e830094b97205d2a")
+
+# outer header fields
+HEADER_END = 0
+HEADER_CIPHER_ID = 2
+HEADER_COMPRESSION_FLAGS = 3
+HEADER_MASTER_SEED = 4
+HEADER_TRANSFORM_SEED = 5
+HEADER_TRANSFORM_ROUNDS = 6
+HEADER_ENCRYPTION_IV = 7
+HEADER_PROTECTED_STREAM_KEY = 8
+HEADER_STREAM_START_BYTES = 9
+HEADER_INNER_RANDOM_STREAM_ID = 10
+HEADER_KDF_PARAMETERS = 11
+
+# inner header fields of KDBX 4
+INNER_HEADER_END = 0
+INNER_HEADER_RANDOM_STREAM_ID = 1
+INNER_HEADER_RANDOM_STREAM_KEY = 2
+
+VARIANT_DICTIONARY_TYPES: t.Dict[int, t.Callable[[bytes], t.Any]] = {
+    0x04: lambda value: struct.unpack("<I", value)[0],
+    0x05: lambda value: struct.unpack("<Q", value)[0],
+    0x08: lambda value: value != b"\x00",
+    0x0C: lambda value: struct.unpack("<i", value)[0],
+    0x0D: lambda value: struct.unpack("<q", value)[0],
+    0x18: lambda value: value.decode("utf-8"),
+    0x42: lambda value: value,
+}
+
+
+class KdbxError(OSError):
+    pass
+
+
+class KdbxCredentialsError(KdbxError):
+    pass
+
+
+class KdbxHeader:
+    """Fields of the outer header which are needed to decrypt a database."""
+
+    def __init__(self, version: int, fields: t.Dict[int, bytes], raw: bytes) -> None:
+        self.version = version
+        self.fields = fields
+        self.raw = raw
+        self.kdf_parameters = self._parse_kdf_parameters()
+
+    def get(self, field: int) -> bytes:
+        try:
+            return self.fields[field]
+        except KeyError:
+            raise KdbxError(f"The database header doesn't have the field {field}.")
+
+    @property
+    def cipher_id(self) -> bytes:
+        return self.get(HEADER_CIPHER_ID)
+
+    @property
+    def is_compressed(self) -> bool:
+        return struct.unpack("<I", self.get(HEADER_COMPRESSION_FLAGS))[0] == 1
+
+    def _parse_kdf_parameters(self) -> t.Dict[str, t.Any]:
+        if self.version == KDBX4:
+            return parse_variant_dictionary(self.get(HEADER_KDF_PARAMETERS))
+
+        return {
+            "$UUID": KDF_AES_KDBX3,
+            "S": self.get(HEADER_TRANSFORM_SEED),
+            "R": struct.unpack("<Q", self.get(HEADER_TRANSFORM_ROUNDS))[0],
+        }
+
+    @property
+    def kdf_cache_key(self) -> t.Tuple[t.Any, ...]:
+        """Returns a hashable representation of the KDF parameters."""
+
+        return tuple(sorted(self.kdf_parameters.items()))
+
+
+class KdbxEntry:
+    """Entry of a KeePass database with its string attributes."""
+
+    def __init__(self, uuid: str, group_path: t.List[str], attributes: t.Dict[str, str], tags: str) -> None:
+        self.uuid = uuid
+        self.group_path = group_path
+        self.attributes = attributes
+        self.tags = tags
+
+    @property
+    def title(self) -> str:
+        return self.attributes.get("Title", "")
+
+    @property
+    def username(self) -> str:
+        return self.attributes.get("UserName", "")
+
+    @property
+    def password(self) -> str:
+        return self.attributes.get("Password", "")
+
+    @property
+    def url(self) -> str:
+        return self.attributes.get("URL", "")
+
+    @property
+    def notes(self) -> str:
+        return self.attributes.get("Notes", "")
+
+    @property
+    def path(self) -> str:
+        """Returns the path in the format of keepassxc-cli, e.g. "/group/title"."""
+
+        return "/" + "/".join(self.group_path + [self.title])
+
+
+def parse_variant_dictionary(data: bytes) -> t.Dict[str, t.Any]:
+    """Parses the VariantDictionary structure used for KDF parameters of KDBX 4."""
+
+    (version,) = struct.unpack_from("<H", data, 0)
+
+    if version >> 8 != 1:
+        raise KdbxError("Unsupported version of KDF parameters.")
+
+    result: t.Dict[str, t.Any] = {}
+    offset = 2
+
+    while True:
+        value_type = data[offset]
+        offset += 1
+
+        if value_type == 0:
+            return result
+
+        (key_size,) = struct.unpack_from("<I", data, offset)
+        key = data[offset + 4 : offset + 4 + key_size].decode("utf-8")  # noqa: E203
+        offset += 4 + key_size
+        (value_size,) = struct.unpack_from("<I", data, offset)
+        value = data[offset + 4 : offset + 4 + value_size]  # noqa: E203
+        offset += 4 + value_size
+
+        if value_type in VARIANT_DICTIONARY_TYPES:
+            result[key] = VARIANT_DICTIONARY_TYPES[value_type](value)
+
+
+def parse_header(data: bytes) -> t.Tuple[KdbxHeader, int]:
+    """Parses the outer header. Returns the header and the offset of the data after it."""
+
+    if len(data) < 12 or struct.unpack_from("<II", data, 0) != SIGNATURE:
+        raise KdbxError("The file isn't a KeePass database.")
+
+    _, version = struct.unpack_from("<HH", data, 8)
+
+    if version not in (KDBX3, KDBX4):
+        raise KdbxError(f"Unsupported database version: {version}.")
+
+    size_format = "<I" if version == KDBX4 else "<H"
+    size_length = struct.calcsize(size_format)
+    fields, offset = {}, 12
+
+    while True:
+        field = data[offset]
+        (size,) = struct.unpack_from(size_format, data, offset + 1)
+        offset += 1 + size_length
+        fields[field] = data[offset : offset + size]  # noqa: E203
+        offset += size
+
+        if field == HEADER_END:
+            break
+
+    return KdbxHeader(version=version, fields=fields, raw=data[:offset]), offset
+
+
+def read_key_file(key_file: str) -> bytes:
+    """Returns the 32-byte key stored in a key file in any format supported by KeePassXC."""
+
+    with open(key_file, "rb") as key_file_stream:
+        data = key_file_stream.read()
+
+    if data.lstrip().startswith(b"<?xml") or data.lstrip().startswith(b"<KeyFile"):
+        try:
+            key_element = ElementTree.fromstring(data).find("Key/Data")
+        except ElementTree.ParseError:
+            key_element = None
+
+        if key_element is not None and key_element.text:
+            if key_element.get("Hash") is not None:  # version 2.0 stores hex digits
+                return bytes.fromhex("".join(key_element.text.split()))
+
+            return base64.b64decode(key_element.text.strip())
+
+    if len(data) == 32:
+        return data
+
+    if len(data) == 64:
+        try:
+            return bytes.fromhex(data.decode("ascii"))
+        except ValueError:
+            pass
+
+    return hashlib.sha256(data).digest()
+
+
+def build_composite_key(password: t.Optional[str], key_file: t.Optional[str]) -> bytes:
+    """Combines the password and the key file into the composite key."""
+
+    parts = []
+
+    if password is not None:
+        parts.append(hashlib.sha256(password.encode("utf-8")).digest())
+
+    if key_file:
+        parts.append(read_key_file(key_file))
+
+    return hashlib.sha256(b"".join(parts)).digest()
+
+
+def transform_key(composite_key: bytes, kdf_parameters: t.Dict[str, t.Any]) -> bytes:
+    """Runs the key derivation function of the database."""
+
+    kdf_id = kdf_parameters["$UUID"]
+
+    if kdf_id in (KDF_AES_KDBX3, KDF_AES_KDBX4):
+        return crypto.aes_kdf(composite_key, kdf_parameters["S"], kdf_parameters["R"])
+
+    if kdf_id in (KDF_ARGON2D, KDF_ARGON2ID):
+        return crypto.argon2(
+            password=composite_key,
+            salt=kdf_parameters["S"],
+            time_cost=kdf_parameters["I"],
+            memory_cost=kdf_parameters["M"] // 1024,
+            parallelism=kdf_parameters["P"],
+            type_=crypto.ARGON2D if kdf_id == KDF_ARGON2D else crypto.ARGON2ID,
+            version=kdf_parameters.get("V", 0x13),
+            secret=kdf_parameters.get("K", b""),
+            associated_data=kdf_parameters.get("A", b""),
+        )
+
+    raise KdbxError("Unsupported key derivation function.")
+
+
+def decrypt_payload(header: KdbxHeader, key: bytes, data: bytes) -> bytes:
+    iv = header.get(HEADER_ENCRYPTION_IV)
+
+    if header.cipher_id == CIPHER_AES256:
+        try:
+            return crypto.aes_cbc_decrypt(key, iv, data)
+        except crypto.CryptoError:
+            raise KdbxCredentialsError("Invalid credentials were provided.")
+
+    if header.cipher_id == CIPHER_CHACHA20:
+        return crypto.ChaCha20(key, iv).process(data)
+
+    raise KdbxError("Unsupported cipher. Only AES-256 and ChaCha20 are supported.")
+
+
+def read_kdbx3_payload(header: KdbxHeader, transformed_key: bytes, data: bytes) -> t.Tuple[bytes, int, bytes]:
+    """Decrypts KDBX 3.1 payload and returns XML, ID and key of the protected values stream."""
+
+    master_key = hashlib.sha256(header.get(HEADER_MASTER_SEED) + transformed_key).digest()
+    decrypted = decrypt_payload(header, master_key, data)
+    start_bytes = header.get(HEADER_STREAM_START_BYTES)
+
+    if decrypted[: len(start_bytes)] != start_bytes:
+        raise KdbxCredentialsError("Invalid credentials were provided.")
+
+    blocks, offset = [], len(start_bytes)
+
+    while True:
+        _, block_hash, size = struct.unpack_from("<I32sI", decrypted, offset)
+        offset += 40
+
+        if size == 0:
+            break
+
+        block = decrypted[offset : offset + size]  # noqa: E203
+        offset += size
+
+        if hashlib.sha256(block).digest() != block_hash:
+            raise KdbxError("The database is corrupted: block hash mismatch.")
+
+        blocks.append(block)
+
+    payload = b"".join(blocks)
+    payload = gzip.decompress(payload) if header.is_compressed else payload
+    stream_id = struct.unpack("<I", header.get(HEADER_INNER_RANDOM_STREAM_ID))[0]
+
+    return payload, stream_id, header.get(HEADER_PROTECTED_STREAM_KEY)
+
+
+def read_kdbx4_payload(header: KdbxHeader, transformed_key: bytes, data: bytes) -> t.Tuple[bytes, int, bytes]:
+    """Verifies and decrypts KDBX 4 payload and returns XML, ID and key of the protected values stream."""
+
+    master_seed = header.get(HEADER_MASTER_SEED)
+    encryption_key = hashlib.sha256(master_seed + transformed_key).digest()
+    hmac_base_key = hashlib.sha512(master_seed + transformed_key + b"\x01").digest()
+
+    def block_hmac_key(index: int) -> bytes:
+        return hashlib.sha512(struct.pack("<Q", index) + hmac_base_key).digest()
+
+    header_hash, header_hmac = data[:32], data[32:64]
+
+    if hashlib.sha256(header.raw).digest() != header_hash:
+        raise KdbxError("The database is corrupted: header hash mismatch.")
+
+    if not hmac.compare_digest(
+        hmac.new(block_hmac_key(0xFFFFFFFFFFFFFFFF), header.raw, hashlib.sha256).digest(), header_hmac
+    ):
+        raise KdbxCredentialsError("Invalid credentials were provided.")
+
+    blocks, offset, index = [], 64, 0
+
+    while True:
+        block_hmac, size = struct.unpack_from("<32si", data, offset)
+        offset += 36
+        block = data[offset : offset + size]  # noqa: E203
+        offset += size
+        expected = hmac.new(block_hmac_key(index), struct.pack("<Qi", index, size) + block, hashlib.sha256).digest()
+
+        if not hmac.compare_digest(expected, block_hmac):
+            raise KdbxError("The database is corrupted: block HMAC mismatch.")
+
+        if size == 0:
+            break
+
+        blocks.append(block)
+        index += 1
+
+    payload = decrypt_payload(header, encryption_key, b"".join(blocks))
+    payload = gzip.decompress(payload) if header.is_compressed else payload
+
+    return parse_inner_header(payload)
+
+
+def parse_inner_header(payload: bytes) -> t.Tuple[bytes, int, bytes]:
+    """Splits decrypted KDBX 4 payload into XML, ID and key of the protected values stream."""
+
+    stream_id, stream_key, offset = 0, b"", 0
+
+    while True:
+        field = payload[offset]
+        (size,) = struct.unpack_from("<I", payload, offset + 1)
+        value = payload[offset + 5 : offset + 5 + size]  # noqa: E203
+        offset += 5 + size
+
+        if field == INNER_HEADER_END:
+            break
+        elif field == INNER_HEADER_RANDOM_STREAM_ID:
+            (stream_id,) = struct.unpack("<I", value)
+        elif field == INNER_HEADER_RANDOM_STREAM_KEY:
+            stream_key = value
+
+    return payload[offset:], stream_id, stream_key
+
+
+def build_protected_stream(stream_id: int, key: bytes) -> crypto.StreamCipher:
+    if stream_id == PROTECTED_STREAM_SALSA20:
+        return crypto.Salsa20(hashlib.sha256(key).digest(), SALSA20_PROTECTED_STREAM_NONCE)
+
+    if stream_id == PROTECTED_STREAM_CHACHA20:
+        digest = hashlib.sha512(key).digest()
+        return crypto.ChaCha20(digest[:32], digest[32:44])
+
+    raise KdbxError("Unsupported protected values stream.")
+
+
+def parse_entries(xml: bytes, protected_stream: crypto.StreamCipher) -> t.List[KdbxEntry]:
+    """Parses entries of the inner XML document. History entries are skipped."""
+
+    root = ElementTree.fromstring(xml)
+
+    # the stream is shared by all protected values in the order they appear in the document
+    for value_element in root.iter("Value"):
+        if value_element.get("Protected", "").lower() == "true" and value_element.text:
+            encrypted = base64.b64decode(value_element.text)
+            value_element.text = protected_stream.process(encrypted).decode("utf-8")
+
+    root_group = root.find("Root/Group")
+
+    if root_group is None:
+        raise KdbxError("The database doesn't have the root group.")
+
+    entries: t.List[KdbxEntry] = []
+    _collect_entries(root_group, [], entries)
+    return entries
+
+
+def _collect_entries(group: ElementTree.Element, group_path: t.List[str], entries: t.List[KdbxEntry]) -> None:
+    for entry_element in group.findall("Entry"):
+        attributes = {}
+
+        for string_element in entry_element.findall("String"):
+            attributes[string_element.findtext("Key", "")] = string_element.findtext("Value") or ""
+
+        uuid = base64.b64decode(entry_element.findtext("UUID", "")).hex()
+        entries.append(KdbxEntry(uuid, group_path, attributes, entry_element.findtext("Tags") or ""))
+
+    for child_group in group.findall("Group"):
+        _collect_entries(child_group, group_path + [child_group.findtext("Name", "")], entries)
+
+
+class KdbxReader:
+    """Reads entries of a database and keeps them until the file changes.
+
+    The transformed key is cached by the KDF parameters, including the seed,
+    and the composite key. Every save in KeePassXC changes the seed, so a
+    read after it derives the key again.
+    """
+
+    def __init__(self, db_path: str, password: t.Optional[str], key_file: t.Optional[str] = None) -> None:
+        self.db_path = db_path
+        self.password = password
+        self.key_file = key_file
+        self._transformed_keys: t.Dict[t.Tuple[t.Any, ...], bytes] = {}
+        self._entries: t.List[KdbxEntry] = []
+        self._fingerprint: t.Optional[t.Tuple[int, ...]] = None
+
+    def read(self) -> t.List[KdbxEntry]:
+        """Returns all entries of the database. They are parsed again only if the file has changed."""
+
+        stat = os.stat(self.db_path)
+        fingerprint = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+        if fingerprint == self._fingerprint:
+            return self._entries
+
+        with open(self.db_path, "rb") as db_file:
+            data = db_file.read()
+
+        header, offset = parse_header(data)
+        transformed_key = self._get_transformed_key(header)
+
+        if header.version == KDBX4:
+            xml, stream_id, stream_key = read_kdbx4_payload(header, transformed_key, data[offset:])
+        else:
+            xml, stream_id, stream_key = read_kdbx3_payload(header, transformed_key, data[offset:])
+
+        self._entries = parse_entries(xml, build_protected_stream(stream_id, stream_key))
+        self._fingerprint = fingerprint
+
+        return self._entries
+
+    def _get_transformed_key(self, header: KdbxHeader) -> bytes:
+        composite_key = build_composite_key(self.password, self.key_file)
+        cache_key = (header.kdf_cache_key, composite_key)
+
+        if cache_key not in self._transformed_keys:
+            self._transformed_keys.clear()  # a key for old parameters is never needed again
+            self._transformed_keys[cache_key] = transform_key(composite_key, header.kdf_parameters)
+
+        return self._transformed_keys[cache_key]
@@ -0,0 +1,298 @@
+"""Subprocesses which don't outlive the workflow run that started them.
+
+The search script filter runs with the queue mode "terminate previous
+script", so Alfred kills the run of a superseded query. Its keepassxc-cli
+would keep deriving the key and pile up with the ones of the next keystrokes,
+therefore every subprocess is started in its own session, i.e. in its own
+process group, and is killed:
+
+- when a call takes longer than the ``subprocess_timeout`` setting;
+- when the run gets SIGTERM, SIGHUP or SIGINT, see ``install_signal_handlers``;
+- when the run dies without handling a signal, e.g. by SIGKILL. Every
+  subprocess is recorded as a "<parent pid>-<child pid>" file in the runtime
+  directory, and the first subprocess of the next run kills the process
+  groups left by dead parents. The process ID might have been reused since,
+  so a group is killed only if its leader has gone or started before the
+  record was written. If the start time can't be read, only records younger
+  than the subprocess timeout are trusted. Records older than
+  ``RECORD_MAX_AGE`` are only removed.
+
+The signal handler doesn't take locks, so it can interrupt the registration
+of a subprocess. A signal which comes while a subprocess is being started is
+handled once the subprocess is recorded. After killing the subprocesses the
+handler raises SystemExit in the main thread, so ``finally`` blocks clean up
+as usual.
+"""
+
+import os
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+import typing as t
+
+from conf import settings
+
+DEFAULT_TIMEOUT = 60
+RECORD_MAX_AGE = 3600
+START_TIME_TOLERANCE = 1.0  # the start time on Linux is derived from the boot time and clock ticks
+TERMINATION_SIGNALS = (signal.SIGTERM, signal.SIGHUP, signal.SIGINT)
+
+_children: t.Dict[int, str] = {}  # pid: path of the record
+_child_threads: t.Dict[int, int] = {}  # pid: ID of the thread which has started it
+_spawning_threads: t.Set[int] = set()
+_pending_signal: t.Optional[int] = None
+_reaped_directory: t.Optional[str] = None
+
+
+class SubprocessTimeoutError(OSError):
+    """Raised when a subprocess hasn't finished within the timeout and has been killed."""
+
+
+class Watchdog:
+    """Kills the process group of a subprocess which is still running after the timeout.
+
+    It's used for subprocesses whose output is read by the caller as it comes,
+    when ``communicate`` can't be used.
+    """
+
+    def __init__(self, process: "subprocess.Popen[bytes]", timeout: t.Optional[float] = None) -> None:
+        self.process = process
+        self.timeout = get_timeout() if timeout is None else timeout
+        self.has_fired = False
+        self._timer = threading.Timer(self.timeout, self._fire)
+        self._timer.daemon = True
+
+    def __enter__(self) -> "Watchdog":
+        self._timer.start()
+        return self
+
+    def __exit__(self, *_: t.Any) -> None:
+        self._timer.cancel()
+
+    def _fire(self) -> None:
+        self.has_fired = True
+        kill(self.process)
+
+
+def get_timeout() -> float:
+    return settings.SUBPROCESS_TIMEOUT.value or DEFAULT_TIMEOUT
+
+
+def get_records_directory() -> str:
+    from services import get_runtime_directory
+
+    return os.path.join(get_runtime_directory(), "children")
+
+
+def spawn(command: t.List[str], **kwargs: t.Any) -> "subprocess.Popen[bytes]":
+    """Starts the command in a new process group and records it until ``release`` is called."""
+
+    global _reaped_directory
+
+    directory = get_records_directory()
+
+    if directory != _reaped_directory:  # once per process
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        reap_orphans(directory)
+        _reaped_directory = directory
+
+    thread_id = threading.get_ident()
+    _spawning_threads.add(thread_id)
+
+    try:
+        process = subprocess.Popen(command, start_new_session=True, **kwargs)
+        record_path = os.path.join(directory, f"{os.getpid()}-{process.pid}")
+        _children[process.pid] = record_path
+        _child_threads[process.pid] = thread_id
+        os.close(os.open(record_path, os.O_WRONLY | os.O_CREAT, 0o600))
+    finally:
+        _spawning_threads.discard(thread_id)
+
+        if _pending_signal is not None and not _spawning_threads:
+            terminate(_pending_signal)
+
+    return process
+
+
+def communicate(
+    process: "subprocess.Popen[bytes]", input: t.Optional[bytes] = None, timeout: t.Optional[float] = None
+) -> t.Tuple[bytes, bytes]:
+    """Like ``Popen.communicate``, but the process group is killed on timeout and the record is released."""
+
+    timeout = get_timeout() if timeout is None else timeout
+
+    try:
+        return process.communicate(input, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill(process)
+        process.communicate()
+        name = os.path.basename(str(process.args[0] if isinstance(process.args, list) else process.args))
+        raise SubprocessTimeoutError(f"{name} hasn't finished in {timeout:g} seconds.")
+    finally:
+        release(process)
+
+
+def kill(process: "subprocess.Popen[bytes]") -> None:
+    """Kills the process group of the subprocess."""
+
+    kill_group(process.pid)
+
+
+def kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):  # the group has gone, macOS reports a group of zombies as EPERM
+        pass
+
+
+def kill_started_by(thread_ids: t.Collection[int]) -> None:
+    """Kills the process groups of the recorded subprocesses started by the threads.
+
+    The records are released by the threads when they see the subprocesses exit.
+    """
+
+    for pid, thread_id in list(_child_threads.items()):
+        if thread_id in thread_ids:
+            kill_group(pid)
+
+
+def release(process: "subprocess.Popen[bytes]") -> None:
+    """Forgets a finished subprocess."""
+
+    _child_threads.pop(process.pid, None)
+    record_path = _children.pop(process.pid, None)
+
+    if record_path:
+        try:
+            os.unlink(record_path)
+        except FileNotFoundError:
+            pass
+
+
+def reap_orphans(directory: str) -> None:
+    """Kills the process groups recorded by processes which have died and removes their records."""
+
+    now = time.time()
+
+    for dir_entry in os.scandir(directory):
+        parent_pid, _, pid = dir_entry.name.partition("-")
+
+        try:
+            if parent_pid.isdigit() and is_alive(int(parent_pid)):
+                continue
+
+            recorded_at = dir_entry.stat().st_mtime
+
+            if pid.isdigit() and now - recorded_at < RECORD_MAX_AGE and is_recorded_process(int(pid), recorded_at):
+                kill_group(int(pid))
+
+            os.unlink(dir_entry.path)
+        except FileNotFoundError:  # reaped by another process
+            pass
+
+
+def is_recorded_process(pid: int, recorded_at: float) -> bool:
+    """Tells if the process group of the pid is still the one recorded at the given time."""
+
+    if not is_alive(pid):
+        return True  # the group may outlive its leader, and its ID isn't reused while it exists
+
+    started_at = get_start_time(pid)
+
+    if started_at is None:
+        return time.time() - recorded_at < get_timeout()
+
+    return started_at <= recorded_at + START_TIME_TOLERANCE
+
+
+def get_start_time(pid: int) -> t.Optional[float]:
+    """Returns the Unix time when the process started or None if it can't be read."""
+
+    try:
+        if os.path.isdir("/proc/self"):
+            return _get_proc_start_time(pid)
+
+        if sys.platform == "darwin":
+            return _get_darwin_start_time(pid)
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+def _get_proc_start_time(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as stat_file:
+        ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19])  # the 22nd field, after the command name
+
+    with open("/proc/stat") as stat_file:
+        boot_time = next(int(line.split()[1]) for line in stat_file if line.startswith("btime "))
+
+    return boot_time + ticks / os.sysconf("SC_CLK_TCK")
+
+
+def _get_darwin_start_time(pid: int) -> t.Optional[float]:
+    import ctypes
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    mib = (ctypes.c_int * 4)(1, 14, 1, pid)  # CTL_KERN, KERN_PROC, KERN_PROC_PID
+    buffer = ctypes.create_string_buffer(1024)  # struct kinfo_proc
+    size = ctypes.c_size_t(len(buffer))
+
+    if libc.sysctl(mib, 4, buffer, ctypes.byref(size), None, 0) != 0 or not size.value:
+        return None
+
+    seconds, microseconds = struct.unpack_from("=qi", buffer.raw)  # kp_proc.p_starttime, a struct timeval
+
+    return seconds + microseconds / 1e6
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # it's a process of another user
+        return True
+
+    return True
+
+
+def install_signal_handlers() -> None:
+    """Makes termination signals kill the subprocesses. It's called from the main thread."""
+
+    for signal_number in TERMINATION_SIGNALS:
+        signal.signal(signal_number, on_termination_signal)
+
+
+def on_termination_signal(signal_number: int, _: t.Any) -> None:
+    global _pending_signal
+
+    _pending_signal = signal_number
+
+    if not _spawning_threads:
+        terminate(signal_number)
+
+
+def terminate(signal_number: int) -> None:
+    """Kills all recorded subprocesses and exits with the status a shell gives to a process killed by the signal.
+
+    SystemExit is raised in the main thread, so ``finally`` blocks run. A
+    signal deferred by another thread is sent again to the main thread.
+    """
+
+    for pid, record_path in list(_children.items()):
+        kill_group(pid)
+
+        try:
+            os.unlink(record_path)
+        except FileNotFoundError:
+            pass
+
+    if threading.current_thread() is not threading.main_thread():
+        signal.pthread_kill(threading.main_thread().ident or 0, signal_number)
+        return
+
+    raise SystemExit(128 + signal_number)
@@ -0,0 +1,663 @@
+"""Local ranked search over entry paths and titles.
+
+``SearchIndex`` is built once from the entries of a database. Queries are
+split into terms and every term has to be found in the title or in the group
+path of an entry. Candidates come from trigram inverted indexes: a term can
+only occur where all its trigrams occur, so the posting lists are intersected,
+the smallest first. Terms shorter than three characters use indexes of word
+prefixes instead. A term without any candidates is matched fuzzily: entries
+sharing at least half of its trigrams are accepted with a low score.
+
+Group paths are shared by many entries, so they are indexed once per group.
+Text is folded once per entry: NFKD normalization without combining marks
+and casefold, so "cafe" finds "Café".
+
+Ranking rewards title prefixes over word beginnings in titles, any other
+title matches and group path matches. Ties go to shorter titles. Only the
+most selective term of a query collects candidates, the other terms filter
+them, and the top results are picked with a heap, so the candidates are never
+sorted. A single term, the usual query while typing, isn't scored at all:
+lists of entries by title and word beginnings are kept in the order of the
+tie-breaker, so the results are taken from their heads score by score.
+Several terms aren't scored either if enough titles have the best possible
+total: they start with one term and have words starting with the others.
+Substring matches of many titles are taken in the order of the tie-breaker
+too, so a few results don't need a heap of all the candidates.
+
+Terms like "user:alice" filter entries by a field instead of being ranked:
+``title``, ``user``, ``url`` (the host), ``tag`` and ``group``. Usernames,
+URL hosts and tags have inverted indexes by words with sorted vocabularies,
+so a value matches words starting with it. ``group:/Work/`` matches the
+group and its subgroups, a value without the leading slash matches words of
+group paths. Terms with other prefixes are free text.
+"""
+
+import bisect
+import collections
+import heapq
+import itertools
+import operator
+import re
+import sys
+import typing as t
+import unicodedata
+import urllib.parse
+
+DEFAULT_LIMIT = 50
+FUZZY_MATCH_RATIO = 0.5
+WORD_PATTERN = re.compile(r"\w+")
+FIELD_TERM_PATTERN = re.compile(r"(\w+):(.*)")
+TAG_SEPARATOR_PATTERN = re.compile(r"[;,]")
+
+# prefixes of field terms like in KeePassXC search
+FIELD_ALIASES = {
+    "t": "title",
+    "title": "title",
+    "u": "user",
+    "user": "user",
+    "username": "user",
+    "url": "url",
+    "tag": "tag",
+    "tags": "tag",
+    "g": "group",
+    "group": "group",
+}
+
+# scores of a term depending on where it has been found
+TITLE_PREFIX_SCORE = 100
+TITLE_WORD_SCORE = 70
+TITLE_SUBSTRING_SCORE = 50
+GROUP_WORD_SCORE = 30
+GROUP_SUBSTRING_SCORE = 20
+FUZZY_SCORE = 10
+
+
+class SearchableEntry(t.Protocol):
+    @property
+    def path(self) -> str: ...  # noqa: E704
+
+    @property
+    def title(self) -> str: ...  # noqa: E704
+
+    @property
+    def username(self) -> str: ...  # noqa: E704
+
+    @property
+    def url(self) -> str: ...  # noqa: E704
+
+    @property
+    def tags(self) -> str: ...  # noqa: E704
+
+
+def fold(text: str) -> str:
+    """Removes accents and case differences."""
+
+    if text.isascii():
+        return text.lower()
+
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def get_trigrams(text: str) -> t.Set[str]:
+    return {text[index : index + 3] for index in range(len(text) - 2)}  # noqa: E203
+
+
+def get_word_prefixes(text: str, max_size: int) -> t.Set[str]:
+    return {word[:size] for word in WORD_PATTERN.findall(text) for size in range(1, max_size + 1)}
+
+
+def get_url_host(url: str) -> str:
+    """Returns the host of the URL, URLs without a scheme are accepted too."""
+
+    try:
+        return urllib.parse.urlsplit(url if "//" in url else f"//{url}").hostname or ""
+    except ValueError:
+        return ""
+
+
+def get_tags(tags: str) -> t.Set[str]:
+    return {tag.strip() for tag in TAG_SEPARATOR_PATTERN.split(tags) if tag.strip()}
+
+
+def parse_query(query: str) -> t.Tuple[t.List[str], t.List[t.Tuple[str, str]]]:
+    """Splits the folded query into free text terms and field filters, e.g. ("user", "alice")."""
+
+    terms: t.List[str] = []
+    filters: t.List[t.Tuple[str, str]] = []
+
+    for term in fold(query).split():
+        match = FIELD_TERM_PATTERN.fullmatch(term)
+        field = FIELD_ALIASES.get(match.group(1)) if match else None
+
+        if match is None or field is None:
+            terms.append(term)
+        elif match.group(2):
+            filters.append((field, match.group(2)))
+
+    return terms, filters
+
+
+def compile_word_start(term: str) -> t.Callable[[str], t.Optional[t.Match[str]]]:
+    """Returns a function finding the term at the beginning of a word."""
+
+    return re.compile(r"(?<!\w)" + re.escape(term)).search
+
+
+class SearchIndex:
+    """Inverted indexes over titles and group paths of entries.
+
+    Lists of entries are kept in the order of ranks once the index is
+    prepared, so the best entries of a score are the first ones.
+    """
+
+    def __init__(self, entries: t.Iterable[SearchableEntry]) -> None:
+        self.entries: t.List[SearchableEntry] = []
+        self._titles: t.List[str] = []
+        self._entry_groups: t.List[int] = []
+        self._groups: t.List[str] = []
+        self._group_ids: t.Dict[str, int] = {}
+        self._group_entries: t.List[t.List[int]] = []
+        self._title_trigrams: t.Dict[str, t.Set[int]] = {}
+        self._title_starts: t.Dict[str, t.List[int]] = {}
+        self._title_word_starts: t.Dict[str, t.List[int]] = {}
+        self._group_trigrams: t.Dict[str, t.Set[int]] = {}
+        self._group_word_starts: t.Dict[str, t.Set[int]] = {}
+        self._field_postings: t.Dict[str, t.Dict[str, t.Set[int]]] = {"user": {}, "url": {}, "tag": {}}
+        self._field_words: t.Dict[str, t.List[str]] = {}
+        self._order: t.List[int] = []
+        self._ranks: t.List[int] = []
+        self._is_prepared = False
+
+        for entry in entries:
+            self.add(entry)
+
+        self.prepare()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, entry: SearchableEntry) -> None:
+        """Adds an entry to the index. ``prepare`` is called by the next search."""
+
+        entry_id = len(self.entries)
+        title = fold(entry.title)
+        group_id = self._add_group(fold(entry.path[: len(entry.path) - len(entry.title)]))
+        self.entries.append(entry)
+        self._titles.append(title)
+        self._entry_groups.append(group_id)
+        self._group_entries[group_id].append(entry_id)
+        self._is_prepared = False
+
+        for trigram in get_trigrams(title):
+            self._title_trigrams.setdefault(trigram, set()).add(entry_id)
+
+        for prefix in get_word_prefixes(title, 3):
+            self._title_word_starts.setdefault(prefix, []).append(entry_id)
+
+        for size in range(1, min(len(title), 3) + 1):
+            self._title_starts.setdefault(title[:size], []).append(entry_id)
+
+        field_words = (
+            ("user", WORD_PATTERN.findall(fold(entry.username))),
+            ("url", WORD_PATTERN.findall(fold(get_url_host(entry.url)))),
+            ("tag", get_tags(fold(entry.tags))),
+        )
+
+        for field, words in field_words:
+            for word in words:
+                self._field_postings[field].setdefault(word, set()).add(entry_id)
+
+    def _add_group(self, group: str) -> int:
+        if group in self._group_ids:
+            return self._group_ids[group]
+
+        group_id = self._group_ids[group] = len(self._groups)
+        self._groups.append(group)
+        self._group_entries.append([])
+
+        for trigram in get_trigrams(group):
+            self._group_trigrams.setdefault(trigram, set()).add(group_id)
+
+        for prefix in get_word_prefixes(group, 2):
+            self._group_word_starts.setdefault(prefix, set()).add(group_id)
+
+        return group_id
+
+    def prepare(self) -> None:
+        """Ranks entries by the title length, which is the tie-breaker of scores."""
+
+        if self._is_prepared:
+            return
+
+        order = sorted(range(len(self.entries)), key=lambda entry_id: (len(self._titles[entry_id]), entry_id))
+        self._order = order
+        self._ranks = [0] * len(order)
+
+        for rank, entry_id in enumerate(order):
+            self._ranks[entry_id] = rank
+
+        for entry_ids in itertools.chain(
+            self._title_starts.values(), self._title_word_starts.values(), self._group_entries
+        ):
+            entry_ids.sort(key=self._ranks.__getitem__)
+
+        self._field_words = {field: sorted(postings) for field, postings in self._field_postings.items()}
+        self._is_prepared = True
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> t.List[SearchableEntry]:
+        """Returns at most ``limit`` entries matching all terms of the query, the best first."""
+
+        terms, filters = parse_query(query)
+
+        if not terms and not filters:
+            return self.entries[:limit]
+
+        if limit <= 0:
+            return []
+
+        self.prepare()
+        allowed_ids = self._apply_filters(filters) if filters else None
+
+        if allowed_ids is not None and not terms:
+            return [self.entries[entry_id] for entry_id in self._select_first(allowed_ids, limit)]
+
+        if allowed_ids is None and len(terms) == 1:
+            best_ids = self._search_term(terms[0], limit)
+
+            if best_ids:
+                return [self.entries[entry_id] for entry_id in best_ids]
+
+        if allowed_ids is None and len(terms) > 1:
+            best_ids = self._search_top_tier(terms, limit)
+
+            if best_ids:
+                return [self.entries[entry_id] for entry_id in best_ids]
+
+        terms.sort(key=self._estimate_candidates)
+        entry_ids, term_fuzzy_scores = self._collect_candidates(terms, allowed_ids)
+        totals = [0.0] * len(entry_ids)
+        minimums = [1.0] * len(entry_ids)
+
+        for term, fuzzy_scores in zip(terms, term_fuzzy_scores):
+            if fuzzy_scores:
+                scores = list(map(fuzzy_scores.__getitem__, entry_ids))
+            else:
+                scores = self._score_term(term, entry_ids)
+
+            totals = list(map(operator.add, totals, scores))
+            minimums = list(map(min, minimums, scores))
+
+        totals = list(map(operator.mul, totals, map(bool, minimums)))  # every term has to match
+        return [self.entries[entry_id] for entry_id in self._select_best(entry_ids, totals, limit)]
+
+    def _collect_candidates(
+        self, terms: t.List[str], allowed_ids: t.Optional[t.Set[int]]
+    ) -> t.Tuple[t.List[int], t.List[t.Dict[int, float]]]:
+        """Returns entries which may contain all terms and fuzzy scores of every term.
+
+        The most selective term or the filtered entries give candidates, other
+        terms only filter them.
+        """
+
+        if allowed_ids is not None and len(allowed_ids) <= self._estimate_candidates(terms[0]):
+            entry_ids, fuzzy_scores = self._filter_candidates(terms[0], list(allowed_ids))
+        else:
+            entry_ids, fuzzy_scores = self._find_candidates(terms[0])
+
+            if allowed_ids is not None:
+                entry_ids = list(allowed_ids.intersection(entry_ids))
+
+        term_fuzzy_scores = [fuzzy_scores]
+
+        for term in terms[1:]:
+            entry_ids, fuzzy_scores = self._filter_candidates(term, entry_ids)
+            term_fuzzy_scores.append(fuzzy_scores)
+
+        return entry_ids, term_fuzzy_scores
+
+    def _apply_filters(self, filters: t.List[t.Tuple[str, str]]) -> t.Set[int]:
+        """Returns entries matching all field filters.
+
+        Posting lists of the most selective filter give the entries, the other
+        filters intersect them. Posting lists of words aren't merged, e.g. of
+        a prefix of many usernames, so intersections pick entries from each
+        of them. If the next filter has a single posting list, the ones of
+        the first filter are intersected with it instead of being merged.
+        Group filters come last and check groups of the entries if they are
+        fewer than entries of the groups, which are lists.
+        """
+
+        postings = [(self._find_field_postings(field, value), field) for field, value in filters]
+        postings.sort(key=lambda posting: sum(map(len, posting[0])))
+        postings[1:] = sorted(postings[1:], key=lambda posting: posting[1] == "group")
+
+        if len(postings) > 1 and postings[1][1] != "group" and len(postings[1][0]) == 1:
+            allowed_ids = self._intersect_any(self._union(postings.pop(1)[0]), postings[0][0])
+        else:
+            allowed_ids = self._union(postings[0][0])
+
+        entry_groups = self._entry_groups
+
+        for entry_sets, field in postings[1:]:
+            if not allowed_ids:
+                break
+
+            if field == "group" and len(allowed_ids) * 4 < sum(map(len, entry_sets)):
+                group_ids = {entry_groups[next(iter(entry_ids))] for entry_ids in entry_sets}  # groups aren't empty
+                allowed_ids = {entry_id for entry_id in allowed_ids if entry_groups[entry_id] in group_ids}
+            else:
+                allowed_ids = self._intersect_any(allowed_ids, entry_sets)
+
+        return allowed_ids
+
+    def _find_field_postings(self, field: str, value: str) -> t.Sequence[t.Collection[int]]:
+        """Returns posting lists of the field value, an entry matches if it's in any of them."""
+
+        if field == "group":
+            return [self._group_entries[group_id] for group_id in self._find_group_filter(value)]
+
+        if field == "title":
+            return [self._find_title_words(value)]
+
+        if field == "tag":
+            return self._find_field_words(field, value)
+
+        words = WORD_PATTERN.findall(value)
+
+        if len(words) == 1:
+            return self._find_field_words(field, words[0])
+
+        # every word of the value has to match, e.g. "url:github.com"
+        word_postings = [set().union(*self._find_field_words(field, word)) for word in words]
+        return [self._intersect(word_postings)]  # type: ignore
+
+    def _find_field_words(self, field: str, prefix: str) -> t.List[t.Set[int]]:
+        """Returns posting lists of field words starting with the prefix."""
+
+        words = self._field_words[field]
+        start = bisect.bisect_left(words, prefix)
+        # words starting with the prefix are sorted before the prefix with the next last character
+        end = bisect.bisect_left(words, prefix[:-1] + chr(min(ord(prefix[-1]) + 1, sys.maxunicode)), start)
+        return list(map(self._field_postings[field].__getitem__, words[start:end]))
+
+    def _find_title_words(self, prefix: str) -> t.Set[int]:
+        entry_ids = self._title_word_starts.get(prefix[:3], [])
+
+        if len(prefix) <= 3:
+            return set(entry_ids)
+
+        find_word = compile_word_start(prefix)
+        titles = self._titles
+        return {entry_id for entry_id in entry_ids if find_word(titles[entry_id])}
+
+    def _find_group_filter(self, value: str) -> t.List[int]:
+        """Returns groups matching "group:" filter, a path with the leading slash includes subgroups."""
+
+        if value.startswith("/"):
+            group_path = value.rstrip("/") + "/"
+            return [group_id for group_id, group in enumerate(self._groups) if group.startswith(group_path)]
+
+        find_word = compile_word_start(value)
+        return [group_id for group_id, group in enumerate(self._groups) if find_word(group)]
+
+    def _search_term(self, term: str, limit: int) -> t.List[int]:
+        """Returns the best entries for a single term, score by score, without scoring every candidate."""
+
+        titles = self._titles
+        find_word = compile_word_start(term)
+
+        if not all(trigram in self._title_trigrams for trigram in get_trigrams(term)):
+            return self._find_group_matches(term, limit, set())  # e.g. a typo, no title contains the term
+
+        best_ids = self._find_title_prefixes(term, limit)
+
+        if len(best_ids) < limit:
+            word_ids = self._title_word_starts.get(term[:3], [])
+            is_word = map(
+                lambda title: not title.startswith(term) and find_word(title), map(titles.__getitem__, word_ids)
+            )
+            best_ids.extend(itertools.islice(itertools.compress(word_ids, is_word), limit - len(best_ids)))
+
+        if len(best_ids) < limit and len(term) >= 3:
+            found_ids = set(best_ids)
+            substring_ids = (
+                entry_id
+                for entry_id in self._iterate_by_rank(self._find_title_candidates(term))
+                if entry_id not in found_ids and term in titles[entry_id]
+            )
+            best_ids.extend(itertools.islice(substring_ids, limit - len(best_ids)))
+
+        if len(best_ids) < limit:
+            best_ids.extend(self._find_group_matches(term, limit - len(best_ids), set(best_ids)))
+
+        return best_ids
+
+    def _search_top_tier(self, terms: t.List[str], limit: int) -> t.List[int]:
+        """Returns the best entries for several terms if the best possible total is enough for all of them.
+
+        A title starts with at most one of the terms unless one of them is a
+        prefix of another, so the best total is a title starting with one
+        term and having words starting with the others. Such entries are
+        taken from the lists of title prefixes, which are in the order of
+        ranks, without scoring the candidates. If there are fewer than
+        ``limit`` of them, lower totals count too and nothing is returned.
+        """
+
+        if any(first.startswith(second) for first, second in itertools.permutations(terms, 2)):
+            return []
+
+        # word starts are indexed by words of word characters only
+        if not all(WORD_PATTERN.fullmatch(term) and term[:3] in self._title_word_starts for term in terms):
+            return []
+
+        find_words = [compile_word_start(term) for term in terms]
+        tiers = [
+            self._iterate_top_tier(term, find_words[:index] + find_words[index + 1 :])  # noqa: E203
+            for index, term in enumerate(terms)
+        ]
+        best_ids = list(itertools.islice(heapq.merge(*tiers, key=self._ranks.__getitem__), limit))
+
+        return best_ids if len(best_ids) == limit else []
+
+    def _iterate_top_tier(
+        self, term: str, other_find_words: t.List[t.Callable[[str], t.Optional[t.Match[str]]]]
+    ) -> t.Iterator[int]:
+        """Yields entries whose titles start with the term and have words starting with the other terms."""
+
+        titles = self._titles
+
+        for entry_id in self._title_starts.get(term[:3], []):
+            title = titles[entry_id]
+
+            if title.startswith(term) and all(find_word(title) for find_word in other_find_words):
+                yield entry_id
+
+    def _find_title_prefixes(self, term: str, limit: int) -> t.List[int]:
+        entry_ids = self._title_starts.get(term[:3], [])
+
+        if len(term) <= 3:
+            return entry_ids[:limit]
+
+        titles = map(self._titles.__getitem__, entry_ids)
+        is_prefix = map(str.startswith, titles, itertools.repeat(term))
+        return list(itertools.islice(itertools.compress(entry_ids, is_prefix), limit))
+
+    def _find_group_matches(self, term: str, limit: int, found_ids: t.Set[int]) -> t.List[int]:
+        """Returns entries of groups matching the term, groups with the term as a word first."""
+
+        group_ids = sorted(self._find_groups(term), key=lambda group_id: -self._score_group(term, group_id))
+        best_ids: t.List[int] = []
+
+        for _, same_score_ids in itertools.groupby(group_ids, key=lambda group_id: self._score_group(term, group_id)):
+            merged_ids = heapq.merge(
+                *(self._group_entries[group_id] for group_id in same_score_ids), key=self._ranks.__getitem__
+            )
+            new_ids = itertools.filterfalse(found_ids.__contains__, merged_ids)
+            best_ids.extend(itertools.islice(new_ids, limit - len(best_ids)))
+
+        return best_ids
+
+    def _find_groups(self, term: str) -> t.List[int]:
+        if len(term) < 3:
+            return list(self._group_word_starts.get(term, ()))
+
+        group_ids = self._intersect([self._group_trigrams.get(trigram) for trigram in get_trigrams(term)])
+        return [group_id for group_id in group_ids if term in self._groups[group_id]]
+
+    def _find_title_candidates(self, term: str) -> t.Collection[int]:
+        if len(term) < 3:
+            return self._title_word_starts.get(term, [])
+
+        return self._intersect([self._title_trigrams.get(trigram) for trigram in get_trigrams(term)])
+
+    def _estimate_candidates(self, term: str) -> int:
+        """Returns an upper bound of the number of entries containing the term."""
+
+        if len(term) < 3:
+            title_count = len(self._title_word_starts.get(term, ()))
+        else:
+            title_count = min(len(self._title_trigrams.get(trigram, ())) for trigram in get_trigrams(term))
+
+        return title_count + sum(len(self._group_entries[group_id]) for group_id in self._find_groups(term))
+
+    def _find_candidates(self, term: str) -> t.Tuple[t.List[int], t.Dict[int, float]]:
+        """Returns entries which may contain the term and fuzzy scores if the term has no candidates."""
+
+        candidates = set(self._find_title_candidates(term))
+        candidates.update(*(self._group_entries[group_id] for group_id in self._find_groups(term)))
+
+        if candidates or len(term) < 3:
+            return list(candidates), {}
+
+        fuzzy_scores = self._score_fuzzy_term(term)
+        return list(fuzzy_scores), fuzzy_scores
+
+    def _filter_candidates(self, term: str, entry_ids: t.List[int]) -> t.Tuple[t.List[int], t.Dict[int, float]]:
+        """Returns entries containing the term among the given ones, fuzzy matches if the term is found nowhere."""
+
+        titles = self._titles
+        groups = self._groups
+        entry_groups = self._entry_groups
+
+        if len(term) < 3:
+            word_ids = self._title_word_starts.get(term, ())
+            group_ids = self._group_word_starts.get(term, set())
+
+            # like in scoring, a few titles are matched instead of building a set of many word starts
+            if len(word_ids) < len(entry_ids) * 8:
+                title_ids = set(word_ids)
+            else:
+                find_word = compile_word_start(term)
+                title_ids = {entry_id for entry_id in entry_ids if find_word(titles[entry_id])}
+
+            matches = [
+                entry_id for entry_id in entry_ids if entry_id in title_ids or entry_groups[entry_id] in group_ids
+            ]
+        else:
+            matches = [
+                entry_id for entry_id in entry_ids if term in titles[entry_id] or term in groups[entry_groups[entry_id]]
+            ]
+
+        if matches or len(term) < 3 or self._find_title_candidates(term) or self._find_groups(term):
+            return matches, {}
+
+        fuzzy_scores = self._score_fuzzy_term(term)
+        return [entry_id for entry_id in entry_ids if entry_id in fuzzy_scores], fuzzy_scores
+
+    @staticmethod
+    def _union(entry_sets: t.Sequence[t.Collection[int]]) -> t.Set[int]:
+        if len(entry_sets) == 1 and isinstance(entry_sets[0], set):
+            return entry_sets[0]  # it isn't changed, so it isn't copied
+
+        return set().union(*entry_sets)
+
+    @staticmethod
+    def _intersect_any(entry_ids: t.Set[int], entry_sets: t.Sequence[t.Collection[int]]) -> t.Set[int]:
+        """Returns the entries which are in any of the posting lists."""
+
+        return set().union(*map(entry_ids.intersection, entry_sets))
+
+    @staticmethod
+    def _intersect(postings: t.List[t.Optional[t.Set[int]]]) -> t.Set[int]:
+        if not postings or not all(postings):
+            return set()
+
+        postings.sort(key=len)  # type: ignore
+        return postings[0].intersection(*postings[1:])  # type: ignore
+
+    def _score_group(
+        self, term: str, group_id: int, find_word: t.Optional[t.Callable[[str], t.Optional[t.Match[str]]]] = None
+    ) -> float:
+        group = self._groups[group_id]
+
+        if (find_word or compile_word_start(term))(group):
+            return GROUP_WORD_SCORE
+
+        return GROUP_SUBSTRING_SCORE if term in group else 0
+
+    def _score_term(self, term: str, entry_ids: t.List[int]) -> t.List[float]:
+        titles = list(map(self._titles.__getitem__, entry_ids))
+        entry_groups = list(map(self._entry_groups.__getitem__, entry_ids))
+        find_word = compile_word_start(term)
+        group_scores = {group_id: self._score_group(term, group_id, find_word) for group_id in set(entry_groups)}
+        terms = itertools.repeat(term)
+
+        word_ids = self._title_word_starts.get(term, []) if len(term) <= 3 else None
+
+        # building a set of word starts is cheaper than matching many titles, but not a few ones
+        if word_ids is not None and len(word_ids) < len(entry_ids) * 8:
+            is_word = map(set(word_ids).__contains__, entry_ids)
+        else:
+            is_word = map(bool, map(find_word, titles))
+
+        return list(
+            map(
+                max,
+                map(operator.mul, map(str.startswith, titles, terms), itertools.repeat(TITLE_PREFIX_SCORE)),
+                map(operator.mul, is_word, itertools.repeat(TITLE_WORD_SCORE)),
+                map(operator.mul, map(operator.contains, titles, terms), itertools.repeat(TITLE_SUBSTRING_SCORE)),
+                map(group_scores.__getitem__, entry_groups),
+            )
+        )
+
+    def _score_fuzzy_term(self, term: str) -> t.Dict[int, float]:
+        """Scores entries which have most trigrams of the term in the title, e.g. with a typo."""
+
+        trigrams = get_trigrams(term)
+        required_hits = max(1, round(len(trigrams) * FUZZY_MATCH_RATIO))
+        hits = collections.Counter(
+            itertools.chain.from_iterable(self._title_trigrams.get(trigram, ()) for trigram in trigrams)
+        )
+        return {
+            entry_id: FUZZY_SCORE * count / len(trigrams) for entry_id, count in hits.items() if count >= required_hits
+        }
+
+    def _iterate_by_rank(self, entry_ids: t.Collection[int]) -> t.Iterator[int]:
+        """Yields the entries in the order of ranks, so a caller needing a few of them stops early."""
+
+        # the order of all entries is walked if it soon comes across the given ones
+        if len(entry_ids) * 64 > len(self._order):
+            entry_set = entry_ids if isinstance(entry_ids, set) else set(entry_ids)
+            return filter(entry_set.__contains__, self._order)
+
+        return iter(sorted(entry_ids, key=self._ranks.__getitem__))
+
+    def _select_first(self, entry_ids: t.Set[int], limit: int) -> t.List[int]:
+        """Returns the first entries by ranks."""
+
+        return list(itertools.islice(self._iterate_by_rank(entry_ids), limit))
+
+    def _select_best(self, entry_ids: t.List[int], totals: t.List[float], limit: int) -> t.List[int]:
+        """Returns the best entries by total scores, ranks break ties. Entries with zero totals are skipped."""
+
+        best_ids: t.List[int] = []
+
+        for total in sorted(set(totals), reverse=True):
+            if not total or len(best_ids) >= limit:
+                break
+
+            same_total_ids = itertools.compress(entry_ids, map(operator.eq, totals, itertools.repeat(total)))
+            best_ids.extend(heapq.nsmallest(limit - len(best_ids), same_total_ids, key=self._ranks.__getitem__))
+
+        return best_ids
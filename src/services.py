@@ -1,14 +1,33 @@
+import base64
 import binascii
+import collections
+import hashlib
 import json
 import os
 import re
+import selectors
 import subprocess
+import sys
+import threading
+import time
 import typing as t
 import unicodedata
-import urllib.request
 
+import instrumentation
+import processes
 from conf import settings
-from helpers import Version
+from helpers import Version, get_files_fingerprint
+from singleflight import SingleFlight
+from usage import UsageStore
+
+# Every keystroke starts a new process, so the modules which aren't needed
+# to search with keepassxc-cli are imported in place.
+if t.TYPE_CHECKING:
+    import xml.etree.ElementTree as ElementTree
+
+    from kdbx import KdbxEntry
+    from search import SearchIndex
+    from totp import TOTPSettings
 
 
 class KeepassXCItem:
@@ -28,6 +47,153 @@ class KeepassXCItem:
         return value is None or value == ""
 
 
+class KeepassXCEntry:
+    """Compact record of an exported KeepassXC entry.
+
+    Exports can contain many thousands of entries, so the class uses
+    ``__slots__`` and doesn't keep passwords. TOTP settings are kept only if
+    they were requested. Timestamps are Unix times.
+    """
+
+    __slots__ = (
+        "uuid",
+        "group_path",
+        "title",
+        "username",
+        "url",
+        "notes",
+        "tags",
+        "created_at",
+        "modified_at",
+        "totp_settings",
+    )
+
+    def __init__(
+        self,
+        uuid: str,
+        group_path: str,
+        title: str,
+        username: str,
+        url: str,
+        notes: str,
+        tags: str,
+        created_at: t.Optional[int],
+        modified_at: t.Optional[int],
+        totp_settings: t.Optional["TOTPSettings"] = None,
+    ) -> None:
+        self.uuid = uuid
+        self.group_path = group_path
+        self.title = title
+        self.username = username
+        self.url = url
+        self.notes = notes
+        self.tags = tags
+        self.created_at = created_at
+        self.modified_at = modified_at
+        self.totp_settings = totp_settings
+
+    @property
+    def path(self) -> str:
+        """Returns the path in the format of "keepassxc-cli search", e.g. "/group/title"."""
+
+        return f"{self.group_path}/{self.title}"
+
+
+def parse_keepassxc_time(value: t.Optional[str]) -> t.Optional[int]:
+    """Converts a time of KeePass XML or CSV export to Unix time.
+
+    KDBX 4 stores base64-encoded seconds since 0001-01-01, older formats
+    and CSV exports use ISO 8601 strings.
+    """
+
+    import datetime
+
+    if not value:
+        return None
+
+    try:
+        if "-" in value and ":" in value:
+            moment = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+            return int(moment.replace(tzinfo=moment.tzinfo or datetime.timezone.utc).timestamp())
+
+        return int.from_bytes(base64.b64decode(value), "little", signed=True) - KDBX_EPOCH_OFFSET
+    except ValueError:
+        return None
+
+
+KDBX_EPOCH_OFFSET = 62135596800  # seconds between 0001-01-01 and 1970-01-01
+
+
+VAULT_REFERENCE_SEPARATOR = ":"
+NO_SEARCH_RESULTS_MESSAGE = "No results for that search term."
+INVALID_CREDENTIALS_MESSAGE = "Invalid credentials were provided"
+SEARCH_FIELDS = ("title", "username", "url", "notes", "tags")
+SEARCH_TERM_PATTERN = re.compile(r'(-?)(?:"([^"]*)"|(\S+))')
+SEARCH_SYNTAX_CHARACTERS = frozenset('"*?|+!:\\')  # quotes, wildcards, exact matches and fields
+
+
+def parse_totp_settings(attributes: t.Dict[str, str]) -> t.Optional["TOTPSettings"]:
+    """Returns TOTP settings from entry attributes or None if there are no valid settings."""
+
+    from totp import TOTPError, TOTPSettings
+
+    try:
+        return TOTPSettings.from_entry_attributes(attributes)
+    except TOTPError:
+        return None
+
+
+class NoSearchResultsError(OSError):
+    """Raised when a search has no results."""
+
+
+def parse_search_terms(query: str) -> t.List[t.Tuple[bool, str]]:
+    """Returns (is_excluded, term) pairs of a "keepassxc-cli search" query."""
+
+    query = unicodedata.normalize("NFKC", query).casefold()
+    terms = []
+
+    for match in SEARCH_TERM_PATTERN.finditer(query):
+        is_excluded, term = match.group(1) == "-", match.group(2) or match.group(3) or ""
+
+        if term:
+            terms.append((is_excluded, term))
+
+    return terms
+
+
+def matches_search_terms(entry: t.Union["KdbxEntry", KeepassXCEntry], terms: t.List[t.Tuple[bool, str]]) -> bool:
+    """Checks that every term is found in the title, username, URL, notes or tags, and no excluded term is."""
+
+    values = [unicodedata.normalize("NFKC", getattr(entry, field)).casefold() for field in SEARCH_FIELDS]
+
+    for is_excluded, term in terms:
+        if any(term in value for value in values) == is_excluded:
+            return False
+
+    return True
+
+
+def is_query_refinement(previous_query: str, query: str) -> bool:
+    """Checks that every entry found by the query is found by the previous query too.
+
+    It's so if the query appends characters to the last term or adds terms.
+    Appending to an excluded term finds more entries, and the search syntax
+    of keepassxc-cli like wildcards isn't taken into account at all.
+    """
+
+    if not query.startswith(previous_query) or SEARCH_SYNTAX_CHARACTERS.intersection(query):
+        return False
+
+    last_terms = previous_query.split()[-1:]
+    is_last_term_finished = not previous_query or previous_query[-1].isspace()
+    return is_last_term_finished or not last_terms[0].startswith("-")
+
+
+class KeepassXCCredentialsError(OSError):
+    """Raised when keepassxc-cli can't unlock the database with the given credentials."""
+
+
 class KeychainAccess:
     """interface for security system command."""
 
@@ -36,8 +202,12 @@ class KeychainAccess:
         """Returns a password using "security find-generic-password" command."""
 
         command = ["security", "find-generic-password", "-g", "-a", account, "-s", service]
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        _, stderr = process.communicate()
+
+        with instrumentation.stage("keychain"):
+            process = processes.spawn(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = processes.communicate(process)
+
+        instrumentation.add_bytes_read(len(stdout or b"") + len(stderr or b""))
 
         if process.returncode != 0:
             error = "Can't fetch a password from security tool.\nExit code: {exit_code}.\nOutput: {output}"
@@ -62,20 +232,306 @@ class KeychainAccess:
         return groups.get("password", "")
 
 
+class KeepassXCSessionError(OSError):
+    """Raised when an interactive keepassxc-cli session gets out of sync."""
+
+
+class KeepassXCSession:
+    """Interface for keepassxc-cli running in the interactive mode ("keepassxc-cli open").
+
+    The database is unlocked once when the process starts, so the following
+    commands don't pay the key derivation again. The interactive mode has no
+    framing, therefore every command is followed by a sentinel: an unknown command
+    with a unique name. The command is finished when the error about the sentinel
+    appears in stderr and keepassxc-cli prints its prompt again.
+
+    If the output doesn't look like it is expected to, the process is restarted
+    and the command is sent once more.
+    """
+
+    SENTINEL_PREFIX = "__alfred_keepassxc_sentinel_"
+
+    def __init__(self, command: t.List[str], password: str, timeout: float = 30.0) -> None:
+        self.command = command
+        self.password = password
+        self.timeout = timeout
+        self._process: t.Optional["subprocess.Popen[bytes]"] = None
+        self._selector: t.Optional[selectors.BaseSelector] = None
+        self._stdout = b""
+        self._stderr = b""
+        self._prompt = b""
+        self._echo = False
+        self._sentinel_counter = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_alive(self) -> bool:
+        """Tells us if the keepassxc-cli process is running."""
+
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> None:
+        """Starts keepassxc-cli, unlocks the database and learns the prompt."""
+
+        self._process = processes.spawn(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._process.stdout, selectors.EVENT_READ)  # type: ignore
+        self._selector.register(self._process.stderr, selectors.EVENT_READ)  # type: ignore
+        self._stdout, self._stderr = b"", b""
+
+        if self.password:
+            self._write(self.password)
+
+        first_sentinel, second_sentinel = self._next_sentinel(), self._next_sentinel()
+        self._write(first_sentinel)
+        self._write(second_sentinel)
+        self._read_until(
+            lambda: self._has_sentinel(second_sentinel) and self._detect_prompt(first_sentinel, second_sentinel)
+        )
+        errors = self._collect_errors(first_sentinel)
+        self._stdout, self._stderr = b"", b""
+
+        if errors:
+            self.stop()
+            error_class = KeepassXCCredentialsError if INVALID_CREDENTIALS_MESSAGE in errors else OSError
+            raise error_class(f"Can't open the database with keepassxc-cli tool.\nOutput: {errors}")
+
+    def stop(self) -> None:
+        """Stops the keepassxc-cli process."""
+
+        if self._selector:
+            self._selector.close()
+            self._selector = None
+
+        if not self._process:
+            return
+
+        process, self._process = self._process, None
+
+        try:
+            process.stdin.close()  # type: ignore
+        except OSError:
+            pass
+
+        process.terminate()
+
+        try:
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            processes.kill(process)
+            process.wait()
+
+        processes.release(process)
+        process.stdout.close()  # type: ignore
+        process.stderr.close()  # type: ignore
+
+    def restart(self) -> None:
+        """Starts a new keepassxc-cli process instead of the current one."""
+
+        self.stop()
+        self.start()
+
+    def execute(self, arguments: t.List[str]) -> str:
+        """Sends a command to keepassxc-cli and returns its output.
+
+        A desynchronized session is restarted and the command is repeated once.
+        """
+
+        with self._lock:
+            try:
+                return self._execute(arguments)
+            except KeepassXCSessionError:
+                self.restart()
+                return self._execute(arguments)
+
+    def _execute(self, arguments: t.List[str]) -> str:
+        if not self.is_alive:
+            self.restart()
+
+        command_line = self._quote(arguments)
+        sentinel = self._next_sentinel()
+        self._write(command_line)
+        self._write(sentinel)
+        self._read_until(lambda: self._has_sentinel(sentinel) and self._is_prompt_shown(sentinel))
+
+        output = self._collect_output(command_line, sentinel)
+        errors = self._collect_errors(sentinel)
+        self._stdout, self._stderr = b"", b""
+
+        if errors:
+            raise OSError(f"Can't fetch data from keepassxc-cli tool.\nOutput: {errors}")
+
+        return output.decode("utf-8")
+
+    def _next_sentinel(self) -> str:
+        self._sentinel_counter += 1
+        return f"{self.SENTINEL_PREFIX}{os.getpid()}_{self._sentinel_counter}"
+
+    def _write(self, line: str) -> None:
+        try:
+            self._process.stdin.write(line.encode("utf-8") + b"\n")  # type: ignore
+            self._process.stdin.flush()  # type: ignore
+        except (OSError, AttributeError) as error:
+            raise KeepassXCSessionError("Can't write to keepassxc-cli session.") from error
+
+    def _read_until(self, is_done: t.Callable[[], bool]) -> None:
+        deadline = time.monotonic() + self.timeout
+
+        while not is_done():
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0 or not self._selector or not self._process:
+                raise KeepassXCSessionError("keepassxc-cli session doesn't respond.")
+
+            for key, _ in self._selector.select(remaining):
+                chunk = os.read(key.fd, 65536)
+                instrumentation.add_bytes_read(len(chunk))
+
+                if not chunk:
+                    raise KeepassXCSessionError("keepassxc-cli session has been closed unexpectedly.")
+
+                if key.fileobj is self._process.stdout:
+                    self._stdout += chunk
+                else:
+                    self._stderr += chunk
+
+    def _has_sentinel(self, sentinel: str) -> bool:
+        return sentinel.encode("utf-8") in self._stderr
+
+    def _detect_prompt(self, first_sentinel: str, second_sentinel: str) -> bool:
+        """Learns the prompt from the output printed around two sentinels.
+
+        keepassxc-cli built with readline echoes the commands to stdout, so
+        the output looks like "P<first>\\nP<second>\\nP". Otherwise, it's "PPP".
+        """
+
+        lines = self._stdout.split(b"\n")
+
+        if len(lines) >= 3:
+            prompt = lines[-1]
+            is_echoed = lines[-2] == prompt + second_sentinel.encode("utf-8")
+
+            if is_echoed and lines[-3].endswith(prompt + first_sentinel.encode("utf-8")):
+                self._prompt, self._echo = prompt, True
+                return True
+
+        last_line = lines[-1]
+
+        for size in range(2, len(last_line) // 3 + 1):
+            prompt = last_line[-size:]
+
+            if prompt.endswith(b"> ") and last_line.endswith(prompt * 3):
+                self._prompt, self._echo = prompt, False
+                return True
+
+        return False
+
+    def _prompt_tail(self, sentinel: str) -> bytes:
+        if self._echo:
+            return self._prompt + sentinel.encode("utf-8") + b"\n" + self._prompt
+
+        return self._prompt * 2
+
+    def _is_prompt_shown(self, sentinel: str) -> bool:
+        return self._stdout.endswith(self._prompt_tail(sentinel))
+
+    def _collect_output(self, command_line: str, sentinel: str) -> bytes:
+        output = self._stdout[: -len(self._prompt_tail(sentinel))]
+        echoed_command = command_line.encode("utf-8") + b"\n"
+
+        if self._echo and output.startswith(echoed_command):
+            output = output.replace(echoed_command, b"", 1)
+
+        return output
+
+    def _collect_errors(self, sentinel: str) -> str:
+        errors = []
+
+        for line in self._stderr.decode("utf-8", errors="replace").split("\n"):
+            if sentinel in line:
+                break
+
+            if self.SENTINEL_PREFIX in line:
+                raise KeepassXCSessionError("keepassxc-cli session is out of sync.")
+
+            if line.strip():
+                errors.append(line)
+
+        return "\n".join(errors)
+
+    @staticmethod
+    def _quote(arguments: t.List[str]) -> str:
+        """Escapes arguments the way keepassxc-cli splits an interactive command."""
+
+        escaped_arguments = []
+
+        for argument in arguments:
+            argument = re.sub(r"[\r\n]+", " ", argument)
+            escaped_arguments.append(re.sub(r'([\\"\s])', r"\\\1", argument))
+
+        return " ".join(escaped_arguments)
+
+
 class KeepassXCClient:
-    """Interface for keepassxc-cli system command."""
+    """Interface for keepassxc-cli system command.
 
-    def __init__(self, cli_path: str, db_path: str, key_file: str, password: str) -> None:
+    With ``use_session`` the commands are sent to one keepassxc-cli process
+    running in the interactive mode instead of a new process per command.
+    With ``single_flight`` a search runs in one process at a time and the
+    other processes running the same search for the same version of the
+    database get its output. Commands whose output holds secrets, e.g.
+    ``show``, are never coalesced, so their output isn't written to disk.
+    """
+
+    def __init__(
+        self,
+        cli_path: str,
+        db_path: str,
+        key_file: t.Optional[str],
+        password: str,
+        use_session: bool = False,
+        single_flight: t.Optional[SingleFlight] = None,
+    ) -> None:
         self.cli_path = cli_path
         self.db_path = db_path
         self.key_file = key_file
         self.password = password
+        self.use_session = use_session
+        self.single_flight = single_flight
+        self._session: t.Optional[KeepassXCSession] = None
+
+    @property
+    def session(self) -> KeepassXCSession:
+        """Returns the interactive keepassxc-cli session. It's created on the first call."""
+
+        if self._session is None:
+            command = self._build_cli_command(action="open", action_parameters=[])
+            self._session = KeepassXCSession(
+                command=command, password=self.password or "", timeout=processes.get_timeout()
+            )
+
+        return self._session
+
+    def close(self) -> None:
+        """Stops the interactive keepassxc-cli session if it was started."""
+
+        if self._session is not None:
+            self._session.stop()
+            self._session = None
 
     def _normalize_query(self, query: str) -> str:
         query = unicodedata.normalize("NFKC", query)
         return query
 
     def _build_command(self, action: str, action_parameters: t.List[str]) -> t.List[str]:
+        if self.use_session:  # the database is already opened by the session
+            return [self._normalize_query(arg) for arg in [action] + action_parameters]
+
+        return self._build_cli_command(action=action, action_parameters=action_parameters)
+
+    def _build_cli_command(self, action: str, action_parameters: t.List[str]) -> t.List[str]:
         command = [self.cli_path, action, "-q", self.db_path]
         command += action_parameters
 
@@ -89,13 +545,42 @@ class KeepassXCClient:
 
         return command
 
-    def _run_command(self, command: t.List[str]) -> str:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
-        output, _ = process.communicate(input=self.password.encode())
+    def _run_command(self, command: t.List[str], coalesce: bool = False) -> str:
+        with instrumentation.stage("keepassxc-cli"):
+            if self.use_session:
+                try:
+                    return self.session.execute(command)
+                except OSError as e:
+                    if NO_SEARCH_RESULTS_MESSAGE in str(e):
+                        raise NoSearchResultsError(str(e)) from e
+
+                    raise
+
+            if coalesce and self.single_flight:
+                try:
+                    key = json.dumps([command, get_files_fingerprint([self.db_path, *filter(None, [self.key_file])])])
+                except OSError:
+                    return self._execute(command)
+
+                return self.single_flight.run(key, lambda: self._execute(command))
+
+            return self._execute(command)
+
+    def _execute(self, command: t.List[str]) -> str:
+        process = processes.spawn(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
+        output, _ = processes.communicate(process, input=self.password.encode())
+        instrumentation.add_bytes_read(len(output or b""))
 
         if process.returncode != 0:
             error = "Can't fetch data from keepassxc-cli tool.\nExit code: {exit_code}.\n"
-            raise OSError(error.format(output=output, exit_code=process.returncode))
+            error_class = OSError
+
+            if NO_SEARCH_RESULTS_MESSAGE.encode() in (output or b""):
+                error_class = NoSearchResultsError
+            elif INVALID_CREDENTIALS_MESSAGE.encode() in (output or b""):
+                error_class = KeepassXCCredentialsError
+
+            raise error_class(error.format(output=output, exit_code=process.returncode))
 
         return output.decode("utf-8")
 
@@ -106,23 +591,26 @@ class KeepassXCClient:
         cmd_parameters += [query]
         command = self._build_command(action="show", action_parameters=cmd_parameters)
         output = self._run_command(command)
-        entry_data = output[:-1].split("\n")  # the latest element is break line
 
-        return KeepassXCItem(
-            title=entry_data[0],
-            username=entry_data[1],
-            password=entry_data[2],
-            url=entry_data[3],
-            notes="\n".join(entry_data[4:]),
-        )
+        with instrumentation.stage("parsing"):
+            entry_data = output[:-1].split("\n")  # the latest element is break line
+
+            return KeepassXCItem(
+                title=entry_data[0],
+                username=entry_data[1],
+                password=entry_data[2],
+                url=entry_data[3],
+                notes="\n".join(entry_data[4:]),
+            )
 
     def search(self, query: str) -> t.List[str]:
         """Handles the command "keepassxc-cli search"."""
 
         command = self._build_command(action="search", action_parameters=[query])
-        output = self._run_command(command)
+        output = self._run_command(command, coalesce=True)
 
-        return output.split("\n")[:-1]  # the latest element is empty string
+        with instrumentation.stage("parsing"):
+            return output.split("\n")[:-1]  # the latest element is empty string
 
     def totp(self, query: str) -> str:
         """Handles the command "keepassxc-cli show" with --totp flag."""
@@ -133,57 +621,1271 @@ class KeepassXCClient:
 
         return output[:-1]  # the latest element is break line
 
+    def totp_settings(self, query: str) -> "TOTPSettings":
+        """Reads TOTP settings from the "otp" attribute with the command "keepassxc-cli show".
 
-def initialize_keepassxc_client() -> KeepassXCClient:
-    """Initializes the KeepassXC client using user settings."""
+        Entries with legacy "TOTP Seed" attributes aren't supported, OSError is raised.
+        """
 
-    password = KeychainAccess().get_password(
-        account=settings.KEYCHAIN_ACCOUNT.value,
-        service=settings.KEYCHAIN_SERVICE.value,
-    )
+        from totp import TOTPError, TOTPSettings
 
-    kp_client = KeepassXCClient(
-        cli_path=settings.KEEPASSXC_CLI_PATH.value,
-        db_path=settings.KEEPASSXC_DB_PATH.value,
-        key_file=settings.KEEPASSXC_KEYFILE_PATH.value,
-        password=password,
-    )
+        command = self._build_command(action="show", action_parameters=["-a", "otp", query])
+        output = self._run_command(command)[:-1]  # the latest element is break line
 
-    return kp_client
+        try:
+            totp_settings = TOTPSettings.from_entry_attributes({"otp": output})
+        except TOTPError as e:
+            raise OSError(str(e))
 
+        if totp_settings is None:
+            raise OSError(f"Entry with path {query} has no TOTP set up.")
 
-class WorkflowUpdatesChecker:
-    """Interface for checking updates for this workflow."""
+        return totp_settings
 
-    def __init__(self) -> None:
-        self._cached_latest_version = None
+    def export_entries(self, export_format: str = "xml", with_totp: bool = False) -> t.Iterator[KeepassXCEntry]:
+        """Handles the command "keepassxc-cli export" and yields entries while the output is read.
 
-    @property
-    def current_version(self) -> Version:
-        """Returns a current version of the workflow.
+        One process decrypts the whole database instead of a "show" call per
+        entry. The output isn't loaded into memory: XML is parsed with
+        iterparse and released entry by entry, CSV is read row by row.
+        The export runs in its own process even in session mode. The process
+        is killed if the export, including the time the caller spends on the
+        entries, takes longer than the ``subprocess_timeout`` setting.
+        With ``with_totp`` entries have TOTP settings.
+        """
 
-        The workflow's version is stored in ``alfred_workflow_version`` environment variable.
+        import xml.etree.ElementTree as ElementTree
+
+        parsers = {"xml": self._parse_xml_export, "csv": self._parse_csv_export}
+
+        if export_format not in parsers:
+            raise ValueError(f"Unsupported export format: {export_format}.")
+
+        command = self._build_cli_command(action="export", action_parameters=["-f", export_format])
+        process = processes.spawn(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process.stdin.write((self.password or "").encode())  # type: ignore
+        process.stdin.close()  # type: ignore
+        watchdog = processes.Watchdog(process)
+
+        try:
+            with watchdog:
+                yield from parsers[export_format](process.stdout, with_totp)  # type: ignore
+        except ElementTree.ParseError:
+            if process.wait() == 0:
+                raise
+        finally:
+            if process.poll() is None:  # the caller stopped the iteration early
+                processes.kill(process)
+
+            errors = process.stderr.read()  # type: ignore
+            process.wait()
+            processes.release(process)
+            process.stdout.close()  # type: ignore
+            process.stderr.close()  # type: ignore
+
+        if watchdog.has_fired:
+            error = f"keepassxc-cli hasn't exported the database in {watchdog.timeout:g} seconds."
+            raise processes.SubprocessTimeoutError(error)
+
+        if process.returncode != 0:
+            error = "Can't export data from keepassxc-cli tool.\nExit code: {exit_code}.\n{errors}"
+            error_class = KeepassXCCredentialsError if INVALID_CREDENTIALS_MESSAGE.encode() in errors else OSError
+            raise error_class(error.format(exit_code=process.returncode, errors=errors.decode("utf-8", "replace")))
+
+    @staticmethod
+    def _parse_xml_export(stream: t.IO[bytes], with_totp: bool = False) -> t.Iterator[KeepassXCEntry]:
+        import xml.etree.ElementTree as ElementTree
+
+        open_elements = [ElementTree.Element("Document")]  # the parent of the root element
+        group_names: t.List[str] = []
+        history_depth = 0
+
+        for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                open_elements.append(element)
+
+                if element.tag == "Group":
+                    group_names.append("")
+                elif element.tag == "History":
+                    history_depth += 1
+
+                continue
+
+            open_elements.pop()
+            parent = open_elements[-1]
+
+            # processed elements are detached, so memory doesn't grow with the size of the export
+            if element.tag == "Name" and parent.tag == "Group":
+                group_names[-1] = element.text or ""
+            elif element.tag == "History":
+                history_depth -= 1
+            elif element.tag == "Entry" and not history_depth:
+                yield KeepassXCClient._build_exported_entry(element, group_names, with_totp)
+                parent.remove(element)
+            elif element.tag == "Group":
+                group_names.pop()
+                parent.remove(element)
+            elif element.tag == "Meta":
+                element.clear()
+
+    @staticmethod
+    def _build_exported_entry(
+        element: "ElementTree.Element", group_names: t.List[str], with_totp: bool = False
+    ) -> KeepassXCEntry:
+        strings = {item.findtext("Key", ""): item.findtext("Value") or "" for item in element.findall("String")}
+
+        return KeepassXCEntry(
+            uuid=base64.b64decode(element.findtext("UUID", "")).hex(),
+            group_path="".join(f"/{name}" for name in group_names[1:]),  # without the root group
+            title=strings.get("Title", ""),
+            username=strings.get("UserName", ""),
+            url=strings.get("URL", ""),
+            notes=strings.get("Notes", ""),
+            tags=element.findtext("Tags") or "",
+            created_at=parse_keepassxc_time(element.findtext("Times/CreationTime")),
+            modified_at=parse_keepassxc_time(element.findtext("Times/LastModificationTime")),
+            totp_settings=parse_totp_settings(strings) if with_totp else None,
+        )
+
+    @staticmethod
+    def _parse_csv_export(stream: t.IO[bytes], with_totp: bool = False) -> t.Iterator[KeepassXCEntry]:
+        import csv
+        import io
+
+        text_stream = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+        for row in csv.DictReader(text_stream):
+            group_names = (row.get("Group") or "").split("/")[1:]  # without the root group
+
+            yield KeepassXCEntry(
+                uuid=row.get("UUID") or "",
+                group_path="".join(f"/{name}" for name in group_names),
+                title=row.get("Title") or "",
+                username=row.get("Username") or "",
+                url=row.get("URL") or "",
+                notes=row.get("Notes") or "",
+                tags=row.get("Tags") or "",
+                created_at=parse_keepassxc_time(row.get("Created")),
+                modified_at=parse_keepassxc_time(row.get("Last Modified")),
+                totp_settings=parse_totp_settings({"otp": row.get("TOTP") or ""}) if with_totp else None,
+            )
+
+
+class KdbxClient:
+    """Reads the database in-process instead of running keepassxc-cli.
+
+    It has the same interface as KeepassXCClient. The entries and the
+    transformed key are kept in memory, so a long-lived process decrypts the
+    database only when the file changes and runs the KDF once per save of the
+    database.
+    """
+
+    def __init__(self, db_path: str, key_file: t.Optional[str], password: t.Optional[str]) -> None:
+        self.db_path = db_path
+        self.key_file = key_file
+        self.password = password
+
+        from kdbx import KdbxReader
+
+        self.reader = KdbxReader(db_path=db_path, password=password or None, key_file=key_file)
+
+    def close(self) -> None:
+        """Does nothing, there are no processes to stop. It's here for compatibility with KeepassXCClient."""
+
+    def _find_entry(self, query: str) -> "KdbxEntry":
+        from kdbx import KdbxError
+
+        path = unicodedata.normalize("NFKC", query)
+        path = path if path.startswith("/") else f"/{path}"
+
+        for entry in self.reader.read():
+            if unicodedata.normalize("NFKC", entry.path) == path:
+                return entry
+
+        raise KdbxError(f"Could not find entry with path {query}.")
+
+    def show(self, query: str) -> KeepassXCItem:
+        """Returns the entry with the given path like "keepassxc-cli show" does."""
+
+        entry = self._find_entry(query)
+
+        return KeepassXCItem(
+            title=entry.title,
+            username=entry.username,
+            password=entry.password,
+            url=entry.url,
+            notes=entry.notes,
+        )
+
+    def search(self, query: str) -> t.List[str]:
+        """Returns paths of entries matching all terms of the query like "keepassxc-cli search" does.
+
+        Every term is searched case-insensitively in the title, username, URL,
+        notes and tags. Terms in double quotes can contain spaces, terms
+        starting with "-" exclude matching entries.
         """
 
-        return Version(os.getenv("alfred_workflow_version"))
+        terms = parse_search_terms(query)
+        paths = [entry.path for entry in self.reader.read() if matches_search_terms(entry, terms)]
 
-    def fetch_latest_version(self) -> Version:
-        """Requests the latest version of the workflow from github repo.
+        if not paths:
+            raise NoSearchResultsError(NO_SEARCH_RESULTS_MESSAGE)
+
+        return paths
+
+    def totp(self, query: str) -> str:
+        """Generates the current TOTP of the entry like "keepassxc-cli show --totp" does."""
+
+        return self.totp_settings(query).generate()
+
+    def totp_settings(self, query: str) -> "TOTPSettings":
+        """Returns TOTP settings of the entry. KdbxError is raised if the entry has no TOTP set up."""
+
+        from kdbx import KdbxError
+        from totp import TOTPError, TOTPSettings
+
+        entry = self._find_entry(query)
+
+        try:
+            totp_settings = TOTPSettings.from_entry_attributes(entry.attributes)
+        except TOTPError as e:
+            raise KdbxError(str(e))
+
+        if totp_settings is None:
+            raise KdbxError(f"Entry with path {query} has no TOTP set up.")
+
+        return totp_settings
+
+    def export_entries(self, with_totp: bool = False) -> t.Iterator[KeepassXCEntry]:
+        """Yields all entries like KeepassXCClient.export_entries does. Timestamps aren't read."""
+
+        for entry in self.reader.read():
+            yield KeepassXCEntry(
+                uuid=entry.uuid,
+                group_path="".join(f"/{group}" for group in entry.group_path),
+                title=entry.title,
+                username=entry.username,
+                url=entry.url,
+                notes=entry.notes,
+                tags=entry.tags,
+                created_at=None,
+                modified_at=None,
+                totp_settings=parse_totp_settings(entry.attributes) if with_totp else None,
+            )
+
+
+KeepassClient = t.Union[KeepassXCClient, KdbxClient]
+
+
+class KeepassXCClientPool:
+    """Keeps initialized KeepassXC clients between requests of a long-lived process.
 
-        Version is cached within one instance.
+    The pool is disabled by default because every workflow run is a new process.
+    The agent enables it, so a client with its unlocked keepassxc-cli session
+    is reused while the settings it was created with stay the same. A key
+    starts with the database path, and every database of the configured
+    vaults keeps its own client. Vaults are searched in parallel threads, so
+    the clients are stored under a lock.
+    """
+
+    def __init__(self) -> None:
+        self.is_enabled = False
+        self._clients: t.Dict[t.Tuple[t.Optional[str], ...], KeepassClient] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: t.Tuple[t.Optional[str], ...]) -> t.Optional[KeepassClient]:
+        """Returns a client stored with the given key or None."""
+
+        if not self.is_enabled:
+            return None
+
+        with self._lock:
+            return self._clients.get(key)
+
+    def add(self, key: t.Tuple[t.Optional[str], ...], client: KeepassClient) -> None:
+        """Stores a client. Clients of the same database with other settings are closed.
+
+        KeepassXCClient is switched to session mode.
         """
 
-        if self._cached_latest_version:
-            return self._cached_latest_version
+        if not self.is_enabled:
+            return
 
-        url = "https://api.github.com/repos/lxbrvr/alfred-keepassxc-workflow/releases/latest"
+        if isinstance(client, KeepassXCClient):
+            client.use_session = True
 
-        with urllib.request.urlopen(url, timeout=10) as response:
-            latest_release_response = response.read()
-            latest_release = json.loads(latest_release_response)
+        with self._lock:
+            replaced_clients = [
+                self._clients.pop(stored_key) for stored_key in list(self._clients) if stored_key[0] == key[0]
+            ]
+            self._clients[key] = client
 
-            self._cached_latest_version = Version(latest_release["tag_name"])
-            return self._cached_latest_version
+        for replaced_client in replaced_clients:
+            replaced_client.close()
+
+    def clear(self) -> None:
+        """Closes and forgets all stored clients."""
+
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+
+        for client in clients:
+            client.close()
+
+
+client_pool = KeepassXCClientPool()
+
+
+class KeychainPasswordCache:
+    """Keeps the master password from Keychain in memory of a long-lived process.
+
+    Every lookup runs the "security" tool, which takes tens of milliseconds.
+    Like the client pool, the cache is disabled by default because every
+    workflow run is a new process. The agent enables it, so Keychain is asked
+    again only after ``ttl`` seconds without requests or when the password
+    has been rejected. Every vault has its own Keychain item, so the items
+    are cached separately. The password is never written anywhere. The
+    agent logs every lookup with the number of lookups so far. Vaults are
+    searched in parallel threads, so the cache is updated under a lock, but
+    Keychain is asked outside of it.
+    """
+
+    def __init__(self, ttl: float = 300.0) -> None:
+        self.is_enabled = False
+        self.ttl = ttl
+        self.lookups = 0
+        self._passwords: t.Dict[t.Tuple[str, str], t.Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, account: str, service: str) -> str:
+        """Returns the password of the Keychain item, asking Keychain only if it isn't cached."""
+
+        key, now = (account, service), time.monotonic()
+
+        with self._lock:
+            password, used_at = self._passwords.pop(key, (None, 0.0))
+
+            if self.is_enabled and password is not None and now - used_at <= self.ttl:
+                self._passwords[key] = (password, now)
+                return password
+
+            self.lookups += 1
+            message = f"Keychain lookup of {service} (lookups: {self.lookups})"
+
+        if self.is_enabled:  # the counter grows only in the agent, which returns stderr to the client
+            sys.stderr.write(message + "\n")
+        else:
+            instrumentation.log(message)
+
+        password = KeychainAccess.get_password(account=account, service=service)
+
+        if self.is_enabled:
+            with self._lock:
+                self._passwords[key] = (password, now)
+
+        return password
+
+    def clear(self) -> None:
+        """Forgets all passwords."""
+
+        with self._lock:
+            self._passwords.clear()
+
+
+keychain_password_cache = KeychainPasswordCache()
+
+
+def is_credentials_error(error: Exception) -> bool:
+    """Tells us if the database has rejected the credentials."""
+
+    from kdbx import KdbxCredentialsError
+
+    return isinstance(error, (KeepassXCCredentialsError, KdbxCredentialsError))
+
+
+def forget_credentials() -> None:
+    """Drops the cached master password and the clients unlocked with it.
+
+    It's called when the database rejects the password, so the next request
+    reads the password from Keychain again.
+    """
+
+    keychain_password_cache.clear()
+    client_pool.clear()
+
+
+class SearchResultsCache:
+    """Remembers results of the last searches for the current version of the database.
+
+    Typing a query extends it keystroke by keystroke, and every entry found by
+    "github" has been found by "githu" already. So a query extending a
+    remembered one is answered by filtering the remembered paths, and a query
+    extending one without results has no results either. Filtering needs
+    entry attributes, which are exported once per version of the database.
+    The version is the size, the modification time and the inode of the file.
+
+    Like the client pool, the cache is disabled by default because every
+    workflow run is a new process. The agent enables it.
+    """
+
+    def __init__(self, max_size: int = 8) -> None:
+        self.is_enabled = False
+        self.max_size = max_size
+        self._version: t.Optional[t.Tuple[t.Any, ...]] = None
+        self._results: "collections.OrderedDict[str, t.List[str]]" = collections.OrderedDict()
+        self._entries: t.Optional[t.Dict[str, t.List[KeepassXCEntry]]] = None
+
+    def search(self, kp_client: KeepassClient, query: str) -> t.List[str]:
+        """Returns paths of entries found by the query like the search of the client does."""
+
+        if not self.is_enabled:
+            return kp_client.search(query)
+
+        self._check_version(kp_client.db_path)
+        paths = self._search_remembered(kp_client, query)
+
+        if paths is None:
+            try:
+                paths = kp_client.search(query)
+            except NoSearchResultsError:
+                paths = []
+
+            self._remember(query, paths)
+
+        if not paths:
+            raise NoSearchResultsError(NO_SEARCH_RESULTS_MESSAGE)
+
+        return paths
+
+    def clear(self) -> None:
+        """Forgets all results and exported entries."""
+
+        self._version = self._entries = None
+        self._results.clear()
+
+    def _check_version(self, db_path: str) -> None:
+        stat = os.stat(db_path)
+        version = (db_path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+        if version != self._version:
+            self.clear()
+            self._version = version
+
+    def _search_remembered(self, kp_client: KeepassClient, query: str) -> t.Optional[t.List[str]]:
+        if query in self._results:
+            self._results.move_to_end(query)
+            return self._results[query]
+
+        refined_queries = [previous for previous in self._results if is_query_refinement(previous, query)]
+
+        if not refined_queries:
+            return None
+
+        paths = self._results[max(refined_queries, key=len)]
+
+        if paths:
+            terms = parse_search_terms(query)
+            entries = self._get_entries(kp_client)
+            paths = [
+                path for path in paths if any(matches_search_terms(entry, terms) for entry in entries.get(path, []))
+            ]
+
+        self._remember(query, paths)
+        return paths
+
+    def _get_entries(self, kp_client: KeepassClient) -> t.Dict[str, t.List[KeepassXCEntry]]:
+        if self._entries is None:
+            self._entries = {}
+
+            for entry in kp_client.export_entries():
+                self._entries.setdefault(entry.path, []).append(entry)
+
+        return self._entries
+
+    def _remember(self, query: str, paths: t.List[str]) -> None:
+        self._results[query] = paths
+
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+
+search_results_cache = SearchResultsCache()
+
+
+class EntryPrefetcher:
+    """Fetches attributes of the first found entries in the background.
+
+    After a search the user usually picks one of the first results, so their
+    attributes are fetched in advance and the fetch handler takes them from
+    memory. An item is kept for ``ttl`` seconds, at most ``max_size`` items
+    are kept, and they are never written anywhere. A new search cancels the
+    prefetch started by the previous one.
+
+    Like the client pool, the prefetcher is disabled by default: a workflow
+    run exits before the user picks an entry. The agent enables it.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_size: int = 10) -> None:
+        self.is_enabled = False
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items: "collections.OrderedDict[str, t.Tuple[float, KeepassXCItem]]" = collections.OrderedDict()
+        self._client: t.Optional[KeepassClient] = None
+        self._generation = 0
+        self._thread: t.Optional[threading.Thread] = None
+
+    def schedule(self, kp_client: KeepassClient, paths: t.List[str]) -> None:
+        """Starts fetching the entries in a background thread. The previous prefetch is cancelled."""
+
+        if not self.is_enabled:
+            return
+
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+
+            if kp_client is not self._client:
+                self._items.clear()
+                self._client = kp_client
+
+        self._thread = threading.Thread(
+            target=self._prefetch, args=(kp_client, paths[: self.max_size], generation), daemon=True
+        )
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """Stops the current prefetch after the entry being fetched. Fetched items are kept."""
+
+        with self._lock:
+            self._generation += 1
+
+    def get(self, kp_client: KeepassClient, path: str) -> t.Optional[KeepassXCItem]:
+        """Returns the prefetched item of the entry or None."""
+
+        with self._lock:
+            if kp_client is not self._client:
+                return None
+
+            expires_at, item = self._items.get(path, (0.0, None))
+
+            if expires_at < time.monotonic():
+                return None
+
+            return item
+
+    def join(self, timeout: t.Optional[float] = None) -> None:
+        """Waits for the current prefetch to finish."""
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def clear(self) -> None:
+        """Cancels the prefetch and forgets all items."""
+
+        with self._lock:
+            self._generation += 1
+            self._items.clear()
+            self._client = None
+
+    def _prefetch(self, kp_client: KeepassClient, paths: t.List[str], generation: int) -> None:
+        for path in paths:
+            with self._lock:
+                if generation != self._generation:
+                    return
+
+                if self._items.get(path, (0.0, None))[0] > time.monotonic():
+                    continue
+
+            try:
+                item = kp_client.show(path)
+            except OSError:  # the client has been closed or the entry has been removed
+                return
+
+            with self._lock:
+                if generation != self._generation:
+                    return
+
+                self._items[path] = (time.monotonic() + self.ttl, item)
+                self._items.move_to_end(path)
+
+                while len(self._items) > self.max_size:
+                    self._items.popitem(last=False)
+
+
+entry_prefetcher = EntryPrefetcher()
+
+
+class TOTPSettingsCache:
+    """Keeps TOTP settings of entries, so codes are generated without the client.
+
+    Like the client pool, the cache is disabled by default because every
+    workflow run is a new process, and the agent enables it. The settings
+    contain the secret, so they're kept only in memory, until the database
+    file changes or the agent exits.
+    """
+
+    def __init__(self, max_size: int = 32) -> None:
+        self.is_enabled = False
+        self.max_size = max_size
+        self._client: t.Optional[KeepassClient] = None
+        self._fingerprint: t.Optional[t.List[t.Tuple[str, int, int, int]]] = None
+        self._settings: "collections.OrderedDict[str, TOTPSettings]" = collections.OrderedDict()
+
+    def get(self, kp_client: KeepassClient, path: str) -> "TOTPSettings":
+        """Returns TOTP settings of the entry, reads them with the client if needed."""
+
+        if not self.is_enabled:
+            return kp_client.totp_settings(path)
+
+        fingerprint = get_files_fingerprint([kp_client.db_path])
+
+        if kp_client is not self._client or fingerprint != self._fingerprint:
+            self.clear()
+            self._client, self._fingerprint = kp_client, fingerprint
+
+        if path not in self._settings:
+            self._settings[path] = kp_client.totp_settings(path)
+
+            while len(self._settings) > self.max_size:
+                self._settings.popitem(last=False)
+
+        self._settings.move_to_end(path)
+
+        return self._settings[path]
+
+    def clear(self) -> None:
+        """Forgets all settings."""
+
+        self._client = self._fingerprint = None
+        self._settings.clear()
+
+
+totp_settings_cache = TOTPSettingsCache()
+
+
+def prefetch_entries(paths: t.List[str]) -> None:
+    """Prefetches the first ``prefetch_entries`` found entries if the prefetcher is enabled.
+
+    The prefetcher serves the primary vault, so references to entries of other vaults are skipped.
+    """
+
+    paths = [path for path in paths if path.startswith("/")]
+
+    if entry_prefetcher.is_enabled and settings.PREFETCH_ENTRIES.value and paths:
+        entry_prefetcher.schedule(initialize_keepassxc_client(), paths[: settings.PREFETCH_ENTRIES.value])
+
+
+def get_runtime_directory() -> str:
+    """Returns a per-user directory for files shared between workflow runs.
+
+    It's in /dev/shm if it exists, i.e. in memory on Linux, or in the
+    temporary directory.
+    """
+
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else os.getenv("TMPDIR") or "/tmp"
+    return os.path.join(root, f"alfred-keepassxc-{os.getuid()}")
+
+
+class Vault:
+    """A database searched by the workflow with the key file and the Keychain item unlocking it.
+
+    The primary vault is configured with the usual settings, others are
+    listed in ``keepassxc_vaults``. Entries of the primary vault are referred
+    to by their paths, entries of other vaults by "<vault name>:<path>".
+    """
+
+    def __init__(
+        self, name: str, db_path: str, keyfile_path: t.Optional[str], keychain_account: str, is_primary: bool = False
+    ) -> None:
+        self.name = name
+        self.db_path = db_path
+        self.keyfile_path = keyfile_path
+        self.keychain_account = keychain_account
+        self.is_primary = is_primary
+
+    def reference(self, path: str) -> str:
+        """Returns the reference to the entry which is passed to the next script filters."""
+
+        return path if self.is_primary else f"{self.name}{VAULT_REFERENCE_SEPARATOR}{path}"
+
+
+def get_primary_vault() -> Vault:
+    """Returns the vault configured with ``keepassxc_db_path`` and the other usual settings."""
+
+    db_path = settings.KEEPASSXC_DB_PATH.value
+
+    return Vault(
+        name=os.path.splitext(os.path.basename(db_path or ""))[0],
+        db_path=db_path,
+        keyfile_path=settings.KEEPASSXC_KEYFILE_PATH.value,
+        keychain_account=settings.KEYCHAIN_ACCOUNT.value,
+        is_primary=True,
+    )
+
+
+def load_vaults() -> t.List[Vault]:
+    """Returns the primary vault followed by the vaults from ``keepassxc_vaults``.
+
+    The setting is a JSON list of objects with "name", "db_path",
+    "keychain_account" and optional "keyfile_path" keys. Vaults repeating
+    a database are skipped. ValueError is raised if the setting is invalid.
+    """
+
+    vaults = [get_primary_vault()]
+
+    if not settings.KEEPASSXC_VAULTS.value:
+        return vaults
+
+    try:
+        configured_vaults = json.loads(settings.KEEPASSXC_VAULTS.value)
+    except ValueError as e:
+        raise ValueError(f"Invalid {settings.KEEPASSXC_VAULTS.name}: {e}.")
+
+    if not isinstance(configured_vaults, list):
+        raise ValueError(f"Invalid {settings.KEEPASSXC_VAULTS.name}: a list of vaults is expected.")
+
+    for vault in map(parse_vault, configured_vaults):
+        if any(vault.name == known_vault.name for known_vault in vaults[1:]):
+            raise ValueError(f"Vault {vault.name} is listed twice.")
+
+        if all(vault.db_path != known_vault.db_path for known_vault in vaults):
+            vaults.append(vault)
+
+    return vaults
+
+
+def parse_vault(configured_vault: t.Dict[str, str]) -> Vault:
+    """Returns the vault configured in ``keepassxc_vaults``. ValueError is raised if it's invalid."""
+
+    try:
+        vault = Vault(
+            name=configured_vault["name"],
+            db_path=configured_vault["db_path"],
+            keyfile_path=configured_vault.get("keyfile_path") or None,
+            keychain_account=configured_vault["keychain_account"],
+        )
+    except (AttributeError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid vault in {settings.KEEPASSXC_VAULTS.name}: {e!r}.")
+
+    if not vault.name or vault.name.startswith("/") or VAULT_REFERENCE_SEPARATOR in vault.name:
+        raise ValueError(f"Invalid vault name: {vault.name!r}.")
+
+    return vault
+
+
+def resolve_entry_reference(reference: str, vaults: t.Optional[t.List[Vault]] = None) -> t.Tuple[Vault, str]:
+    """Returns the vault of the referred entry and the path of the entry in it."""
+
+    vaults = vaults or load_vaults()
+    name, separator, path = reference.partition(VAULT_REFERENCE_SEPARATOR)
+
+    if separator and path.startswith("/"):
+        for vault in vaults[1:]:
+            if vault.name == name:
+                return vault, path
+
+    return vaults[0], reference
+
+
+def initialize_keepassxc_client(vault: t.Optional[Vault] = None) -> KeepassClient:
+    """Initializes the KeepassXC client of the vault, the primary one by default.
+
+    The "kdbx" backend reads the database in-process, any other value of the
+    setting means keepassxc-cli. Processes running the same keepassxc-cli
+    command at once share one run. In a long-lived process the password is
+    cached and the client is taken from the pool when it has been created
+    with the same password.
+    """
+
+    vault = vault or get_primary_vault()
+    pool_key = (
+        vault.db_path,
+        settings.KEEPASSXC_BACKEND.value,
+        settings.KEEPASSXC_CLI_PATH.value,
+        vault.keyfile_path,
+        vault.keychain_account,
+        settings.KEYCHAIN_SERVICE.value,
+    )
+    password = keychain_password_cache.get(
+        account=vault.keychain_account,
+        service=settings.KEYCHAIN_SERVICE.value,
+    )
+    pooled_client = client_pool.get(pool_key)
+
+    if pooled_client and pooled_client.password == password:
+        return pooled_client
+
+    kp_client: KeepassClient
+
+    if settings.KEEPASSXC_BACKEND.value == "kdbx":
+        kp_client = KdbxClient(
+            db_path=vault.db_path,
+            key_file=vault.keyfile_path,
+            password=password,
+        )
+    else:
+        kp_client = KeepassXCClient(
+            cli_path=settings.KEEPASSXC_CLI_PATH.value,
+            db_path=vault.db_path,
+            key_file=vault.keyfile_path,
+            password=password,
+            single_flight=SingleFlight(
+                directory=os.path.join(get_runtime_directory(), "flights"),
+                error_classes=[NoSearchResultsError, KeepassXCCredentialsError],
+            ),
+        )
+
+    client_pool.add(pool_key, kp_client)
+
+    return kp_client
+
+
+class SearchIndexCache:
+    """Keeps the search index of the database between requests of a long-lived process.
+
+    The index is built from exported entries and rebuilt when the database
+    file changes. Building it costs a full export, which pays off only when
+    the index serves many queries, so it's enabled only in the agent.
+    """
+
+    def __init__(self) -> None:
+        self.is_enabled = False
+        self._key: t.Optional[t.Tuple[t.Any, ...]] = None
+        self._index: t.Optional["SearchIndex"] = None
+
+    def get(self, kp_client: KeepassClient) -> "SearchIndex":
+        """Returns the index of the client's database, builds it if needed."""
+
+        stat = os.stat(kp_client.db_path)
+        key = (kp_client.db_path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+        if self._index is None or key != self._key:
+            from search import SearchIndex
+
+            self._index = SearchIndex(kp_client.export_entries())
+            self._key = key
+
+        return self._index
+
+    def clear(self) -> None:
+        """Forgets the stored index."""
+
+        self._key = self._index = None
+
+
+search_index_cache = SearchIndexCache()
+
+
+def is_local_search_enabled() -> bool:
+    """Tells if searches go to the local index: it's set up and the agent serves the request."""
+
+    return bool(settings.USE_LOCAL_SEARCH.value) and search_index_cache.is_enabled
+
+
+class SearchResultsFileCache:
+    """Stores search results in files, so the next workflow runs can reuse them.
+
+    Every keystroke in Alfred starts a new process, so the results are kept in
+    a directory, preferably a RAM-backed one. A file contains only the paths
+    of the found entries. Its name is a hash of the normalized query and of
+    the fingerprint of the database and the key file: their paths, sizes,
+    modification times and inodes. So results of a changed database are never
+    returned.
+
+    Files expire after ``ttl`` seconds. The access time of a file is updated
+    on every hit and the least recently used files are removed when there are
+    more than ``max_size`` of them. A file is written under a temporary name
+    and renamed, so a concurrent process reads either the whole file or none.
+
+    Hits and misses of all processes are counted in the "hits" and "misses"
+    files of the directory: every lookup appends a byte to one of them, so the
+    size of a file is the count and concurrent processes don't lose updates.
+    Every lookup is written to stderr, where the Alfred debugger shows it,
+    with both counts.
+    """
+
+    COUNTER_FILE_NAMES = ("hits", "misses")
+
+    def __init__(
+        self, directory: str, source_paths: t.List[str], namespace: str, ttl: int, max_size: int = 256
+    ) -> None:
+        self.directory = directory
+        self.source_paths = source_paths
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._fingerprint: t.Optional[str] = None
+
+    def get(self, query: str) -> t.Optional[t.List[str]]:
+        """Returns remembered paths of entries found by the query or None."""
+
+        try:
+            paths = self._read(self._get_file_path(query))
+        except (OSError, ValueError):
+            paths = None
+
+        if paths is None:
+            self._count("misses")
+            self._log("miss")
+        else:
+            self._count("hits")
+            self._log("hit")
+
+        return paths
+
+    def set(self, query: str, paths: t.List[str]) -> None:
+        """Remembers paths of entries found by the query.
+
+        Errors are ignored, they're only logged: the search works without
+        the cache.
+        """
+
+        try:
+            self._write(self._get_file_path(query), paths)
+            self._evict()
+        except OSError as e:
+            self._log(f"not saved: {e}")
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Returns the query with the same meaning for keepassxc-cli.
+
+        Whitespaces inside quotes are a part of a term, so they are collapsed
+        only in queries without quotes.
+        """
+
+        query = unicodedata.normalize("NFKC", query).strip()
+
+        return query if '"' in query else " ".join(query.split())
+
+    def _get_file_path(self, query: str) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = self._build_fingerprint()
+
+        key = json.dumps([self._fingerprint, self.normalize_query(query)])
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _build_fingerprint(self) -> str:
+        return json.dumps([self.namespace, get_files_fingerprint(self.source_paths)])
+
+    def _read(self, file_path: str) -> t.Optional[t.List[str]]:
+        stat = os.stat(file_path)
+
+        if time.time() - stat.st_mtime > self.ttl:
+            os.unlink(file_path)
+            return None
+
+        with open(file_path, encoding="utf-8") as cache_file:
+            paths = json.load(cache_file)
+
+        os.utime(file_path, ns=(time.time_ns(), stat.st_mtime_ns))
+
+        return paths if isinstance(paths, list) else None
+
+    def _write(self, file_path: str, paths: t.List[str]) -> None:
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+        if os.stat(self.directory).st_uid != os.getuid():
+            raise PermissionError(f"{self.directory} belongs to another user.")
+
+        import tempfile
+
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as cache_file:
+                json.dump(paths, cache_file)
+
+            os.replace(temporary_path, file_path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def _evict(self) -> None:
+        """Removes expired files, files left by killed processes and the least recently used files."""
+
+        now = time.time()
+        files = []
+
+        for dir_entry in os.scandir(self.directory):
+            stat = dir_entry.stat()
+
+            if dir_entry.name in self.COUNTER_FILE_NAMES:
+                continue
+
+            if now - stat.st_mtime > self.ttl:
+                self._unlink(dir_entry.path)
+            elif dir_entry.name.endswith(".json"):
+                files.append((stat.st_atime_ns, dir_entry.path))
+
+        for _, file_path in sorted(files)[: max(len(files) - self.max_size, 0)]:
+            self._unlink(file_path)
+
+    @staticmethod
+    def _unlink(file_path: str) -> None:
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:  # removed by another process
+            pass
+
+    def _count(self, name: str) -> None:
+        """Adds a lookup to the counter shared by all processes and reads both counters.
+
+        If the counter can't be written, only the lookups of this process are counted.
+        """
+
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            descriptor = os.open(os.path.join(self.directory, name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+            try:
+                os.write(descriptor, b".")
+            finally:
+                os.close(descriptor)
+        except OSError:
+            setattr(self, name, getattr(self, name) + 1)
+            return
+
+        self.hits, self.misses = (self._read_count(counter_name) for counter_name in self.COUNTER_FILE_NAMES)
+
+    def _read_count(self, name: str) -> int:
+        try:
+            return os.stat(os.path.join(self.directory, name)).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _log(self, message: str) -> None:
+        sys.stderr.write(f"Search results cache {message} (hits: {self.hits}, misses: {self.misses})\n")
+
+
+def get_search_cache_directory() -> str:
+    """Returns the directory of the search results cache. ``search_cache_dir`` takes priority."""
+
+    if settings.SEARCH_CACHE_DIR.value:
+        return settings.SEARCH_CACHE_DIR.value
+
+    return os.path.join(get_runtime_directory(), "search-results")
+
+
+def initialize_search_results_file_cache(
+    vaults: t.Optional[t.List[Vault]] = None,
+) -> t.Optional[SearchResultsFileCache]:
+    """Initializes the search results cache if ``search_cache_ttl`` is set.
+
+    Results depend on files of the vaults, the primary one by default. The
+    namespace separates results of different search engines.
+    """
+
+    if not settings.SEARCH_CACHE_TTL.value or settings.SEARCH_CACHE_TTL.value <= 0:
+        return None
+
+    source_paths = []
+
+    for vault in vaults or [get_primary_vault()]:
+        source_paths.append(vault.db_path)
+
+        if vault.keyfile_path:
+            source_paths.append(vault.keyfile_path)
+
+    namespace = "local" if is_local_search_enabled() else settings.KEEPASSXC_BACKEND.value or "keepassxc-cli"
+
+    return SearchResultsFileCache(
+        directory=get_search_cache_directory(),
+        source_paths=source_paths,
+        namespace=namespace,
+        ttl=settings.SEARCH_CACHE_TTL.value,
+    )
+
+
+def initialize_usage_store() -> t.Optional[UsageStore]:
+    """Initializes the history of chosen entries if ``recent_entries`` is a positive number.
+
+    The history is opt-in, because it writes paths of entries to the disk.
+    It's kept in the workflow data directory given by Alfred, one file per
+    primary database.
+    """
+
+    if (settings.RECENT_ENTRIES.value or 0) <= 0:
+        return None
+
+    directory = os.getenv("alfred_workflow_data") or get_runtime_directory()
+    db_hash = hashlib.sha256((settings.KEEPASSXC_DB_PATH.value or "").encode("utf-8")).hexdigest()
+
+    return UsageStore(file_path=os.path.join(directory, f"usage-{db_hash[:16]}.log"))
+
+
+def record_entry_usage(reference: str) -> None:
+    """Adds the chosen entry to the history. The history is optional, so its errors are only logged."""
+
+    usage_store = initialize_usage_store()
+
+    if usage_store is None:
+        return
+
+    try:
+        usage_store.record(reference)
+    except OSError as e:
+        sys.stderr.write(f"Can't record the usage of the entry: {e}\n")
+
+
+LATEST_RELEASE_URL = "https://api.github.com/repos/lxbrvr/alfred-keepassxc-workflow/releases/latest"
+
+
+class WorkflowUpdatesRateLimitError(OSError):
+    """Raised when GitHub API doesn't accept requests until its rate limit is reset."""
+
+
+class WorkflowUpdatesChecker:
+    """Interface for checking updates for this workflow.
+
+    The latest release is kept in a file with its ETag, so for ``ttl`` seconds
+    the following checks don't make requests. An expired release is refreshed
+    with a conditional request: GitHub answers 304 without a body if the
+    release hasn't changed. When the rate limit is exhausted, the time of its
+    reset from the ``Retry-After`` or ``X-RateLimit-*`` headers is kept too,
+    and until then the cached release is returned without requests or
+    WorkflowUpdatesRateLimitError is raised if there is none.
+    """
+
+    def __init__(
+        self, cache_path: t.Optional[str] = None, ttl: int = 3600, url: str = LATEST_RELEASE_URL, timeout: int = 10
+    ) -> None:
+        directory = os.getenv("alfred_workflow_cache") or get_runtime_directory()
+        self.cache_path = cache_path or os.path.join(directory, "latest-release.json")
+        self.ttl = ttl
+        self.url = url
+        self.timeout = timeout
+        self._cached_latest_version: t.Optional[Version] = None
+
+    @property
+    def current_version(self) -> Version:
+        """Returns a current version of the workflow.
+
+        The workflow's version is stored in ``alfred_workflow_version`` environment variable.
+        """
+
+        return Version(os.getenv("alfred_workflow_version"))
+
+    def fetch_latest_version(self) -> Version:
+        """Returns the latest version of the workflow from the cache or from the github repo.
+
+        Version is also cached within one instance.
+        """
+
+        if self._cached_latest_version:
+            return self._cached_latest_version
+
+        release = self._read_cache()
+        now = time.time()
+        is_fresh = now - release.get("fetched_at", 0) < self.ttl
+
+        if not release.get("tag_name") or (not is_fresh and now >= release.get("blocked_until", 0)):
+            try:
+                release = self._request(release, now)
+            except WorkflowUpdatesRateLimitError:
+                if not release.get("tag_name"):
+                    raise
+
+        self._cached_latest_version = Version(release["tag_name"])
+        return self._cached_latest_version
+
+    def _request(self, release: t.Dict[str, t.Any], now: float) -> t.Dict[str, t.Any]:
+        """Requests the latest release, conditionally if a release is cached, and caches the answer."""
+
+        import urllib.error
+        import urllib.request
+
+        blocked_until = release.get("blocked_until", 0)
+
+        if now < blocked_until:
+            raise WorkflowUpdatesRateLimitError(self._format_rate_limit_error(blocked_until))
+
+        headers = {"Accept": "application/vnd.github+json", "User-Agent": "alfred-keepassxc-workflow"}
+
+        if release.get("tag_name") and release.get("etag"):
+            headers["If-None-Match"] = release["etag"]
+
+        request = urllib.request.Request(self.url, headers=headers)
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                latest_release = json.loads(response.read())
+                release = {"tag_name": latest_release["tag_name"], "etag": response.headers.get("ETag")}
+                response_headers = response.headers
+        except urllib.error.HTTPError as e:
+            blocked_until = self._get_blocked_until(e.headers, now)
+
+            if e.code in (403, 429) and blocked_until:
+                self._write_cache(dict(release, blocked_until=blocked_until))
+                raise WorkflowUpdatesRateLimitError(self._format_rate_limit_error(blocked_until)) from e
+
+            if e.code != 304:
+                raise
+
+            response_headers = e.headers  # the cached release hasn't changed
+
+        release.update(fetched_at=now, blocked_until=self._get_blocked_until(response_headers, now))
+        self._write_cache(release)
+
+        return release
+
+    @staticmethod
+    def _get_blocked_until(headers: t.Any, now: float) -> float:
+        """Returns the time until which GitHub API won't accept requests according to the headers or 0."""
+
+        retry_after = (headers or {}).get("Retry-After") or ""
+        reset_at = (headers or {}).get("X-RateLimit-Reset") or ""
+
+        if retry_after.isdigit():
+            return now + int(retry_after)
+
+        if (headers or {}).get("X-RateLimit-Remaining") == "0" and reset_at.isdigit():
+            return float(reset_at)
+
+        return 0
+
+    @staticmethod
+    def _format_rate_limit_error(blocked_until: float) -> str:
+        reset_time = time.strftime("%H:%M", time.localtime(blocked_until))
+        return f"GitHub doesn't accept requests for updates until {reset_time}."
+
+    def _read_cache(self) -> t.Dict[str, t.Any]:
+        try:
+            with open(self.cache_path, encoding="utf-8") as cache_file:
+                release = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+        return release if isinstance(release, dict) else {}
+
+    def _write_cache(self, release: t.Dict[str, t.Any]) -> None:
+        """Writes the release under a temporary name and renames it.
+
+        Errors are ignored: without the cache the release is requested again.
+        """
+
+        import tempfile
+
+        directory = os.path.dirname(self.cache_path)
+
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+
+            try:
+                with os.fdopen(descriptor, "w", encoding="utf-8") as cache_file:
+                    json.dump(release, cache_file)
+
+                os.replace(temporary_path, self.cache_path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+        except OSError:
+            pass
 
     def has_new_version(self) -> bool:
         """Tells us if there is a new version of the workflow."""
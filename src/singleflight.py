@@ -0,0 +1,208 @@
+"""Coalescing of identical commands running in different processes.
+
+Alfred starts a new process for every keystroke and for every script filter,
+so several processes may ask keepassxc-cli for the same thing at once and
+every one of them pays for the key derivation. ``SingleFlight`` lets only one
+of them run the command.
+
+Processes coordinate through files named by a hash of the command key:
+
+- ``<hash>.lock``: the leader holds an exclusive flock while the command runs,
+  followers wait for a shared flock on it.
+- ``<hash>.json``: the result published by the leader: the output or the
+  error message and the name of the error class, and the publication time.
+  It's written only if a follower waits for it.
+- ``<hash>.waiters``: followers hold a shared flock on it while they wait and
+  read. The last process which gets an exclusive flock on it removes the
+  result, so outputs don't outlive the flight.
+
+A result may stay on disk if a process is killed before it's removed, so
+only outputs without secrets should be shared, e.g. of searches.
+
+A follower accepts only a result published after it started. If the leader
+is killed, the kernel releases its flock, the followers find no result and
+one of them becomes the next leader. A follower waiting longer than
+``timeout`` runs the command itself.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import time
+import typing as t
+
+STALE_FILE_AGE = 3600
+
+
+class SingleFlight:
+    """Runs a function in one process at a time and shares its result with the waiting processes."""
+
+    def __init__(
+        self,
+        directory: str,
+        timeout: float = 30.0,
+        poll_interval: float = 0.01,
+        error_classes: t.Sequence[t.Type[OSError]] = (),
+    ) -> None:
+        self.directory = directory
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.error_classes = {error_class.__name__: error_class for error_class in error_classes}
+
+    def run(self, key: str, function: t.Callable[[], str]) -> str:
+        """Returns the output of the function, either run here or published by another process.
+
+        OSError raised by the function is shared with the followers as well.
+        Errors of the coordination itself aren't raised: the function is just
+        run without it.
+        """
+
+        try:
+            self._prepare_directory()
+        except OSError:
+            return function()
+
+        base_path = os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+        started_at = time.time_ns()
+        deadline = time.monotonic() + self.timeout
+
+        with open(base_path + ".lock", "a") as lock_file, open(base_path + ".waiters", "a") as waiters_file:
+            os.utime(lock_file.fileno())  # keeps the files from being removed as stale
+            os.utime(waiters_file.fileno())
+
+            while True:
+                if self._try_lock(lock_file, fcntl.LOCK_EX):
+                    return self._lead(function, lock_file, waiters_file, base_path + ".json")
+
+                result = self._follow(lock_file, waiters_file, base_path + ".json", started_at, deadline)
+
+                if result is not None:
+                    return self._unpack(result)
+
+                if time.monotonic() > deadline:
+                    return function()
+
+    def _prepare_directory(self) -> None:
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+        if os.stat(self.directory).st_uid != os.getuid():
+            raise PermissionError(f"{self.directory} belongs to another user.")
+
+    def _lead(
+        self, function: t.Callable[[], str], lock_file: t.IO[str], waiters_file: t.IO[str], result_path: str
+    ) -> str:
+        try:
+            self._remove(result_path)  # left by a killed process
+            self._remove_stale_files()
+
+            try:
+                output = function()
+            except OSError as e:
+                self._publish(waiters_file, result_path, {"error": str(e), "error_class": type(e).__name__})
+                raise
+
+            self._publish(waiters_file, result_path, {"output": output})
+
+            return output
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            self._clean_up(waiters_file, result_path)
+
+    def _follow(
+        self, lock_file: t.IO[str], waiters_file: t.IO[str], result_path: str, started_at: int, deadline: float
+    ) -> t.Optional[t.Dict[str, t.Any]]:
+        """Waits for the leader and returns its result or None if there is no fresh result."""
+
+        fcntl.flock(waiters_file, fcntl.LOCK_SH)
+
+        try:
+            while not self._try_lock(lock_file, fcntl.LOCK_SH):
+                if time.monotonic() > deadline:
+                    return None
+
+                time.sleep(self.poll_interval)
+
+            try:
+                return self._read(result_path, started_at)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            fcntl.flock(waiters_file, fcntl.LOCK_UN)
+            self._clean_up(waiters_file, result_path)
+
+    @staticmethod
+    def _try_lock(lock_file: t.IO[str], operation: int) -> bool:
+        try:
+            fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        return True
+
+    def _clean_up(self, waiters_file: t.IO[str], result_path: str) -> None:
+        """Removes the result if nobody waits for it."""
+
+        if self._try_lock(waiters_file, fcntl.LOCK_EX):
+            self._remove(result_path)
+            fcntl.flock(waiters_file, fcntl.LOCK_UN)
+
+    def _publish(self, waiters_file: t.IO[str], result_path: str, result: t.Dict[str, t.Any]) -> None:
+        """Writes the result if a follower waits for it.
+
+        A follower which comes later finds no fresh result and runs the
+        function itself.
+        """
+
+        if self._try_lock(waiters_file, fcntl.LOCK_EX):  # nobody waits
+            fcntl.flock(waiters_file, fcntl.LOCK_UN)
+            return
+
+        import tempfile
+
+        result["published_at"] = time.time_ns()
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as result_file:
+                json.dump(result, result_file)
+
+            os.replace(temporary_path, result_path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    @staticmethod
+    def _read(result_path: str, started_at: int) -> t.Optional[t.Dict[str, t.Any]]:
+        try:
+            with open(result_path, encoding="utf-8") as result_file:
+                result = json.load(result_file)
+        except (OSError, ValueError):
+            return None
+
+        return result if result.get("published_at", 0) >= started_at else None
+
+    def _unpack(self, result: t.Dict[str, t.Any]) -> str:
+        if "error" in result:
+            raise self.error_classes.get(result.get("error_class", ""), OSError)(result["error"])
+
+        return result["output"]
+
+    def _remove_stale_files(self) -> None:
+        """Removes files of commands which haven't been run for a long time."""
+
+        now = time.time()
+
+        for dir_entry in os.scandir(self.directory):
+            try:
+                if now - dir_entry.stat().st_mtime > STALE_FILE_AGE:
+                    os.unlink(dir_entry.path)
+            except FileNotFoundError:  # removed by another process
+                pass
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,153 @@
+import base64
+import hmac
+import struct
+import time
+import typing as t
+import urllib.parse
+
+STEAM_ALPHABET = "23456789BCDFGHJKMNPQRTVWXY"
+DEFAULT_PERIOD = 30
+DEFAULT_DIGITS = 6
+MIN_DIGITS = 6
+MAX_DIGITS = 10
+SUPPORTED_ALGORITHMS = ("sha1", "sha256", "sha512")
+
+
+class TOTPError(ValueError):
+    pass
+
+
+class TOTPSettings:
+    """Parameters of a time-based one-time password from RFC 6238."""
+
+    def __init__(
+        self,
+        secret: bytes,
+        period: int = DEFAULT_PERIOD,
+        digits: int = DEFAULT_DIGITS,
+        algorithm: str = "sha1",
+        is_steam: bool = False,
+    ) -> None:
+        self.secret = secret
+        self.period = period
+        self.digits = digits
+        self.algorithm = algorithm
+        self.is_steam = is_steam
+
+    @classmethod
+    def from_entry_attributes(cls, attributes: t.Dict[str, str]) -> t.Optional["TOTPSettings"]:
+        """Builds the settings from entry attributes the same way as KeePassXC does.
+
+        The "otp" attribute with an otpauth:// URI is used first, then the
+        legacy "TOTP Seed" and "TOTP Settings" attributes. Returns None if the
+        entry has no TOTP set up.
+        """
+
+        otp = attributes.get("otp")
+
+        if otp:
+            return cls.from_uri(otp) if otp.startswith("otpauth://") else cls(secret=decode_secret(otp))
+
+        seed = attributes.get("TOTP Seed")
+
+        if not seed:
+            return None
+
+        settings = cls(secret=decode_secret(seed))
+        period, _, digits = (attributes.get("TOTP Settings") or "").partition(";")
+
+        if period.isdigit():
+            settings.period = int(period)
+
+        if digits == "S":
+            settings.digits, settings.is_steam = 5, True
+        elif digits.isdigit():
+            settings.digits = int(digits)
+
+        settings.validate()
+
+        return settings
+
+    @classmethod
+    def from_uri(cls, uri: str) -> "TOTPSettings":
+        """Parses an otpauth://totp/ URI."""
+
+        parsed_uri = urllib.parse.urlparse(uri)
+        parameters = dict(urllib.parse.parse_qsl(parsed_uri.query))
+
+        if parsed_uri.netloc != "totp" or not parameters.get("secret"):
+            raise TOTPError("Only otpauth://totp/ URIs with a secret are supported.")
+
+        settings = cls(secret=decode_secret(parameters["secret"]))
+        settings.period = parse_number(parameters.get("period"), "period", DEFAULT_PERIOD)
+        settings.digits = parse_number(parameters.get("digits"), "digits", DEFAULT_DIGITS)
+        settings.algorithm = (parameters.get("algorithm") or "sha1").lower()
+        settings.is_steam = parameters.get("encoder") == "steam"
+
+        if settings.is_steam:
+            settings.digits = 5
+
+        settings.validate()
+
+        return settings
+
+    def validate(self) -> None:
+        """Raises TOTPError if a password can't be generated with the parameters."""
+
+        if self.period <= 0:
+            raise TOTPError("TOTP period must be a positive number of seconds.")
+
+        if not self.is_steam and not MIN_DIGITS <= self.digits <= MAX_DIGITS:
+            raise TOTPError(f"TOTP must have from {MIN_DIGITS} to {MAX_DIGITS} digits.")
+
+        if self.algorithm not in SUPPORTED_ALGORITHMS:
+            raise TOTPError(f"TOTP algorithm {self.algorithm.upper()} isn't supported.")
+
+    def generate(self, timestamp: t.Optional[float] = None) -> str:
+        """Returns the one-time password for the given time or for now."""
+
+        timestamp = time.time() if timestamp is None else timestamp
+        counter = struct.pack(">Q", int(timestamp) // self.period)
+        digest = hmac.new(self.secret, counter, self.algorithm).digest()
+        offset = digest[-1] & 0x0F
+        (code,) = struct.unpack(">I", digest[offset : offset + 4])  # noqa: E203
+        code &= 0x7FFFFFFF
+
+        if self.is_steam:
+            characters = []
+
+            for _ in range(self.digits):
+                code, index = divmod(code, len(STEAM_ALPHABET))
+                characters.append(STEAM_ALPHABET[index])
+
+            return "".join(characters)
+
+        return str(code % 10**self.digits).zfill(self.digits)
+
+    def remaining_seconds(self, timestamp: t.Optional[float] = None) -> int:
+        """Returns how many seconds the current password stays valid."""
+
+        timestamp = time.time() if timestamp is None else timestamp
+        return self.period - int(timestamp) % self.period
+
+
+def parse_number(value: t.Optional[str], name: str, default: int) -> int:
+    if not value:
+        return default
+
+    try:
+        return int(value)
+    except ValueError:
+        raise TOTPError(f"TOTP {name} isn't a number.")
+
+
+def decode_secret(secret: str) -> bytes:
+    """Decodes a base32 secret. Spaces, dashes and missing padding are tolerated."""
+
+    normalized = secret.replace(" ", "").replace("-", "").upper().rstrip("=")
+    normalized += "=" * (-len(normalized) % 8)
+
+    try:
+        return base64.b32decode(normalized)
+    except ValueError:
+        raise TOTPError("TOTP secret isn't a valid base32 string.")
@@ -0,0 +1,148 @@
+"""History of the entries chosen by the user.
+
+The history ranks search results by frecency, i.e. by how often and how
+recently an entry has been chosen, and lists recent entries without
+unlocking the database. A visit is a line with a Unix time and an entry
+reference in a file, passwords and other attributes are never written.
+
+Several workflow runs may write at once, so:
+
+- a visit is appended with a single write while a shared flock is held on
+  ``<file>.lock``;
+- when the file grows beyond ``max_file_size``, the writer takes an
+  exclusive flock and compacts it: only the last ``visits_per_entry`` visits
+  of the ``max_entries`` entries with the highest scores are kept. The
+  compacted file is written under a temporary name and renamed, so readers
+  see either the old file or the new one and need no lock.
+"""
+
+import fcntl
+import json
+import os
+import time
+import typing as t
+
+Visits = t.Dict[str, t.List[float]]
+
+
+class UsageStore:
+    """Records visits of entries and ranks entries by them."""
+
+    def __init__(
+        self,
+        file_path: str,
+        half_life: float = 14 * 24 * 3600,
+        max_entries: int = 100,
+        visits_per_entry: int = 5,
+        max_file_size: int = 128 * 1024,
+    ) -> None:
+        self.file_path = file_path
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self.visits_per_entry = visits_per_entry
+        self.max_file_size = max_file_size
+
+    def record(self, reference: str, now: t.Optional[float] = None) -> None:
+        """Appends a visit of the entry and compacts the file if it has grown too much."""
+
+        now = time.time() if now is None else now
+        line = json.dumps([int(now), reference]) + "\n"
+        directory = os.path.dirname(self.file_path)
+
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        with open(self.file_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+
+            try:
+                descriptor = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+                try:
+                    os.write(descriptor, line.encode("utf-8"))
+                    file_size = os.fstat(descriptor).st_size
+                finally:
+                    os.close(descriptor)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            if file_size > self.max_file_size:
+                self._compact(lock_file, now)
+
+    def rank(self, references: t.List[str], now: t.Optional[float] = None) -> t.List[str]:
+        """Sorts the references by frecency. Entries with equal scores keep their order."""
+
+        scores = self.scores(now)
+
+        return sorted(references, key=lambda reference: -scores.get(reference, 0.0))
+
+    def recent(self, limit: int) -> t.List[str]:
+        """Returns references of the last visited entries, the most recent first."""
+
+        visits = self._read()
+        references = sorted(visits, key=lambda reference: max(visits[reference]), reverse=True)
+
+        return references[:limit]
+
+    def scores(self, now: t.Optional[float] = None) -> t.Dict[str, float]:
+        """Returns frecency scores of the visited entries."""
+
+        now = time.time() if now is None else now
+
+        return {reference: self._score(visit_times, now) for reference, visit_times in self._read().items()}
+
+    def _score(self, visit_times: t.List[float], now: float) -> float:
+        """Every visit adds a weight which halves every ``half_life`` seconds."""
+
+        return sum(0.5 ** (max(now - visited_at, 0.0) / self.half_life) for visited_at in visit_times)
+
+    def _read(self) -> Visits:
+        visits: Visits = {}
+
+        try:
+            with open(self.file_path, encoding="utf-8") as usage_file:
+                lines = usage_file.readlines()
+        except OSError:  # there is no history yet or it can't be read, neither prevents searching
+            return visits
+
+        for line in lines:
+            try:
+                visited_at, reference = json.loads(line)
+            except (TypeError, ValueError):  # a line being appended right now
+                continue
+
+            visits.setdefault(reference, []).append(visited_at)
+
+        return visits
+
+    def _compact(self, lock_file: t.IO[str], now: float) -> None:
+        """Keeps the last visits of the entries with the highest scores.
+
+        It's skipped if another process is writing or compacting the file.
+        """
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+
+        try:
+            visits = self._read()
+            kept_references = sorted(visits, key=lambda reference: -self._score(visits[reference], now))
+            kept_visits = sorted(
+                (visited_at, reference)
+                for reference in kept_references[: self.max_entries]
+                for visited_at in sorted(visits[reference], reverse=True)[: self.visits_per_entry]
+            )
+            temporary_path = f"{self.file_path}.{os.getpid()}.tmp"
+
+            with open(
+                os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8"
+            ) as usage_file:
+                usage_file.writelines(
+                    json.dumps([visited_at, reference]) + "\n" for visited_at, reference in kept_visits
+                )
+
+            os.replace(temporary_path, self.file_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,3 +1,5 @@
+import json
+import os
 import plistlib
 
 import pytest
@@ -5,7 +7,7 @@ import pytest
 from alfred import AlfredScriptFilter
 from conf import Settings
 from helpers import Version
-from services import KeepassXCClient, KeepassXCItem
+from services import KdbxClient, KeepassXCClient, KeepassXCItem
 
 
 @pytest.fixture
@@ -14,6 +16,26 @@ def info_plist():
         return plistlib.loads(info_plist.read())
 
 
+@pytest.fixture(autouse=True)
+def workflow_data_directory(tmp_path, monkeypatch):
+    # handlers write the history of chosen entries there
+    monkeypatch.setenv("alfred_workflow_data", str(tmp_path / "workflow-data"))
+    yield tmp_path / "workflow-data"
+
+
+@pytest.fixture
+def usage_history(environ_factory):
+    # the history of chosen entries is opt-in
+    environ_factory(recent_entries="10")
+
+
+@pytest.fixture(autouse=True)
+def subprocess_records_directory(tmp_path, monkeypatch):
+    # subprocesses are recorded there, see the processes module
+    monkeypatch.setattr("processes.get_records_directory", lambda: str(tmp_path / "children"))
+    yield tmp_path / "children"
+
+
 @pytest.fixture
 def keychain_account():
     yield "account"
@@ -112,3 +134,50 @@ def version_factory():
         return Version(version)
 
     yield factory
+
+
+@pytest.fixture
+def fake_keepassxc_cli():
+    yield os.path.join(os.path.dirname(__file__), "fakes", "keepassxc-cli")
+
+
+@pytest.fixture
+def fake_security(mocker, tmp_path):
+    def install(password="password"):
+        log_path = tmp_path / "security.log"
+        log_path.touch()
+        environment = {
+            "PATH": os.path.join(os.path.dirname(__file__), "fakes") + os.pathsep + os.environ.get("PATH", ""),
+            "FAKE_SECURITY_LOG": str(log_path),
+        }
+
+        if password is not None:
+            environment["FAKE_SECURITY_PASSWORD"] = password
+
+        mocker.patch.dict(os.environ, environment)
+        return log_path
+
+    yield install
+
+
+@pytest.fixture
+def fake_keepassxc_db(tmp_path):
+    def create(password="password", entries=None):
+        db_path = tmp_path / "passwords.kdbx"
+        db_path.write_text(json.dumps({"password": password, "entries": entries or []}))
+        return str(db_path)
+
+    yield create
+
+
+@pytest.fixture
+def kdbx_fixture():
+    def path(name):
+        return os.path.join(os.path.dirname(__file__), "fixtures", name)
+
+    yield path
+
+
+@pytest.fixture
+def kdbx_client(kdbx_fixture):
+    yield KdbxClient(db_path=kdbx_fixture("kdbx4-aes-argon2d.kdbx"), key_file=None, password="password")
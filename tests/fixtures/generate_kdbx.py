@@ -0,0 +1,302 @@
+"""Generates the KeePass databases used by the test suite.
+
+The files are written with pycryptodomex and argon2-cffi, independently of
+the workflow's own primitives, and every file is checked by opening it with
+pykeepass. The KDF parameters are tiny so the pure Python fallback of the
+workflow can read the databases quickly.
+
+    pip install pycryptodomex argon2-cffi pykeepass
+    python tests/fixtures/generate_kdbx.py
+"""
+
+import base64
+import gzip
+import hashlib
+import hmac
+import os
+import struct
+import uuid
+import xml.etree.ElementTree as ElementTree
+
+from argon2.low_level import Type, hash_secret_raw
+from Cryptodome.Cipher import AES, ChaCha20, Salsa20
+from Cryptodome.Util.Padding import pad
+from pykeepass import PyKeePass, create_database
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = "password"
+KEY_FILE = os.path.join(FIXTURES_DIR, "keyfile.keyx")
+KEY_FILE_DATA = bytes(range(32))
+
+CIPHERS = {
+    "aes": bytes.fromhex("31c1f2e6bf714350be5805216afc5aff"),
+    "chacha20": bytes.fromhex("d6038a2b8b6f4cb5a524339a31dbb59a"),
+}
+KDFS = {
+    "aes": bytes.fromhex("c9d9f39a628a4460bf740d08c18a4fea"),
+    "argon2d": bytes.fromhex("ef636ddf8c29444b91f7a9a403e30a0c"),
+    "argon2id": bytes.fromhex("9e298b1956db4773b23dfc3ec6f0a1e6"),
+}
+
+GROUPS = {
+    "Root": [
+        {"Title": "Root entry", "UserName": "root", "Password": "root password", "URL": "", "Notes": ""},
+    ],
+    "Root/Internet": [
+        {
+            "Title": "GitHub",
+            "UserName": "octocat",
+            "Password": "gh secret",
+            "URL": "https://github.com",
+            "Notes": "first line\nsecond line",
+            "otp": "otpauth://totp/GitHub:octocat?secret=GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ&period=30&digits=6",
+            "_tags": "dev;work",
+            "_history": [{"Title": "GitHub", "UserName": "octocat", "Password": "old gh secret"}],
+        },
+        {"Title": "Café", "UserName": "günter", "Password": "pässwörd", "URL": "https://cafe.example", "Notes": ""},
+    ],
+    "Root/Internet/Mail": [
+        {
+            "Title": "Mail",
+            "UserName": "user@example.com",
+            "Password": "mail secret",
+            "URL": "https://mail.example",
+            "Notes": "",
+            "TOTP Seed": "GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ",
+            "TOTP Settings": "30;8",
+        },
+    ],
+    "Root/Recycle Bin": [
+        {"Title": "Deleted", "UserName": "", "Password": "deleted secret", "URL": "", "Notes": ""},
+    ],
+}
+PROTECTED = ("Password", "otp", "TOTP Seed")
+
+
+def b64(data):
+    return base64.b64encode(data).decode()
+
+
+def build_entry(parent, fields):
+    entry = ElementTree.SubElement(parent, "Entry")
+    ElementTree.SubElement(entry, "UUID").text = b64(uuid.uuid4().bytes)
+    ElementTree.SubElement(entry, "Tags").text = fields.get("_tags", "")
+
+    for key, value in fields.items():
+        if key.startswith("_"):
+            continue
+
+        string = ElementTree.SubElement(entry, "String")
+        ElementTree.SubElement(string, "Key").text = key
+        value_element = ElementTree.SubElement(string, "Value")
+        value_element.text = value
+
+        if key in PROTECTED:
+            value_element.set("Protected", "True")
+
+    if fields.get("_history"):
+        history = ElementTree.SubElement(entry, "History")
+
+        for old_fields in fields["_history"]:
+            build_entry(history, old_fields)
+
+
+def build_xml(stream):
+    root = ElementTree.Element("KeePassFile")
+    meta = ElementTree.SubElement(root, "Meta")
+    ElementTree.SubElement(meta, "Generator").text = "generate_kdbx.py"
+    ElementTree.SubElement(meta, "DatabaseName").text = "fixture"
+    groups = {}
+
+    for path, entries in GROUPS.items():
+        parent_path, _, name = path.rpartition("/")
+        parent = groups[parent_path] if parent_path else ElementTree.SubElement(root, "Root")
+        group = ElementTree.SubElement(parent, "Group")
+        ElementTree.SubElement(group, "UUID").text = b64(uuid.uuid4().bytes)
+        ElementTree.SubElement(group, "Name").text = name
+        groups[path] = group
+
+        for fields in entries:
+            build_entry(group, fields)
+
+    for value in root.iter("Value"):
+        if value.get("Protected") == "True":
+            value.text = b64(stream(value.text.encode()))
+
+    return ElementTree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def composite_key(password, key_file):
+    parts = [hashlib.sha256(password.encode()).digest()] if password is not None else []
+
+    if key_file:
+        parts.append(KEY_FILE_DATA)
+
+    return hashlib.sha256(b"".join(parts)).digest()
+
+
+def aes_kdf(key, seed, rounds):
+    cipher = AES.new(seed, AES.MODE_ECB)
+
+    for _ in range(rounds):
+        key = cipher.encrypt(key)
+
+    return hashlib.sha256(key).digest()
+
+
+def encrypt(cipher, key, iv, data):
+    if cipher == "aes":
+        return AES.new(key, AES.MODE_CBC, iv).encrypt(pad(data, 16))
+
+    return ChaCha20.new(key=key, nonce=iv).encrypt(data)
+
+
+def variant_dictionary(items):
+    types = {bytes: 0x42, int: 0x05}
+    data = struct.pack("<H", 0x0100)
+
+    for key, value in items:
+        value_type, raw = (
+            (0x04, struct.pack("<I", value[1])) if isinstance(value, tuple) else (types[type(value)], value)
+        )
+        raw = struct.pack("<Q", raw) if value_type == 0x05 else raw
+        data += struct.pack("<BI", value_type, len(key)) + key.encode() + struct.pack("<I", len(raw)) + raw
+
+    return data + b"\x00"
+
+
+def header_field(field, value, size_format):
+    return struct.pack("<B" + size_format[1:], field, len(value)) + value
+
+
+def write_kdbx4(name, cipher="aes", kdf="argon2d", password=PASSWORD, key_file=False, compress=True):
+    master_seed, salt = os.urandom(32), os.urandom(32)
+    iv = os.urandom(16 if cipher == "aes" else 12)
+
+    if kdf == "aes":
+        kdf_items = [("$UUID", KDFS[kdf]), ("R", 100), ("S", salt)]
+        transformed_key = aes_kdf(composite_key(password, key_file), salt, 100)
+    else:
+        kdf_items = [
+            ("$UUID", KDFS[kdf]),
+            ("I", 2),
+            ("M", 64 * 1024),
+            ("P", ("u32", 2)),
+            ("S", salt),
+            ("V", ("u32", 0x13)),
+        ]
+        transformed_key = hash_secret_raw(
+            composite_key(password, key_file), salt, 2, 64, 2, 32, Type.D if kdf == "argon2d" else Type.ID
+        )
+
+    header = struct.pack("<IIHH", 0x9AA2D903, 0xB54BFB67, 1, 4)
+    header += header_field(2, CIPHERS[cipher], "<I")
+    header += header_field(3, struct.pack("<I", int(compress)), "<I")
+    header += header_field(4, master_seed, "<I")
+    header += header_field(7, iv, "<I")
+    header += header_field(11, variant_dictionary(kdf_items), "<I")
+    header += header_field(0, b"\r\n\r\n", "<I")
+
+    stream_key = os.urandom(64)
+    digest = hashlib.sha512(stream_key).digest()
+    stream = ChaCha20.new(key=digest[:32], nonce=digest[32:44])
+    inner_header = (
+        header_field(1, struct.pack("<I", 3), "<I") + header_field(2, stream_key, "<I") + header_field(0, b"", "<I")
+    )
+    payload = inner_header + build_xml(stream.encrypt)
+    payload = gzip.compress(payload) if compress else payload
+    encrypted = encrypt(cipher, hashlib.sha256(master_seed + transformed_key).digest(), iv, payload)
+
+    hmac_key = hashlib.sha512(master_seed + transformed_key + b"\x01").digest()
+
+    def block_key(index):
+        return hashlib.sha512(struct.pack("<Q", index) + hmac_key).digest()
+
+    data = header + hashlib.sha256(header).digest() + hmac.new(block_key(2**64 - 1), header, hashlib.sha256).digest()
+    blocks = [encrypted[i : i + 1000] for i in range(0, len(encrypted), 1000)] + [b""]  # noqa: E203
+
+    for index, block in enumerate(blocks):
+        block_hmac = hmac.new(block_key(index), struct.pack("<Qi", index, len(block)) + block, hashlib.sha256).digest()
+        data += block_hmac + struct.pack("<i", len(block)) + block
+
+    save(name, data, password, key_file)
+
+
+def write_kdbx3(name, cipher="aes", password=PASSWORD, key_file=False, compress=True):
+    master_seed, transform_seed, iv = os.urandom(32), os.urandom(32), os.urandom(16 if cipher == "aes" else 12)
+    stream_key, start_bytes = os.urandom(32), os.urandom(32)
+    transformed_key = aes_kdf(composite_key(password, key_file), transform_seed, 100)
+
+    header = struct.pack("<IIHH", 0x9AA2D903, 0xB54BFB67, 1, 3)
+    header += header_field(2, CIPHERS[cipher], "<H")
+    header += header_field(3, struct.pack("<I", int(compress)), "<H")
+    header += header_field(4, master_seed, "<H")
+    header += header_field(5, transform_seed, "<H")
+    header += header_field(6, struct.pack("<Q", 100), "<H")
+    header += header_field(7, iv, "<H")
+    header += header_field(8, stream_key, "<H")
+    header += header_field(9, start_bytes, "<H")
+    header += header_field(10, struct.pack("<I", 2), "<H")
+    header += header_field(0, b"\r\n\r\n", "<H")
+
+    stream = Salsa20.new(key=hashlib.sha256(stream_key).digest(), nonce=bytes.fromhex("e830094b97205d2a"))
+    xml = build_xml(stream.encrypt)
+    xml = xml.replace(
+        b"</Generator>",
+        b"</Generator><HeaderHash>" + base64.b64encode(hashlib.sha256(header).digest()) + b"</HeaderHash>",
+    )
+    payload = gzip.compress(xml) if compress else xml
+    blocks = [payload[i : i + 1000] for i in range(0, len(payload), 1000)]  # noqa: E203
+    hashed = b"".join(
+        struct.pack("<I", i) + hashlib.sha256(block).digest() + struct.pack("<I", len(block)) + block
+        for i, block in enumerate(blocks)
+    )
+    hashed += struct.pack("<I", len(blocks)) + bytes(32) + struct.pack("<I", 0)
+    encrypted = encrypt(cipher, hashlib.sha256(master_seed + transformed_key).digest(), iv, start_bytes + hashed)
+
+    save(name, header + encrypted, password, key_file)
+
+
+def save(name, data, password, key_file):
+    path = os.path.join(FIXTURES_DIR, name)
+
+    with open(path, "wb") as db_file:
+        db_file.write(data)
+
+    database = PyKeePass(path, password=password, keyfile=KEY_FILE if key_file else None)
+    titles = sorted(entry.title for entry in database.entries)
+    assert database.find_entries(title="GitHub", first=True).password == "gh secret", name
+    print(f"{name}: {len(titles)} entries, checked with pykeepass")
+
+
+def write_with_pykeepass(name):
+    """Writes a database with pykeepass itself, so the fixtures don't rely only on the writer above."""
+
+    path = os.path.join(FIXTURES_DIR, name)
+    database = create_database(path, password=PASSWORD)
+    kdf_parameters = database.kdbx.header.value.dynamic_header.kdf_parameters.data.dict
+    kdf_parameters.I.value, kdf_parameters.M.value = 2, 64 * 1024
+    group = database.add_group(database.root_group, "Internet")
+    database.add_entry(group, "GitHub", "octocat", "gh secret", url="https://github.com", notes="pykeepass")
+    database.save()
+    save(name, open(path, "rb").read(), PASSWORD, False)
+
+
+def main():
+    with open(KEY_FILE, "wb") as key_file:
+        key_file.write(KEY_FILE_DATA)
+
+    write_kdbx4("kdbx4-aes-argon2d.kdbx")
+    # the same database saved again: KeePassXC generates new seeds and a new Argon2 salt on every save
+    write_kdbx4("kdbx4-aes-argon2d-resaved.kdbx")
+    write_kdbx4("kdbx4-chacha20-argon2id.kdbx", cipher="chacha20", kdf="argon2id")
+    write_kdbx4("kdbx4-aes-aeskdf-uncompressed.kdbx", kdf="aes", compress=False)
+    write_kdbx4("kdbx4-keyfile.kdbx", key_file=True)
+    write_kdbx4("kdbx4-keyfile-only.kdbx", password=None, key_file=True)
+    write_with_pykeepass("kdbx4-pykeepass.kdbx")
+    write_kdbx3("kdbx3-aes.kdbx")
+    write_kdbx3("kdbx3-chacha20-keyfile.kdbx", cipher="chacha20", key_file=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import fcntl
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+import instrumentation
+from agent import PROTOCOL_VERSION, Agent, AgentClient, receive_message, send_message
+
+SOURCE_PATH = os.path.abspath("src")
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        time.sleep(0.01)
+
+    return True
+
+
+@pytest.fixture
+def socket_path():
+    directory = tempfile.mkdtemp(prefix="kp-", dir="/tmp")  # unix socket paths must be short
+    yield os.path.join(directory, "agent", "agent.sock")
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def running_agent(mocker, socket_path):
+    mocker.patch.dict("agent.os.environ", {})
+    agent = Agent(socket_path, idle_timeout=0.5)
+    agent.bind()
+    thread = threading.Thread(target=agent.serve)
+    thread.start()
+
+    yield agent
+
+    thread.join()
+
+
+class TestBindMethod:
+    def test_permissions(self, socket_path):
+        agent = Agent(socket_path)
+        agent.bind()
+
+        try:
+            assert os.stat(os.path.dirname(socket_path)).st_mode & 0o777 == 0o700
+            assert os.stat(socket_path).st_mode & 0o777 == 0o600
+        finally:
+            agent.close()
+
+        assert not os.path.exists(socket_path)
+
+    def test_stale_socket(self, socket_path):
+        os.makedirs(os.path.dirname(socket_path))
+        stale_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale_socket.bind(socket_path)
+        stale_socket.close()
+        agent = Agent(socket_path)
+        agent.bind()
+        agent.close()
+
+    def test_another_agent(self, socket_path):
+        first_agent = Agent(socket_path)
+        first_agent.bind()
+
+        try:
+            with pytest.raises(OSError):
+                Agent(socket_path).bind()
+        finally:
+            first_agent.close()
+
+    def test_socket_of_locking_agent_is_kept(self, socket_path):
+        os.makedirs(os.path.dirname(socket_path))
+        starting_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        starting_socket.bind(socket_path)  # bound, but not listening yet
+
+        with starting_socket, open(socket_path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            with pytest.raises(OSError):
+                Agent(socket_path).bind()
+
+            assert os.path.exists(socket_path)
+
+    def test_lock_is_released(self, socket_path):
+        first_agent = Agent(socket_path)
+        first_agent.bind()
+        first_agent.close()
+        second_agent = Agent(socket_path)
+        second_agent.bind()
+        second_agent.close()
+
+
+class TestHandleRequestMethod:
+    def test_output_and_environment(self, mocker):
+        mocker.patch.dict("agent.os.environ", {"previous": "value"})
+        response = Agent("path").handle_request(
+            {"version": PROTOCOL_VERSION, "arguments": ["settings_list"], "environment": {"alfred_keyword": "kp"}}
+        )
+        output = json.loads(response["output"])
+
+        assert response["error"] is None
+        assert output["items"][0]["subtitle"] == "kp"
+        assert os.environ == {"alfred_keyword": "kp"}
+
+    def test_log(self, mocker):
+        mocker.patch.dict("agent.os.environ", {})
+        mocker.patch("handlers.AlfredScriptFilter.send", side_effect=lambda: sys.stderr.write("message\n"))
+        response = Agent("path").handle_request({"version": PROTOCOL_VERSION, "arguments": ["settings_list"]})
+
+        assert response["log"] == "message\n"
+        assert response["error"] is None
+
+    def test_instrumentation(self, mocker, tmp_path):
+        mocker.patch.dict("agent.os.environ", {})
+        environment = {
+            "instrumentation_trace": "true",
+            "INVOCATION_ID": "invocation",
+            "alfred_workflow_data": str(tmp_path / "workflow-data"),
+        }
+        response = Agent("path").handle_request(
+            {"version": PROTOCOL_VERSION, "arguments": ["settings_list"], "environment": environment}
+        )
+        trace = (tmp_path / "workflow-data" / "trace-invocation.json").read_text()
+        spans = [json.loads(line.rstrip(",")) for line in trace.splitlines()[1:]]
+
+        assert json.loads(response["output"])["variables"] == {"INVOCATION_ID": "invocation"}
+        assert response["log"].startswith("Instrumentation of settings_list: ")
+        assert [span["name"] for span in spans if span["ph"] == "X"] == ["send", "handler", "agent.py settings_list"]
+        assert instrumentation.recorder is None
+
+    def test_handler_error(self, mocker):
+        mocker.patch.dict("agent.os.environ", {})
+        mocker.patch("handlers.AlfredScriptFilter.send", side_effect=ValueError("failure"))
+        response = Agent("path").handle_request({"version": PROTOCOL_VERSION, "arguments": ["settings_list"]})
+
+        assert "ValueError: failure" in response["error"]
+
+    def test_invalid_arguments(self, mocker):
+        mocker.patch.dict("agent.os.environ", {})
+        response = Agent("path").handle_request({"version": PROTOCOL_VERSION, "arguments": ["unknown"]})
+
+        assert "SystemExit" in response["error"]
+
+
+class TestHandleConnectionMethod:
+    def test_response(self, mocker):
+        mocker.patch.object(Agent, "handle_request", return_value={"version": PROTOCOL_VERSION, "output": "items"})
+        client, connection = socket.socketpair()
+
+        with client, connection:
+            send_message(client, {"version": PROTOCOL_VERSION, "arguments": ["search", "query"]})
+            Agent("path")._handle_connection(connection)
+
+            assert receive_message(client)["output"] == "items"
+
+    def test_disconnected_client(self, mocker):
+        handle_request = mocker.patch.object(Agent, "handle_request")
+        client, connection = socket.socketpair()
+
+        with connection:
+            send_message(client, {"version": PROTOCOL_VERSION, "arguments": ["search", "query"]})
+            client.close()
+            Agent("path")._handle_connection(connection)
+
+        handle_request.assert_not_called()
+
+
+class TestServeMethod:
+    def test_termination_signal_during_request(self, tmp_path, socket_path):
+        code = (
+            "import argparse, sys, time, agent, cli, processes\n"
+            "def handler(_):\n"
+            "    open(sys.argv[2], 'w').close()\n"
+            "    time.sleep(30)\n"
+            "cli.parse_args = lambda arguments: argparse.Namespace(handler=handler)\n"
+            "processes.install_signal_handlers()\n"
+            "agent.Agent(sys.argv[1]).serve()\n"
+        )
+        started_path = tmp_path / "started"
+        process = subprocess.Popen([sys.executable, "-c", code, socket_path, str(started_path)], cwd=SOURCE_PATH)
+
+        try:
+            assert wait_until(lambda: os.path.exists(socket_path))
+
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.connect(socket_path)
+                send_message(connection, {"version": PROTOCOL_VERSION, "arguments": ["search", "query"]})
+
+                assert wait_until(started_path.exists)
+
+                process.send_signal(signal.SIGTERM)
+
+                assert process.wait(timeout=5) == 128 + signal.SIGTERM
+                assert not os.path.exists(socket_path)
+        finally:
+            process.kill()
+            process.wait()
+
+    def test_requests(self, running_agent, socket_path):
+        client = AgentClient(socket_path)
+
+        for keyword in ["kp", "kpx"]:
+            response = client.request(["settings_list"], {"alfred_keyword": keyword})
+
+            assert json.loads(response["output"])["items"][0]["subtitle"] == keyword
+
+    def test_idle_shutdown(self, running_agent, socket_path):
+        client = AgentClient(socket_path)
+        client.request(["settings_list"], {})
+        threading.Event().wait(1)
+
+        assert not os.path.exists(socket_path)
+
+        with pytest.raises(OSError):
+            client.request(["settings_list"], {})
+
+    def test_pool_is_enabled(self, running_agent, socket_path):
+        from services import (
+            client_pool,
+            entry_prefetcher,
+            keychain_password_cache,
+            search_index_cache,
+            search_results_cache,
+            totp_settings_cache,
+        )
+
+        AgentClient(socket_path).request(["settings_list"], {})
+
+        assert client_pool.is_enabled
+        assert search_results_cache.is_enabled
+        assert entry_prefetcher.is_enabled
+        assert keychain_password_cache.is_enabled
+        assert search_index_cache.is_enabled
+        assert totp_settings_cache.is_enabled
@@ -0,0 +1,115 @@
+import socket
+
+import pytest
+
+from agent import (
+    PROTOCOL_VERSION,
+    AgentProtocolError,
+    forward_to_agent,
+    receive_message,
+    send_message,
+)
+
+
+class TestFraming:
+    def test_round_trip(self):
+        message = {"version": PROTOCOL_VERSION, "arguments": ["search", "запрос"], "environment": {"a": "b"}}
+        left, right = socket.socketpair()
+
+        with left, right:
+            send_message(left, message)
+
+            assert receive_message(right) == message
+
+    def test_length_prefix(self):
+        left, right = socket.socketpair()
+
+        with left, right:
+            send_message(left, {"version": PROTOCOL_VERSION})
+            header = right.recv(4)
+
+            assert int.from_bytes(header, "big") == len(b'{"version": 1}')
+
+    def test_unsupported_version(self):
+        left, right = socket.socketpair()
+
+        with left, right:
+            send_message(left, {"version": PROTOCOL_VERSION + 1})
+
+            with pytest.raises(AgentProtocolError):
+                receive_message(right)
+
+    def test_closed_connection(self):
+        left, right = socket.socketpair()
+
+        with right:
+            left.sendall(b"\x00\x00\x00\x10{")
+            left.close()
+
+            with pytest.raises(AgentProtocolError):
+                receive_message(right)
+
+    def test_too_big_message(self, mocker):
+        mocker.patch("agent.MAX_MESSAGE_SIZE", 1)
+        left, right = socket.socketpair()
+
+        with left, right:
+            send_message(left, {"version": PROTOCOL_VERSION})
+
+            with pytest.raises(AgentProtocolError):
+                receive_message(right)
+
+
+class TestForwardToAgent:
+    def test_disabled_agent(self, mocker, environ_factory):
+        environ_factory(use_agent="false")
+        client_mock = mocker.patch("agent.AgentClient")
+
+        assert forward_to_agent(["search", "query"]) is False
+        client_mock.assert_not_called()
+
+    def test_not_supported_action(self, mocker, environ_factory):
+        environ_factory(use_agent="true")
+        client_mock = mocker.patch("agent.AgentClient")
+
+        assert forward_to_agent(["open_url", "http://a"]) is False
+        client_mock.assert_not_called()
+
+    def test_absent_agent(self, mocker, environ_factory):
+        environ_factory(use_agent="true")
+        mocker.patch("agent.AgentClient.request", side_effect=FileNotFoundError)
+        start_agent_mock = mocker.patch("agent.start_agent")
+
+        assert forward_to_agent(["search", "query"]) is False
+        start_agent_mock.assert_called_once()
+
+    @pytest.mark.parametrize("error", [socket.timeout, AgentProtocolError])
+    def test_busy_agent(self, mocker, environ_factory, error):
+        environ_factory(use_agent="true")
+        mocker.patch("agent.AgentClient.request", side_effect=error)
+        start_agent_mock = mocker.patch("agent.start_agent")
+
+        assert forward_to_agent(["search", "query"]) is False
+        start_agent_mock.assert_not_called()
+
+    def test_invocation_id(self, mocker, environ_factory):
+        environ_factory(use_agent="true")
+        mocker.patch("instrumentation.get_variables", return_value={"INVOCATION_ID": "invocation"})
+        request_mock = mocker.patch("agent.AgentClient.request", return_value={"output": ""})
+
+        assert forward_to_agent(["search", "query"]) is True
+        assert request_mock.call_args[0][1]["INVOCATION_ID"] == "invocation"
+        assert request_mock.call_args[0][1]["use_agent"] == "true"
+
+    def test_output(self, mocker, environ_factory, capsys):
+        environ_factory(use_agent="true")
+        mocker.patch(
+            "agent.AgentClient.request",
+            return_value={"output": '{"items": []}', "log": "Keychain lookup\n", "error": "Traceback"},
+        )
+
+        assert forward_to_agent(["search", "query"]) is True
+
+        captured = capsys.readouterr()
+        assert captured.out == '{"items": []}'
+        assert captured.err == "Keychain lookup\nTraceback"
@@ -1,3 +1,4 @@
+import json
 import sys
 
 import pytest
@@ -11,6 +12,9 @@ class TestInitMethod:
 
         assert script_filter.items == []
         assert script_filter.variables == {}
+        assert script_filter.rerun is None
+        assert script_filter.cache is None
+        assert not script_filter.skip_knowledge
 
 
 class TestAddVariableMethod:
@@ -21,6 +25,40 @@ class TestAddVariableMethod:
         assert alfred_script_filter.variables.get(incoming_key) == incoming_value
 
 
+class TestSetRerunMethod:
+    def test(self, alfred_script_filter):
+        alfred_script_filter.set_rerun(1)
+
+        assert alfred_script_filter.rerun == 1
+
+
+class TestSetCacheMethod:
+    @pytest.mark.parametrize(
+        "seconds, loose_reload, expected_cache",
+        [
+            (5, False, {"seconds": 5}),
+            (86400, False, {"seconds": 86400}),
+            (60, True, {"seconds": 60, "loosereload": True}),
+        ],
+    )
+    def test(self, alfred_script_filter, seconds, loose_reload, expected_cache):
+        alfred_script_filter.set_cache(seconds, loose_reload=loose_reload)
+
+        assert alfred_script_filter.cache == expected_cache
+
+    @pytest.mark.parametrize("seconds", [0, 4, 86401])
+    def test_out_of_range(self, alfred_script_filter, seconds):
+        with pytest.raises(ValueError):
+            alfred_script_filter.set_cache(seconds)
+
+
+class TestSetSkipKnowledgeMethod:
+    def test(self, alfred_script_filter):
+        alfred_script_filter.set_skip_knowledge()
+
+        assert alfred_script_filter.skip_knowledge
+
+
 class TestAddItemMethod:
     @pytest.mark.parametrize(
         "title, subtitle, is_valid, arg, mods, expected_item",
@@ -66,6 +104,11 @@ class TestAddItemMethod:
         assert len(alfred_script_filter.items) == 1
         assert alfred_script_filter.items[0] == expected_item
 
+    def test_uid_and_match(self, alfred_script_filter):
+        alfred_script_filter.add_item(title="a", arg="b", uid="c", match="d e")
+
+        assert alfred_script_filter.items[0] == {"title": "a", "valid": True, "arg": "b", "uid": "c", "match": "d e"}
+
     @pytest.mark.parametrize("number_of_items, expected_number_of_items", [(1, 1), (2, 2), (3, 3)])
     def test_appending_multiple_items(self, alfred_script_filter, number_of_items, expected_number_of_items):
         for _ in range(number_of_items):
@@ -112,3 +155,37 @@ class TestSendMethod:
 
         assert dump_mock.called_with(expected_data, sys.stdout)
         stdout_mock.flush.assert_called_once()
+
+    def test_with_rerun(self, alfred_script_filter, mocker, capsys):
+        alfred_script_filter.add_item(title="title")
+        alfred_script_filter.set_rerun(1)
+        alfred_script_filter.send()
+
+        assert json.loads(capsys.readouterr().out) == {"items": [{"title": "title", "valid": True}], "rerun": 1}
+
+    def test_with_cache(self, alfred_script_filter, capsys):
+        alfred_script_filter.add_item(title="title")
+        alfred_script_filter.set_cache(30, loose_reload=True)
+        alfred_script_filter.send()
+
+        assert json.loads(capsys.readouterr().out) == {
+            "items": [{"title": "title", "valid": True}],
+            "cache": {"seconds": 30, "loosereload": True},
+        }
+
+    def test_with_skip_knowledge(self, alfred_script_filter, capsys):
+        alfred_script_filter.add_item(title="title")
+        alfred_script_filter.set_skip_knowledge()
+        alfred_script_filter.send()
+
+        assert json.loads(capsys.readouterr().out) == {
+            "items": [{"title": "title", "valid": True}],
+            "skipknowledge": True,
+        }
+
+    def test_with_invocation_id(self, alfred_script_filter, capsys, mocker):
+        mocker.patch("instrumentation.get_variables", return_value={"INVOCATION_ID": "abc"})
+        alfred_script_filter.add_variable("USER_QUERY", "query")
+        alfred_script_filter.send()
+
+        assert json.loads(capsys.readouterr().out)["variables"] == {"USER_QUERY": "query", "INVOCATION_ID": "abc"}
@@ -5,9 +5,11 @@ class TestChoicesMethod:
     actual_choices = CLIActions.choices()
     expected_choices = [
         CLIActions.SEARCH,
+        CLIActions.LIST_ENTRIES,
         CLIActions.FETCH,
         CLIActions.SETTINGS_LIST,
         CLIActions.TOTP,
+        CLIActions.TOTPS,
         CLIActions.CHECK_FOR_UPDATES,
         CLIActions.OPEN_URL,
     ]
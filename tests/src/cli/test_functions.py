@@ -1,12 +1,23 @@
-from cli import CLIActions, main, parse_args
+import subprocess
+import sys
+
+import pytest
+
+from cli import ACTION_HANDLERS, CLIActions, build_parser, main, parse_args
+from handlers import list_entries_handler, open_url_handler, search_handler, totps_handler
 
 
 class TestMain:
+    @pytest.fixture(autouse=True)
+    def install_signal_handlers_mock(self, mocker):
+        # the handlers would exit the test process on Ctrl-C
+        yield mocker.patch("processes.install_signal_handlers")
+
     def test_exception(self, mocker):
         namespace_mock = mocker.patch("argparse.Namespace")
         namespace_mock.handler.side_effect = Exception
         mocker.patch("cli.parse_args", return_value=namespace_mock)
-        print_exc_mock = mocker.patch("cli.traceback.print_exc")
+        print_exc_mock = mocker.patch("traceback.print_exc")
         main()
 
         print_exc_mock.assert_called_once()
@@ -14,23 +25,94 @@ class TestMain:
     def test_without_exception(self, mocker):
         namespace_mock = mocker.patch("argparse.Namespace")
         mocker.patch("cli.parse_args", return_value=namespace_mock)
-        print_exc_mock = mocker.patch("cli.traceback.print_exc")
+        print_exc_mock = mocker.patch("traceback.print_exc")
         main()
 
         print_exc_mock.assert_not_called()
 
+    def test_signal_handlers(self, mocker, install_signal_handlers_mock):
+        mocker.patch("cli.parse_args", return_value=mocker.Mock())
+        main()
+
+        install_signal_handlers_mock.assert_called_once()
+
+    @pytest.mark.parametrize(
+        "summary, profile, trace",
+        [("true", "", ""), ("true", "true", ""), ("", "", "true")],
+    )
+    def test_instrumentation(self, mocker, monkeypatch, summary, profile, trace):
+        monkeypatch.setenv("instrumentation", summary)
+        monkeypatch.setenv("instrumentation_profile", profile)
+        monkeypatch.setenv("instrumentation_trace", trace)
+        mocker.patch("sys.argv", ["cli.py", "search", "query"])
+        mocker.patch("cli.parse_args", return_value=mocker.Mock())
+        enable_mock = mocker.patch("instrumentation.enable")
+        finish_mock = mocker.patch("instrumentation.finish")
+        main()
+
+        enable_mock.assert_called_once_with(profile=bool(profile), trace=bool(trace), resident=False)
+        finish_mock.assert_called_once_with("search")
+
 
 class TestParseArgs:
+    @pytest.mark.parametrize(
+        "arguments, expected_handler, expected_values",
+        [
+            ([CLIActions.SEARCH, "github"], search_handler, {"query": "github"}),
+            ([CLIActions.SEARCH, "-work"], search_handler, {"query": "-work"}),
+            ([CLIActions.OPEN_URL, "github.com"], open_url_handler, {"url": "github.com"}),
+            ([CLIActions.TOTPS, "mail"], totps_handler, {"query": "mail"}),
+            ([CLIActions.LIST_ENTRIES], list_entries_handler, {}),
+        ],
+    )
+    def test_arguments(self, mocker, arguments, expected_handler, expected_values):
+        build_parser_spy = mocker.spy(sys.modules["cli"], "build_parser")
+        parsed_args = parse_args(arguments)
+
+        assert parsed_args.handler is expected_handler
+        assert {name: getattr(parsed_args, name) for name in expected_values} == expected_values
+        build_parser_spy.assert_not_called()
+
+    def test_totps_without_query(self):
+        parsed_args = parse_args([CLIActions.TOTPS])
+
+        assert parsed_args.query == ""
+
+    @pytest.mark.parametrize("arguments", [["unknown"], [CLIActions.SEARCH], [CLIActions.SEARCH, "a", "b"]])
+    def test_invalid_arguments(self, arguments):
+        with pytest.raises(SystemExit):
+            parse_args(arguments)
+
+    def test_every_action_has_handler(self):
+        assert sorted(ACTION_HANDLERS) == sorted(CLIActions.choices())
+
+    def test_search_doesnt_import_other_actions(self):
+        code = "import sys, cli; cli.parse_args(['search', 'query']); print('\\n'.join(sys.modules))"
+        output = subprocess.run(
+            [sys.executable, "-S", "-c", code], cwd="src", stdout=subprocess.PIPE, universal_newlines=True, check=True
+        ).stdout
+
+        imported_modules = set(output.splitlines())
+
+        for module in ["argparse", "kdbx", "search", "totp", "traceback", "urllib.request", "webbrowser"]:
+            assert module not in imported_modules
+
+
+class TestBuildParser:
     def test_subparsers_parameters(self, mocker):
         add_parser_mock = mocker.patch("argparse._SubParsersAction.add_parser")
-        mocker.patch("cli.argparse.ArgumentParser.parse_args")
-        parse_args()
+        build_parser()
 
         add_parser_mock.assert_any_call(CLIActions.SEARCH)
+        add_parser_mock.assert_any_call(CLIActions.LIST_ENTRIES)
         add_parser_mock.assert_any_call(CLIActions.SETTINGS_LIST)
         add_parser_mock.assert_any_call(CLIActions.FETCH)
         add_parser_mock.assert_any_call(CLIActions.TOTP)
+        add_parser_mock.assert_any_call(CLIActions.TOTPS)
         add_parser_mock.assert_any_call(CLIActions.CHECK_FOR_UPDATES)
         add_parser_mock.assert_any_call(CLIActions.OPEN_URL)
 
-        assert add_parser_mock.call_count == 6
+        assert add_parser_mock.call_count == 8
+
+    def test_optional_query(self):
+        assert build_parser().parse_args([CLIActions.TOTPS]).query == ""
@@ -0,0 +1,24 @@
+import pytest
+
+from crypto import AES, CryptoError
+
+
+class TestAES:
+    @pytest.mark.parametrize(
+        "key, expected",
+        [
+            ("000102030405060708090a0b0c0d0e0f", "69c4e0d86a7b0430d8cdb78070b4c55a"),
+            ("000102030405060708090a0b0c0d0e0f1011121314151617", "dda97ca4864cdfe06eaf70a0ec0d7191"),
+            ("000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f", "8ea2b7ca516745bfeafc49904b496089"),
+        ],
+    )
+    def test_fips_197_vectors(self, key, expected):
+        cipher = AES(bytes.fromhex(key))
+        plain = bytes.fromhex("00112233445566778899aabbccddeeff")
+
+        assert cipher.encrypt_block(plain).hex() == expected
+        assert cipher.decrypt_block(bytes.fromhex(expected)) == plain
+
+    def test_invalid_key(self):
+        with pytest.raises(CryptoError):
+            AES(b"short")
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from crypto import ARGON2D, ARGON2ID, CryptoError, aes_cbc_decrypt, aes_kdf, argon2, xor_bytes
+
+
+class TestXorBytes:
+    def test(self):
+        assert xor_bytes(b"\x0f\xf0", b"\xff\xff\x00") == b"\xf0\x0f"
+
+
+class TestAesCbcDecrypt:
+    def test_decryption(self):
+        encrypted = bytes.fromhex(
+            "a4cd054c7e4ba6a4359c1b02e48d2a7bffa02acf8b86c68c3ee1e88e61c60110" "6c3ff5667c91089b43327c3f68c5c44a"
+        )
+
+        assert aes_cbc_decrypt(bytes(range(32)), bytes(range(16)), encrypted) == b"x" * 37
+
+    @pytest.mark.parametrize("data", [b"", b"x" * 15, bytes(32)])
+    def test_invalid_data(self, data):
+        with pytest.raises(CryptoError):
+            aes_cbc_decrypt(bytes(range(32)), bytes(range(16)), data)
+
+
+class TestAesKdf:
+    def test(self):
+        expected = "3252d9bbf6a5d5fc3ff2d5ecd5f6694113159c21c3580e7fccf99258cea955e0"
+        assert aes_kdf(bytes(range(32)), bytes(range(32, 64)), 100).hex() == expected
+
+
+class TestArgon2:
+    @pytest.mark.parametrize(
+        "type_, expected",
+        [
+            (ARGON2D, "512b391b6f1162975371d30919734294f868e3be3984f3c1a13a4db9fabe4acb"),
+            (ARGON2ID, "0d640df58d78766c08c037a34a8b53c9d01ef0452d75b65eb52520e96b01e659"),
+        ],
+    )
+    def test_rfc_9106_vectors(self, type_, expected):
+        actual = argon2(
+            password=b"\x01" * 32,
+            salt=b"\x02" * 16,
+            time_cost=3,
+            memory_cost=32,
+            parallelism=4,
+            hash_len=32,
+            type_=type_,
+            secret=b"\x03" * 8,
+            associated_data=b"\x04" * 12,
+        )
+
+        assert actual.hex() == expected
+
+    def test_long_output(self):
+        actual = argon2(b"password", b"somesalt12345678", time_cost=3, memory_cost=300, parallelism=3, hash_len=40)
+        assert len(actual) == 40
+
+    def test_unsupported_type(self):
+        with pytest.raises(CryptoError):
+            argon2(b"password", b"somesalt12345678", time_cost=1, memory_cost=8, parallelism=1, type_=1)
+
+
+class TestImportAccelerator:
+    def test_without_site(self, tmp_path):
+        """With -S the accelerator is found in site-packages, but sys.path and sys.modules stay as they are."""
+
+        environment = dict(os.environ, PYTHONUSERBASE=str(tmp_path), PYTHONPATH=os.path.abspath("src"))
+        site_packages = subprocess.run(
+            [sys.executable, "-S", "-c", "import site; print(site.getusersitepackages())"],
+            env=environment,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        os.makedirs(os.path.join(site_packages, "accelerator"))
+        open(os.path.join(site_packages, "accelerator", "__init__.py"), "w").close()
+        code = (
+            "import sys\n"
+            "path = sys.path[:]\n"
+            "import crypto\n"
+            "assert crypto._import_accelerator('accelerator') is not None\n"
+            "assert crypto._import_accelerator('missing_accelerator') is None\n"
+            "assert sys.path == path, sys.path\n"
+        )
+
+        subprocess.run([sys.executable, "-S", "-c", code], env=environment, check=True)
@@ -0,0 +1,44 @@
+import pytest
+
+from crypto import ChaCha20, CryptoError, Salsa20
+
+RFC_8439_PLAINTEXT = (
+    b"Ladies and Gentlemen of the class of '99: If I could offer you only one tip for the future, "
+    b"sunscreen would be it."
+)
+RFC_8439_CIPHERTEXT = (
+    "6e2e359a2568f98041ba0728dd0d6981e97e7aec1d4360c20a27afccfd9fae0bf91b65c5524733ab8f593dabcd62b357"
+    "1639d624e65152ab8f530c359f0861d807ca0dbf500d6a6156a38e088a22b65e52bc514d16ccf806818ce91ab7793736"
+    "5af90bbf74a35be6b40b8eedf2785e42874d"
+)
+
+
+class TestChaCha20:
+    def test_rfc_8439_vector(self):
+        cipher = ChaCha20(bytes(range(32)), bytes.fromhex("000000000000004a00000000"), counter=1)
+        assert cipher.process(RFC_8439_PLAINTEXT).hex() == RFC_8439_CIPHERTEXT
+
+    def test_key_stream_is_continuous(self):
+        cipher = ChaCha20(bytes(range(32)), bytes.fromhex("000000000000004a00000000"), counter=1)
+        encrypted = b"".join(cipher.process(RFC_8439_PLAINTEXT[i : i + 7]) for i in range(0, 114, 7))  # noqa: E203
+
+        assert encrypted.hex() == RFC_8439_CIPHERTEXT
+
+    def test_invalid_nonce(self):
+        with pytest.raises(CryptoError):
+            ChaCha20(bytes(32), bytes(8))
+
+
+class TestSalsa20:
+    def test_vector(self):
+        cipher = Salsa20(bytes(range(32)), bytes(8))
+        expected = (
+            "d4e196067d178496257b991d750c0a305871bdea20278e7a5370ae73ce2b2a28"
+            "84a915d28e2ee486b68c32fe9fdb128a1281adc62edc510cebc677a6195fe8ce"
+        )
+
+        assert cipher.process(b"a" * 64).hex() == expected
+
+    def test_invalid_nonce(self):
+        with pytest.raises(CryptoError):
+            Salsa20(bytes(32), bytes(12))
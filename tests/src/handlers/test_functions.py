@@ -1,21 +1,44 @@
 import argparse
+import json
+import os
+import queue
+import signal
 import subprocess
-from collections import namedtuple
+import sys
+import threading
 
 import pytest
+from freezegun import freeze_time
 
+import handlers
+import processes
 from alfred import AlfredModActionEnum
 from handlers import (
+    announce_updates,
     check_for_updates_handler,
     fetch_handler,
+    list_entries_handler,
     list_settings_handler,
     open_url_handler,
     require_password,
     search_handler,
     totp_handler,
+    totps_handler,
     validate_settings,
 )
 from helpers import cast_bool_to_yesno
+from services import (
+    KeepassXCCredentialsError,
+    NoSearchResultsError,
+    WorkflowUpdatesRateLimitError,
+    entry_prefetcher,
+    initialize_usage_store,
+    search_index_cache,
+    totp_settings_cache,
+)
+from totp import TOTPSettings
+
+VAULTS = '[{"name": "team", "db_path": "/team.kdbx", "keychain_account": "team"}]'
 
 
 class TestValidateSettingsDecorator:
@@ -75,6 +98,26 @@ class TestRequirePasswordDecorator:
         send_mock.assert_not_called()
         handler_mock.assert_called_once()
 
+    def test_rejected_password(self, mocker, configurable_valid_settings):
+        configurable_valid_settings(keepassxc_master_password="password")
+        forget_credentials_mock = mocker.patch("handlers.forget_credentials")
+        handler_mock = mocker.Mock(side_effect=KeepassXCCredentialsError)
+
+        with pytest.raises(KeepassXCCredentialsError):
+            require_password(handler_mock)()
+
+        forget_credentials_mock.assert_called_once()
+
+    def test_other_errors(self, mocker, configurable_valid_settings):
+        configurable_valid_settings(keepassxc_master_password="password")
+        forget_credentials_mock = mocker.patch("handlers.forget_credentials")
+        handler_mock = mocker.Mock(side_effect=OSError)
+
+        with pytest.raises(OSError):
+            require_password(handler_mock)()
+
+        forget_credentials_mock.assert_not_called()
+
 
 class TestSearchHandler:
     def test_kp_client_error(self, mocker, valid_settings, keepassxc_client):
@@ -82,7 +125,9 @@ class TestSearchHandler:
         mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
+
+        set_cache_mock = mocker.patch("handlers.AlfredScriptFilter.set_cache")
 
         with pytest.raises(OSError):
             search_handler(parsed_args)
@@ -92,6 +137,7 @@ class TestSearchHandler:
             is_valid=False,
         )
         send_mock.assert_called_once()
+        set_cache_mock.assert_not_called()
 
     @pytest.mark.parametrize(
         "kp_output, expected_title, expected_arg",
@@ -110,7 +156,7 @@ class TestSearchHandler:
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
         add_variable_mock = mocker.patch("handlers.AlfredScriptFilter.add_variable")
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         search_handler(parsed_args)
 
         add_item_mock.assert_called_with(
@@ -119,6 +165,375 @@ class TestSearchHandler:
         send_mock.assert_called_once()
         add_variable_mock.assert_called_with("USER_QUERY", parsed_args.query)
 
+    def test_output_is_cached(self, mocker, valid_settings, keepassxc_client, capsys):
+        mocker.patch.object(keepassxc_client, "search", return_value=["/entry"])
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        search_handler(argparse.Namespace(query="entry"))
+
+        assert json.loads(capsys.readouterr().out)["cache"] == {"seconds": 10, "loosereload": True}
+
+    def test_local_search(self, mocker, configurable_valid_settings, kdbx_client):
+        configurable_valid_settings(use_local_search="true", python_path="/usr/bin/python3")
+        mocker.patch.object(search_index_cache, "is_enabled", True)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        search_mock = mocker.patch.object(kdbx_client, "search")
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+        parsed_args = argparse.Namespace(query="mail")
+
+        try:
+            search_handler(parsed_args)
+        finally:
+            search_index_cache.clear()
+
+        search_mock.assert_not_called()
+        add_item_mock.assert_called_once_with(title="Internet > Mail > Mail", arg="/Internet/Mail/Mail")
+
+    def test_local_search_without_agent(self, mocker, configurable_valid_settings, kdbx_client):
+        configurable_valid_settings(use_local_search="true", python_path="/usr/bin/python3")
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        export_entries_mock = mocker.patch.object(kdbx_client, "export_entries")
+        search_mock = mocker.patch.object(kdbx_client, "search", return_value=["/Internet/Mail/Mail"])
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        search_handler(argparse.Namespace(query="mail"))
+
+        export_entries_mock.assert_not_called()
+        search_mock.assert_called_once_with("mail")
+        add_item_mock.assert_called_once_with(title="Internet > Mail > Mail", arg="/Internet/Mail/Mail")
+
+    def test_local_search_without_matches(self, mocker, configurable_valid_settings, kdbx_client):
+        configurable_valid_settings(use_local_search="true", python_path="/usr/bin/python3")
+        mocker.patch.object(search_index_cache, "is_enabled", True)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
+        parsed_args = argparse.Namespace(query="nothing")
+
+        try:
+            search_handler(parsed_args)
+        finally:
+            search_index_cache.clear()
+
+        add_item_mock.assert_called_once_with(title="There aren't matches or something went wrong.", is_valid=False)
+        send_mock.assert_called_once()
+
+    def test_cached_results(self, mocker, tmp_path, configurable_valid_settings, keepassxc_client):
+        db_path = tmp_path / "passwords.kdbx"
+        db_path.write_bytes(b"database")
+        configurable_valid_settings(
+            keepassxc_db_path=str(db_path),
+            search_cache_ttl="60",
+            search_cache_dir=str(tmp_path / "cache"),
+            python_path="/usr/bin/python3",
+        )
+        search_mock = mocker.patch.object(keepassxc_client, "search", return_value=["/Internet/GitHub"])
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        search_handler(argparse.Namespace(query="github"))
+        search_handler(argparse.Namespace(query="github"))
+
+        initialize_mock.assert_called_once()
+        search_mock.assert_called_once_with("github")
+        assert add_item_mock.call_args_list == [mocker.call(title="Internet > GitHub", arg="/Internet/GitHub")] * 2
+
+    def test_cached_empty_results(self, mocker, tmp_path, configurable_valid_settings, keepassxc_client):
+        db_path = tmp_path / "passwords.kdbx"
+        db_path.write_bytes(b"database")
+        configurable_valid_settings(
+            keepassxc_db_path=str(db_path),
+            search_cache_ttl="60",
+            search_cache_dir=str(tmp_path / "cache"),
+            python_path="/usr/bin/python3",
+        )
+        search_mock = mocker.patch.object(keepassxc_client, "search", side_effect=NoSearchResultsError)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        search_handler(argparse.Namespace(query="nothing"))
+        search_handler(argparse.Namespace(query="nothing"))
+
+        search_mock.assert_called_once()
+        add_item_mock.assert_called_with(title="There aren't matches or something went wrong.", is_valid=False)
+
+    def test_prefetch(self, mocker, configurable_valid_settings, keepassxc_client):
+        configurable_valid_settings(prefetch_entries="2", python_path="/usr/bin/python3")
+        mocker.patch.object(keepassxc_client, "search", return_value=["/a", "/b", "/c"])
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        mocker.patch("services.initialize_keepassxc_client", return_value=keepassxc_client)
+        mocker.patch.object(entry_prefetcher, "is_enabled", True)
+        cancel_mock = mocker.patch.object(entry_prefetcher, "cancel")
+        schedule_mock = mocker.patch.object(entry_prefetcher, "schedule")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        search_handler(argparse.Namespace(query="query"))
+
+        cancel_mock.assert_called_once()
+        schedule_mock.assert_called_once_with(keepassxc_client, ["/a", "/b"])
+
+    def test_disabled_prefetch(self, mocker, configurable_valid_settings, keepassxc_client):
+        configurable_valid_settings(prefetch_entries="2", python_path="/usr/bin/python3")
+        mocker.patch.object(keepassxc_client, "search", return_value=["/a", "/b", "/c"])
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        schedule_mock = mocker.patch.object(entry_prefetcher, "schedule")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        search_handler(argparse.Namespace(query="query"))
+
+        schedule_mock.assert_not_called()
+
+    def test_vaults(self, mocker, configurable_valid_settings, capsys):
+        configurable_valid_settings(python_path="/usr/bin/python3", keepassxc_vaults=VAULTS)
+        found_paths = {"path": ["/a", "/b", "/a"], "team": ["/a"]}
+        mocker.patch("handlers.search_entries", side_effect=lambda query, vault: found_paths[vault.name])
+        search_handler(argparse.Namespace(query="a"))
+        output = json.loads(capsys.readouterr().out)
+
+        assert output["items"] == [
+            {"title": "a", "subtitle": "path", "valid": True, "arg": "/a"},
+            {"title": "b", "subtitle": "path", "valid": True, "arg": "/b"},
+            {"title": "a", "subtitle": "team", "valid": True, "arg": "team:/a"},
+        ]
+        assert "cache" in output
+
+    def test_vaults_are_searched_concurrently(self, mocker, configurable_valid_settings, capsys):
+        configurable_valid_settings(python_path="/usr/bin/python3", keepassxc_vaults=VAULTS)
+        barrier = threading.Barrier(2, timeout=5)
+
+        def search_entries(query, vault):
+            barrier.wait()  # passed only if the other vault is searched at the same time
+            return [f"/{vault.name}"]
+
+        mocker.patch("handlers.search_entries", side_effect=search_entries)
+        search_handler(argparse.Namespace(query="a"))
+        output = json.loads(capsys.readouterr().out)
+
+        assert [item["arg"] for item in output["items"]] == ["/path", "team:/team"]
+
+    def test_failed_and_slow_vaults(self, mocker, configurable_valid_settings, capsys):
+        configurable_valid_settings(
+            keepassxc_vaults='[{"name": "team", "db_path": "/team.kdbx", "keychain_account": "team"},'
+            ' {"name": "infra", "db_path": "/infra.kdbx", "keychain_account": "infra"}]',
+            search_cache_ttl="30",
+            python_path="/usr/bin/python3",
+        )
+        mocker.patch("handlers.VAULT_SEARCH_TIMEOUT", 0.1)
+        forget_credentials_mock = mocker.patch("handlers.forget_credentials")
+        set_mock = mocker.patch("services.SearchResultsFileCache.set")
+        mocker.patch("services.SearchResultsFileCache.get", return_value=None)
+        released = threading.Event()
+
+        def search_entries(query, vault):
+            if vault.name == "team":
+                raise KeepassXCCredentialsError("Invalid credentials were provided")
+
+            if vault.name == "infra":
+                released.wait(5)
+
+            return ["/a"]
+
+        mocker.patch("handlers.search_entries", side_effect=search_entries)
+
+        try:
+            search_handler(argparse.Namespace(query="a"))
+        finally:
+            released.set()
+
+        output = json.loads(capsys.readouterr().out)
+
+        assert output["items"] == [
+            {"title": "Can't search team.", "subtitle": "Invalid credentials were provided", "valid": False},
+            {"title": "Can't search infra.", "subtitle": "It hasn't answered in 0.1 s.", "valid": False},
+            {"title": "a", "subtitle": "path", "valid": True, "arg": "/a"},
+        ]
+        assert "cache" not in output
+        forget_credentials_mock.assert_called_once()
+        set_mock.assert_not_called()
+
+    def test_subprocesses_of_slow_vaults_are_killed(self, mocker, configurable_valid_settings, capsys):
+        configurable_valid_settings(python_path="/usr/bin/python3", keepassxc_vaults=VAULTS)
+        mocker.patch("handlers.VAULT_SEARCH_TIMEOUT", 0.5)
+        started_processes = queue.Queue()
+
+        def search_entries(query, vault):
+            if vault.name == "team":
+                process = processes.spawn(["sleep", "30"])
+                started_processes.put(process)
+                processes.communicate(process)
+
+            return ["/a"]
+
+        mocker.patch("handlers.search_entries", side_effect=search_entries)
+        search_handler(argparse.Namespace(query="a"))
+        process = started_processes.get(timeout=5)
+
+        assert process.wait(timeout=5) == -signal.SIGKILL
+        assert "hasn't answered" in capsys.readouterr().out
+
+    def test_invalid_vaults(self, mocker, configurable_valid_settings):
+        configurable_valid_settings(python_path="/usr/bin/python3", keepassxc_vaults="[")
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        with pytest.raises(ValueError):
+            search_handler(argparse.Namespace(query="a"))
+
+        add_item_mock.assert_called_once_with(
+            title="Vaults are configured incorrectly.", subtitle=mocker.ANY, is_valid=False
+        )
+
+    def test_recent_entries(self, mocker, configurable_valid_settings, capsys):
+        configurable_valid_settings(python_path="/usr/bin/python3", keepassxc_vaults=VAULTS, recent_entries="10")
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client")
+        usage_store = initialize_usage_store()
+
+        for reference in ["/Internet/GitHub", "removed:/Mail", "team:/Servers/Web", "/Internet/GitHub"]:
+            usage_store.record(reference)
+
+        search_handler(argparse.Namespace(query=""))
+        output = json.loads(capsys.readouterr().out)
+
+        assert output["items"] == [
+            {
+                "title": "Internet > GitHub",
+                "subtitle": "Recently used in path",
+                "valid": True,
+                "arg": "/Internet/GitHub",
+            },
+            {"title": "Servers > Web", "subtitle": "Recently used in team", "valid": True, "arg": "team:/Servers/Web"},
+        ]
+        initialize_mock.assert_not_called()
+
+    def test_recent_entries_of_one_character(self, mocker, valid_settings, usage_history, capsys):
+        mocker.patch("handlers.initialize_keepassxc_client")
+        usage_store = initialize_usage_store()
+        usage_store.record("/Internet/GitHub")
+        usage_store.record("/Mail")
+
+        search_handler(argparse.Namespace(query="G"))
+        output = json.loads(capsys.readouterr().out)
+
+        assert output["items"] == [
+            {"title": "Internet > GitHub", "subtitle": "Recently used", "valid": True, "arg": "/Internet/GitHub"}
+        ]
+        assert output["variables"] == {"USER_QUERY": "G"}  # the "back" button restores the query as typed
+
+    def test_one_character_without_recent_entries(self, mocker, valid_settings, usage_history, keepassxc_client):
+        initialize_usage_store().record("/Mail")
+        search_mock = mocker.patch.object(keepassxc_client, "search", return_value=["/Internet/GitHub"])
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        search_handler(argparse.Namespace(query="g"))
+
+        search_mock.assert_called_once_with("g")
+
+    def test_empty_history(self, mocker, valid_settings, usage_history):
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client")
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        search_handler(argparse.Namespace(query=""))
+
+        add_item_mock.assert_called_once_with(
+            title="Type to search entries.", subtitle="Chosen entries are listed here.", is_valid=False
+        )
+        initialize_mock.assert_not_called()
+
+    def test_results_ranked_by_usage(self, mocker, valid_settings, usage_history, keepassxc_client, capsys):
+        usage_store = initialize_usage_store()
+        usage_store.record("/c")
+        usage_store.record("/b")
+        usage_store.record("/b")
+        mocker.patch.object(keepassxc_client, "search", return_value=["/a", "/b", "/c", "/d"])
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+
+        search_handler(argparse.Namespace(query="query"))
+        output = json.loads(capsys.readouterr().out)
+
+        assert [item["arg"] for item in output["items"]] == ["/b", "/c", "/a", "/d"]
+
+    @pytest.mark.parametrize("recent_entries", [None, "0"])
+    def test_empty_query_without_history(self, mocker, configurable_valid_settings, recent_entries):
+        configurable_valid_settings(python_path="/usr/bin/python3", recent_entries=recent_entries)
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client")
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        search_handler(argparse.Namespace(query=" "))
+
+        add_item_mock.assert_called_once_with(title="Type to search entries.", is_valid=False)
+        initialize_mock.assert_not_called()
+
+
+class TestListEntriesHandler:
+    def test_listed_entries(self, mocker, valid_settings, kdbx_client, capsys):
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        list_entries_handler(argparse.Namespace())
+        output = json.loads(capsys.readouterr().out)
+
+        assert [item["arg"] for item in output["items"]] == [
+            "/Internet/Café",
+            "/Internet/GitHub",
+            "/Internet/Mail/Mail",
+            "/Recycle Bin/Deleted",
+            "/Root entry",
+        ]
+        assert output["items"][2] == {
+            "title": "Internet > Mail > Mail",
+            "valid": True,
+            "arg": "/Internet/Mail/Mail",
+            "uid": "a3b57a07aa3641e4b8df52b28ee8a79f",
+            "match": "Mail Internet user@example.com user example com",
+        }
+        assert output["cache"] == {"seconds": 600, "loosereload": True}
+        assert output["variables"] == {"USER_QUERY": ""}
+
+    def test_too_many_entries(self, mocker, configurable_valid_settings, kdbx_client, capsys):
+        configurable_valid_settings(alfred_filtering_max_entries="3", python_path="/usr/bin/python3")
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        list_entries_handler(argparse.Namespace())
+        output = json.loads(capsys.readouterr().out)
+
+        assert output["items"] == [
+            {"title": "There are more than 3 entries.", "subtitle": 'Search them with "kp <term>".', "valid": False}
+        ]
+        assert "cache" not in output
+
+    def test_export_stops_after_limit(self, mocker, configurable_valid_settings, keepassxc_client):
+        configurable_valid_settings(alfred_filtering_max_entries="1", python_path="/usr/bin/python3")
+        read_entries = []
+
+        def export_entries():
+            for path in ["/a", "/b", "/c"]:
+                read_entries.append(path)
+                yield mocker.Mock(path=path)
+
+        mocker.patch.object(keepassxc_client, "export_entries", side_effect=export_entries)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        list_entries_handler(argparse.Namespace())
+
+        assert read_entries == ["/a", "/b"]
+
+    def test_kp_client_error(self, mocker, valid_settings, keepassxc_client):
+        mocker.patch.object(keepassxc_client, "export_entries", side_effect=OSError)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        set_cache_mock = mocker.patch("handlers.AlfredScriptFilter.set_cache")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        with pytest.raises(OSError):
+            list_entries_handler(argparse.Namespace())
+
+        add_item_mock.assert_called_once_with(title="Something went wrong.", is_valid=False)
+        set_cache_mock.assert_not_called()
+
 
 class TestFetchHandler:
     @pytest.mark.parametrize(
@@ -151,7 +566,7 @@ class TestFetchHandler:
         mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         fetch_handler(parsed_args)
 
         send_mock.assert_called_once()
@@ -315,7 +730,7 @@ class TestFetchHandler:
         mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         fetch_handler(parsed_args)
 
         send_mock.assert_called_once()
@@ -357,7 +772,7 @@ class TestFetchHandler:
         mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         expected_add_item["mods"] = mocker.ANY
         fetch_handler(parsed_args)
 
@@ -396,7 +811,7 @@ class TestFetchHandler:
 
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         fetch_handler(parsed_args)
 
         send_mock.assert_called_once()
@@ -430,7 +845,7 @@ class TestFetchHandler:
         mocker.patch("handlers.AlfredScriptFilter.send")
         mod_mock = mocker.patch("handlers.AlfredMod")
         mod_instance_mock = mod_mock.return_value
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         fetch_handler(parsed_args)
 
         mod_mock.assert_called_once_with(
@@ -440,6 +855,15 @@ class TestFetchHandler:
         )
         mod_instance_mock.add_variable.assert_called_once_with("USER_ACTION", "cmd")
 
+    def test_output_isnt_cached(self, valid_settings, keepassxc_item, keepassxc_client, mocker, capsys):
+        mocker.patch.object(keepassxc_client, "show", return_value=keepassxc_item)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        fetch_handler(argparse.Namespace(query="/entry"))
+        output = json.loads(capsys.readouterr().out)
+
+        assert "cache" not in output
+        assert output["skipknowledge"] is True
+
     @pytest.mark.parametrize("show_totp_request, is_there_totp_request", [("true", True), ("false", False)])
     def test_totp_request(
         self,
@@ -457,7 +881,7 @@ class TestFetchHandler:
         mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         mocker.patch("handlers.AlfredScriptFilter.send")
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         fetch_handler(parsed_args)
 
         if is_there_totp_request:
@@ -504,7 +928,7 @@ class TestFetchHandler:
         mocker.patch("handlers.AlfredScriptFilter.send")
         mod_mock = mocker.patch("handlers.AlfredMod")
         mod_instance_mock = mod_mock.return_value
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         fetch_handler(parsed_args)
 
         expected_call = mocker.call(
@@ -557,7 +981,7 @@ class TestFetchHandler:
         mocker.patch("handlers.AlfredScriptFilter.send")
         mod_mock = mocker.patch("handlers.AlfredMod")
         mod_instance_mock = mod_mock.return_value
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         fetch_handler(parsed_args)
 
         expected_call = mocker.call(
@@ -576,8 +1000,67 @@ class TestFetchHandler:
             except AssertionError:
                 pass
 
+    def test_prefetched_entry(self, mocker, valid_settings, environ_factory, keepassxc_client, keepassxc_item):
+        environ_factory(desired_attributes="title", show_attribute_values="yes")
+        show_mock = mocker.patch.object(keepassxc_client, "show")
+        get_mock = mocker.patch.object(entry_prefetcher, "get", return_value=keepassxc_item)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        fetch_handler(argparse.Namespace(query="/entry"))
+
+        get_mock.assert_called_once_with(keepassxc_client, "/entry")
+        show_mock.assert_not_called()
+        add_item_mock.assert_any_call(title="Title", is_valid=True, subtitle="title", arg="title", mods=mocker.ANY)
+
+    def test_entry_of_vault(self, mocker, configurable_valid_settings, keepassxc_client, keepassxc_item):
+        configurable_valid_settings(python_path="/usr/bin/python3", keepassxc_vaults=VAULTS, desired_attributes="title")
+        show_mock = mocker.patch.object(keepassxc_client, "show", return_value=keepassxc_item)
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        fetch_handler(argparse.Namespace(query="team:/Internet/GitHub"))
+
+        assert initialize_mock.call_args[0][0].name == "team"
+        show_mock.assert_called_once_with("/Internet/GitHub")
+
+    def test_usage_is_recorded(self, mocker, valid_settings, usage_history, keepassxc_client, keepassxc_item):
+        mocker.patch.object(keepassxc_client, "show", return_value=keepassxc_item)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        fetch_handler(argparse.Namespace(query="/Internet/GitHub"))
+
+        assert initialize_usage_store().recent(10) == ["/Internet/GitHub"]
+
+    def test_usage_isnt_recorded_without_history(
+        self, mocker, valid_settings, keepassxc_client, keepassxc_item, workflow_data_directory
+    ):
+        mocker.patch.object(keepassxc_client, "show", return_value=keepassxc_item)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        fetch_handler(argparse.Namespace(query="/Internet/GitHub"))
+
+        assert not workflow_data_directory.exists()
+
+    def test_failed_fetch_isnt_recorded(self, mocker, valid_settings, usage_history, keepassxc_client):
+        mocker.patch.object(keepassxc_client, "show", side_effect=OSError)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+
+        with pytest.raises(OSError):
+            fetch_handler(argparse.Namespace(query="/Internet/GitHub"))
+
+        assert initialize_usage_store().recent(10) == []
+
 
 class TestListSettingsHandler:
+    def test_output_is_cached(self, valid_settings, capsys):
+        list_settings_handler(argparse.Namespace())
+
+        assert json.loads(capsys.readouterr().out)["cache"] == {"seconds": 3600, "loosereload": True}
+
     def test_added_items(self, mocker, valid_settings):
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
@@ -683,7 +1166,7 @@ class TestTotpHandler:
         mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
         add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
 
         with pytest.raises(OSError):
             totp_handler(parsed_args)
@@ -703,7 +1186,7 @@ class TestTotpHandler:
         send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
         alfred_mod = mocker.patch("handlers.AlfredMod")
         alfred_mod_instance = alfred_mod.return_value
-        parsed_args = namedtuple("parsed_args", "query")
+        parsed_args = argparse.Namespace(query="/entry")
         totp_handler(parsed_args)
 
         add_item_mock.assert_called_with(
@@ -720,8 +1203,230 @@ class TestTotpHandler:
         alfred_mod_instance.add_variable.assert_called_with("USER_ACTION", "mod")
         send_mock.assert_called_once()
 
+    @freeze_time("2009-02-13 23:31:40")
+    def test_generated_totp(self, mocker, valid_settings, kdbx_client):
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        totp_mock = mocker.spy(kdbx_client, "totp")
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        add_variable_mock = mocker.patch("handlers.AlfredScriptFilter.add_variable")
+        set_rerun_mock = mocker.patch("handlers.AlfredScriptFilter.set_rerun")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        try:
+            totp_handler(argparse.Namespace(query="/Internet/GitHub"))
+        finally:
+            totp_settings_cache.clear()
 
-class TestCheckForUpdatesHandler:
+        totp_mock.assert_not_called()
+        add_item_mock.assert_called_once_with(
+            title="005924", subtitle="Press Enter to copy the TOTP. Expires in 20 s.", arg="005924", mods=mocker.ANY
+        )
+        set_rerun_mock.assert_called_once_with(1)
+        name, value = add_variable_mock.call_args[0]
+        assert name == "TOTP_CODES"
+        assert json.loads(value) == {
+            "query": "/Internet/GitHub",
+            "codes": [["005924", 1234567920], ["590587", 1234567950], ["240500", 1234567980], ["992085", 1234568010]],
+        }
+
+    @freeze_time("2009-02-13 23:32:05")
+    def test_passed_totp(self, mocker, valid_settings, environ_factory):
+        codes = {"query": "/entry", "codes": [["111111", 1234567920], ["222222", 1234567950]]}
+        environ_factory(TOTP_CODES=json.dumps(codes))
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client")
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        add_variable_mock = mocker.patch("handlers.AlfredScriptFilter.add_variable")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        totp_handler(argparse.Namespace(query="/entry"))
+
+        initialize_mock.assert_not_called()
+        add_item_mock.assert_called_once_with(
+            title="222222", subtitle="Press Enter to copy the TOTP. Expires in 25 s.", arg="222222", mods=mocker.ANY
+        )
+        add_variable_mock.assert_called_once_with(
+            "TOTP_CODES", json.dumps({"query": "/entry", "codes": [["222222", 1234567950]]})
+        )
+
+    @freeze_time("2009-02-13 23:32:05")
+    def test_output_isnt_cached(self, valid_settings, environ_factory, capsys):
+        codes = {"query": "/entry", "codes": [["111111", 1234567950]]}
+        environ_factory(TOTP_CODES=json.dumps(codes))
+        totp_handler(argparse.Namespace(query="/entry"))
+        output = json.loads(capsys.readouterr().out)
+
+        assert "cache" not in output
+        assert output["skipknowledge"] is True
+
+    @pytest.mark.parametrize(
+        "codes",
+        [
+            {"query": "/another", "codes": [["111111", 1234567920]]},
+            {"query": "/entry", "codes": [["111111", 1234567890]]},
+            "not a dict",
+        ],
+    )
+    @freeze_time("2009-02-13 23:32:05")
+    def test_not_passed_totp(self, mocker, valid_settings, environ_factory, keepassxc_client, codes):
+        environ_factory(TOTP_CODES=json.dumps(codes))
+        mocker.patch.object(keepassxc_client, "totp_settings", side_effect=OSError)
+        mocker.patch.object(keepassxc_client, "totp", return_value="333333")
+        mocker.patch("services.get_files_fingerprint")
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        set_rerun_mock = mocker.patch("handlers.AlfredScriptFilter.set_rerun")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        try:
+            totp_handler(argparse.Namespace(query="/entry"))
+        finally:
+            totp_settings_cache.clear()
+
+        add_item_mock.assert_called_once_with(
+            title="333333", subtitle="Press Enter to copy the TOTP.", arg="333333", mods=mocker.ANY
+        )
+        set_rerun_mock.assert_not_called()
+
+    @freeze_time("2009-02-13 23:31:40")
+    def test_entry_of_vault(self, mocker, configurable_valid_settings, kdbx_client):
+        configurable_valid_settings(python_path="/usr/bin/python3", keepassxc_vaults=VAULTS)
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        try:
+            totp_handler(argparse.Namespace(query="team:/Internet/GitHub"))
+        finally:
+            totp_settings_cache.clear()
+
+        assert initialize_mock.call_args[0][0].name == "team"
+        assert add_item_mock.call_args[1]["title"] == "005924"
+
+
+class TestTotpsHandler:
+    @freeze_time("2009-02-13 23:31:40")
+    def test_generated_totps(self, mocker, valid_settings, kdbx_client):
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        export_entries_spy = mocker.spy(kdbx_client, "export_entries")
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        add_variable_mock = mocker.patch("handlers.AlfredScriptFilter.add_variable")
+        set_rerun_mock = mocker.patch("handlers.AlfredScriptFilter.set_rerun")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        totps_handler(argparse.Namespace(query=""))
+
+        export_entries_spy.assert_called_once_with(with_totp=True)
+        assert add_item_mock.call_args_list == [
+            mocker.call(
+                title="005924  Internet > GitHub",
+                subtitle="Expires in 20 s. Press Enter to copy the TOTP.",
+                arg="005924",
+                mods=mocker.ANY,
+            ),
+            mocker.call(
+                title="89005924  Internet > Mail > Mail",
+                subtitle="Expires in 20 s. Press Enter to copy the TOTP.",
+                arg="89005924",
+                mods=mocker.ANY,
+            ),
+        ]
+        set_rerun_mock.assert_called_once_with(1)
+        name, value = add_variable_mock.call_args[0]
+        passed_list = json.loads(value)
+        assert name == "TOTP_LIST"
+        assert passed_list["query"] == ""
+        assert [entry_path for entry_path, _ in passed_list["entries"]] == ["/Internet/GitHub", "/Internet/Mail/Mail"]
+        assert passed_list["entries"][0][1][0] == ["005924", 1234567920]
+
+    @freeze_time("2009-02-13 23:31:40")
+    @pytest.mark.parametrize(
+        "malformed_settings",
+        [
+            TOTPSettings(secret=b"a", period=0),
+            TOTPSettings(secret=b"a", digits=4),
+            TOTPSettings(secret=b"a", algorithm="foo"),
+        ],
+    )
+    def test_malformed_entry(self, mocker, valid_settings, kdbx_client, malformed_settings):
+        kp_entries = list(kdbx_client.export_entries(with_totp=True))
+        next(entry for entry in kp_entries if entry.path == "/Internet/GitHub").totp_settings = malformed_settings
+        mocker.patch.object(kdbx_client, "export_entries", return_value=iter(kp_entries))
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        totps_handler(argparse.Namespace(query=""))
+
+        add_item_mock.assert_called_once_with(
+            title="89005924  Internet > Mail > Mail",
+            subtitle="Expires in 20 s. Press Enter to copy the TOTP.",
+            arg="89005924",
+            mods=mocker.ANY,
+        )
+
+    @freeze_time("2009-02-13 23:31:40")
+    def test_not_matched_entries(self, mocker, valid_settings, kdbx_client):
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        totps_handler(argparse.Namespace(query="café"))
+
+        add_item_mock.assert_called_once_with(title="There aren't entries with TOTP.", is_valid=False)
+
+    @freeze_time("2009-02-13 23:32:05")
+    def test_output_isnt_cached(self, valid_settings, environ_factory, capsys):
+        totp_list = {"query": "", "entries": [["/a", [["111111", 1234567950]]]]}
+        environ_factory(TOTP_LIST=json.dumps(totp_list))
+        totps_handler(argparse.Namespace(query=""))
+        output = json.loads(capsys.readouterr().out)
+
+        assert "cache" not in output
+        assert output["skipknowledge"] is True
+
+    @freeze_time("2009-02-13 23:32:05")
+    def test_passed_totps(self, mocker, valid_settings, environ_factory):
+        totp_list = {"query": "", "entries": [["/a", [["111111", 1234567920], ["222222", 1234567950]]]]}
+        environ_factory(TOTP_LIST=json.dumps(totp_list))
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client")
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        totps_handler(argparse.Namespace(query=""))
+
+        initialize_mock.assert_not_called()
+        add_item_mock.assert_called_once_with(
+            title="222222  a", subtitle="Expires in 25 s. Press Enter to copy the TOTP.", arg="222222", mods=mocker.ANY
+        )
+
+    @freeze_time("2009-02-13 23:32:05")
+    def test_expired_totps(self, mocker, valid_settings, environ_factory, kdbx_client):
+        totp_list = {"query": "", "entries": [["/a", [["111111", 1234567950]]], ["/b", [["222222", 1234567920]]]]}
+        environ_factory(TOTP_LIST=json.dumps(totp_list))
+        initialize_mock = mocker.patch("handlers.initialize_keepassxc_client", return_value=kdbx_client)
+        mocker.patch("handlers.AlfredScriptFilter.add_item")
+        mocker.patch("handlers.AlfredScriptFilter.send")
+
+        totps_handler(argparse.Namespace(query=""))
+
+        initialize_mock.assert_called_once()
+
+    def test_kp_client_error(self, mocker, valid_settings, keepassxc_client):
+        mocker.patch.object(keepassxc_client, "export_entries", side_effect=OSError)
+        mocker.patch("handlers.initialize_keepassxc_client", return_value=keepassxc_client)
+        add_item_mock = mocker.patch("handlers.AlfredScriptFilter.add_item")
+        send_mock = mocker.patch("handlers.AlfredScriptFilter.send")
+
+        with pytest.raises(OSError):
+            totps_handler(argparse.Namespace(query=""))
+
+        add_item_mock.assert_called_with(
+            title="There aren't entries with TOTP or something went wrong.", is_valid=False
+        )
+        send_mock.assert_called_once()
+
+
+class TestAnnounceUpdates:
     def test_no_version(self, mocker, version_factory):
         popen_mock = mocker.patch("handlers.subprocess.Popen")
         mocker.patch.multiple(
@@ -730,7 +1435,7 @@ class TestCheckForUpdatesHandler:
             has_new_version=mocker.Mock(return_value=False),
         )
 
-        check_for_updates_handler(mocker.Mock())
+        announce_updates()
 
         expected_message = "Version 1.2.3 is the newest version available at the moment."
         popen_mock.assert_called_once_with(
@@ -747,7 +1452,7 @@ class TestCheckForUpdatesHandler:
             has_new_version=mocker.Mock(side_effect=Exception()),
         )
 
-        check_for_updates_handler(mocker.Mock())
+        announce_updates()
 
         expected_message = "An error occurred while trying to check for updates. Please try again later."
         popen_mock.assert_called_once_with(
@@ -765,7 +1470,7 @@ class TestCheckForUpdatesHandler:
             fetch_latest_version=mocker.Mock(return_value=version_factory("1.2.3")),
         )
 
-        check_for_updates_handler(mocker.Mock())
+        announce_updates()
 
         popen_mock.assert_called_once_with(
             ["osascript", "-l", "JavaScript", "settings.js", "announceNewRelease", "1.2.3"],
@@ -774,6 +1479,40 @@ class TestCheckForUpdatesHandler:
             stdin=subprocess.PIPE,
         )
 
+    def test_rate_limit(self, mocker):
+        popen_mock = mocker.patch("handlers.subprocess.Popen")
+        error = WorkflowUpdatesRateLimitError("GitHub doesn't accept requests for updates until 12:30.")
+        mocker.patch.multiple("handlers.WorkflowUpdatesChecker", has_new_version=mocker.Mock(side_effect=error))
+
+        announce_updates()
+
+        expected_message = "GitHub doesn't accept requests for updates until 12:30. Please try again later."
+        popen_mock.assert_called_once_with(
+            ["osascript", "-l", "JavaScript", "settings.js", "showMessage", expected_message],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.PIPE,
+        )
+
+
+class TestCheckForUpdatesHandler:
+    def test_check_in_detached_process(self, mocker):
+        popen_mock = mocker.patch("handlers.subprocess.Popen")
+        has_new_version_mock = mocker.patch("handlers.WorkflowUpdatesChecker.has_new_version")
+
+        check_for_updates_handler(mocker.Mock())
+
+        has_new_version_mock.assert_not_called()
+        popen_mock.assert_called_once_with(
+            [sys.executable, "-S", "-c", "import handlers; handlers.announce_updates()"],
+            cwd=os.path.dirname(os.path.abspath(handlers.__file__)),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            close_fds=True,
+        )
+
 
 class TestOpenUrlHandler:
     @pytest.mark.parametrize(
@@ -787,7 +1526,7 @@ class TestOpenUrlHandler:
         ],
     )
     def test_opening_depends_on_url_prefix(self, mocker, incoming_url, is_suitable_for_opening):
-        webbrowser_mock = mocker.patch("handlers.webbrowser.open")
+        webbrowser_mock = mocker.patch("webbrowser.open")
         open_url_handler(argparse.Namespace(url=incoming_url))
 
         if is_suitable_for_opening:
@@ -804,7 +1543,7 @@ class TestOpenUrlHandler:
         ],
     )
     def test_opened_url(self, mocker, incoming_url, expected_url):
-        webbrowser_mock = mocker.patch("handlers.webbrowser.open")
+        webbrowser_mock = mocker.patch("webbrowser.open")
         open_url_handler(argparse.Namespace(url=incoming_url))
 
         webbrowser_mock.assert_called_once_with(expected_url)
@@ -0,0 +1,171 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture(autouse=True)
+def disable_instrumentation():
+    yield
+    instrumentation.recorder = None
+
+
+def read_trace(path):
+    with open(path) as trace_file:
+        return json.loads(trace_file.read().rstrip(",\n") + "]")
+
+
+def read_log(directory):
+    with open(directory / instrumentation.LOG_FILE_NAME) as log_file:
+        return [json.loads(line) for line in log_file]
+
+
+class TestStage:
+    def test_disabled(self):
+        with instrumentation.stage("handler"):
+            pass
+
+        assert instrumentation.stage("handler") is instrumentation.NULL_STAGE
+
+    def test_enabled(self):
+        instrumentation.enable()
+
+        for _ in range(2):
+            with instrumentation.stage("keychain"):
+                pass
+
+        with pytest.raises(ValueError):
+            with instrumentation.stage("keepassxc-cli"):
+                raise ValueError
+
+        stages = instrumentation.recorder.stages
+
+        assert list(stages) == ["keychain", "keepassxc-cli"]
+        assert stages["keychain"][0] == 2
+        assert stages["keepassxc-cli"][0] == 1
+
+
+class TestFinish:
+    def test_disabled(self, tmp_path, capsys):
+        instrumentation.add_bytes_read(10)
+        instrumentation.finish("search")
+
+        assert capsys.readouterr().err == ""
+        assert not (tmp_path / "workflow-data").exists()
+
+    def test_summary(self, tmp_path, capsys):
+        instrumentation.enable()
+
+        with instrumentation.stage("keepassxc-cli"):
+            subprocess.run(["true"])
+
+        instrumentation.add_bytes_read(100)
+        instrumentation.add_bytes_read(24)
+        instrumentation.finish("search")
+        instrumentation.finish("search")  # the run has already been finished
+        (summary,) = read_log(tmp_path / "workflow-data")
+        stderr = capsys.readouterr().err
+
+        assert instrumentation.recorder is None
+        assert summary["action"] == "search"
+        assert summary["subprocesses"] == 1
+        assert summary["bytes_read"] == 124
+        assert summary["stages"]["keepassxc-cli"]["count"] == 1
+        assert summary["total_ms"] >= summary["stages"]["keepassxc-cli"]["ms"] > 0
+        assert summary["startup_cpu_ms"] > 0
+        assert stderr.startswith("Instrumentation of search: total ")
+        assert stderr.count("\n") == 1
+        assert "keepassxc-cli " in stderr and "; 1 subprocesses, 124 bytes read" in stderr
+        assert os.stat(tmp_path / "workflow-data" / instrumentation.LOG_FILE_NAME).st_mode & 0o777 == 0o600
+
+    def test_profile(self, tmp_path):
+        instrumentation.enable(profile=True)
+        instrumentation.finish("fetch")
+        (summary,) = read_log(tmp_path / "workflow-data")
+
+        assert summary["profile"] == str(tmp_path / "workflow-data" / "profile-fetch.prof")
+        assert os.path.getsize(summary["profile"]) > 0
+
+    def test_unwritable_log(self, tmp_path, capsys, monkeypatch):
+        (tmp_path / "file").touch()
+        monkeypatch.setenv("alfred_workflow_data", str(tmp_path / "file"))
+        instrumentation.enable()
+        instrumentation.finish("search")
+
+        assert "Can't write the instrumentation log: " in capsys.readouterr().err
+
+
+class TestTrace:
+    def test_invocation(self, tmp_path, monkeypatch):
+        data_directory = tmp_path / "workflow-data"
+
+        for action in ["search", "fetch"]:
+            instrumentation.enable(trace=True)
+
+            with instrumentation.stage("keepassxc-cli") as stage:
+                stage.annotate(hit=False)
+                subprocess.run(["true"])
+
+            monkeypatch.setenv("INVOCATION_ID", instrumentation.get_variables()["INVOCATION_ID"])
+            instrumentation.finish(action)
+
+        (trace_path,) = data_directory.glob("trace-*.json")
+        events = read_trace(trace_path)
+        spans = [event for event in events if event["ph"] == "X"]
+
+        assert trace_path.name == f"trace-{os.environ['INVOCATION_ID']}.json"
+        assert [span["name"] for span in spans] == ["keepassxc-cli", "cli.py search", "keepassxc-cli", "cli.py fetch"]
+        assert spans[0]["args"] == {"hit": False}
+        assert spans[1]["ts"] <= spans[0]["ts"] and spans[0]["ts"] + spans[0]["dur"] <= spans[1]["ts"] + spans[1]["dur"]
+        assert spans[1]["ts"] + spans[1]["dur"] <= spans[2]["ts"]
+        assert [event["name"] for event in events if event["ph"] == "i"] == ["start true", "start true"]
+        assert [event["args"]["name"] for event in events if event["ph"] == "M"] == ["cli.py search", "cli.py fetch"]
+        assert all(event["pid"] == os.getpid() for event in events)
+        assert [line["invocation_id"] for line in read_log(data_directory)] == [os.environ["INVOCATION_ID"]] * 2
+
+    def test_resident_process(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("INVOCATION_ID", "invocation")
+
+        for _ in range(2):
+            instrumentation.enable(trace=True, resident=True)
+            subprocess.run(["true"])
+            instrumentation.finish("search")
+
+        events = read_trace(tmp_path / "workflow-data" / "trace-invocation.json")
+        summaries = read_log(tmp_path / "workflow-data")
+
+        assert [event["name"] for event in events if event["ph"] == "X"] == ["agent.py search"] * 2
+        assert [event["name"] for event in events if event["ph"] == "i"] == ["start true"] * 2
+        assert [summary["startup_cpu_ms"] for summary in summaries] == [0, 0]
+        assert [summary["subprocesses"] for summary in summaries] == [1, 1]
+
+    def test_without_trace(self):
+        instrumentation.enable()
+
+        assert instrumentation.get_variables() == {}
+        assert instrumentation.recorder.trace_events is None
+
+    def test_old_trace_files(self, tmp_path):
+        (tmp_path / "trace-old.json").touch()
+        (tmp_path / "trace-recent.json").touch()
+        os.utime(tmp_path / "trace-old.json", (0, 0))
+        instrumentation.create_trace_file(str(tmp_path / "trace-new.json"))
+
+        assert sorted(os.listdir(tmp_path)) == ["trace-new.json", "trace-recent.json"]
+        assert (tmp_path / "trace-new.json").read_text() == "[\n"
+
+
+class TestWriteLogLine:
+    def test_rotation(self, tmp_path, mocker):
+        mocker.patch("instrumentation.MAX_LOG_SIZE", 10)
+        path = str(tmp_path / "instrumentation.log")
+
+        for line in ["first", "second", "third"]:
+            instrumentation.write_log_line(path, line)
+
+        with open(path) as log_file, open(path + ".1") as rotated_log_file:
+            assert log_file.read() == "third\n"
+            assert rotated_log_file.read() == "first\nsecond\n"
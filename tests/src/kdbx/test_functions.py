@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import struct
+
+import pytest
+
+from kdbx import (
+    KDF_AES_KDBX3,
+    KdbxError,
+    build_composite_key,
+    parse_header,
+    parse_variant_dictionary,
+    read_key_file,
+)
+
+
+class TestParseHeader:
+    def test_kdbx4(self, kdbx_fixture):
+        with open(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), "rb") as db_file:
+            header, offset = parse_header(db_file.read())
+
+        assert header.version == 4
+        assert header.is_compressed
+        assert header.kdf_parameters["M"] == 64 * 1024
+        assert offset == len(header.raw)
+
+    def test_kdbx3(self, kdbx_fixture):
+        with open(kdbx_fixture("kdbx3-aes.kdbx"), "rb") as db_file:
+            header, _ = parse_header(db_file.read())
+
+        assert header.version == 3
+        assert header.kdf_parameters["$UUID"] == KDF_AES_KDBX3
+        assert header.kdf_parameters["R"] == 100
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            b"",
+            b"not a database",
+            struct.pack("<IIHH", 0x9AA2D903, 0xB54BFB67, 0, 2),
+        ],
+    )
+    def test_invalid_file(self, data):
+        with pytest.raises(KdbxError):
+            parse_header(data)
+
+
+class TestParseVariantDictionary:
+    def test(self):
+        data = struct.pack("<H", 0x0100)
+        data += struct.pack("<BI", 0x05, 1) + b"I" + struct.pack("<IQ", 8, 2)
+        data += struct.pack("<BI", 0x42, 1) + b"S" + struct.pack("<I", 3) + b"abc"
+        data += struct.pack("<BI", 0x18, 4) + b"Name" + struct.pack("<I", 4) + b"name"
+        data += b"\x00"
+
+        assert parse_variant_dictionary(data) == {"I": 2, "S": b"abc", "Name": "name"}
+
+    def test_unsupported_version(self):
+        with pytest.raises(KdbxError):
+            parse_variant_dictionary(struct.pack("<H", 0x0200) + b"\x00")
+
+
+class TestReadKeyFile:
+    def test_xml_v1(self, tmp_path):
+        key_file = tmp_path / "key.key"
+        key = bytes(range(32))
+        key_file.write_text(
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            f"<KeyFile><Meta><Version>1.00</Version></Meta><Key><Data>{base64.b64encode(key).decode()}</Data></Key>"
+            "</KeyFile>"
+        )
+
+        assert read_key_file(str(key_file)) == key
+
+    def test_xml_v2(self, tmp_path):
+        key_file = tmp_path / "key.keyx"
+        key_file.write_text(
+            '<?xml version="1.0" encoding="UTF-8"?>\n<KeyFile><Meta><Version>2.0</Version></Meta>'
+            '<Key><Data Hash="00000000">\n  00010203 04050607 08090A0B 0C0D0E0F\n'
+            "  10111213 14151617 18191A1B 1C1D1E1F\n</Data></Key></KeyFile>"
+        )
+
+        assert read_key_file(str(key_file)) == bytes(range(32))
+
+    def test_raw_32_bytes(self, tmp_path):
+        key_file = tmp_path / "key"
+        key_file.write_bytes(bytes(range(32)))
+
+        assert read_key_file(str(key_file)) == bytes(range(32))
+
+    def test_hex_64_chars(self, tmp_path):
+        key_file = tmp_path / "key"
+        key_file.write_text(bytes(range(32)).hex())
+
+        assert read_key_file(str(key_file)) == bytes(range(32))
+
+    def test_any_other_file(self, tmp_path):
+        key_file = tmp_path / "key.png"
+        key_file.write_bytes(b"arbitrary content")
+
+        assert read_key_file(str(key_file)) == hashlib.sha256(b"arbitrary content").digest()
+
+
+class TestBuildCompositeKey:
+    def test_password(self):
+        expected = hashlib.sha256(hashlib.sha256(b"password").digest()).digest()
+        assert build_composite_key("password", None) == expected
+
+    def test_password_and_key_file(self, kdbx_fixture):
+        expected = hashlib.sha256(hashlib.sha256(b"password").digest() + bytes(range(32))).digest()
+        assert build_composite_key("password", kdbx_fixture("keyfile.keyx")) == expected
+
+    def test_key_file_only(self, kdbx_fixture):
+        expected = hashlib.sha256(bytes(range(32))).digest()
+        assert build_composite_key(None, kdbx_fixture("keyfile.keyx")) == expected
@@ -0,0 +1,136 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import kdbx
+from kdbx import KdbxCredentialsError, KdbxReader
+
+EXPECTED_ENTRIES = [
+    ("/Root entry", "root", "root password"),
+    ("/Internet/GitHub", "octocat", "gh secret"),
+    ("/Internet/Café", "günter", "pässwörd"),
+    ("/Internet/Mail/Mail", "user@example.com", "mail secret"),
+    ("/Recycle Bin/Deleted", "", "deleted secret"),
+]
+
+
+class TestReadMethod:
+    @pytest.mark.parametrize(
+        "db_name, password, use_key_file",
+        [
+            ("kdbx4-aes-argon2d.kdbx", "password", False),
+            ("kdbx4-chacha20-argon2id.kdbx", "password", False),
+            ("kdbx4-aes-aeskdf-uncompressed.kdbx", "password", False),
+            ("kdbx4-keyfile.kdbx", "password", True),
+            ("kdbx4-keyfile-only.kdbx", None, True),
+            ("kdbx3-aes.kdbx", "password", False),
+            ("kdbx3-chacha20-keyfile.kdbx", "password", True),
+        ],
+    )
+    def test_formats(self, kdbx_fixture, db_name, password, use_key_file):
+        key_file = kdbx_fixture("keyfile.keyx") if use_key_file else None
+        entries = KdbxReader(kdbx_fixture(db_name), password, key_file).read()
+
+        assert [(entry.path, entry.username, entry.password) for entry in entries] == EXPECTED_ENTRIES
+
+    def test_database_written_by_pykeepass(self, kdbx_fixture):
+        entries = KdbxReader(kdbx_fixture("kdbx4-pykeepass.kdbx"), "password").read()
+
+        assert [(entry.path, entry.password, entry.notes) for entry in entries] == [
+            ("/Internet/GitHub", "gh secret", "pykeepass")
+        ]
+
+    def test_attributes(self, kdbx_fixture):
+        entry = KdbxReader(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), "password").read()[1]
+
+        assert entry.url == "https://github.com"
+        assert entry.notes == "first line\nsecond line"
+        assert entry.tags == "dev;work"
+        assert entry.attributes["otp"].startswith("otpauth://totp/")
+        assert len(entry.uuid) == 32
+
+    @pytest.mark.parametrize("db_name", ["kdbx4-aes-argon2d.kdbx", "kdbx4-chacha20-argon2id.kdbx", "kdbx3-aes.kdbx"])
+    def test_invalid_password(self, kdbx_fixture, db_name):
+        with pytest.raises(KdbxCredentialsError):
+            KdbxReader(kdbx_fixture(db_name), "wrong password").read()
+
+    def test_not_a_database(self, tmp_path):
+        db_path = tmp_path / "passwords.kdbx"
+        db_path.write_bytes(b"not a database")
+
+        with pytest.raises(OSError):
+            KdbxReader(str(db_path), "password").read()
+
+    def test_unchanged_file_is_not_parsed_again(self, mocker, kdbx_fixture):
+        parse_entries_mock = mocker.patch("kdbx.parse_entries", wraps=kdbx.parse_entries)
+        reader = KdbxReader(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), "password")
+
+        assert reader.read() is reader.read()
+        parse_entries_mock.assert_called_once()
+
+    def test_transformed_key_is_cached(self, mocker, tmp_path, kdbx_fixture):
+        db_path = tmp_path / "passwords.kdbx"
+        shutil.copy(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), db_path)
+        transform_key_mock = mocker.patch("kdbx.transform_key", wraps=kdbx.transform_key)
+        parse_entries_mock = mocker.patch("kdbx.parse_entries", wraps=kdbx.parse_entries)
+        reader = KdbxReader(str(db_path), "password")
+        reader.read()
+
+        shutil.copy(kdbx_fixture("kdbx4-chacha20-argon2id.kdbx"), db_path)  # other KDF parameters
+        reader.read()
+        shutil.copy(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), db_path)  # a restored copy keeps the header
+        os.utime(db_path, ns=(0, 0))
+        reader.read()
+        os.utime(db_path, ns=(1, 1))
+        reader.read()
+
+        assert transform_key_mock.call_count == 3
+        assert parse_entries_mock.call_count == 4
+
+    def test_saved_database_derives_key_again(self, mocker, tmp_path, kdbx_fixture):
+        db_path = tmp_path / "passwords.kdbx"
+        shutil.copy(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), db_path)
+        transform_key_mock = mocker.patch("kdbx.transform_key", wraps=kdbx.transform_key)
+        reader = KdbxReader(str(db_path), "password")
+        reader.read()
+
+        shutil.copy(kdbx_fixture("kdbx4-aes-argon2d-resaved.kdbx"), db_path)  # the same parameters, a new salt
+        entries = reader.read()
+
+        assert transform_key_mock.call_count == 2
+        assert [(entry.path, entry.username, entry.password) for entry in entries] == EXPECTED_ENTRIES
+
+    def test_changed_credentials(self, mocker, tmp_path, kdbx_fixture):
+        transform_key_mock = mocker.patch("kdbx.transform_key", wraps=kdbx.transform_key)
+        reader = KdbxReader(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), "wrong password")
+
+        with pytest.raises(KdbxCredentialsError):
+            reader.read()
+
+        reader.password = "password"
+        reader.read()
+
+        assert transform_key_mock.call_count == 2
+
+
+@pytest.mark.skipif(shutil.which("keepassxc-cli") is None, reason="keepassxc-cli isn't installed")
+class TestKeepassXCDatabases:
+    def run_cli(self, *arguments, password="password"):
+        process = subprocess.run(
+            ["keepassxc-cli", *arguments], input=f"{password}\n{password}\n", capture_output=True, text=True
+        )
+        assert process.returncode == 0, process.stderr
+
+    def test_database_created_by_keepassxc_cli(self, tmp_path):
+        db_path = str(tmp_path / "passwords.kdbx")
+        self.run_cli("db-create", "--set-password", "--decryption-time", "100", db_path)
+        self.run_cli("mkdir", "-q", db_path, "Internet")
+        self.run_cli("add", "-q", db_path, "--username", "octocat", "--url", "https://github.com", "Internet/GitHub")
+
+        entries = KdbxReader(db_path, "password").read()
+
+        assert [(entry.path, entry.username, entry.url) for entry in entries] == [
+            ("/Internet/GitHub", "octocat", "https://github.com")
+        ]
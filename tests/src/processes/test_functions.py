@@ -0,0 +1,323 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import processes
+
+SOURCE_PATH = os.path.abspath("src")
+
+
+def is_running(pid):
+    """Tells if the process exists and isn't a zombie, orphans aren't always reaped in containers."""
+
+    if not os.path.isdir("/proc/self"):
+        return processes.is_alive(pid)
+
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            return stat_file.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+    except FileNotFoundError:
+        return False
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        time.sleep(0.01)
+
+    return True
+
+
+def get_dead_pid():
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+class TestSpawn:
+    def test_new_process_group(self, subprocess_records_directory):
+        process = processes.spawn(["sleep", "30"])
+
+        try:
+            assert os.getpgid(process.pid) == process.pid
+            assert os.listdir(subprocess_records_directory) == [f"{os.getpid()}-{process.pid}"]
+        finally:
+            processes.kill(process)
+            process.wait()
+            processes.release(process)
+
+        assert os.listdir(subprocess_records_directory) == []
+
+
+class TestCommunicate:
+    def test_output(self, subprocess_records_directory):
+        process = processes.spawn(["cat"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        assert processes.communicate(process, input=b"input") == (b"input", b"")
+        assert os.listdir(subprocess_records_directory) == []
+
+    def test_timeout_kills_process_group(self, tmp_path, subprocess_records_directory):
+        pid_path = tmp_path / "grandchild.pid"
+        process = processes.spawn(["sh", "-c", f"sleep 30 & echo $! > {pid_path}; wait"], stdout=subprocess.PIPE)
+        assert wait_until(lambda: pid_path.exists() and pid_path.read_text().strip())
+
+        with pytest.raises(processes.SubprocessTimeoutError, match="sh hasn't finished in 0.2 seconds"):
+            processes.communicate(process, timeout=0.2)
+
+        assert wait_until(lambda: not is_running(int(pid_path.read_text())))
+        assert os.listdir(subprocess_records_directory) == []
+
+    def test_timeout_setting(self, monkeypatch):
+        monkeypatch.setenv("subprocess_timeout", "1")
+        process = processes.spawn(["sleep", "30"])
+
+        with pytest.raises(processes.SubprocessTimeoutError, match="sleep hasn't finished in 1 seconds"):
+            processes.communicate(process)
+
+
+class TestKillStartedBy:
+    def test(self):
+        processes_of_threads = {}
+
+        def start():
+            processes_of_threads[threading.get_ident()] = processes.spawn(["sleep", "30"])
+
+        threads = [threading.Thread(target=start) for _ in range(2)]
+
+        for thread in threads:
+            thread.start()
+            thread.join()
+
+        processes.kill_started_by([threads[0].ident])
+        killed_process, running_process = (processes_of_threads[thread.ident] for thread in threads)
+
+        try:
+            assert killed_process.wait(timeout=5) == -signal.SIGKILL
+            assert running_process.poll() is None
+        finally:
+            processes.kill(running_process)
+
+            for process in (killed_process, running_process):
+                process.wait()
+                processes.release(process)
+
+
+class TestWatchdog:
+    def test_fired(self):
+        process = processes.spawn(["sleep", "30"])
+
+        with processes.Watchdog(process, timeout=0.2) as watchdog:
+            process.wait()
+
+        processes.release(process)
+        assert watchdog.has_fired
+
+    def test_not_fired(self):
+        process = processes.spawn(["true"])
+
+        with processes.Watchdog(process, timeout=5) as watchdog:
+            process.wait()
+
+        processes.release(process)
+        assert not watchdog.has_fired
+
+
+class TestReapOrphans:
+    @pytest.fixture
+    def orphan(self, subprocess_records_directory):
+        subprocess_records_directory.mkdir(exist_ok=True)
+        process = subprocess.Popen(["sleep", "30"], start_new_session=True)
+        record_path = subprocess_records_directory / f"{get_dead_pid()}-{process.pid}"
+        record_path.touch()
+
+        yield process, record_path
+
+        process.kill()
+        process.wait()
+
+    def test_dead_parent(self, orphan, subprocess_records_directory):
+        process, record_path = orphan
+        processes.reap_orphans(str(subprocess_records_directory))
+
+        assert process.wait(timeout=5) == -signal.SIGKILL
+        assert not record_path.exists()
+
+    def test_alive_parent(self, orphan, subprocess_records_directory):
+        process, record_path = orphan
+        alive_record_path = record_path.with_name(f"{os.getpid()}-{process.pid}")
+        record_path.rename(alive_record_path)
+        processes.reap_orphans(str(subprocess_records_directory))
+
+        assert process.poll() is None
+        assert alive_record_path.exists()
+
+    def test_reused_pid(self, orphan, subprocess_records_directory):
+        process, record_path = orphan
+        recorded_at = time.time() - 60  # the recorded process has exited and its ID was given to another one
+        os.utime(record_path, (recorded_at, recorded_at))
+        processes.reap_orphans(str(subprocess_records_directory))
+
+        assert process.poll() is None
+        assert not record_path.exists()
+
+    def test_unknown_start_time(self, mocker, orphan, subprocess_records_directory):
+        process, record_path = orphan
+        mocker.patch("processes.get_start_time", return_value=None)
+        recorded_at = time.time() - processes.DEFAULT_TIMEOUT - 1
+        os.utime(record_path, (recorded_at, recorded_at))
+        processes.reap_orphans(str(subprocess_records_directory))
+
+        assert process.poll() is None
+        assert not record_path.exists()
+
+    def test_old_record(self, orphan, subprocess_records_directory):
+        process, record_path = orphan
+        modified_at = time.time() - processes.RECORD_MAX_AGE - 1
+        os.utime(record_path, (modified_at, modified_at))
+        processes.reap_orphans(str(subprocess_records_directory))
+
+        assert process.poll() is None
+        assert not record_path.exists()
+
+
+class TestGetStartTime:
+    @pytest.mark.skipif(not os.path.isdir("/proc/self") and sys.platform != "darwin", reason="no process start times")
+    def test_new_process(self):
+        started_at = time.time()
+        process = subprocess.Popen(["sleep", "30"])
+
+        try:
+            assert started_at - 1 <= processes.get_start_time(process.pid) <= time.time() + 1
+        finally:
+            process.kill()
+            process.wait()
+
+    def test_missing_process(self):
+        assert processes.get_start_time(get_dead_pid()) is None
+
+
+class TestSignalHandlers:
+    @pytest.mark.parametrize("signal_number", processes.TERMINATION_SIGNALS)
+    def test_subprocesses_are_killed(self, tmp_path, signal_number):
+        code = (
+            "import sys, time, processes\n"
+            "processes.get_records_directory = lambda: sys.argv[1]\n"
+            "processes.install_signal_handlers()\n"
+            "print(processes.spawn(['sleep', '30']).pid, flush=True)\n"
+            "time.sleep(30)\n"
+        )
+        process = subprocess.Popen(
+            [sys.executable, "-c", code, str(tmp_path / "children")],
+            cwd=SOURCE_PATH,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        child_pid = int(process.stdout.readline())
+        process.send_signal(signal_number)
+
+        assert process.wait(timeout=5) == 128 + signal_number
+        assert wait_until(lambda: not is_running(child_pid))
+        assert os.listdir(tmp_path / "children") == []
+        process.stdout.close()
+
+    def test_finally_blocks_run(self, tmp_path):
+        code = (
+            "import sys, time, processes\n"
+            "processes.get_records_directory = lambda: sys.argv[1]\n"
+            "processes.install_signal_handlers()\n"
+            "try:\n"
+            "    print(processes.spawn(['sleep', '30']).pid, flush=True)\n"
+            "    time.sleep(30)\n"
+            "finally:\n"
+            "    open(sys.argv[2], 'w').close()\n"
+        )
+        process = subprocess.Popen(
+            [sys.executable, "-c", code, str(tmp_path / "children"), str(tmp_path / "cleaned-up")],
+            cwd=SOURCE_PATH,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        process.stdout.readline()
+        process.send_signal(signal.SIGTERM)
+
+        assert process.wait(timeout=5) == 128 + signal.SIGTERM
+        assert (tmp_path / "cleaned-up").exists()
+        process.stdout.close()
+
+    def test_signal_deferred_by_another_thread(self, tmp_path):
+        code = (
+            "import signal, sys, threading, time, processes\n"
+            "processes.get_records_directory = lambda: sys.argv[1]\n"
+            "processes.install_signal_handlers()\n"
+            "processes._pending_signal = signal.SIGTERM  # came while the thread was starting a subprocess\n"
+            "thread = threading.Thread(target=processes.spawn, args=(['sleep', '30'],))\n"
+            "thread.start()\n"
+            "time.sleep(30)\n"
+        )
+        process = subprocess.run([sys.executable, "-c", code, str(tmp_path / "children")], cwd=SOURCE_PATH, timeout=10)
+
+        assert process.returncode == 128 + signal.SIGTERM
+        assert os.listdir(tmp_path / "children") == []
+
+
+class TestSupersededSearches:
+    """Replays fast typing: Alfred terminates the run of every query but the last one."""
+
+    @pytest.fixture
+    def environment(self, tmp_path, fake_security, fake_keepassxc_cli, fake_keepassxc_db):
+        fake_security()
+        db_path = fake_keepassxc_db(entries=[{"path": "/Internet/github", "title": "github"}])
+
+        yield dict(
+            os.environ,
+            alfred_keyword="kp",
+            keepassxc_cli_path=fake_keepassxc_cli,
+            keepassxc_db_path=db_path,
+            keepassxc_master_password="••••••••",
+            keychain_account="account",
+            keychain_service="service",
+            python_path=sys.executable,
+            desired_attributes="title,username,password",
+            entry_delimiter=" › ",
+            FAKE_KEEPASSXC_DELAY="30",
+            FAKE_KEEPASSXC_LOG=str(tmp_path / "unlocks.log"),
+        )
+
+    @staticmethod
+    def read_unlock_pids(environment):
+        try:
+            with open(environment["FAKE_KEEPASSXC_LOG"]) as log:
+                return [int(line) for line in log]
+        except FileNotFoundError:
+            return []
+
+    def search(self, query, environment):
+        return subprocess.Popen(
+            [sys.executable, "-S", os.path.join(SOURCE_PATH, "cli.py"), "search", query],
+            env=environment,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    @pytest.mark.parametrize("signal_number", [signal.SIGTERM, signal.SIGKILL])
+    def test_burst(self, environment, signal_number):
+        for index in range(20):
+            process = self.search(f"github {index}", environment)
+            assert wait_until(lambda: len(self.read_unlock_pids(environment)) == index + 1)
+            process.send_signal(signal_number)
+            process.communicate()
+
+        process = self.search("github", dict(environment, FAKE_KEEPASSXC_DELAY="0"))
+        output, _ = process.communicate(timeout=30)
+
+        assert b"/Internet/github" in output
+        assert wait_until(lambda: not any(is_running(pid) for pid in self.read_unlock_pids(environment)))
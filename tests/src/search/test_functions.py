@@ -0,0 +1,83 @@
+import pytest
+
+from search import compile_word_start, fold, get_tags, get_trigrams, get_url_host, get_word_prefixes, parse_query
+
+
+@pytest.mark.parametrize(
+    "text, expected_value",
+    [
+        ("GitHub", "github"),
+        ("Café", "cafe"),
+        ("Ärger Straße", "arger strasse"),
+        ("ﬁle", "file"),
+        ("", ""),
+    ],
+)
+def test_fold(text, expected_value):
+    assert fold(text) == expected_value
+
+
+@pytest.mark.parametrize(
+    "text, expected_value",
+    [
+        ("github", {"git", "ith", "thu", "hub"}),
+        ("git", {"git"}),
+        ("gi", set()),
+        ("aaaa", {"aaa"}),
+    ],
+)
+def test_get_trigrams(text, expected_value):
+    assert get_trigrams(text) == expected_value
+
+
+def test_get_word_prefixes():
+    assert get_word_prefixes("my-git hub", 2) == {"m", "my", "g", "gi", "h", "hu"}
+
+
+@pytest.mark.parametrize(
+    "text, is_found",
+    [
+        ("hub", True),
+        ("git hub", True),
+        ("git-hub", True),
+        ("github", False),
+        ("git_hub", False),
+    ],
+)
+def test_compile_word_start(text, is_found):
+    assert bool(compile_word_start("hub")(text)) is is_found
+
+
+@pytest.mark.parametrize(
+    "url, expected_value",
+    [
+        ("https://GitHub.com/login", "github.com"),
+        ("github.com/login", "github.com"),
+        ("ftp://user@files.example.org:21", "files.example.org"),
+        ("", ""),
+        ("http://[invalid", ""),
+    ],
+)
+def test_get_url_host(url, expected_value):
+    assert get_url_host(url) == expected_value
+
+
+def test_get_tags():
+    assert get_tags("prod; ci,work ,") == {"prod", "ci", "work"}
+
+
+@pytest.mark.parametrize(
+    "query, expected_value",
+    [
+        ("git hub", (["git", "hub"], [])),
+        ("user:Alice url:github.com ci", (["ci"], [("user", "alice"), ("url", "github.com")])),
+        (
+            "u:alice t:git g:/Work/ tags:prod",
+            ([], [("user", "alice"), ("title", "git"), ("group", "/work/"), ("tag", "prod")]),
+        ),
+        ("notes:secret http://host", (["notes:secret", "http://host"], [])),
+        ("user: git", (["git"], [])),
+    ],
+)
+def test_parse_query(query, expected_value):
+    assert parse_query(query) == expected_value
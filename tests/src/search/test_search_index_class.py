@@ -0,0 +1,201 @@
+import pytest
+
+from search import SearchIndex
+
+
+class Entry:
+    def __init__(self, path, username="", url="", tags=""):
+        self.path = path
+        self.title = path.rsplit("/", 1)[-1]
+        self.username = username
+        self.url = url
+        self.tags = tags
+
+
+def search_paths(index, query, limit=50):
+    return [entry.path for entry in index.search(query, limit)]
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(
+        Entry(path)
+        for path in [
+            "/Work/Servers/Production admin",
+            "/Work/GitLab",
+            "/Personal/My GitHub",
+            "/Personal/GitHub",
+            "/Personal/GitHub personal account",
+            "/Work/Legacy/Forgithub",
+            "/Work/GitHub/Token",
+            "/Travel/Café",
+        ]
+    )
+
+
+@pytest.fixture
+def fields_index():
+    return SearchIndex(
+        [
+            Entry("/Work/GitHub", username="alice@example.com", url="https://github.com/login", tags="prod;ci"),
+            Entry("/Work/CI/GitHub deploy", username="deploy", url="github.com", tags="prod"),
+            Entry("/Work/CI/Jenkins", username="alice", url="https://ci.example.com:8080", tags="Prod, staging"),
+            Entry("/Workshop/Tools", username="bob", url="https://tools.example.org"),
+            Entry("/Personal/GitHub", username="alice", url="https://github.com", tags="personal"),
+        ]
+    )
+
+
+class TestSearchMethod:
+    def test_ranking(self, index):
+        assert search_paths(index, "github") == [
+            "/Personal/GitHub",  # title prefix, the shortest title
+            "/Personal/GitHub personal account",  # title prefix
+            "/Personal/My GitHub",  # title word
+            "/Work/Legacy/Forgithub",  # title substring
+            "/Work/GitHub/Token",  # group word
+        ]
+
+    def test_every_term_has_to_match(self, index):
+        assert search_paths(index, "github personal") == [
+            "/Personal/GitHub personal account",
+            "/Personal/GitHub",
+            "/Personal/My GitHub",
+        ]
+
+    def test_group_terms(self, index):
+        assert search_paths(index, "servers admin") == ["/Work/Servers/Production admin"]
+
+    @pytest.mark.parametrize("query", ["cafe", "CAFÉ", "Café"])
+    def test_folding(self, index, query):
+        assert search_paths(index, query) == ["/Travel/Café"]
+
+    def test_short_terms_match_word_prefixes(self, index):
+        assert search_paths(index, "gi") == [
+            "/Work/GitLab",
+            "/Personal/GitHub",
+            "/Personal/GitHub personal account",
+            "/Personal/My GitHub",
+            "/Work/GitHub/Token",
+        ]
+
+    def test_fuzzy_match(self, index):
+        assert search_paths(index, "githib")[:2] == ["/Personal/GitHub", "/Personal/My GitHub"]
+
+    def test_fuzzy_term_with_exact_term(self, index):
+        assert search_paths(index, "personal githib") == [
+            "/Personal/GitHub personal account",
+            "/Personal/GitHub",
+            "/Personal/My GitHub",
+        ]
+
+    def test_limit(self, index):
+        assert search_paths(index, "github", limit=2) == ["/Personal/GitHub", "/Personal/GitHub personal account"]
+        assert search_paths(index, "github personal", limit=1) == ["/Personal/GitHub personal account"]
+
+    def test_empty_query(self, index):
+        assert search_paths(index, " ", limit=2) == ["/Work/Servers/Production admin", "/Work/GitLab"]
+
+    def test_without_matches(self, index):
+        assert search_paths(index, "nothing") == []
+
+    def test_added_entries(self, index):
+        index.add(Entry("/Git"))
+
+        assert search_paths(index, "git", limit=1) == ["/Git"]
+        assert len(index) == 9
+
+    def test_large_index(self):
+        index = SearchIndex(Entry(f"/Group {number % 10}/Entry {number}") for number in range(1000))
+
+        assert search_paths(index, "entry 99", limit=3) == [
+            "/Group 9/Entry 99",
+            "/Group 0/Entry 990",
+            "/Group 1/Entry 991",
+        ]
+        assert search_paths(index, "group 3", limit=2) == ["/Group 3/Entry 3", "/Group 0/Entry 30"]
+
+    def test_substring_of_many_titles(self):
+        index = SearchIndex(
+            Entry(f"/Group/{name} admin {number}") for number in range(100) for name in ("Box", "Gmail")
+        )
+
+        assert search_paths(index, "dmin", limit=3) == [
+            "/Group/Box admin 0",
+            "/Group/Box admin 1",
+            "/Group/Box admin 2",
+        ]
+
+    @pytest.mark.parametrize("query", ["g a", "a g", "gmail a", "g admin", "g a ka", "g gm", "api ka"])
+    def test_several_terms_with_many_best_matches(self, mocker, query):
+        names = ["Gmail", "Google", "AWS", "Azure", "GitHub"]
+        qualifiers = ["admin", "api", "ci", "deploy"]
+        index = SearchIndex(
+            Entry(f"/{group}/{name} {qualifier} {account}")
+            for group in ["Archive", "Games"]
+            for name in names
+            for qualifier in qualifiers
+            for account in ["kalo", "gumi", "anne", "zeta"]
+        )
+        paths = search_paths(index, query, limit=5)
+        mocker.patch.object(index, "_search_top_tier", return_value=[])
+
+        assert paths == search_paths(index, query, limit=5)
+
+
+class TestSearchMethodWithFields:
+    @pytest.mark.parametrize(
+        "query, expected_paths",
+        [
+            ("user:alice", ["/Work/GitHub", "/Personal/GitHub", "/Work/CI/Jenkins"]),
+            ("u:ali url:github", ["/Work/GitHub", "/Personal/GitHub"]),
+            ("url:github.com tag:prod", ["/Work/GitHub", "/Work/CI/GitHub deploy"]),
+            ("url:example.com", ["/Work/CI/Jenkins"]),
+            ("tag:prod", ["/Work/GitHub", "/Work/CI/Jenkins", "/Work/CI/GitHub deploy"]),
+            ("tag:staging user:bob", []),
+            ("group:/Work/", ["/Work/GitHub", "/Work/CI/Jenkins", "/Work/CI/GitHub deploy"]),
+            ("group:/work/ci", ["/Work/CI/Jenkins", "/Work/CI/GitHub deploy"]),
+            ("group:work", ["/Workshop/Tools", "/Work/GitHub", "/Work/CI/Jenkins", "/Work/CI/GitHub deploy"]),
+            ("title:deploy", ["/Work/CI/GitHub deploy"]),
+            ("t:git g:personal", ["/Personal/GitHub"]),
+        ],
+    )
+    def test_filters(self, fields_index, query, expected_paths):
+        assert search_paths(fields_index, query) == expected_paths
+
+    def test_filters_with_free_text(self, fields_index):
+        assert search_paths(fields_index, "user:alice group:/Work/ git") == ["/Work/GitHub"]
+        assert search_paths(fields_index, "tag:prod ci") == ["/Work/CI/Jenkins", "/Work/CI/GitHub deploy"]
+
+    def test_unknown_prefixes_are_free_text(self, fields_index):
+        assert search_paths(fields_index, "notes:github") == []
+        assert search_paths(SearchIndex([Entry("/Server http:8080")]), "http:8080") == ["/Server http:8080"]
+
+    def test_empty_value_is_ignored(self, fields_index):
+        assert search_paths(fields_index, "user: tools") == ["/Workshop/Tools"]
+
+    def test_limit(self, fields_index):
+        assert search_paths(fields_index, "tag:prod", limit=1) == ["/Work/GitHub"]
+
+    @pytest.mark.parametrize(
+        "query, matches",
+        [
+            ("user:ka1 tag:2fa group:finance", lambda number: number % 50 == 10 and number % 3 == 0),
+            ("user:ka15 tag:2fa g:finance", lambda number: False),
+            ("user:ka15 g:finance", lambda number: number % 50 == 15 and number % 3 == 0),
+            ("user:ka group:/finance/", lambda number: number % 3 == 0),
+            ("tag:2fa g:work user:ka2", lambda number: number % 50 == 20 and number % 3),
+        ],
+    )
+    def test_filters_of_many_entries(self, query, matches):
+        index = SearchIndex(
+            Entry(
+                f"/{'Finance' if number % 3 == 0 else 'Work'}/Entry {number}",
+                username=f"ka{number % 50}@example.com",
+                tags="2fa" if number % 10 == 0 else "prod",
+            )
+            for number in range(1000)
+        )
+        expected_paths = [entry.path for number, entry in enumerate(index.entries) if matches(number)]
+
+        assert search_paths(index, query, limit=100) == expected_paths[:100]
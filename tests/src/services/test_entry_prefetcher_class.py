@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from services import EntryPrefetcher, KeepassXCItem
+
+
+@pytest.fixture
+def prefetcher():
+    prefetcher = EntryPrefetcher()
+    prefetcher.is_enabled = True
+    yield prefetcher
+    prefetcher.clear()
+    prefetcher.join()
+
+
+class TestScheduleMethod:
+    def test_prefetched_items(self, prefetcher, kdbx_client):
+        prefetcher.schedule(kdbx_client, ["/Internet/GitHub", "/Internet/Mail/Mail"])
+        prefetcher.join()
+
+        assert prefetcher.get(kdbx_client, "/Internet/GitHub").username == "octocat"
+        assert prefetcher.get(kdbx_client, "/Internet/Mail/Mail").title == "Mail"
+        assert prefetcher.get(kdbx_client, "/Internet/Café") is None
+
+    def test_disabled_prefetcher(self, mocker, kdbx_client):
+        show_spy = mocker.spy(kdbx_client, "show")
+        prefetcher = EntryPrefetcher()
+        prefetcher.schedule(kdbx_client, ["/Internet/GitHub"])
+        prefetcher.join()
+
+        show_spy.assert_not_called()
+        assert prefetcher.get(kdbx_client, "/Internet/GitHub") is None
+
+    def test_max_size(self, mocker, kdbx_client):
+        show_spy = mocker.spy(kdbx_client, "show")
+        prefetcher = EntryPrefetcher(max_size=1)
+        prefetcher.is_enabled = True
+        prefetcher.schedule(kdbx_client, ["/Internet/GitHub", "/Internet/Mail/Mail"])
+        prefetcher.join()
+
+        show_spy.assert_called_once_with("/Internet/GitHub")
+        assert prefetcher.get(kdbx_client, "/Internet/GitHub")
+
+    def test_expired_items(self, mocker, prefetcher, kdbx_client):
+        monotonic_mock = mocker.patch("services.time.monotonic", return_value=100.0)
+        prefetcher.schedule(kdbx_client, ["/Internet/GitHub"])
+        prefetcher.join()
+        monotonic_mock.return_value = 100.0 + prefetcher.ttl + 1
+
+        assert prefetcher.get(kdbx_client, "/Internet/GitHub") is None
+
+    def test_another_client(self, prefetcher, kdbx_client, keepassxc_client):
+        prefetcher.schedule(kdbx_client, ["/Internet/GitHub"])
+        prefetcher.join()
+
+        assert prefetcher.get(keepassxc_client, "/Internet/GitHub") is None
+
+    def test_client_errors(self, mocker, prefetcher, kdbx_client):
+        mocker.patch.object(kdbx_client, "show", side_effect=OSError)
+        prefetcher.schedule(kdbx_client, ["/Internet/GitHub"])
+        prefetcher.join()
+
+        assert prefetcher.get(kdbx_client, "/Internet/GitHub") is None
+
+    def test_newer_search_cancels_prefetch(self, mocker, prefetcher, kdbx_client):
+        is_showing, can_continue = threading.Event(), threading.Event()
+        item = KeepassXCItem(title="title", username="username", password="password", url="url", notes="notes")
+
+        def show(path):
+            is_showing.set()
+            can_continue.wait(1)
+            return item
+
+        show_mock = mocker.patch.object(kdbx_client, "show", side_effect=show)
+        prefetcher.schedule(kdbx_client, ["/first", "/second"])
+        is_showing.wait(1)
+        prefetcher.cancel()
+        can_continue.set()
+        prefetcher.join()
+
+        show_mock.assert_called_once_with("/first")
+        assert prefetcher.get(kdbx_client, "/first") is None
+
+
+class TestClearMethod:
+    def test(self, prefetcher, kdbx_client):
+        prefetcher.schedule(kdbx_client, ["/Internet/GitHub"])
+        prefetcher.join()
+        prefetcher.clear()
+
+        assert prefetcher.get(kdbx_client, "/Internet/GitHub") is None
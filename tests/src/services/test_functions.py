@@ -1,4 +1,25 @@
-from services import initialize_keepassxc_client
+import pytest
+
+from services import (
+    KeepassXCEntry,
+    Vault,
+    client_pool,
+    forget_credentials,
+    get_search_cache_directory,
+    initialize_keepassxc_client,
+    initialize_search_results_file_cache,
+    initialize_usage_store,
+    is_query_refinement,
+    keychain_password_cache,
+    load_vaults,
+    matches_search_terms,
+    parse_search_terms,
+    record_entry_usage,
+    resolve_entry_reference,
+    search_index_cache,
+)
+
+VAULTS = '[{"name": "team", "db_path": "/team.kdbx", "keychain_account": "team", "keyfile_path": "/team.key"}]'
 
 
 class TestInitializeKeepassXCClient:
@@ -18,6 +39,7 @@ class TestInitializeKeepassXCClient:
             db_path=valid_settings.KEEPASSXC_DB_PATH.value,
             key_file=valid_settings.KEEPASSXC_KEYFILE_PATH.value,
             password=keychain_access_mock(),
+            single_flight=mocker.ANY,
         )
 
     def test_returned_value(self, mocker):
@@ -26,3 +48,310 @@ class TestInitializeKeepassXCClient:
         actual_value = initialize_keepassxc_client()
 
         assert actual_value == kp_client_mock()
+
+    def test_pooled_client(self, mocker, valid_settings):
+        keychain_access_mock = mocker.patch("services.KeychainAccess.get_password", return_value="password")
+        mocker.patch.object(client_pool, "is_enabled", True)
+        mocker.patch.object(keychain_password_cache, "is_enabled", True)
+
+        try:
+            first_client = initialize_keepassxc_client()
+            second_client = initialize_keepassxc_client()
+        finally:
+            forget_credentials()
+
+        keychain_access_mock.assert_called_once()
+        assert first_client is second_client
+        assert first_client.use_session
+
+    def test_pooled_client_with_changed_password(self, mocker, valid_settings):
+        mocker.patch("services.KeychainAccess.get_password", side_effect=["password", "new password"])
+        mocker.patch.object(client_pool, "is_enabled", True)
+
+        try:
+            first_client = initialize_keepassxc_client()
+            second_client = initialize_keepassxc_client()
+        finally:
+            client_pool.clear()
+
+        assert first_client is not second_client
+        assert second_client.password == "new password"
+
+    def test_kdbx_backend(self, mocker, configurable_valid_settings):
+        settings = configurable_valid_settings(keepassxc_backend="kdbx", keepassxc_keyfile_path="/key/path")
+        keychain_access_mock = mocker.patch("services.KeychainAccess.get_password")
+        kdbx_client_mock = mocker.patch("services.KdbxClient")
+
+        actual_value = initialize_keepassxc_client()
+
+        kdbx_client_mock.assert_called_with(
+            db_path=settings.KEEPASSXC_DB_PATH.value,
+            key_file="/key/path",
+            password=keychain_access_mock(),
+        )
+        assert actual_value == kdbx_client_mock()
+
+    def test_vault(self, mocker, valid_settings):
+        keychain_access_mock = mocker.patch("services.KeychainAccess.get_password")
+        kp_client_mock = mocker.patch("services.KeepassXCClient")
+        vault = Vault(name="team", db_path="/team.kdbx", keyfile_path="/team.key", keychain_account="team")
+
+        initialize_keepassxc_client(vault)
+
+        keychain_access_mock.assert_called_with(account="team", service=valid_settings.KEYCHAIN_SERVICE.value)
+        kp_client_mock.assert_called_with(
+            cli_path=valid_settings.KEEPASSXC_CLI_PATH.value,
+            db_path="/team.kdbx",
+            key_file="/team.key",
+            password=keychain_access_mock(),
+            single_flight=mocker.ANY,
+        )
+
+    def test_pooled_clients_of_vaults(self, mocker, valid_settings):
+        keychain_access_mock = mocker.patch("services.KeychainAccess.get_password", return_value="password")
+        mocker.patch.object(client_pool, "is_enabled", True)
+        mocker.patch.object(keychain_password_cache, "is_enabled", True)
+        vault = Vault(name="team", db_path="/team.kdbx", keyfile_path=None, keychain_account="team")
+
+        try:
+            clients = [initialize_keepassxc_client(), initialize_keepassxc_client(vault)]
+            clients += [initialize_keepassxc_client(), initialize_keepassxc_client(vault)]
+        finally:
+            forget_credentials()
+
+        assert keychain_access_mock.call_count == 2
+        assert clients[0] is clients[2]
+        assert clients[1] is clients[3]
+        assert clients[0] is not clients[1]
+
+
+class TestLoadVaults:
+    def test_primary_vault(self, configurable_valid_settings):
+        configurable_valid_settings(keepassxc_db_path="/vaults/personal.kdbx", keepassxc_keyfile_path="/key/path")
+        vaults = load_vaults()
+
+        assert len(vaults) == 1
+        assert vaults[0].name == "personal"
+        assert vaults[0].db_path == "/vaults/personal.kdbx"
+        assert vaults[0].keyfile_path == "/key/path"
+        assert vaults[0].keychain_account == "account"
+        assert vaults[0].is_primary
+
+    def test_configured_vaults(self, configurable_valid_settings):
+        configurable_valid_settings(keepassxc_vaults=VAULTS)
+        vaults = load_vaults()
+
+        assert [vault.name for vault in vaults] == ["path", "team"]
+        assert vaults[1].db_path == "/team.kdbx"
+        assert vaults[1].keyfile_path == "/team.key"
+        assert vaults[1].keychain_account == "team"
+        assert not vaults[1].is_primary
+
+    def test_repeated_database(self, configurable_valid_settings):
+        configurable_valid_settings(
+            keepassxc_vaults='[{"name": "copy", "db_path": "/db/path", "keychain_account": "account"}]'
+        )
+
+        assert [vault.name for vault in load_vaults()] == ["path"]
+
+    @pytest.mark.parametrize(
+        "configured_vaults",
+        [
+            "[",
+            "{}",
+            '["team"]',
+            '[{"name": "team"}]',
+            '[{"name": "a:b", "db_path": "/a", "keychain_account": "a"}]',
+            '[{"name": "/a", "db_path": "/a", "keychain_account": "a"}]',
+            '[{"name": "a", "db_path": "/a", "keychain_account": "a"},'
+            ' {"name": "a", "db_path": "/b", "keychain_account": "b"}]',
+        ],
+    )
+    def test_invalid_vaults(self, configurable_valid_settings, configured_vaults):
+        configurable_valid_settings(keepassxc_vaults=configured_vaults)
+
+        with pytest.raises(ValueError):
+            load_vaults()
+
+
+class TestResolveEntryReference:
+    @pytest.mark.parametrize(
+        "reference, expected_vault_name, expected_path",
+        [
+            ("/Internet/GitHub", "path", "/Internet/GitHub"),
+            ("team:/Internet/GitHub", "team", "/Internet/GitHub"),
+            ("unknown:/Internet/GitHub", "path", "unknown:/Internet/GitHub"),
+            ("/team:/GitHub", "path", "/team:/GitHub"),
+        ],
+    )
+    def test(self, configurable_valid_settings, reference, expected_vault_name, expected_path):
+        configurable_valid_settings(keepassxc_vaults=VAULTS)
+        vault, path = resolve_entry_reference(reference)
+
+        assert vault.name == expected_vault_name
+        assert path == expected_path
+        assert vault.reference(path) == reference
+
+
+class TestForgetCredentials:
+    def test(self, mocker, valid_settings):
+        keychain_access_mock = mocker.patch("services.KeychainAccess.get_password", return_value="password")
+        mocker.patch.object(client_pool, "is_enabled", True)
+        mocker.patch.object(keychain_password_cache, "is_enabled", True)
+
+        try:
+            first_client = initialize_keepassxc_client()
+            forget_credentials()
+            second_client = initialize_keepassxc_client()
+        finally:
+            forget_credentials()
+
+        assert keychain_access_mock.call_count == 2
+        assert first_client is not second_client
+
+
+class TestInitializeSearchResultsFileCache:
+    @pytest.mark.parametrize("ttl", [None, "0"])
+    def test_disabled(self, configurable_valid_settings, ttl):
+        configurable_valid_settings(search_cache_ttl=ttl)
+
+        assert initialize_search_results_file_cache() is None
+
+    @pytest.mark.parametrize(
+        "extra_settings, expected_namespace",
+        [
+            ({}, "keepassxc-cli"),
+            ({"keepassxc_backend": "kdbx"}, "kdbx"),
+            ({"keepassxc_backend": "kdbx", "use_local_search": "true"}, "local"),
+        ],
+    )
+    def test_enabled(self, mocker, configurable_valid_settings, extra_settings, expected_namespace):
+        mocker.patch.object(search_index_cache, "is_enabled", True)
+        configurable_valid_settings(
+            search_cache_ttl="30", search_cache_dir="/cache", keepassxc_keyfile_path="/key/path", **extra_settings
+        )
+        cache = initialize_search_results_file_cache()
+
+        assert cache.directory == "/cache"
+        assert cache.source_paths == ["/db/path", "/key/path"]
+        assert cache.namespace == expected_namespace
+        assert cache.ttl == 30
+
+    def test_local_search_without_agent(self, configurable_valid_settings):
+        configurable_valid_settings(search_cache_ttl="30", keepassxc_backend="kdbx", use_local_search="true")
+
+        assert initialize_search_results_file_cache().namespace == "kdbx"
+
+    def test_vaults(self, configurable_valid_settings):
+        configurable_valid_settings(search_cache_ttl="30", keepassxc_vaults=VAULTS)
+        cache = initialize_search_results_file_cache(load_vaults())
+
+        assert cache.source_paths == ["/db/path", "/team.kdbx", "/team.key"]
+
+
+class TestInitializeUsageStore:
+    def test_enabled(self, configurable_valid_settings, workflow_data_directory):
+        configurable_valid_settings(keepassxc_db_path="/db/path", recent_entries="10")
+        usage_store = initialize_usage_store()
+
+        assert usage_store.file_path == str(workflow_data_directory / "usage-31adf7c94021692c.log")
+
+    @pytest.mark.parametrize("recent_entries", [None, "0", "-1"])
+    def test_disabled(self, configurable_valid_settings, recent_entries):
+        configurable_valid_settings(recent_entries=recent_entries)
+
+        assert initialize_usage_store() is None
+
+
+class TestRecordEntryUsage:
+    def test(self, valid_settings, usage_history):
+        record_entry_usage("/a")
+
+        assert initialize_usage_store().recent(10) == ["/a"]
+
+    def test_disabled_history(self, valid_settings, workflow_data_directory):
+        record_entry_usage("/a")
+
+        assert not workflow_data_directory.exists()
+
+    def test_error(self, valid_settings, usage_history, workflow_data_directory, capsys):
+        workflow_data_directory.write_text("")  # a file instead of the directory
+        record_entry_usage("/a")
+
+        assert capsys.readouterr().err.startswith("Can't record the usage of the entry:")
+
+
+class TestGetSearchCacheDirectory:
+    def test_configured_directory(self, configurable_valid_settings):
+        configurable_valid_settings(search_cache_dir="/cache")
+
+        assert get_search_cache_directory() == "/cache"
+
+    @pytest.mark.parametrize("has_shm, expected_root", [(True, "/dev/shm"), (False, "/tmp/user")])
+    def test_default_directory(self, mocker, configurable_valid_settings, has_shm, expected_root):
+        configurable_valid_settings(TMPDIR="/tmp/user")
+        mocker.patch("services.os.path.isdir", return_value=has_shm)
+        mocker.patch("services.os.getuid", return_value=501)
+
+        assert get_search_cache_directory() == f"{expected_root}/alfred-keepassxc-501/search-results"
+
+
+class TestParseSearchTerms:
+    def test(self):
+        assert parse_search_terms('GitHub -mail "second line" -"a b"') == [
+            (False, "github"),
+            (True, "mail"),
+            (False, "second line"),
+            (True, "a b"),
+        ]
+
+
+class TestMatchesSearchTerms:
+    @pytest.mark.parametrize(
+        "query, is_matched",
+        [
+            ("github", True),
+            ("OCTOCAT", True),
+            ("github -work", False),
+            ("github -mail", True),
+            ("dev", True),
+            ("nothing", False),
+        ],
+    )
+    def test(self, query, is_matched):
+        entry = KeepassXCEntry(
+            uuid="",
+            group_path="/Internet",
+            title="GitHub",
+            username="octocat",
+            url="https://github.com",
+            notes="",
+            tags="dev;work",
+            created_at=None,
+            modified_at=None,
+        )
+
+        assert matches_search_terms(entry, parse_search_terms(query)) is is_matched
+
+
+class TestIsQueryRefinement:
+    @pytest.mark.parametrize(
+        "previous_query, query, expected_value",
+        [
+            ("githu", "github", True),
+            ("", "github", True),
+            ("github", "github", True),
+            ("github", "github work", True),
+            ("github ", "github -work", True),
+            ("github -wo", "github -work", False),
+            ("github", "gitlab", False),
+            ("github", "git", False),
+            ("git", "git*", False),
+            ("git", "git|lab", False),
+            ("u", "u:alice", False),
+            ("git", "git +hub", False),
+            ('"git', '"git hub"', False),
+        ],
+    )
+    def test(self, previous_query, query, expected_value):
+        assert is_query_refinement(previous_query, query) is expected_value
@@ -0,0 +1,110 @@
+import pytest
+from freezegun import freeze_time
+
+from services import KdbxClient, NoSearchResultsError
+
+
+class TestSearchMethod:
+    @pytest.mark.parametrize(
+        "query, expected_paths",
+        [
+            ("github", ["/Internet/GitHub"]),
+            ("GITHUB", ["/Internet/GitHub"]),
+            ("example", ["/Internet/Café", "/Internet/Mail/Mail"]),
+            ("example -mail", ["/Internet/Café"]),
+            ('"second line"', ["/Internet/GitHub"]),
+            ("work", ["/Internet/GitHub"]),
+            ("café", ["/Internet/Café"]),
+            ("https octocat", ["/Internet/GitHub"]),
+        ],
+    )
+    def test_matches(self, kdbx_client, query, expected_paths):
+        assert kdbx_client.search(query) == expected_paths
+
+    def test_passwords_are_not_searched(self, kdbx_client):
+        with pytest.raises(NoSearchResultsError):
+            kdbx_client.search("pässwörd")
+
+    def test_without_matches(self, kdbx_client):
+        with pytest.raises(OSError):
+            kdbx_client.search("nothing")
+
+
+class TestShowMethod:
+    @pytest.mark.parametrize("query", ["/Internet/GitHub", "Internet/GitHub"])
+    def test(self, kdbx_client, query):
+        item = kdbx_client.show(query)
+
+        assert item.title == "GitHub"
+        assert item.username == "octocat"
+        assert item.password == "gh secret"
+        assert item.url == "https://github.com"
+        assert item.notes == "first line\nsecond line"
+
+    def test_unknown_entry(self, kdbx_client):
+        with pytest.raises(OSError):
+            kdbx_client.show("/Internet/Unknown")
+
+    def test_key_file(self, kdbx_fixture):
+        client = KdbxClient(
+            db_path=kdbx_fixture("kdbx4-keyfile-only.kdbx"), key_file=kdbx_fixture("keyfile.keyx"), password=""
+        )
+
+        assert client.show("/Root entry").password == "root password"
+
+
+class TestTotpMethod:
+    @freeze_time("2009-02-13 23:31:30")
+    @pytest.mark.parametrize(
+        "query, expected",
+        [
+            ("/Internet/GitHub", "005924"),
+            ("/Internet/Mail/Mail", "89005924"),
+        ],
+    )
+    def test(self, kdbx_client, query, expected):
+        assert kdbx_client.totp(query) == expected
+
+    def test_without_totp(self, kdbx_client):
+        with pytest.raises(OSError):
+            kdbx_client.totp("/Internet/Café")
+
+
+class TestTotpSettingsMethod:
+    def test(self, kdbx_client):
+        totp_settings = kdbx_client.totp_settings("/Internet/Mail/Mail")
+
+        assert totp_settings.digits == 8
+
+    def test_without_totp(self, kdbx_client):
+        with pytest.raises(OSError):
+            kdbx_client.totp_settings("/Internet/Café")
+
+
+class TestCloseMethod:
+    def test(self, kdbx_client):
+        kdbx_client.close()
+
+
+class TestExportEntriesMethod:
+    def test(self, kdbx_client):
+        entries = {entry.path: entry for entry in kdbx_client.export_entries()}
+        github = entries["/Internet/GitHub"]
+
+        assert "/Root entry" in entries
+        assert "/Internet/Mail/Mail" in entries
+        assert github.group_path == "/Internet"
+        assert github.title == "GitHub"
+        assert github.username == "octocat"
+        assert github.url == "https://github.com"
+        assert github.tags == "dev;work"
+        assert github.created_at is None
+        assert github.totp_settings is None
+        assert not hasattr(github, "password")
+
+    def test_totp_settings(self, kdbx_client):
+        entries = {entry.path: entry for entry in kdbx_client.export_entries(with_totp=True)}
+
+        assert entries["/Internet/GitHub"].totp_settings.digits == 6
+        assert entries["/Internet/Mail/Mail"].totp_settings.digits == 8
+        assert entries["/Internet/Café"].totp_settings is None
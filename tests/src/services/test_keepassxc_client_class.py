@@ -1,8 +1,11 @@
 import subprocess
+import threading
 
 import pytest
 
-from services import KeepassXCClient
+from processes import SubprocessTimeoutError
+from services import KeepassXCClient, KeepassXCCredentialsError, NoSearchResultsError, parse_keepassxc_time
+from singleflight import SingleFlight
 
 
 class TestInitMethod:
@@ -52,6 +55,19 @@ class TestBuildCommandMethod:
 
         assert actual_command == expected_command
 
+    def test_command_building_in_session_mode(self):
+        client = KeepassXCClient(
+            cli_path="cli",
+            db_path="db_path",
+            key_file="key_file",
+            password="password",
+            use_session=True,
+        )
+
+        actual_command = client._build_command(action="action", action_parameters=["parameter"])
+
+        assert actual_command == ["action", "parameter"]
+
 
 class TestRunCommandMethod:
     def test_with_non_successful_code(self, mocker, keepassxc_client):
@@ -63,6 +79,25 @@ class TestRunCommandMethod:
             command = ""
             keepassxc_client._run_command(command)
 
+    def test_without_search_results(self, mocker, keepassxc_client):
+        popen_mock = mocker.patch("services.subprocess.Popen")
+        popen_mock.return_value.returncode = 1
+        popen_mock.return_value.communicate.return_value = (b"No results for that search term.\n", b"")
+
+        with pytest.raises(NoSearchResultsError):
+            keepassxc_client._run_command(["search"])
+
+    def test_invalid_credentials(self, mocker, keepassxc_client):
+        popen_mock = mocker.patch("services.subprocess.Popen")
+        popen_mock.return_value.returncode = 1
+        popen_mock.return_value.communicate.return_value = (
+            b"Error while reading the database: Invalid credentials were provided, please try again.\n",
+            b"",
+        )
+
+        with pytest.raises(KeepassXCCredentialsError):
+            keepassxc_client._run_command(["search"])
+
     def test_popen_parameters(self, mocker, keepassxc_client):
         popen_mock = mocker.patch("services.subprocess.Popen")
         popen_mock.return_value.returncode = 0
@@ -71,7 +106,9 @@ class TestRunCommandMethod:
         command = "command"
         keepassxc_client._run_command(command)
 
-        popen_mock.assert_called_with(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
+        popen_mock.assert_called_with(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE, start_new_session=True
+        )
         popen_mock.assert_called_once()
 
     def test_output(self, mocker, keepassxc_client):
@@ -84,6 +121,27 @@ class TestRunCommandMethod:
 
         assert actual_output == "output"
 
+    def test_session_mode(self, mocker, keepassxc_client):
+        popen_mock = mocker.patch("services.subprocess.Popen")
+        session_mock = mocker.patch("services.KeepassXCSession")
+        session_mock.return_value.execute.return_value = "output"
+        keepassxc_client.use_session = True
+        actual_output = keepassxc_client._run_command(["search", "query"])
+
+        session_mock.return_value.execute.assert_called_once_with(["search", "query"])
+        popen_mock.assert_not_called()
+        assert actual_output == "output"
+
+    def test_timeout(self, mocker, fake_keepassxc_cli, fake_keepassxc_db):
+        mocker.patch.dict("os.environ", {"FAKE_KEEPASSXC_DELAY": "30", "subprocess_timeout": "1"})
+        client = KeepassXCClient(cli_path=fake_keepassxc_cli, db_path=fake_keepassxc_db(), key_file=None, password="")
+        popen_spy = mocker.spy(subprocess, "Popen")
+
+        with pytest.raises(SubprocessTimeoutError, match="keepassxc-cli hasn't finished in 1 seconds"):
+            client.search("query")
+
+        assert popen_spy.spy_return.returncode is not None
+
 
 class TestShowMethod:
     def test_build_command_parameters(self, keepassxc_client, mocker):
@@ -224,7 +282,7 @@ class TestSearchMethod:
         run_command_mock = mocker.patch.object(keepassxc_client, "_run_command")
         keepassxc_client.search("query")
 
-        run_command_mock.assert_called_with(build_command_mock())
+        run_command_mock.assert_called_with(build_command_mock(), coalesce=True)
 
     @pytest.mark.parametrize(
         "command_output, expected_result",
@@ -265,3 +323,223 @@ class TestTotpMethod:
         actual_result = keepassxc_client.totp("query")
 
         assert actual_result == expected_result
+
+
+class TestTotpSettingsMethod:
+    def test_build_command_parameters(self, keepassxc_client, mocker):
+        build_command_mock = mocker.patch.object(keepassxc_client, "_build_command")
+        mocker.patch.object(keepassxc_client, "_run_command", return_value="GEZDGNBV\n")
+        keepassxc_client.totp_settings("query")
+
+        build_command_mock.assert_called_with(action="show", action_parameters=["-a", "otp", "query"])
+
+    def test_parsing_of_command_output(self, keepassxc_client, mocker):
+        output = "otpauth://totp/a?secret=GEZDGNBV&period=60&digits=8&algorithm=SHA256\n"
+        mocker.patch.object(keepassxc_client, "_run_command", return_value=output)
+        totp_settings = keepassxc_client.totp_settings("query")
+
+        assert totp_settings.secret == b"12345"
+        assert (totp_settings.period, totp_settings.digits, totp_settings.algorithm) == (60, 8, "sha256")
+
+    @pytest.mark.parametrize("output", ["\n", "otpauth://hotp/a?secret=GEZDGNBV\n", "not base32!\n"])
+    def test_invalid_settings(self, keepassxc_client, mocker, output):
+        mocker.patch.object(keepassxc_client, "_run_command", return_value=output)
+
+        with pytest.raises(OSError):
+            keepassxc_client.totp_settings("query")
+
+
+class TestExportEntriesMethod:
+    @pytest.fixture
+    def exporting_client(self, fake_keepassxc_cli, fake_keepassxc_db):
+        db_path = fake_keepassxc_db(
+            entries=[
+                {
+                    "path": "/Internet/Mail/Mail",
+                    "title": "Mail",
+                    "username": "user",
+                    "password": "secret",
+                    "url": "https://mail.example",
+                    "notes": "first line\nsecond line",
+                    "uuid": "00112233445566778899aabbccddeeff",
+                    "tags": "work;mail",
+                    "created": 1600000000,
+                    "modified": 1650000000,
+                    "otp": "otpauth://totp/Mail?secret=GEZDGNBV&digits=8",
+                },
+                {"path": "/Root entry", "title": "Root entry", "username": "root"},
+            ]
+        )
+
+        yield KeepassXCClient(cli_path=fake_keepassxc_cli, db_path=db_path, key_file=None, password="password")
+
+    def test_xml(self, exporting_client):
+        first_entry, second_entry = exporting_client.export_entries("xml")
+
+        assert first_entry.uuid == "00112233445566778899aabbccddeeff"
+        assert first_entry.group_path == "/Internet/Mail"
+        assert first_entry.path == "/Internet/Mail/Mail"
+        assert (first_entry.title, first_entry.username, first_entry.url) == ("Mail", "user", "https://mail.example")
+        assert first_entry.notes == "first line\nsecond line"
+        assert first_entry.tags == "work;mail"
+        assert (first_entry.created_at, first_entry.modified_at) == (1600000000, 1650000000)
+        assert second_entry.path == "/Root entry"
+
+    def test_history_is_skipped(self, exporting_client):
+        titles = [entry.title for entry in exporting_client.export_entries("xml")]
+        assert titles == ["Mail", "Root entry"]
+
+    def test_csv(self, exporting_client):
+        first_entry, second_entry = exporting_client.export_entries("csv")
+
+        assert first_entry.path == "/Internet/Mail/Mail"
+        assert (first_entry.username, first_entry.notes) == ("user", "first line\nsecond line")
+        assert (first_entry.created_at, first_entry.modified_at) == (1600000000, 1650000000)
+        assert second_entry.group_path == ""
+
+    @pytest.mark.parametrize("export_format", ["xml", "csv"])
+    def test_totp_settings(self, exporting_client, export_format):
+        first_entry, second_entry = exporting_client.export_entries(export_format, with_totp=True)
+
+        assert (first_entry.totp_settings.secret, first_entry.totp_settings.digits) == (b"12345", 8)
+        assert second_entry.totp_settings is None
+
+    def test_totp_settings_are_not_requested(self, exporting_client):
+        assert next(exporting_client.export_entries()).totp_settings is None
+
+    def test_passwords_are_not_kept(self, exporting_client):
+        entry = next(exporting_client.export_entries())
+
+        assert not hasattr(entry, "password")
+        assert not hasattr(entry, "__dict__")
+
+    def test_command(self, mocker, exporting_client):
+        popen_spy = mocker.spy(subprocess, "Popen")
+        list(exporting_client.export_entries("csv"))
+
+        assert popen_spy.call_args.args[0] == [
+            exporting_client.cli_path,
+            "export",
+            "-q",
+            exporting_client.db_path,
+            "-f",
+            "csv",
+        ]
+
+    def test_early_stop_kills_process(self, mocker, exporting_client):
+        popen_spy = mocker.spy(subprocess, "Popen")
+        entries = exporting_client.export_entries()
+        next(entries)
+        entries.close()
+
+        assert popen_spy.spy_return.returncode is not None
+
+    def test_timeout(self, mocker, exporting_client):
+        mocker.patch.dict("os.environ", {"FAKE_KEEPASSXC_DELAY": "30", "subprocess_timeout": "1"})
+
+        with pytest.raises(SubprocessTimeoutError, match="hasn't exported the database in 1 seconds"):
+            list(exporting_client.export_entries())
+
+    def test_invalid_password(self, exporting_client):
+        exporting_client.password = "wrong password"
+
+        with pytest.raises(KeepassXCCredentialsError, match="Invalid credentials"):
+            list(exporting_client.export_entries())
+
+    def test_unsupported_format(self, exporting_client):
+        with pytest.raises(ValueError):
+            list(exporting_client.export_entries("html"))
+
+
+class TestParseKeepassXCTime:
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            ("AAfw1g4AAAA=", 1600000000),
+            ("2020-09-13T12:26:40Z", 1600000000),
+            ("2020-09-13T12:26:40", 1600000000),
+            ("", None),
+            (None, None),
+            ("invalid", None),
+        ],
+    )
+    def test(self, value, expected):
+        assert parse_keepassxc_time(value) == expected
+
+
+class TestSingleFlight:
+    @pytest.fixture
+    def client_factory(self, mocker, tmp_path, fake_keepassxc_cli, fake_keepassxc_db):
+        db_path = fake_keepassxc_db(entries=[{"path": "/Internet/GitHub", "title": "GitHub"}])
+        log_path = tmp_path / "unlocks.log"
+        mocker.patch.dict("os.environ", {"FAKE_KEEPASSXC_DELAY": "0.5", "FAKE_KEEPASSXC_LOG": str(log_path)})
+
+        def create():
+            return KeepassXCClient(
+                cli_path=fake_keepassxc_cli,
+                db_path=db_path,
+                key_file=None,
+                password="password",
+                single_flight=SingleFlight(
+                    directory=str(tmp_path / "flights"),
+                    error_classes=[NoSearchResultsError, KeepassXCCredentialsError],
+                ),
+            )
+
+        yield create, log_path
+
+    def run_concurrently(self, function):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(function())) for _ in range(3)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_concurrent_searches(self, client_factory):
+        create_client, log_path = client_factory
+
+        results = self.run_concurrently(lambda: create_client().search("github"))
+
+        assert results == [["/Internet/GitHub"]] * 3
+        assert len(log_path.read_text().splitlines()) == 1
+
+    def test_shows_are_not_coalesced(self, client_factory, mocker):
+        create_client, log_path = client_factory
+        run_mock = mocker.spy(SingleFlight, "run")
+
+        results = self.run_concurrently(lambda: create_client().show("/Internet/GitHub").title)
+
+        assert results == ["GitHub"] * 3
+        assert len(log_path.read_text().splitlines()) == 3
+        run_mock.assert_not_called()
+
+    def test_concurrent_searches_without_results(self, client_factory):
+        create_client, log_path = client_factory
+
+        def search():
+            with pytest.raises(NoSearchResultsError):
+                create_client().search("nothing")
+
+            return True
+
+        assert self.run_concurrently(search) == [True] * 3
+        assert len(log_path.read_text().splitlines()) == 1
+
+    def test_credentials_error_is_shared(self, client_factory):
+        create_client, _ = client_factory
+
+        def search():
+            kp_client = create_client()
+            kp_client.password = "wrong password"
+
+            with pytest.raises(KeepassXCCredentialsError):
+                kp_client.search("github")
+
+            return True
+
+        assert self.run_concurrently(search) == [True] * 3
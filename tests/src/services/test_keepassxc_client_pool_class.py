@@ -0,0 +1,88 @@
+import threading
+
+from services import KeepassXCClientPool
+
+
+class TestGetMethod:
+    def test_disabled_pool(self, keepassxc_client):
+        pool = KeepassXCClientPool()
+        pool.is_enabled = True
+        pool.add(("key",), keepassxc_client)
+        pool.is_enabled = False
+
+        assert pool.get(("key",)) is None
+
+    def test_enabled_pool(self, keepassxc_client):
+        pool = KeepassXCClientPool()
+        pool.is_enabled = True
+        pool.add(("key",), keepassxc_client)
+
+        assert pool.get(("key",)) is keepassxc_client
+        assert pool.get(("other key",)) is None
+
+
+class TestAddMethod:
+    def test_disabled_pool(self, keepassxc_client):
+        pool = KeepassXCClientPool()
+        pool.add(("key",), keepassxc_client)
+
+        assert pool._clients == {}
+        assert not keepassxc_client.use_session
+
+    def test_session_mode(self, keepassxc_client):
+        pool = KeepassXCClientPool()
+        pool.is_enabled = True
+        pool.add(("key",), keepassxc_client)
+
+        assert keepassxc_client.use_session
+
+    def test_kdbx_client(self, kdbx_client):
+        pool = KeepassXCClientPool()
+        pool.is_enabled = True
+        pool.add(("key",), kdbx_client)
+
+        assert pool.get(("key",)) is kdbx_client
+        assert not hasattr(kdbx_client, "use_session")
+
+    def test_previous_clients_are_closed(self, mocker, keepassxc_client):
+        pool = KeepassXCClientPool()
+        pool.is_enabled = True
+        close_mock = mocker.patch.object(keepassxc_client, "close")
+        pool.add(("db", "key"), keepassxc_client)
+        pool.add(("db", "other key"), mocker.Mock())
+
+        close_mock.assert_called_once()
+        assert pool.get(("db", "key")) is None
+
+    def test_clients_of_other_databases_are_kept(self, mocker, keepassxc_client):
+        pool = KeepassXCClientPool()
+        pool.is_enabled = True
+        close_mock = mocker.patch.object(keepassxc_client, "close")
+        other_client = mocker.Mock()
+        pool.add(("db", "key"), keepassxc_client)
+        pool.add(("other db", "key"), other_client)
+
+        close_mock.assert_not_called()
+        assert pool.get(("db", "key")) is keepassxc_client
+        assert pool.get(("other db", "key")) is other_client
+
+    def test_concurrent_clients(self, mocker):
+        pool = KeepassXCClientPool()
+        pool.is_enabled = True
+        barrier = threading.Barrier(8, timeout=5)
+
+        def add(index):
+            barrier.wait()
+
+            for round_index in range(200):
+                pool.add((f"db {index}", round_index), mocker.Mock())
+
+        threads = [threading.Thread(target=add, args=(index,)) for index in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert sorted(pool._clients) == [(f"db {index}", 199) for index in range(8)]
@@ -0,0 +1,127 @@
+import pytest
+
+from services import KeepassXCClient, KeepassXCCredentialsError, KeepassXCSession, KeepassXCSessionError
+
+ENTRIES = [
+    {
+        "path": "/Work/github",
+        "title": "github",
+        "username": "alice",
+        "password": 'pass"word',
+        "url": "https://github.com",
+        "notes": "first line\nsecond line passwords.kdbx> ",
+    },
+    {"path": "/Home/mail box", "title": "mail box", "username": "bob", "password": "", "url": "", "notes": ""},
+]
+
+
+@pytest.fixture(params=["0", "1"], ids=["without_echo", "with_echo"])
+def session_factory(request, monkeypatch, fake_keepassxc_cli, fake_keepassxc_db):
+    monkeypatch.setenv("FAKE_KEEPASSXC_ECHO", request.param)
+    sessions = []
+
+    def create(password="password", timeout=5.0):
+        db_path = fake_keepassxc_db(entries=ENTRIES)
+        session = KeepassXCSession(command=[fake_keepassxc_cli, "open", "-q", db_path], password=password)
+        session.timeout = timeout
+        sessions.append(session)
+        return session
+
+    yield create
+
+    for session in sessions:
+        session.stop()
+
+
+class TestQuoteMethod:
+    @pytest.mark.parametrize(
+        "arguments, expected_line",
+        [
+            (["search", "query"], "search query"),
+            (["show", "/group/entry title"], "show /group/entry\\ title"),
+            (["show", 'a"b'], 'show a\\"b'),
+            (["show", "a\\b"], "show a\\\\b"),
+            (["search", "a\nb"], "search a\\ b"),
+        ],
+    )
+    def test_escaping(self, arguments, expected_line):
+        assert KeepassXCSession._quote(arguments) == expected_line
+
+
+class TestExecuteMethod:
+    def test_search(self, session_factory):
+        session = session_factory()
+
+        assert session.execute(["search", "github"]) == "/Work/github\n"
+
+    def test_show(self, session_factory):
+        session = session_factory()
+        output = session.execute(["show", "-a", "password", "-a", "notes", "/Work/github"])
+
+        assert output == 'pass"word\nfirst line\nsecond line passwords.kdbx> \n'
+
+    def test_path_with_spaces(self, session_factory):
+        session = session_factory()
+
+        assert session.execute(["show", "-a", "username", "/Home/mail box"]) == "bob\n"
+
+    def test_process_is_reused(self, session_factory):
+        session = session_factory()
+        session.execute(["search", "github"])
+        pid = session._process.pid
+        session.execute(["search", "mail"])
+
+        assert session._process.pid == pid
+
+    def test_command_error(self, session_factory):
+        session = session_factory()
+
+        with pytest.raises(OSError, match="Could not find entry"):
+            session.execute(["show", "-a", "title", "/missing"])
+
+        assert session.execute(["search", "mail"]) == "/Home/mail box\n"
+
+    def test_restart_after_killed_process(self, session_factory):
+        session = session_factory()
+        session.execute(["search", "github"])
+        session._process.kill()
+        session._process.wait()
+
+        assert session.execute(["search", "mail"]) == "/Home/mail box\n"
+
+    def test_desync(self, session_factory):
+        session = session_factory(timeout=0.5)
+        session.start()
+
+        with pytest.raises(KeepassXCSessionError):
+            session.execute(["sleep", "5"])
+
+        assert session.execute(["search", "mail"]) == "/Home/mail box\n"
+
+    def test_invalid_password(self, session_factory):
+        session = session_factory(password="invalid")
+
+        with pytest.raises(KeepassXCCredentialsError, match="Invalid credentials"):
+            session.execute(["search", "github"])
+
+        assert not session.is_alive
+
+
+class TestClientWithSession:
+    def test_public_methods(self, fake_keepassxc_cli, fake_keepassxc_db):
+        client = KeepassXCClient(
+            cli_path=fake_keepassxc_cli,
+            db_path=fake_keepassxc_db(entries=ENTRIES),
+            key_file=None,
+            password="password",
+            use_session=True,
+        )
+
+        try:
+            assert client.search("mail") == ["/Home/mail box"]
+            assert client.show("/Home/mail box").username == "bob"
+            assert client.session.is_alive
+        finally:
+            client.close()
+
+        assert client._session is None
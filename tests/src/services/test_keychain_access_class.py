@@ -2,6 +2,7 @@ import subprocess
 
 import pytest
 
+from processes import SubprocessTimeoutError
 from services import KeychainAccess
 
 
@@ -43,8 +44,29 @@ class TestGetPasswordMethod:
             ["security", "find-generic-password", "-g", "-a", keychain_account, "-s", keychain_service],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            start_new_session=True,
         )
 
+    @pytest.mark.parametrize("password", ["", "password", "пароль", 'pass"word'])
+    def test_security_tool(self, fake_security, keychain_account, keychain_service, password):
+        log_path = fake_security(password=password)
+
+        assert KeychainAccess().get_password(account=keychain_account, service=keychain_service) == password
+        assert len(log_path.read_text().splitlines()) == 1
+
+    def test_missing_item(self, fake_security, keychain_account, keychain_service):
+        fake_security(password=None)
+
+        with pytest.raises(OSError, match="Exit code: 44"):
+            KeychainAccess().get_password(account=keychain_account, service=keychain_service)
+
+    def test_timeout(self, mocker, fake_security, keychain_account, keychain_service):
+        fake_security()
+        mocker.patch.dict("os.environ", {"FAKE_SECURITY_DELAY": "30", "subprocess_timeout": "1"})
+
+        with pytest.raises(SubprocessTimeoutError, match="security hasn't finished in 1 seconds"):
+            KeychainAccess().get_password(account=keychain_account, service=keychain_service)
+
     def test_password_parsing_with_incorrect_output(self, mocker, keychain_account, keychain_service):
         popen_mock = mocker.patch("services.subprocess.Popen")
         popen_mock.return_value.returncode = 0
@@ -0,0 +1,94 @@
+import pytest
+
+from services import KeychainPasswordCache
+
+
+class TestKeychainPasswordCache:
+    @pytest.fixture
+    def cache(self):
+        cache = KeychainPasswordCache(ttl=60)
+        cache.is_enabled = True
+        yield cache
+
+    def count_lookups(self, log_path):
+        return len(log_path.read_text().splitlines())
+
+    def test_disabled(self, fake_security):
+        log_path = fake_security(password="password")
+        cache = KeychainPasswordCache()
+
+        assert cache.get(account="account", service="service") == "password"
+        assert cache.get(account="account", service="service") == "password"
+        assert self.count_lookups(log_path) == 2
+
+    def test_cached_password(self, fake_security, cache):
+        log_path = fake_security(password="password")
+
+        assert cache.get(account="account", service="service") == "password"
+        assert cache.get(account="account", service="service") == "password"
+        assert self.count_lookups(log_path) == 1
+        assert cache.lookups == 1
+
+    def test_another_item(self, fake_security, cache):
+        log_path = fake_security(password="password")
+        cache.get(account="account", service="service")
+        cache.get(account="account", service="another service")
+
+        assert self.count_lookups(log_path) == 2
+
+    def test_several_items(self, fake_security, cache):
+        log_path = fake_security(password="password")
+
+        for _ in range(2):
+            cache.get(account="account", service="service")
+            cache.get(account="another account", service="service")
+
+        assert self.count_lookups(log_path) == 2
+
+    def test_idle_timeout(self, mocker, fake_security, cache):
+        log_path = fake_security(password="password")
+        mocker.patch("services.time.monotonic", side_effect=[100, 150, 200, 261])
+
+        for _ in range(4):
+            cache.get(account="account", service="service")
+
+        assert self.count_lookups(log_path) == 2
+
+    def test_clear(self, fake_security, cache):
+        log_path = fake_security(password="password")
+        cache.get(account="account", service="service")
+        cache.clear()
+        fake_security(password="new password")
+
+        assert cache.get(account="account", service="service") == "new password"
+        assert self.count_lookups(log_path) == 2
+
+    def test_failed_lookup(self, fake_security, cache):
+        fake_security(password=None)
+
+        with pytest.raises(OSError):
+            cache.get(account="account", service="service")
+
+        fake_security(password="password")
+
+        assert cache.get(account="account", service="service") == "password"
+
+    def test_lookups_are_logged(self, capsys, fake_security, cache):
+        fake_security(password="password")
+        cache.get(account="account", service="service")
+        cache.get(account="account", service="service")
+
+        assert capsys.readouterr().err == "Keychain lookup of service (lookups: 1)\n"
+
+    def test_lookups_of_disabled_cache_are_logged_with_instrumentation(self, mocker, capsys, fake_security):
+        mocker.patch("instrumentation.recorder")
+        fake_security(password="password")
+        KeychainPasswordCache().get(account="account", service="service")
+
+        assert capsys.readouterr().err == "Keychain lookup of service (lookups: 1)\n"
+
+    def test_lookups_of_disabled_cache_arent_logged_without_instrumentation(self, capsys, fake_security):
+        fake_security(password="password")
+        KeychainPasswordCache().get(account="account", service="service")
+
+        assert capsys.readouterr().err == ""
@@ -0,0 +1,41 @@
+import os
+import shutil
+
+from services import KdbxClient, SearchIndexCache
+
+
+class TestGetMethod:
+    def test_reuses_index(self, mocker, kdbx_client):
+        export_entries_spy = mocker.spy(kdbx_client, "export_entries")
+        cache = SearchIndexCache()
+
+        first_index = cache.get(kdbx_client)
+        second_index = cache.get(kdbx_client)
+
+        assert first_index is second_index
+        assert export_entries_spy.call_count == 1
+        assert [entry.path for entry in first_index.search("github")] == ["/Internet/GitHub"]
+
+    def test_rebuilds_changed_database(self, mocker, tmp_path, kdbx_fixture):
+        db_path = str(tmp_path / "passwords.kdbx")
+        shutil.copy(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), db_path)
+        kdbx_client = KdbxClient(db_path=db_path, key_file=None, password="password")
+        export_entries_spy = mocker.spy(kdbx_client, "export_entries")
+        cache = SearchIndexCache()
+        first_index = cache.get(kdbx_client)
+        stat = os.stat(db_path)
+        os.utime(db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        assert cache.get(kdbx_client) is not first_index
+        assert export_entries_spy.call_count == 2
+
+
+class TestClearMethod:
+    def test(self, mocker, kdbx_client):
+        export_entries_spy = mocker.spy(kdbx_client, "export_entries")
+        cache = SearchIndexCache()
+        cache.get(kdbx_client)
+        cache.clear()
+        cache.get(kdbx_client)
+
+        assert export_entries_spy.call_count == 2
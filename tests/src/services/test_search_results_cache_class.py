@@ -0,0 +1,100 @@
+import os
+import shutil
+
+import pytest
+
+from services import KdbxClient, NoSearchResultsError, SearchResultsCache
+
+
+@pytest.fixture
+def cache():
+    cache = SearchResultsCache()
+    cache.is_enabled = True
+    yield cache
+
+
+class TestSearchMethod:
+    def test_disabled_cache(self, mocker, kdbx_client):
+        search_spy = mocker.spy(kdbx_client, "search")
+        cache = SearchResultsCache()
+
+        assert cache.search(kdbx_client, "github") == ["/Internet/GitHub"]
+        assert cache.search(kdbx_client, "github") == ["/Internet/GitHub"]
+        assert search_spy.call_count == 2
+
+    def test_same_query(self, mocker, cache, kdbx_client):
+        search_spy = mocker.spy(kdbx_client, "search")
+
+        assert cache.search(kdbx_client, "github") == ["/Internet/GitHub"]
+        assert cache.search(kdbx_client, "github") == ["/Internet/GitHub"]
+        assert search_spy.call_count == 1
+
+    def test_refined_query(self, mocker, cache, kdbx_client):
+        search_spy = mocker.spy(kdbx_client, "search")
+        export_entries_spy = mocker.spy(kdbx_client, "export_entries")
+
+        assert cache.search(kdbx_client, "exa") == ["/Internet/Café", "/Internet/Mail/Mail"]
+        assert cache.search(kdbx_client, "exam") == ["/Internet/Café", "/Internet/Mail/Mail"]
+        assert cache.search(kdbx_client, "example -mail") == ["/Internet/Café"]
+        assert cache.search(kdbx_client, "example -mail caf") == ["/Internet/Café"]
+        search_spy.assert_called_once_with("exa")
+        export_entries_spy.assert_called_once()
+
+    def test_refined_query_without_results(self, mocker, cache, kdbx_client):
+        search_spy = mocker.spy(kdbx_client, "search")
+
+        with pytest.raises(NoSearchResultsError):
+            cache.search(kdbx_client, "zzz")
+
+        with pytest.raises(NoSearchResultsError):
+            cache.search(kdbx_client, "zzzz")
+
+        search_spy.assert_called_once_with("zzz")
+
+    def test_not_refined_query(self, mocker, cache, kdbx_client):
+        search_spy = mocker.spy(kdbx_client, "search")
+        cache.search(kdbx_client, "github")
+        cache.search(kdbx_client, "git")
+
+        assert search_spy.call_count == 2
+
+    def test_other_errors_are_not_remembered(self, mocker, cache, kdbx_client):
+        search_mock = mocker.patch.object(kdbx_client, "search", side_effect=OSError)
+
+        for _ in range(2):
+            with pytest.raises(OSError):
+                cache.search(kdbx_client, "github")
+
+        assert search_mock.call_count == 2
+
+    def test_changed_database(self, mocker, cache, tmp_path, kdbx_fixture):
+        db_path = str(tmp_path / "passwords.kdbx")
+        shutil.copy(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), db_path)
+        kdbx_client = KdbxClient(db_path=db_path, key_file=None, password="password")
+        search_spy = mocker.spy(kdbx_client, "search")
+        cache.search(kdbx_client, "github")
+        stat = os.stat(db_path)
+        os.utime(db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        cache.search(kdbx_client, "github")
+
+        assert search_spy.call_count == 2
+
+    def test_max_size(self, mocker, kdbx_client):
+        search_spy = mocker.spy(kdbx_client, "search")
+        cache = SearchResultsCache(max_size=1)
+        cache.is_enabled = True
+        cache.search(kdbx_client, "github")
+        cache.search(kdbx_client, "mail")
+        cache.search(kdbx_client, "github")
+
+        assert search_spy.call_count == 3
+
+
+class TestClearMethod:
+    def test(self, mocker, cache, kdbx_client):
+        search_spy = mocker.spy(kdbx_client, "search")
+        cache.search(kdbx_client, "github")
+        cache.clear()
+        cache.search(kdbx_client, "github")
+
+        assert search_spy.call_count == 2
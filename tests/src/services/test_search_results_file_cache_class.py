@@ -0,0 +1,198 @@
+import os
+import threading
+
+import pytest
+
+from services import SearchResultsFileCache
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = tmp_path / "passwords.kdbx"
+    db_path.write_bytes(b"database")
+    yield str(db_path)
+
+
+@pytest.fixture
+def cache_factory(tmp_path, db_path):
+    def create(**kw):
+        parameters = {
+            "directory": str(tmp_path / "cache"),
+            "source_paths": [db_path],
+            "namespace": "keepassxc-cli",
+            "ttl": 60,
+        }
+        parameters.update(kw)
+
+        return SearchResultsFileCache(**parameters)
+
+    yield create
+
+
+def age_files(directory, seconds):
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns - seconds * 10**9, stat.st_mtime_ns - seconds * 10**9))
+
+
+class TestGetMethod:
+    def test_miss(self, cache_factory):
+        cache = cache_factory()
+
+        assert cache.get("github") is None
+        assert (cache.hits, cache.misses) == (0, 1)
+
+    def test_counters_are_logged(self, capsys, cache_factory):
+        cache = cache_factory()
+        cache.get("github")
+        cache.set("github", ["/Internet/GitHub"])
+        cache.get("github")
+
+        assert capsys.readouterr().err == (
+            "Search results cache miss (hits: 0, misses: 1)\nSearch results cache hit (hits: 1, misses: 1)\n"
+        )
+
+    def test_counters_are_shared_by_processes(self, cache_factory):
+        cache_factory().get("github")
+        cache_factory().set("github", ["/Internet/GitHub"])
+        cache_factory().get("github")
+        cache = cache_factory()
+        cache.get("gitlab")
+
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_counters_arent_expired(self, cache_factory, tmp_path):
+        cache_factory().get("github")
+        age_files(tmp_path / "cache", 61)
+        cache_factory().set("github", ["/Internet/GitHub"])
+        cache = cache_factory()
+        cache.get("gitlab")
+
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    def test_counters_without_directory(self, cache_factory, tmp_path):
+        (tmp_path / "cache").write_text("not a directory")
+        cache = cache_factory()
+        cache.get("github")
+        cache.get("github")
+
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    def test_hit_in_another_instance(self, cache_factory):
+        cache_factory().set("github", ["/Internet/GitHub"])
+        cache = cache_factory()
+
+        assert cache.get("github") == ["/Internet/GitHub"]
+        assert (cache.hits, cache.misses) == (1, 0)
+
+    def test_empty_results(self, cache_factory):
+        cache_factory().set("nothing", [])
+
+        assert cache_factory().get("nothing") == []
+
+    @pytest.mark.parametrize("query", [" github", "github  ", "ｇｉｔｈｕｂ"])
+    def test_normalized_query(self, cache_factory, query):
+        cache_factory().set("github", ["/Internet/GitHub"])
+
+        assert cache_factory().get(query) == ["/Internet/GitHub"]
+
+    def test_whitespaces_in_quotes(self, cache_factory):
+        cache_factory().set('"a  b"', ["/a  b"])
+
+        assert cache_factory().get('"a b"') is None
+
+    def test_changed_database(self, cache_factory, db_path):
+        cache_factory().set("github", ["/Internet/GitHub"])
+
+        with open(db_path, "ab") as db_file:
+            db_file.write(b"changed")
+
+        assert cache_factory().get("github") is None
+
+    def test_changed_key_file(self, cache_factory, db_path, tmp_path):
+        key_file = tmp_path / "key"
+        key_file.write_bytes(b"key")
+        cache_factory(source_paths=[db_path, str(key_file)]).set("github", ["/Internet/GitHub"])
+        key_file.write_bytes(b"another key")
+
+        assert cache_factory(source_paths=[db_path, str(key_file)]).get("github") is None
+
+    def test_another_namespace(self, cache_factory):
+        cache_factory().set("github", ["/Internet/GitHub"])
+
+        assert cache_factory(namespace="local").get("github") is None
+
+    def test_expired_results(self, cache_factory, tmp_path):
+        cache_factory().set("github", ["/Internet/GitHub"])
+        age_files(tmp_path / "cache", 61)
+
+        assert cache_factory().get("github") is None
+        assert os.listdir(tmp_path / "cache") == ["misses"]
+
+    def test_missing_database(self, cache_factory, tmp_path):
+        cache = cache_factory(source_paths=[str(tmp_path / "missing")])
+        cache.set("github", ["/Internet/GitHub"])
+
+        assert cache.get("github") is None
+
+
+class TestSetMethod:
+    def test_file_content(self, cache_factory, tmp_path):
+        cache_factory().set("github", ["/Internet/GitHub"])
+        (file_name,) = os.listdir(tmp_path / "cache")
+
+        assert file_name.endswith(".json")
+        assert (tmp_path / "cache" / file_name).read_text() == '["/Internet/GitHub"]'
+        assert os.stat(tmp_path / "cache").st_mode & 0o777 == 0o700
+
+    def test_least_recently_used_are_evicted(self, cache_factory):
+        cache = cache_factory(max_size=2)
+        cache.set("a", ["/a"])
+        cache.set("b", ["/b"])
+        age_files(cache.directory, 10)
+        cache.get("a")
+        cache.set("c", ["/c"])
+
+        assert cache.get("a") == ["/a"]
+        assert cache.get("b") is None
+        assert cache.get("c") == ["/c"]
+
+    def test_left_temporary_files_are_removed(self, cache_factory, tmp_path):
+        cache = cache_factory()
+        os.makedirs(cache.directory)
+        (tmp_path / "cache" / ".abc.tmp").write_text("[")
+        age_files(cache.directory, 61)
+        cache.set("github", ["/Internet/GitHub"])
+
+        assert len(os.listdir(cache.directory)) == 1
+
+    def test_errors_are_not_raised(self, cache_factory, tmp_path):
+        (tmp_path / "cache").write_text("not a directory")
+        cache = cache_factory()
+        cache.set("github", ["/Internet/GitHub"])
+
+        assert cache.get("github") is None
+
+    def test_concurrent_writes(self, cache_factory):
+        paths = [f"/Group/Entry {index}" for index in range(5000)]
+        cache_factory().set("entry", paths)
+        results = []
+
+        def write():
+            for _ in range(20):
+                cache_factory().set("entry", paths)
+
+        def read():
+            for _ in range(100):
+                results.append(cache_factory().get("entry"))
+
+        threads = [threading.Thread(target=write), threading.Thread(target=read)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert all(result == paths for result in results)
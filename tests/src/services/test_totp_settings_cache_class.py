@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import pytest
+
+from services import KdbxClient, TOTPSettingsCache
+
+
+@pytest.fixture
+def cache():
+    cache = TOTPSettingsCache()
+    cache.is_enabled = True
+    yield cache
+
+
+class TestGetMethod:
+    def test_disabled(self, mocker, kdbx_client):
+        totp_settings_spy = mocker.spy(kdbx_client, "totp_settings")
+        cache = TOTPSettingsCache()
+
+        cache.get(kdbx_client, "/Internet/GitHub")
+        cache.get(kdbx_client, "/Internet/GitHub")
+
+        assert totp_settings_spy.call_count == 2
+
+    def test_cached_settings(self, mocker, kdbx_client, cache):
+        totp_settings_spy = mocker.spy(kdbx_client, "totp_settings")
+
+        assert cache.get(kdbx_client, "/Internet/GitHub") is cache.get(kdbx_client, "/Internet/GitHub")
+        totp_settings_spy.assert_called_once_with("/Internet/GitHub")
+
+    def test_errors(self, kdbx_client, cache):
+        with pytest.raises(OSError):
+            cache.get(kdbx_client, "/Internet/Café")
+
+    def test_max_size(self, mocker, kdbx_client):
+        totp_settings_spy = mocker.spy(kdbx_client, "totp_settings")
+        cache = TOTPSettingsCache(max_size=1)
+        cache.is_enabled = True
+        cache.get(kdbx_client, "/Internet/GitHub")
+        cache.get(kdbx_client, "/Internet/Mail/Mail")
+        cache.get(kdbx_client, "/Internet/GitHub")
+
+        assert totp_settings_spy.call_count == 3
+
+    def test_another_client(self, mocker, kdbx_client, kdbx_fixture, cache):
+        cache.get(kdbx_client, "/Internet/GitHub")
+        another_client = KdbxClient(db_path=kdbx_client.db_path, key_file=None, password="password")
+        totp_settings_spy = mocker.spy(another_client, "totp_settings")
+        cache.get(another_client, "/Internet/GitHub")
+
+        totp_settings_spy.assert_called_once()
+
+    def test_changed_database(self, mocker, tmp_path, kdbx_fixture, cache):
+        db_path = str(tmp_path / "passwords.kdbx")
+        shutil.copy(kdbx_fixture("kdbx4-aes-argon2d.kdbx"), db_path)
+        kdbx_client = KdbxClient(db_path=db_path, key_file=None, password="password")
+        totp_settings_spy = mocker.spy(kdbx_client, "totp_settings")
+        cache.get(kdbx_client, "/Internet/GitHub")
+        stat = os.stat(db_path)
+        os.utime(db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        cache.get(kdbx_client, "/Internet/GitHub")
+
+        assert totp_settings_spy.call_count == 2
+
+
+class TestClearMethod:
+    def test(self, mocker, kdbx_client, cache):
+        totp_settings_spy = mocker.spy(kdbx_client, "totp_settings")
+        cache.get(kdbx_client, "/Internet/GitHub")
+        cache.clear()
+        cache.get(kdbx_client, "/Internet/GitHub")
+
+        assert totp_settings_spy.call_count == 2
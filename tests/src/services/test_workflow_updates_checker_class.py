@@ -1,16 +1,87 @@
+import http.server
 import json
+import threading
+import time
 
 import pytest
 
 from helpers import Version
-from services import WorkflowUpdatesChecker
+from services import LATEST_RELEASE_URL, WorkflowUpdatesChecker, WorkflowUpdatesRateLimitError
+
+RELEASE_PATH = "/repos/lxbrvr/alfred-keepassxc-workflow/releases/latest"
+
+
+class GitHubAPIStandIn:
+    """Answers like the latest release endpoint of GitHub API and records the requests."""
+
+    def __init__(self) -> None:
+        self.tag_name = "1.0.0"
+        self.etag = '"v1"'
+        self.error_status = None
+        self.headers = {}
+        self.requests = []
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._build_handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}{RELEASE_PATH}"
+
+    def _build_handler(self):
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                api.requests.append({"path": self.path, "headers": dict(self.headers)})
+
+                if api.error_status:
+                    self._respond(api.error_status, b'{"message": "API rate limit exceeded"}')
+                elif self.headers.get("If-None-Match") == api.etag:
+                    self._respond(304, b"")
+                else:
+                    self._respond(200, json.dumps({"tag_name": api.tag_name}).encode(), ETag=api.etag)
+
+            def _respond(self, status, body, **headers):
+                self.send_response(status)
+
+                for name, value in dict(api.headers, **headers).items():
+                    self.send_header(name, value)
+
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def github_api(monkeypatch):
+    monkeypatch.setenv("no_proxy", "127.0.0.1")
+    api = GitHubAPIStandIn()
+    thread = threading.Thread(target=api.server.serve_forever, daemon=True)
+    thread.start()
+
+    yield api
+
+    api.server.shutdown()
+    api.server.server_close()
+
+
+@pytest.fixture
+def checker_factory(github_api, tmp_path):
+    def create(ttl=3600):
+        return WorkflowUpdatesChecker(cache_path=str(tmp_path / "latest-release.json"), ttl=ttl, url=github_api.url)
+
+    yield create
 
 
 class TestInitMethod:
-    def test_init_values(self):
+    def test_init_values(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("alfred_workflow_cache", str(tmp_path))
         checker = WorkflowUpdatesChecker()
 
         assert checker._cached_latest_version is None
+        assert checker.cache_path == str(tmp_path / "latest-release.json")
+        assert checker.url == LATEST_RELEASE_URL
 
 
 class TestCurrentValueProperty:
@@ -23,41 +94,91 @@ class TestCurrentValueProperty:
 
 
 class TestFetchLatestVersion:
-    def test_cache(self, mocker, version_factory):
-        checker = WorkflowUpdatesChecker()
-        version = "1.0.0"
-        response = mocker.MagicMock()
-        response.__enter__.return_value.read.return_value = json.dumps({"tag_name": version})
-        mocker.patch("services.urllib.request.urlopen", return_value=response)
+    def test_cache(self, github_api, checker_factory, version_factory):
+        checker = checker_factory(ttl=0)
         first_fetched_version = checker.fetch_latest_version()
-        response = mocker.MagicMock()
-        response.__enter__.return_value.read.return_value = {"tag_name": "2.0.0"}
-        mocker.patch("services.urllib.request.urlopen", return_value=response)
+        github_api.tag_name, github_api.etag = "2.0.0", '"v2"'
         second_fetched_version = checker.fetch_latest_version()
 
-        assert version_factory(version) == first_fetched_version == second_fetched_version
+        assert version_factory("1.0.0") == first_fetched_version == second_fetched_version
+        assert len(github_api.requests) == 1
 
-    def test_called_openurl(self, mocker):
-        urlopen_mock = mocker.patch("services.urllib.request.urlopen")
-        mocker.patch("services.json.loads")
-        checker = WorkflowUpdatesChecker()
-        checker.fetch_latest_version()
+    def test_request(self, github_api, checker_factory):
+        checker_factory().fetch_latest_version()
 
-        urlopen_mock.assert_called_once_with(
-            "https://api.github.com/repos/lxbrvr/alfred-keepassxc-workflow/releases/latest",
-            timeout=10,
-        )
+        assert [request["path"] for request in github_api.requests] == [RELEASE_PATH]
+        assert github_api.requests[0]["headers"]["Accept"] == "application/vnd.github+json"
+        assert "If-None-Match" not in github_api.requests[0]["headers"]
 
-    def test_result(self, version_factory, mocker):
-        checker = WorkflowUpdatesChecker()
-        version = "1.0.0"
-        response = mocker.MagicMock()
-        response.__enter__.return_value.read.return_value = json.dumps({"tag_name": version})
-        mocker.patch("services.urllib.request.urlopen", return_value=response)
-        actual_version = checker.fetch_latest_version()
-        expected_version = version_factory(version)
-
-        assert actual_version == expected_version
+    def test_result(self, checker_factory, version_factory):
+        assert checker_factory().fetch_latest_version() == version_factory("1.0.0")
+
+    def test_file_cache(self, github_api, checker_factory, version_factory):
+        checker_factory().fetch_latest_version()
+        github_api.tag_name, github_api.etag = "2.0.0", '"v2"'
+
+        assert checker_factory().fetch_latest_version() == version_factory("1.0.0")
+        assert len(github_api.requests) == 1
+
+    def test_not_modified(self, github_api, checker_factory, version_factory, tmp_path):
+        checker_factory(ttl=0).fetch_latest_version()
+
+        assert checker_factory(ttl=0).fetch_latest_version() == version_factory("1.0.0")
+        assert github_api.requests[1]["headers"]["If-None-Match"] == '"v1"'
+
+    def test_modified(self, github_api, checker_factory, version_factory):
+        checker_factory(ttl=0).fetch_latest_version()
+        github_api.tag_name, github_api.etag = "2.0.0", '"v2"'
+
+        assert checker_factory(ttl=0).fetch_latest_version() == version_factory("2.0.0")
+        assert checker_factory(ttl=3600).fetch_latest_version() == version_factory("2.0.0")
+        assert len(github_api.requests) == 2
+
+    @pytest.mark.parametrize(
+        "status, headers",
+        [
+            (403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 600)}),
+            (429, {"Retry-After": "600"}),
+        ],
+    )
+    def test_rate_limit_without_cache(self, github_api, checker_factory, status, headers):
+        github_api.error_status, github_api.headers = status, headers
+
+        for _ in range(2):
+            with pytest.raises(WorkflowUpdatesRateLimitError, match="GitHub doesn't accept requests for updates until"):
+                checker_factory().fetch_latest_version()
+
+        assert len(github_api.requests) == 1
+
+    def test_rate_limit_with_cache(self, github_api, checker_factory, version_factory):
+        checker_factory(ttl=0).fetch_latest_version()
+        github_api.error_status, github_api.headers = 429, {"Retry-After": "600"}
+
+        for _ in range(2):
+            assert checker_factory(ttl=0).fetch_latest_version() == version_factory("1.0.0")
+
+        assert len(github_api.requests) == 2
+
+    def test_exhausted_rate_limit(self, github_api, checker_factory, version_factory):
+        github_api.headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 600)}
+        checker_factory(ttl=0).fetch_latest_version()
+        checker_factory(ttl=0).fetch_latest_version()
+
+        assert len(github_api.requests) == 1
+
+    def test_forbidden_without_rate_limit(self, github_api, checker_factory):
+        github_api.error_status = 403
+
+        with pytest.raises(OSError) as error_info:
+            checker_factory().fetch_latest_version()
+
+        assert not isinstance(error_info.value, WorkflowUpdatesRateLimitError)
+
+    def test_unwritable_cache(self, github_api, version_factory, tmp_path):
+        (tmp_path / "file").touch()
+        checker = WorkflowUpdatesChecker(cache_path=str(tmp_path / "file" / "latest-release.json"), url=github_api.url)
+
+        assert checker.fetch_latest_version() == version_factory("1.0.0")
 
 
 class TestHasNewVersionMethod:
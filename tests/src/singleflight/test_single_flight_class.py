@@ -0,0 +1,133 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class CustomError(OSError):
+    pass
+
+
+@pytest.fixture
+def single_flight(tmp_path):
+    yield SingleFlight(directory=str(tmp_path / "flights"), error_classes=[CustomError])
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = target()
+        except OSError as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def lock_path(single_flight, key):
+    return os.path.join(single_flight.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".lock")
+
+
+class TestRunMethod:
+    def test_output(self, single_flight):
+        assert single_flight.run("key", lambda: "output") == "output"
+        assert not [name for name in os.listdir(single_flight.directory) if name.endswith(".json")]
+        assert os.stat(single_flight.directory).st_mode & 0o777 == 0o700
+
+    def test_result_is_not_written_without_followers(self, single_flight, mocker):
+        mkstemp_mock = mocker.patch("tempfile.mkstemp")
+
+        assert single_flight.run("key", lambda: "output") == "output"
+        mkstemp_mock.assert_not_called()
+
+    def test_concurrent_calls(self, single_flight):
+        calls = []
+
+        def function():
+            calls.append(1)
+            time.sleep(0.3)
+            return "output"
+
+        assert run_concurrently(5, lambda: single_flight.run("key", function)) == ["output"] * 5
+        assert len(calls) == 1
+        assert not [name for name in os.listdir(single_flight.directory) if name.endswith(".json")]
+
+    def test_different_keys(self, single_flight):
+        calls = []
+
+        def function():
+            calls.append(1)
+            time.sleep(0.1)
+            return "output"
+
+        keys = iter(["first", "second"])
+
+        assert run_concurrently(2, lambda: single_flight.run(next(keys), function)) == ["output"] * 2
+        assert len(calls) == 2
+
+    def test_shared_errors(self, single_flight):
+        def function():
+            time.sleep(0.3)
+            raise CustomError("no results")
+
+        results = run_concurrently(3, lambda: single_flight.run("key", function))
+
+        assert [type(result) for result in results] == [CustomError] * 3
+        assert [str(result) for result in results] == ["no results"] * 3
+
+    def test_sequential_calls_are_not_shared(self, single_flight):
+        outputs = iter(["first", "second"])
+
+        assert single_flight.run("key", lambda: next(outputs)) == "first"
+        assert single_flight.run("key", lambda: next(outputs)) == "second"
+
+    def test_killed_leader(self, single_flight):
+        os.makedirs(single_flight.directory)
+
+        with open(lock_path(single_flight, "key"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            threading.Timer(0.2, lambda: fcntl.flock(lock_file, fcntl.LOCK_UN)).start()
+
+            assert single_flight.run("key", lambda: "output") == "output"
+
+    def test_timeout(self, tmp_path):
+        single_flight = SingleFlight(directory=str(tmp_path / "flights"), timeout=0.1)
+        os.makedirs(single_flight.directory)
+
+        with open(lock_path(single_flight, "key"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            started_at = time.monotonic()
+
+            assert single_flight.run("key", lambda: "output") == "output"
+            assert time.monotonic() - started_at < 1
+
+    def test_unavailable_directory(self, tmp_path):
+        (tmp_path / "flights").write_text("not a directory")
+        single_flight = SingleFlight(directory=str(tmp_path / "flights"))
+
+        assert single_flight.run("key", lambda: "output") == "output"
+
+    def test_stale_files_are_removed(self, single_flight):
+        os.makedirs(single_flight.directory)
+        stale_path = os.path.join(single_flight.directory, "stale.lock")
+        open(stale_path, "w").close()
+        os.utime(stale_path, (0, 0))
+        single_flight.run("key", lambda: "output")
+
+        assert not os.path.exists(stale_path)
+        assert os.path.exists(lock_path(single_flight, "key"))
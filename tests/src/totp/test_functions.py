@@ -0,0 +1,16 @@
+import pytest
+
+from totp import TOTPError, decode_secret
+
+
+class TestDecodeSecret:
+    @pytest.mark.parametrize("secret", ["GEZDGNBV", "gezd gnbv", "GEZD-GNBV", "GEZDGNBV===="])
+    def test_normalization(self, secret):
+        assert decode_secret(secret) == b"12345"
+
+    def test_missing_padding(self):
+        assert decode_secret("GEZDG") == b"123"
+
+    def test_invalid_secret(self):
+        with pytest.raises(TOTPError):
+            decode_secret("not base32!")
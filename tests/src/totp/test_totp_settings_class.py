@@ -0,0 +1,121 @@
+import base64
+
+import pytest
+
+from totp import TOTPError, TOTPSettings
+
+RFC_6238_SECRETS = {
+    "sha1": b"12345678901234567890",
+    "sha256": b"12345678901234567890123456789012",
+    "sha512": b"1234567890123456789012345678901234567890123456789012345678901234",
+}
+
+
+def encode(secret):
+    return base64.b32encode(secret).decode()
+
+
+class TestGenerateMethod:
+    @pytest.mark.parametrize(
+        "algorithm, timestamp, expected",
+        [
+            ("sha1", 59, "94287082"),
+            ("sha256", 59, "46119246"),
+            ("sha512", 59, "90693936"),
+            ("sha1", 1111111109, "07081804"),
+            ("sha256", 1234567890, "91819424"),
+            ("sha512", 20000000000, "47863826"),
+        ],
+    )
+    def test_rfc_6238_vectors(self, algorithm, timestamp, expected):
+        settings = TOTPSettings(secret=RFC_6238_SECRETS[algorithm], digits=8, algorithm=algorithm)
+        assert settings.generate(timestamp) == expected
+
+    def test_steam(self):
+        code = TOTPSettings(secret=RFC_6238_SECRETS["sha1"], digits=5, is_steam=True).generate(59)
+
+        assert len(code) == 5
+        assert set(code) <= set("23456789BCDFGHJKMNPQRTVWXY")
+
+
+class TestRemainingSecondsMethod:
+    @pytest.mark.parametrize("timestamp, expected", [(0, 30), (59, 1), (61.5, 29)])
+    def test(self, timestamp, expected):
+        assert TOTPSettings(secret=b"secret").remaining_seconds(timestamp) == expected
+
+
+class TestFromUriMethod:
+    def test_parameters(self):
+        uri = f"otpauth://totp/Example:user?secret={encode(b'secret')}&period=60&digits=8&algorithm=SHA256"
+        settings = TOTPSettings.from_uri(uri)
+
+        assert settings.secret == b"secret"
+        assert settings.period == 60
+        assert settings.digits == 8
+        assert settings.algorithm == "sha256"
+        assert not settings.is_steam
+
+    def test_defaults(self):
+        settings = TOTPSettings.from_uri(f"otpauth://totp/user?secret={encode(b'secret')}")
+
+        assert (settings.period, settings.digits, settings.algorithm) == (30, 6, "sha1")
+
+    def test_steam(self):
+        settings = TOTPSettings.from_uri(f"otpauth://totp/user?secret={encode(b'secret')}&encoder=steam")
+
+        assert settings.is_steam
+        assert settings.digits == 5
+
+    @pytest.mark.parametrize("uri", ["otpauth://hotp/user?secret=GEZDGNBV", "otpauth://totp/user"])
+    def test_unsupported_uri(self, uri):
+        with pytest.raises(TOTPError):
+            TOTPSettings.from_uri(uri)
+
+    @pytest.mark.parametrize(
+        "parameters, message",
+        [
+            ("period=abc", "period isn't a number"),
+            ("period=0", "period must be a positive number"),
+            ("period=-30", "period must be a positive number"),
+            ("digits=abc", "digits isn't a number"),
+            ("digits=5", "from 6 to 10 digits"),
+            ("digits=11", "from 6 to 10 digits"),
+            ("algorithm=foo", "algorithm FOO isn't supported"),
+            ("algorithm=md5", "algorithm MD5 isn't supported"),
+        ],
+    )
+    def test_invalid_parameters(self, parameters, message):
+        with pytest.raises(TOTPError, match=message):
+            TOTPSettings.from_uri(f"otpauth://totp/user?secret={encode(b'secret')}&{parameters}")
+
+
+class TestFromEntryAttributesMethod:
+    def test_otp_uri(self):
+        settings = TOTPSettings.from_entry_attributes({"otp": f"otpauth://totp/user?secret={encode(b'a')}&digits=7"})
+
+        assert settings.secret == b"a"
+        assert settings.digits == 7
+
+    def test_otp_secret(self):
+        settings = TOTPSettings.from_entry_attributes({"otp": encode(b"a")})
+        assert settings.secret == b"a"
+
+    @pytest.mark.parametrize(
+        "totp_settings, expected",
+        [
+            ("60;8", (60, 8, False)),
+            ("30;S", (30, 5, True)),
+            ("", (30, 6, False)),
+        ],
+    )
+    def test_legacy_attributes(self, totp_settings, expected):
+        settings = TOTPSettings.from_entry_attributes({"TOTP Seed": encode(b"a"), "TOTP Settings": totp_settings})
+        assert (settings.period, settings.digits, settings.is_steam) == expected
+
+    @pytest.mark.parametrize("totp_settings", ["0;6", "30;4", "30;12"])
+    def test_invalid_legacy_attributes(self, totp_settings):
+        with pytest.raises(TOTPError):
+            TOTPSettings.from_entry_attributes({"TOTP Seed": encode(b"a"), "TOTP Settings": totp_settings})
+
+    def test_without_totp(self):
+        assert TOTPSettings.from_entry_attributes({"Title": "title"}) is None
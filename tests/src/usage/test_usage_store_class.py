@@ -0,0 +1,112 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from usage import UsageStore
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def usage_store(tmp_path):
+    yield UsageStore(file_path=str(tmp_path / "data" / "usage.log"), half_life=DAY)
+
+
+def read_lines(usage_store):
+    with open(usage_store.file_path, encoding="utf-8") as usage_file:
+        return [json.loads(line) for line in usage_file]
+
+
+def record_many(file_path, reference, count, max_file_size):
+    usage_store = UsageStore(file_path=file_path, max_file_size=max_file_size, max_entries=4, visits_per_entry=2)
+
+    for index in range(count):
+        usage_store.record(reference, now=1000 + index)
+
+
+def record_concurrently(file_path, count, max_file_size):
+    processes = [
+        multiprocessing.Process(target=record_many, args=(file_path, f"/entry {index}", count, max_file_size))
+        for index in range(4)
+    ]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+
+
+class TestRecordMethod:
+    def test_appended_visits(self, usage_store):
+        usage_store.record("/a", now=100.5)
+        usage_store.record("team:/b", now=200)
+
+        assert read_lines(usage_store) == [[100, "/a"], [200, "team:/b"]]
+        assert os.stat(usage_store.file_path).st_mode & 0o777 == 0o600
+        assert os.stat(os.path.dirname(usage_store.file_path)).st_mode & 0o777 == 0o700
+
+    def test_compaction(self, usage_store):
+        usage_store.max_entries = 2
+        usage_store.visits_per_entry = 2
+        usage_store.max_file_size = 60
+
+        for now in range(10):
+            usage_store.record("/often", now=now)
+
+        usage_store.record("/once", now=10)
+        usage_store.record("/twice", now=11)
+        usage_store.record("/twice", now=12)
+
+        assert read_lines(usage_store) == [[8, "/often"], [9, "/often"], [11, "/twice"], [12, "/twice"]]
+
+    def test_concurrent_processes(self, usage_store):
+        record_concurrently(usage_store.file_path, count=50, max_file_size=1024 * 1024)
+
+        assert len(read_lines(usage_store)) == 200
+
+    def test_concurrent_compaction(self, usage_store):
+        record_concurrently(usage_store.file_path, count=100, max_file_size=300)
+        lines = read_lines(usage_store)
+
+        assert os.path.getsize(usage_store.file_path) < 1000
+        assert all(isinstance(visited_at, int) and reference.startswith("/entry") for visited_at, reference in lines)
+        assert not [name for name in os.listdir(os.path.dirname(usage_store.file_path)) if name.endswith(".tmp")]
+
+
+class TestRankMethod:
+    def test_frequency(self, usage_store):
+        usage_store.record("/b", now=0)
+        usage_store.record("/b", now=0)
+        usage_store.record("/c", now=0)
+
+        assert usage_store.rank(["/a", "/c", "/b", "/d"], now=0) == ["/b", "/c", "/a", "/d"]
+
+    def test_recency(self, usage_store):
+        usage_store.record("/old", now=0)
+        usage_store.record("/old", now=0)
+        usage_store.record("/new", now=3 * DAY)
+
+        assert usage_store.scores(now=3 * DAY) == {"/old": 0.25, "/new": 1.0}
+        assert usage_store.rank(["/old", "/new"], now=3 * DAY) == ["/new", "/old"]
+
+    def test_without_history(self, usage_store):
+        assert usage_store.rank(["/b", "/a"]) == ["/b", "/a"]
+
+
+class TestRecentMethod:
+    def test(self, usage_store):
+        for now, reference in enumerate(["/a", "/b", "/a", "/c"]):
+            usage_store.record(reference, now=now)
+
+        assert usage_store.recent(2) == ["/c", "/a"]
+
+    def test_unreadable_lines(self, usage_store):
+        usage_store.record("/a", now=1)
+
+        with open(usage_store.file_path, "a") as usage_file:
+            usage_file.write('[2, "/b"')
+
+        assert usage_store.recent(10) == ["/a"]